@@ -5,7 +5,8 @@ from flask_login import LoginManager
 from config import Config
 
 # 初始化扩展
-db = SQLAlchemy()
+from app.db_routing import RoutingSession  # noqa: E402
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'main.login' # 指定登录页面的端点
@@ -16,12 +17,39 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # 连接池参数须在创建引擎之前确定
+    from app.db_engine import configure_engines
+    configure_engines(app)
+
     # 将扩展实例与应用实例绑定
     db.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
 
-    # 注册蓝图
+    # 数据库连接调优（SQLite WAL 等 PRAGMA）和只读副本引擎，须在任何连接建立之前注册
+    from app.db_engine import DatabaseEngine
+    DatabaseEngine(app)
+
+    # 登录用户快照缓存（load_user 使用）
+    from app.user_cache import UserCache
+    UserCache(app)
+
+    # 造价模型版本（修改造价模型时自动生成版本）和按版本缓存的造价计算结果
+    from app.cost_versions import CostVersionCache
+    CostVersionCache(app)
+
+    # 资源费分成方案（编译结果按方案缓存，修改方案时失效）
+    from app.revenue_share import RevenueShareSchedules
+    RevenueShareSchedules(app)
+
+    # 收益分析历史快照（收益分析新增或重新计算时追加）
+    from app.profit_history import ProfitHistory
+    ProfitHistory(app)
+
+    # 按输入哈希缓存的项目现金流指标（NPV、IRR、回收期）
+    from app.cash_flow_cache import CashFlowCache
+    CashFlowCache(app)
+
     # 注册蓝图
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -29,6 +57,36 @@ def create_app(config_class=Config):
     from app.routes import main as main_bp
     app.register_blueprint(main_bp)
 
+    # 全文检索索引（后台线程维护）
+    from app.search import SearchIndexer
+    SearchIndexer(app)
+
+    # 文档后处理流水线（后台线程池）
+    from app.document_pipeline import DocumentPipeline
+    DocumentPipeline(app)
+
+    # 请求性能剖析（SQL计数、模板耗时、慢请求日志）
+    from app.profiling import RequestProfiler
+    RequestProfiler(app)
+
+    # 审计日志（会话事件收集变更，后台线程批量写入）
+    from app.audit import AuditLogger, audit_cli
+    AuditLogger(app)
+    app.cli.add_command(audit_cli)
+
+    # 运行指标（/metrics，Prometheus 文本格式）
+    from app.metrics import Metrics
+    Metrics(app)
+
+    # 批量维护命令：flask portfolio ...
+    from app.portfolio_cli import portfolio_cli
+    app.cli.add_command(portfolio_cli)
+
+    # 模板中使用的权限判断函数
+    from app.permissions import can, has_permission
+    app.jinja_env.globals['has_permission'] = has_permission
+    app.jinja_env.globals['can'] = can
+
     return app
 
 # 在底部导入，以避免循环依赖
@@ -4,6 +4,7 @@ from app import db
 from app.models import User, Project, CostModel, ProfitAnalysis
 from app.permissions import require_admin, has_permission, get_available_roles, get_role_permissions, format_permission_name
 from app.forms import UserForm, CostModelForm
+from app.user_cache import invalidate_user
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 
@@ -119,6 +120,7 @@ def edit_user(user_id):
             user.set_password(form.password.data)
         
         db.session.commit()
+        invalidate_user(user.id)
         flash(f'用户 {user.username} 更新成功', 'success')
         return redirect(url_for('admin.users'))
     
@@ -144,6 +146,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
     
     flash(f'用户 {username} 删除成功', 'success')
     return redirect(url_for('admin.users'))
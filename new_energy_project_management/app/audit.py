@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+审计日志模块
+
+记录谁在什么时候修改了项目阶段、成本明细、收益分析参数、造价模型、资源费分成方案和用户：
+
+- 会话 flush 后从 SQLAlchemy 属性历史中收集 Project、ProjectCostDetail、ProfitAnalysis、
+  CostModel、RevenueShareSchedule、User 的新增、修改（修改前后的值）和删除
+- 事务提交后投递到进程内队列，回滚时丢弃；请求不等待审计记录写入
+- 后台线程按批（AUDIT_BATCH_SIZE 条或等待 AUDIT_FLUSH_INTERVAL 秒）一次性插入 audit_log，
+  每批只有一个写事务
+- 写入失败时保留本批记录，按 AUDIT_RETRY_DELAY 秒为基数指数退避重试（期间继续攒入新记录）；
+  连续失败 AUDIT_MAX_ATTEMPTS 次或进程退出时仍失败的记录以 JSON 行追加到 AUDIT_FALLBACK_FILE，
+  数据库恢复后用 flask audit replay-fallback 写回 audit_log
+- 进程退出时（atexit）将队列中剩余的记录同步写入
+
+audit_log 只追加，SQLite 上由触发器拒绝修改和删除。密码哈希等敏感字段只记录"已修改"，不记录值。
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import click
+from flask import current_app, g, has_app_context, has_request_context
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+TRACKED_MODELS = ('Project', 'ProjectCostDetail', 'ProfitAnalysis', 'CostModel', 'RevenueShareSchedule', 'User')
+
+# 只记录是否修改的字段
+REDACTED_FIELDS = {'password_hash'}
+REDACTED = '***'
+
+# 不记录的自动维护字段
+IGNORED_FIELDS = {'updated_at'}
+
+_STOP = object()
+
+audit_cli = AppGroup('audit', help='审计日志维护。')
+
+
+class AuditLogger:
+    """审计记录的异步批量写入器。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._fallback_lock = threading.Lock()
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ENABLED', True)
+        app.config.setdefault('AUDIT_SYNC', False)
+        app.config.setdefault('AUDIT_BATCH_SIZE', 200)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('AUDIT_MAX_ATTEMPTS', 5)
+        app.config.setdefault('AUDIT_RETRY_DELAY', 1.0)
+        app.config.setdefault('AUDIT_RETRY_MAX_DELAY', 60.0)
+        app.config.setdefault('AUDIT_FALLBACK_FILE',
+                              os.path.join(os.path.dirname(app.root_path), 'logs', 'audit_fallback.jsonl'))
+
+        self.app = app
+        self.enabled = app.config['AUDIT_ENABLED']
+        self.sync = app.config['AUDIT_SYNC']
+        self.batch_size = app.config['AUDIT_BATCH_SIZE']
+        self.flush_interval = app.config['AUDIT_FLUSH_INTERVAL']
+        self.max_attempts = app.config['AUDIT_MAX_ATTEMPTS']
+        self.retry_delay = app.config['AUDIT_RETRY_DELAY']
+        self.retry_max_delay = app.config['AUDIT_RETRY_MAX_DELAY']
+        self.fallback_file = app.config['AUDIT_FALLBACK_FILE']
+        app.extensions['audit_logger'] = self
+        if self.enabled:
+            _register_session_events()
+            if not self.sync:
+                atexit.register(self.shutdown)
+
+    def enqueue(self, records):
+        """投递审计记录（字典，对应 audit_log 的列）。"""
+        records = list(records)
+        if not records:
+            return
+        if self.sync:
+            self._write_or_fallback(records)
+            return
+        self._ensure_worker()
+        for record in records:
+            self._queue.put(record)
+
+    def flush(self):
+        """等待队列中的记录全部写入。"""
+        if not self.sync:
+            self._queue.join()
+
+    def shutdown(self):
+        """停止后台线程，并在当前线程写入剩余记录。"""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive() and self._worker_pid == os.getpid():
+            # 唤醒退避等待中的后台线程，由其写入或转存正在重试的记录
+            self._stopping.set()
+            self._queue.put(_STOP)
+            worker.join(timeout=10)
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+            self._queue.task_done()
+        if remaining:
+            self._write_or_fallback(remaining)
+
+    def replay_fallback(self):
+        """将备用文件中的记录写回 audit_log，成功后删除备用文件，返回写入条数。"""
+        with self._fallback_lock:
+            if not os.path.exists(self.fallback_file):
+                return 0
+            with open(self.fallback_file, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            for record in records:
+                record['created_at'] = datetime.fromisoformat(record['created_at'])
+            if records:
+                self._write(records)
+            os.remove(self.fallback_file)
+        return len(records)
+
+    def _write_or_fallback(self, records):
+        try:
+            self._write(records)
+        except Exception:
+            logger.exception('审计日志写入失败')
+            self._write_fallback(records)
+
+    def _write_fallback(self, records):
+        try:
+            with self._fallback_lock:
+                os.makedirs(os.path.dirname(self.fallback_file), exist_ok=True)
+                with open(self.fallback_file, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(dict(record, created_at=record['created_at'].isoformat()),
+                                           ensure_ascii=False) + '\n')
+            logger.error('%d 条审计记录已写入备用文件 %s，数据库恢复后执行 flask audit replay-fallback',
+                         len(records), self.fallback_file)
+        except OSError:
+            logger.exception('审计记录无法写入备用文件，丢弃 %d 条记录', len(records))
+
+    def _ensure_worker(self):
+        # gunicorn 预加载时线程不会随 fork 复制，按进程号检查并重新启动
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        batch, attempts = [], 0
+        while True:
+            if not batch:
+                first = self._queue.get()
+                if first is _STOP:
+                    self._queue.task_done()
+                    return
+                batch = [first]
+            stop = False
+            # 攒批：达到批量上限或等待超时后写入
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            except Exception:
+                attempts += 1
+                if attempts < self.max_attempts and not stop:
+                    delay = min(self.retry_delay * 2 ** (attempts - 1), self.retry_max_delay)
+                    logger.exception('审计日志写入失败（第 %d 次），%.1f 秒后重试 %d 条记录',
+                                     attempts, delay, len(batch))
+                    # 记录留在本批中，重试时继续攒入新记录；进程退出时立即结束等待
+                    self._stopping.wait(delay)
+                    continue
+                logger.exception('审计日志写入失败（第 %d 次）', attempts)
+                self._write_fallback(batch)
+            for _ in batch:
+                self._queue.task_done()
+            batch, attempts = [], 0
+            if stop:
+                return
+
+    def _write(self, records):
+        from app.db_engine import is_lock_error
+        from app.models import AuditLog
+
+        with self._write_lock, self.app.app_context():
+            retries = self.app.config.get('DB_LOCK_RETRIES', 5)
+            delay = self.app.config.get('DB_LOCK_RETRY_DELAY', 0.02)
+            for attempt in range(retries + 1):
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(AuditLog.__table__.insert(), records)
+                    return
+                except Exception as e:
+                    if not is_lock_error(e) or attempt >= retries:
+                        raise
+                    time.sleep(delay * (2 ** attempt))
+
+
+def get_audit_logger(app=None):
+    return (app or current_app).extensions['audit_logger']
+
+
+@audit_cli.command('replay-fallback')
+def replay_fallback_command():
+    """将写入失败时转存到 AUDIT_FALLBACK_FILE 的审计记录写回数据库。"""
+    count = get_audit_logger().replay_fallback()
+    click.echo(f'已写回 {count} 条审计记录')
+
+
+def get_history(entity, entity_id, limit=100):
+    """返回某条记录的审计历史，最新的在前。"""
+    from app.models import AuditLog
+
+    return AuditLog.query.filter_by(entity=entity, entity_id=entity_id) \
+        .order_by(AuditLog.id.desc()).limit(limit).all()
+
+
+# ----------------------------------------------------------------------
+# 会话事件：flush 后收集变更，提交后投递
+# ----------------------------------------------------------------------
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'after_flush', _collect_changes)
+    event.listen(db.session, 'after_commit', _dispatch_changes)
+    event.listen(db.session, 'after_rollback', _discard_changes)
+
+    # 提交后属性会过期，直接赋值时 SQLAlchemy 默认不加载旧值；
+    # active_history 使赋值前先加载旧值，属性历史中才有修改前的值
+    from app import models
+    for name in TRACKED_MODELS:
+        model = getattr(models, name)
+        for attr in inspect(model).column_attrs:
+            event.listen(getattr(model, attr.key), 'set', _keep_history, active_history=True)
+    _events_registered = True
+
+
+def _keep_history(target, value, oldvalue, initiator):
+    return value
+
+
+def _collect_changes(session, flush_context):
+    if not has_app_context() or not _enabled():
+        return
+    now = datetime.utcnow()
+    user_id, username = current_actor()
+    pending = session.info.setdefault('audit_pending', [])
+
+    def record(obj, action, changes):
+        pending.append({
+            'entity': obj.__tablename__,
+            'entity_id': inspect(obj).identity[0] if action == 'delete' else obj.id,
+            'action': action,
+            'changes': changes,
+            'user_id': user_id,
+            'username': username,
+            'created_at': now,
+        })
+
+    for obj in session.new:
+        if type(obj).__name__ in TRACKED_MODELS:
+            record(obj, 'create', _snapshot(obj, after=True))
+    for obj in session.dirty:
+        if type(obj).__name__ in TRACKED_MODELS:
+            changes = _diff(obj)
+            if changes:
+                record(obj, 'update', changes)
+    for obj in session.deleted:
+        if type(obj).__name__ in TRACKED_MODELS:
+            record(obj, 'delete', _snapshot(obj, after=False))
+
+
+def _dispatch_changes(session):
+    pending = session.info.pop('audit_pending', None)
+    if not pending or not has_app_context():
+        return
+    audit = current_app.extensions.get('audit_logger')
+    if audit is None:
+        return
+    try:
+        audit.enqueue(pending)
+    except Exception:
+        # 审计失败不影响业务提交
+        logger.exception('审计日志投递失败')
+
+
+def _discard_changes(session):
+    session.info.pop('audit_pending', None)
+
+
+def _enabled():
+    audit = current_app.extensions.get('audit_logger')
+    return audit is not None and audit.enabled
+
+
+def current_actor():
+    """当前请求的登录用户，后台任务和脚本中为 None。"""
+    if not has_request_context():
+        return None, None
+    # 直接读取 Flask-Login 已加载的用户，避免在 flush 过程中触发 user_loader 查询
+    user = getattr(g, '_login_user', None)
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return None, None
+    return user.id, user.username
+
+
+def _columns(obj):
+    for attr in inspect(obj).mapper.column_attrs:
+        if attr.key not in IGNORED_FIELDS:
+            yield attr.key
+
+
+def _snapshot(obj, after):
+    # 只读取已加载的值，避免在 flush 过程中为已删除的记录触发查询
+    loaded = inspect(obj).dict
+    changes = {}
+    for key in _columns(obj):
+        value = REDACTED if key in REDACTED_FIELDS else _json_value(loaded.get(key))
+        changes[key] = [None, value] if after else [value, None]
+    return changes
+
+
+def _diff(obj):
+    state = inspect(obj)
+    changes = {}
+    for key in _columns(obj):
+        history = state.attrs[key].history
+        if not history.has_changes():
+            continue
+        before = history.deleted[0] if history.deleted else None
+        after = history.added[0] if history.added else None
+        if before == after:
+            continue
+        if key in REDACTED_FIELDS:
+            changes[key] = [REDACTED, REDACTED]
+        else:
+            changes[key] = [_json_value(before), _json_value(after)]
+    return changes
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
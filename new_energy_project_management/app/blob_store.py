@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内容寻址文档存储模块
+
+同一份并网批复、环评报告经常被上传到几十个项目中。本模块将文档内容按
+SHA-256哈希命名、按哈希前缀分片存放（blobs/ab/cd/abcd...），相同内容只保存
+一份，由 ProjectDocument 记录通过 DocumentBlob.ref_count 进行引用计数。
+
+- 上传：边接收边计算哈希，内容已存在时直接丢弃临时文件，只增加引用
+- 删除：只释放引用，物理文件由垃圾回收统一清理
+- 垃圾回收：按 ProjectDocument 实际引用重新校正计数，删除无引用的实体文件。上传和关联已有内容时
+  刷新实体文件的修改时间，垃圾回收只删除超过宽限期未被使用的实体，不会删除正在上传、
+  尚未提交引用的内容
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+# 读写文件时的分块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 超过该时长仍未完成的临时文件视为上传中断的残留（秒）
+STALE_TEMP_SECONDS = 3600
+
+# 垃圾回收默认宽限期（秒），见 BLOB_GC_GRACE_SECONDS
+GC_GRACE_SECONDS = 3600
+
+
+class BlobStore:
+    """基于文件系统的内容寻址存储。"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+
+    def path_for(self, sha256):
+        """返回指定哈希对应的实体文件路径（两级前缀分片）。"""
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def touch(self, sha256):
+        """刷新实体文件的修改时间，使垃圾回收在宽限期内保留它；返回文件是否存在。"""
+        try:
+            os.utime(self.path_for(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def idle_since(self, sha256, cutoff):
+        """实体文件的修改时间是否早于 cutoff（时间戳），文件不存在时返回 False。"""
+        try:
+            return os.path.getmtime(self.path_for(sha256)) < cutoff
+        except FileNotFoundError:
+            return False
+
+    def ingest_stream(self, stream):
+        """
+        将数据流写入存储
+
+        Args:
+            stream: 支持 read(size) 的文件对象
+
+        Returns:
+            tuple: (sha256, size, created)，created 表示是否新写入了实体文件
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            sha256 = hasher.hexdigest()
+            created = self._commit_temp(tmp_path, sha256)
+            return sha256, size, created
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def ingest_file(self, path, move=False):
+        """
+        将已有文件纳入存储（用于历史上传文件的迁移）
+
+        Args:
+            path (str): 源文件路径
+            move (bool): 为 True 时尽量以重命名方式移动，避免额外的磁盘占用
+
+        Returns:
+            tuple: (sha256, size, created)
+        """
+        sha256 = hash_file(path)
+        size = os.path.getsize(path)
+        target = self.path_for(sha256)
+
+        if self.touch(sha256):
+            if move:
+                os.remove(path)
+            return sha256, size, False
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if move:
+            try:
+                os.replace(path, target)
+            except OSError:
+                # 跨文件系统时无法直接重命名，退化为复制后删除
+                shutil.copy2(path, target)
+                os.remove(path)
+        else:
+            shutil.copy2(path, target)
+        return sha256, size, True
+
+    def delete(self, sha256):
+        """删除实体文件，返回是否确实删除了文件。"""
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def iter_hashes(self):
+        """遍历存储中的全部实体文件哈希。"""
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix == 'tmp' or len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for sub in os.listdir(prefix_dir):
+                sub_dir = os.path.join(prefix_dir, sub)
+                if not os.path.isdir(sub_dir):
+                    continue
+                for name in os.listdir(sub_dir):
+                    yield name
+
+    def purge_stale_temps(self, max_age=STALE_TEMP_SECONDS):
+        """清理中断上传遗留的临时文件，返回清理数量。"""
+        if not os.path.isdir(self.tmp_dir):
+            return 0
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def _commit_temp(self, tmp_path, sha256):
+        target = self.path_for(sha256)
+        if self.touch(sha256):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # os.replace 是原子操作，并发上传同一内容时结果一致
+        os.replace(tmp_path, target)
+        return True
+
+
+def hash_file(path):
+    """分块计算文件的SHA-256哈希。"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_blob_store(app=None):
+    """获取当前应用的 BlobStore 实例（按应用缓存）。"""
+    app = app or current_app
+    store = app.extensions.get('blob_store')
+    if store is None:
+        store = BlobStore(app.config['BLOB_STORAGE_DIR'])
+        app.extensions['blob_store'] = store
+    return store
+
+
+def acquire_blob(sha256, size):
+    """
+    为一个文档记录增加对实体的引用，实体记录不存在时自动创建
+
+    引用计数使用SQL表达式自增，避免并发上传时读改写丢失更新。
+    调用方负责提交事务。
+    """
+    from app.models import DocumentBlob
+
+    blob = DocumentBlob.query.filter_by(sha256=sha256).first()
+    if blob is None:
+        try:
+            with db.session.begin_nested():
+                blob = DocumentBlob(sha256=sha256, size=size, ref_count=0)
+                db.session.add(blob)
+        except IntegrityError:
+            # 并发请求已创建同一实体记录
+            blob = DocumentBlob.query.filter_by(sha256=sha256).first()
+
+    blob.ref_count = DocumentBlob.ref_count + 1
+    return blob
+
+
+def release_blob(sha256):
+    """释放一个引用，调用方负责提交事务。物理文件由 collect_garbage 清理。"""
+    from app.models import DocumentBlob
+
+    DocumentBlob.query.filter(
+        DocumentBlob.sha256 == sha256,
+        DocumentBlob.ref_count > 0
+    ).update({DocumentBlob.ref_count: DocumentBlob.ref_count - 1},
+             synchronize_session=False)
+
+
+def store_upload(stream):
+    """
+    保存上传的文件内容并登记引用
+
+    Returns:
+        tuple: (sha256, size, created)
+    """
+    store = get_blob_store()
+    sha256, size, created = store.ingest_stream(stream)
+    acquire_blob(sha256, size)
+    return sha256, size, created
+
+
+def collect_garbage(dry_run=False, grace_seconds=None):
+    """
+    垃圾回收：校正引用计数并删除无引用的实体
+
+    以 ProjectDocument 中的实际引用为准重新计算 ref_count，
+    删除引用为0的实体记录与文件，并清理存储中无记录的孤立文件和残留临时文件。
+    上传在写入实体文件之后才提交引用，宽限期内写入或关联过的实体即使没有引用也保留，
+    计入 skipped_recent，由之后的回收处理。
+
+    Args:
+        dry_run (bool): 为 True 时只统计，不做任何修改
+        grace_seconds (float): 宽限期（秒），默认取 BLOB_GC_GRACE_SECONDS
+
+    Returns:
+        dict: 回收统计信息
+    """
+    from app.models import DocumentBlob, ProjectDocument
+
+    store = get_blob_store()
+    if grace_seconds is None:
+        grace_seconds = current_app.config.get('BLOB_GC_GRACE_SECONDS', GC_GRACE_SECONDS)
+    cutoff = time.time() - grace_seconds
+    actual_refs = dict(
+        db.session.query(ProjectDocument.content_hash, func.count(ProjectDocument.id))
+        .filter(ProjectDocument.content_hash.isnot(None))
+        .group_by(ProjectDocument.content_hash)
+        .all()
+    )
+
+    stats = {'corrected': 0, 'deleted_blobs': 0, 'deleted_orphans': 0, 'skipped_recent': 0,
+             'purged_temps': 0, 'freed_bytes': 0}
+
+    known_hashes = set()
+    for blob in DocumentBlob.query.all():
+        known_hashes.add(blob.sha256)
+        refs = actual_refs.get(blob.sha256, 0)
+        if blob.ref_count != refs:
+            stats['corrected'] += 1
+            if not dry_run:
+                blob.ref_count = refs
+        if refs == 0:
+            if store.exists(blob.sha256) and not store.idle_since(blob.sha256, cutoff):
+                stats['skipped_recent'] += 1
+                continue
+            stats['deleted_blobs'] += 1
+            stats['freed_bytes'] += blob.size or 0
+            if not dry_run:
+                store.delete(blob.sha256)
+                db.session.delete(blob)
+
+    for sha256 in list(store.iter_hashes()):
+        if sha256 not in known_hashes:
+            if not store.idle_since(sha256, cutoff):
+                stats['skipped_recent'] += 1
+                continue
+            stats['deleted_orphans'] += 1
+            if not dry_run:
+                path = store.path_for(sha256)
+                stats['freed_bytes'] += os.path.getsize(path)
+                store.delete(sha256)
+
+    if not dry_run:
+        stats['purged_temps'] = store.purge_stale_temps()
+        db.session.commit()
+
+    return stats
+
+
+def migrate_legacy_uploads(dry_run=False, batch_size=100):
+    """
+    将 uploads/projects/<id>/ 下的历史上传文件原地转换为内容寻址存储
+
+    对每个尚未关联哈希的文档记录：计算哈希、将文件复制到存储（内容已存在时不再复制）、
+    更新 file_path/stored_filename/content_hash 并登记引用。每批提交之后才删除该批的源文件，
+    中途中断时未提交的记录仍指向原文件，重新执行即可继续迁移。
+
+    Args:
+        dry_run (bool): 为 True 时只统计，不移动文件也不写数据库
+        batch_size (int): 每批提交的记录数
+
+    Returns:
+        dict: 迁移统计信息
+    """
+    from app.models import ProjectDocument
+
+    store = get_blob_store()
+    stats = {'migrated': 0, 'deduplicated': 0, 'missing': 0, 'saved_bytes': 0}
+
+    documents = ProjectDocument.query.filter(
+        ProjectDocument.content_hash.is_(None)
+    ).order_by(ProjectDocument.id).all()
+
+    legacy_dirs = set()
+    committed_sources = []
+    for index, document in enumerate(documents, start=1):
+        source = document.file_path
+        if not source or not os.path.exists(source):
+            stats['missing'] += 1
+            continue
+
+        if dry_run:
+            sha256 = hash_file(source)
+            if store.exists(sha256):
+                stats['deduplicated'] += 1
+                stats['saved_bytes'] += os.path.getsize(source)
+            stats['migrated'] += 1
+            continue
+
+        legacy_dirs.add(os.path.dirname(os.path.abspath(source)))
+        sha256, size, created = store.ingest_file(source)
+        if not created:
+            stats['deduplicated'] += 1
+            stats['saved_bytes'] += size
+
+        acquire_blob(sha256, size)
+        document.content_hash = sha256
+        document.stored_filename = sha256
+        document.file_path = store.path_for(sha256)
+        document.file_size = size
+        stats['migrated'] += 1
+        committed_sources.append(source)
+
+        if index % batch_size == 0:
+            db.session.commit()
+            _remove_files(committed_sources)
+
+    if not dry_run:
+        db.session.commit()
+        _remove_files(committed_sources)
+        # 删除迁移后已经为空的旧项目目录
+        for directory in legacy_dirs:
+            if os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+
+    return stats
+
+
+def _remove_files(paths):
+    """删除已提交迁移的源文件并清空列表。"""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    paths.clear()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多年现金流：按项目所处阶段展开投入和收益，计算净现值、内部收益率和投资回收期
+
+ProfitCalculator 只给出静态的收益总额，这里按年把它们放到时间轴上（第 0 年为当前，
+现金流发生在各年年初）：
+
+- 投入：按标准造价模型计算的工程总造价（或收益分析中的登品投入），按项目类型的
+  CONSTRUCTION_SCHEDULES 比例在建设期各年投入，建设期从进入建设执行阶段开始
+- 委托费收益、资源费分成：按 COMMISSION_MILESTONES、RESOURCE_SHARE_MILESTONES 的比例在进入
+  各阶段时收取
+- 各阶段从进入起持续 STAGE_PERIODS 年（建设执行阶段为建设期年数）。时间轴从项目当前阶段开始，
+  当前阶段按刚进入计算：该阶段的里程碑收益在第 0 年计入，阶段内的投入全部计入（没有建设进度数据）；
+  之前各阶段的投入和收益都视为已经发生，不再计入。并网运营的项目只有第 0 年的并网里程碑收益
+
+同一 (项目类型, 阶段) 的现金流是投入、委托费收益和资源费分成三项的线性组合，先生成各组合的模板
+再对整个组合做矩阵运算。内部收益率用向量化 Newton 法求解：先在 _IRR_GRID 的折现率上找净现值
+变号的区间，Newton 步超出区间时改为二分；没有变号（例如只有收益或只有投入）时为空。
+
+各项目的结果按输入（项目类型、阶段、投入、两项收益、折现率）的哈希缓存在 CashFlowCache（app.cash_flow_cache）中，
+输入不变的项目不再重新计算；组合汇总每次按各组合模板加总。
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app.cash_flow_cache import get_cash_flow_cache
+from app.consistency import fetch_columns, profit_results
+from app.lifecycle import STAGES
+from app.portfolio_optimizer import COST_BASES, investment_costs
+from app.revenue_share import get_revenue_share_schedules
+
+# 默认折现率
+DEFAULT_RATE = 0.08
+
+# 建设执行之前各阶段的持续年数
+STAGE_PERIODS = {'机会挖掘': 1, '前期开发': 1, '投资决策': 1}
+
+# 项目类型 -> 建设期各年的投入比例
+CONSTRUCTION_SCHEDULES = {'集中式光伏': (1.0,), '陆上风电': (0.4, 0.6)}
+DEFAULT_CONSTRUCTION_SCHEDULE = (1.0,)
+
+# 进入各阶段时收取的委托费收益、资源费分成比例
+COMMISSION_MILESTONES = {'投资决策': 0.3, '建设执行': 0.4, '并网运营': 0.3}
+RESOURCE_SHARE_MILESTONES = {'建设执行': 0.5, '并网运营': 0.5}
+
+# 查找内部收益率变号区间的折现率，以及 Newton 迭代的次数上限和收敛精度
+_IRR_GRID = np.array([-0.99, -0.9, -0.75, -0.5, -0.25, 0.0, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+                      1.0, 2.0, 5.0, 10.0, 100.0])
+_IRR_MAX_ITERATIONS = 100
+_IRR_TOLERANCE = 1e-12
+
+
+# ----------------------------------------------------------------------
+# 现金流
+# ----------------------------------------------------------------------
+
+def flow_template(project_type, stage):
+    """
+    从阶段 stage 开始的单位现金流模板
+
+    Returns:
+        np.ndarray: 形状为 (3, 年数)，三行分别为投入（按 1 万元投入的比例）、委托费收益和资源费分成
+            在各年的比例；阶段不在 STAGES 中时为 None
+    """
+    if stage not in STAGES:
+        return None
+    schedule = CONSTRUCTION_SCHEDULES.get(project_type, DEFAULT_CONSTRUCTION_SCHEDULE)
+    durations = dict(STAGE_PERIODS, 建设执行=len(schedule))
+    current = STAGES.index(stage)
+    entered, start = {}, 0
+    for name in STAGES[current:]:
+        entered[name] = start
+        start += durations.get(name, 0)
+
+    periods = entered[STAGES[-1]] + 1
+    if '建设执行' in entered:
+        periods = max(periods, entered['建设执行'] + len(schedule))
+    template = np.zeros((3, periods))
+    if '建设执行' in entered:
+        template[0, entered['建设执行']:entered['建设执行'] + len(schedule)] = schedule
+    for row, milestones in ((1, COMMISSION_MILESTONES), (2, RESOURCE_SHARE_MILESTONES)):
+        for name, share in milestones.items():
+            # 与投入一致：当前阶段的收益在时间轴内，之前阶段的收益已经收取
+            if name in entered:
+                template[row, entered[name]] += share
+    return template
+
+
+def _templates(project_types, stages):
+    """各行所属的 (项目类型, 阶段) 组合序号和补齐到相同年数的模板，阶段无效的行序号为 -1。"""
+    type_codes, type_values = pd.factorize(pd.Series(project_types, dtype=object), use_na_sentinel=False)
+    stage_codes, stage_values = pd.factorize(pd.Series(stages, dtype=object), use_na_sentinel=False)
+    combined, groups = np.unique(type_codes * max(len(stage_values), 1) + stage_codes, return_inverse=True)
+    unique = [(type_values[code // max(len(stage_values), 1)], stage_values[code % max(len(stage_values), 1)])
+              for code in combined]
+    templates = [flow_template(project_type, stage) for project_type, stage in unique]
+    periods = max([template.shape[1] for template in templates if template is not None], default=1)
+    stacked = np.zeros((len(templates), 3, periods))
+    for index, template in enumerate(templates):
+        if template is None:
+            groups[groups == index] = -1
+        else:
+            stacked[index, :, :template.shape[1]] = template
+    return groups, stacked
+
+
+def project_flows(project_types, stages, costs, commission_income, resource_income):
+    """
+    各项目从当前阶段开始的年度净现金流（万元）
+
+    Args:
+        project_types, stages: 各项目的类型和当前阶段
+        costs (array): 投入（万元）
+        commission_income, resource_income (array): ProfitCalculator 计算的委托费收益和资源费分成（万元）
+
+    Returns:
+        np.ndarray: 形状为 (项目数, 年数)，阶段无效的项目为 NaN
+    """
+    groups, templates = _templates(project_types, stages)
+    return _combine(groups, templates, costs, commission_income, resource_income)
+
+
+def _combine(groups, templates, costs, commission_income, resource_income):
+    amounts = np.column_stack([-np.asarray(costs, dtype=float), np.asarray(commission_income, dtype=float),
+                               np.asarray(resource_income, dtype=float)])
+    flows = np.einsum('nk,nkt->nt', amounts, templates[np.maximum(groups, 0)]) if len(groups) \
+        else np.zeros((0, templates.shape[2]))
+    flows[groups < 0] = np.nan
+    return flows
+
+
+# ----------------------------------------------------------------------
+# 指标
+# ----------------------------------------------------------------------
+
+def _check_rate(rate):
+    rate = float(rate)
+    if not rate > -1:
+        raise ValueError(f'折现率必须大于 -1：{rate}')
+    return rate
+
+
+def npv(flows, rate):
+    """各行现金流（第 t 列发生在第 t 年年初）按折现率 rate 的净现值。"""
+    flows = np.atleast_2d(np.asarray(flows, dtype=float))
+    factors = (1 + _check_rate(rate)) ** -np.arange(flows.shape[1], dtype=float)
+    return flows @ factors
+
+
+def irr(flows):
+    """
+    各行现金流的内部收益率（使净现值为 0 的折现率）
+
+    在 _IRR_GRID 上找净现值最先变号的区间，在区间内做 Newton 迭代，迭代点超出区间时取中点；
+    区间随每次迭代的符号收缩，因此总能收敛。没有变号时为 NaN。
+    """
+    flows = np.atleast_2d(np.asarray(flows, dtype=float))
+    n, periods = flows.shape
+    t = np.arange(periods, dtype=float)
+    result = np.full(n, np.nan)
+    # 全为 0 的现金流在任何折现率下净现值都为 0，没有意义
+    valid = np.flatnonzero(~np.isnan(flows).any(axis=1) & (flows != 0).any(axis=1))
+    if not len(valid):
+        return result
+
+    values = flows[valid] @ ((1 + _IRR_GRID)[None, :] ** -t[:, None])
+    exact = values == 0
+    changes = (np.sign(values[:, :-1]) * np.sign(values[:, 1:]) < 0) | exact[:, :-1]
+    changes = np.column_stack([changes, exact[:, -1]])
+    has_root = changes.any(axis=1)
+    first = changes.argmax(axis=1)
+    # 网格点上恰好为 0
+    on_grid = has_root & exact[np.arange(len(valid)), first]
+    result[valid[on_grid]] = _IRR_GRID[first[on_grid]]
+
+    active = np.flatnonzero(has_root & ~on_grid)
+    rows = valid[active]
+    lo, hi = _IRR_GRID[first[active]], _IRR_GRID[first[active] + 1]
+    lo_sign = np.sign(values[active, first[active]])
+    x = (lo + hi) / 2
+    for _ in range(_IRR_MAX_ITERATIONS):
+        if not len(rows):
+            break
+        discount = (1 + x)[:, None] ** -t
+        f = (flows[rows] * discount).sum(axis=1)
+        df = -(flows[rows] * t * discount).sum(axis=1) / (1 + x)
+        below = np.sign(f) == lo_sign
+        lo = np.where(below, x, lo)
+        hi = np.where(below, hi, x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(df != 0, f / df, np.nan)
+        candidate = x - step
+        inside = (candidate > lo) & (candidate < hi)
+        candidate = np.where(inside, candidate, (lo + hi) / 2)
+        done = (f == 0) | (np.abs(candidate - x) <= _IRR_TOLERANCE * (1 + np.abs(x))) | (hi - lo <= _IRR_TOLERANCE)
+        result[rows[done]] = np.where(f[done] == 0, x[done], candidate[done])
+        keep = ~done
+        rows, lo, hi, lo_sign, x = rows[keep], lo[keep], hi[keep], lo_sign[keep], candidate[keep]
+    result[rows] = x
+    return result
+
+
+def payback_period(flows):
+    """
+    各行现金流的静态投资回收期（年）：累计现金流最后一次为负之后转为非负的时点，年内按线性插值
+
+    累计现金流始终非负时为 0，最后仍为负时为 NaN。
+    """
+    flows = np.atleast_2d(np.asarray(flows, dtype=float))
+    n, periods = flows.shape
+    cumulative = np.cumsum(flows, axis=1)
+    negative = cumulative < 0
+    result = np.zeros(n)
+    last = periods - 1 - negative[:, ::-1].argmax(axis=1)
+    has_negative = negative.any(axis=1)
+    never = has_negative & (last == periods - 1)
+    invalid = never | np.isnan(flows).any(axis=1)
+    result[invalid] = np.nan
+    rows = np.flatnonzero(has_negative & ~invalid)
+    k = last[rows]
+    result[rows] = k - cumulative[rows, k] / flows[rows, k + 1]
+    return result
+
+
+def cash_flow_metrics(flows, rate=DEFAULT_RATE):
+    """各行现金流的 npv、irr、payback_years。"""
+    return {'npv': npv(flows, rate), 'irr': irr(flows), 'payback_years': payback_period(flows)}
+
+
+# ----------------------------------------------------------------------
+# 组合计算
+# ----------------------------------------------------------------------
+
+def input_hashes(project_types, stages, costs, commission_income, resource_income):
+    """各项目现金流输入的 64 位哈希。"""
+    frame = pd.DataFrame({'project_type': pd.Series(project_types, dtype=object),
+                          'stage': pd.Series(stages, dtype=object),
+                          'cost': np.asarray(costs, dtype=float),
+                          'commission_income': np.asarray(commission_income, dtype=float),
+                          'resource_income': np.asarray(resource_income, dtype=float)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def cached_metrics(project_types, stages, costs, commission_income, resource_income, rate=DEFAULT_RATE,
+                   cache=None):
+    """
+    各项目的 npv、irr、payback_years，只计算缓存中没有的项目
+
+    Returns:
+        dict: 各指标数组，以及 computed（本次重新计算的项目数）
+    """
+    rate = _check_rate(rate)
+    cache = cache if cache is not None else get_cash_flow_cache()
+    keys = [(rate, key) for key in input_hashes(project_types, stages, costs, commission_income,
+                                                resource_income).tolist()]
+    found = cache.get_many(keys)
+    metrics = np.full((len(keys), 3), np.nan)
+    missing = np.array([value is None for value in found], dtype=bool)
+    hits = np.flatnonzero(~missing)
+    if len(hits):
+        metrics[hits] = [found[i] for i in hits]
+
+    rows = np.flatnonzero(missing)
+    if len(rows):
+        flows = project_flows(np.asarray(project_types, dtype=object)[rows], np.asarray(stages, dtype=object)[rows],
+                              np.asarray(costs, dtype=float)[rows], np.asarray(commission_income, dtype=float)[rows],
+                              np.asarray(resource_income, dtype=float)[rows])
+        computed = cash_flow_metrics(flows, rate)
+        metrics[rows] = np.column_stack([computed['npv'], computed['irr'], computed['payback_years']])
+        cache.put_many([keys[i] for i in rows], [tuple(row) for row in metrics[rows].tolist()])
+    return {'npv': metrics[:, 0], 'irr': metrics[:, 1], 'payback_years': metrics[:, 2],
+            'computed': int(len(rows))}
+
+
+def portfolio_cash_flow(rate=DEFAULT_RATE, cost_basis='investment', stages=None, project_ids=None,
+                        include_flows=False):
+    """
+    各项目（取最新的收益分析）和整个组合的现金流指标
+
+    Args:
+        rate (float): 折现率
+        cost_basis (str): 投入口径，见 app.portfolio_optimizer.COST_BASES
+        stages (tuple): 只计算处于这些阶段的项目，为空时不限
+        project_ids (list): 只计算这些项目
+        include_flows (bool): 是否返回各项目的年度现金流
+
+    Returns:
+        dict: portfolio（组合的年度现金流和指标）、projects（各项目的投入、收益和指标），
+            缺少投入或收益、阶段无效的项目不参与计算，计入 skipped
+    """
+    from app.models import ProfitAnalysis as A, Project
+
+    rate = _check_rate(rate)
+    if cost_basis not in COST_BASES:
+        raise ValueError(f'不支持的投入口径：{cost_basis}，可选 {", ".join(COST_BASES)}')
+
+    query = (select(A.project_id, Project.name, Project.project_type, Project.current_stage, Project.capacity_mw,
+                    A.dev_fee_rate, A.extra_investment, A.resource_fee_total, A.dengpin_cost,
+                    A.revenue_share_schedule_id, A.total_project_cost)
+             .join(Project, Project.id == A.project_id).order_by(A.project_id, A.id))
+    if stages:
+        query = query.where(Project.current_stage.in_(stages))
+    if project_ids is not None:
+        query = query.where(A.project_id.in_(project_ids))
+    columns = fetch_columns(query, (np.int64, object, object, object) + (float,) * 7)
+    # 每个项目取最新的收益分析
+    ids = columns[0]
+    last = len(ids) - 1 - np.unique(ids[::-1], return_index=True)[1]
+    (ids, names, project_types, current_stages, capacity, dev_fee_rate, extra, fee, dengpin,
+     schedule_ids, stored_costs) = (column[last] for column in columns)
+
+    schedules = get_revenue_share_schedules().compiled_by_id(np.unique(schedule_ids[~np.isnan(schedule_ids)]))
+    results = profit_results(capacity, dev_fee_rate, extra, fee, dengpin, schedule_ids=schedule_ids,
+                             schedules=schedules)
+    commission, resource = results['commission_income'], results['resource_income']
+    if cost_basis == 'investment':
+        costs = investment_costs(project_types, capacity, stored_costs)
+    else:
+        costs = np.nan_to_num(dengpin)
+    valid = (~np.isnan(costs) & ~np.isnan(commission) & ~np.isnan(resource)
+             & np.isin(current_stages, STAGES))
+    rows = np.flatnonzero(valid)
+    project_types, current_stages = project_types[rows], current_stages[rows]
+    costs, commission, resource = costs[rows], commission[rows], resource[rows]
+
+    metrics = cached_metrics(project_types, current_stages, costs, commission, resource, rate)
+    groups, templates = _templates(project_types, current_stages)
+    # 组合现金流：各 (项目类型, 阶段) 组合的投入和收益之和乘以模板
+    totals = np.zeros((len(templates), 3))
+    for column, amounts in enumerate((-costs, commission, resource)):
+        np.add.at(totals[:, column], groups, amounts)
+    portfolio_flows = np.einsum('gk,gkt->t', totals, templates)
+    portfolio = cash_flow_metrics(portfolio_flows, rate)
+    flows = _combine(groups, templates, costs, commission, resource) if include_flows else None
+
+    projects = []
+    for j, i in enumerate(rows):
+        project = {'project_id': int(ids[i]), 'name': names[i], 'project_type': project_types[j],
+                   'current_stage': current_stages[j], 'cost': float(costs[j]),
+                   'commission_income': float(commission[j]), 'resource_income': float(resource[j]),
+                   'npv': _rounded(metrics['npv'][j], 2), 'irr': _rounded(metrics['irr'][j], 6),
+                   'payback_years': _rounded(metrics['payback_years'][j], 2)}
+        if include_flows:
+            project['flows'] = [round(float(value), 2) for value in flows[j]]
+        projects.append(project)
+    return {
+        'rate': rate,
+        'cost_basis': cost_basis,
+        'periods': int(templates.shape[2]),
+        'computed': metrics['computed'],
+        'skipped': int((~valid).sum()),
+        'portfolio': {'flows': [round(float(value), 2) for value in portfolio_flows],
+                      'npv': _rounded(portfolio['npv'][0], 2), 'irr': _rounded(portfolio['irr'][0], 6),
+                      'payback_years': _rounded(portfolio['payback_years'][0], 2)},
+        'projects': projects,
+    }
+
+
+def _rounded(value, digits):
+    return None if np.isnan(value) else round(float(value), digits)
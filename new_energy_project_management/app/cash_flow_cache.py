@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目现金流指标缓存
+
+app.cash_flow 计算的各项目净现值、内部收益率和投资回收期按输入哈希缓存。输入（项目类型、阶段、
+投入、收益、折现率）变化后哈希随之变化，旧条目按 LRU 淘汰，不需要失效。与计算分开放在这里，
+create_app 注册缓存时不加载 numpy/pandas。
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class CashFlowCache:
+    """按输入哈希缓存的各项目现金流指标（LRU），CASH_FLOW_CACHE_SIZE 为 0 时关闭。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CASH_FLOW_CACHE_SIZE', 100000)
+        self.app = app
+        self.max_size = app.config['CASH_FLOW_CACHE_SIZE']
+        app.extensions['cash_flow_cache'] = self
+
+    def get_many(self, keys):
+        """返回与 keys 等长的列表，未缓存的为 None。"""
+        if self.max_size <= 0:
+            return [None] * len(keys)
+        found = []
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                found.append(value)
+        return found
+
+    def put_many(self, keys, values):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_cash_flow_cache(app=None):
+    return (app or current_app).extensions['cash_flow_cache']
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+存量计算结果的一致性校验（向量化）
+
+ProjectCostDetail.total_cost、ProfitAnalysis.total_project_cost 以及收益分析结果
+（commission_income、resource_income、total_income、net_profit、roi_percentage）都是保存下来的
+计算结果，在所属页面之外修改装机容量或输入参数后就会过期。本模块按项目 id 区间分块读取，
+用 numpy 对整块数据按与 ProjectCostDetail.compute_total_cost、ProfitCalculator 相同的公式和
+舍入规则（Decimal ROUND_HALF_UP 到分）重新计算，找出超出允许误差的记录：
+
+- costs：成本明细总成本与按项目当前装机容量重新计算的结果
+- totals：收益分析中的项目总造价与重新计算后的成本明细之和（没有成本明细的项目不检查）
+- profits：收益分析结果与按输入参数重新计算的结果（与收益分析页面一致：费率为空或 0 时取默认费率，
+  ROI 无法计算时为 0）
+
+每块只读取数值列，不加载 ORM 对象；flask portfolio verify / recompute-* 命令（app/portfolio_cli.py）
+在此基础上分块提交修正，可作为定时任务运行。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.revenue_share import get_revenue_share_schedules
+
+# 已保存的值与重新计算结果的允许误差（万元、%），金额保存到分
+TOLERANCE = 0.005
+
+# 收益分析中由 ProfitCalculator 计算的结果字段
+PROFIT_FIELDS = ('commission_income', 'resource_income', 'total_income', 'net_profit', 'roi_percentage')
+
+# 检查名称 -> 说明，按此顺序执行和报告
+CHECKS = {'costs': '成本明细', 'totals': '项目总造价', 'profits': '收益分析'}
+
+Diff = namedtuple('Diff', 'entity entity_id project_id field stored expected')
+
+# 成本明细单位 -> 每 MW 的总成本系数（万元 = 单价 × 系数 × 装机容量）；'万元' 为固定成本
+UNIT_CAPACITY_FACTORS = {'元/W': 100.0, '万元/MW': 1.0}
+FIXED_COST_UNIT = '万元'
+
+# 浮点运算误差补偿（以分为单位）。输入的小数位有限时，精确值到舍入边界的距离远大于该值，
+# 舍入结果与 Decimal 计算一致
+_ROUNDING_EPSILON = 1e-6
+
+
+def round_half_up(values):
+    """按 ROUND_HALF_UP 保留 2 位小数（向量化），与 Decimal.quantize(Decimal('0.01')) 一致。"""
+    values = np.asarray(values, dtype=float)
+    return np.copysign(np.floor(np.abs(values) * 100 + 0.5 + _ROUNDING_EPSILON) / 100, values)
+
+
+def cost_item_totals(unit_costs, unit_labels, capacities):
+    """ProjectCostDetail.compute_total_cost 的向量化版本，返回各成本项总成本（万元）。"""
+    labels, index = np.unique(np.asarray(unit_labels, dtype=object).astype(str), return_inverse=True)
+    factors = np.array([UNIT_CAPACITY_FACTORS.get(label, 0.0) for label in labels], dtype=float)[index]
+    fixed = (labels == FIXED_COST_UNIT)[index]
+    return round_half_up(np.asarray(unit_costs, dtype=float) * np.where(fixed, 1.0, factors * capacities))
+
+
+def profit_results(capacity_mw, dev_fee_rate, extra_investment, resource_fee_total, dengpin_cost,
+                   schedule_ids=None, schedules=None):
+    """
+    ProfitCalculator.calculate_comprehensive_profit_analysis 的向量化版本
+
+    参数为等长数组，空值（NaN）按收益分析页面的方式处理。schedule_ids 为各行的资源费分成方案 id，
+    schedules 为 id -> CompiledSchedule（见 app.revenue_share），未指定或为空值时按默认分级。
+
+    Returns:
+        dict: PROFIT_FIELDS 中各字段 -> 数组
+    """
+    from app.profit_calculator import ProfitCalculator as P
+    from app.revenue_share import share_batch
+
+    capacity_mw = np.asarray(capacity_mw, dtype=float)
+    dev_fee_rate = np.asarray(dev_fee_rate, dtype=float)
+    extra_investment = np.nan_to_num(np.asarray(extra_investment, dtype=float))
+    fee = np.nan_to_num(np.asarray(resource_fee_total, dtype=float))
+    dengpin_cost = np.nan_to_num(np.asarray(dengpin_cost, dtype=float))
+
+    # 委托费收益：容量(MW)×10^6×费率(元/W)/10^4 - 额外投资，不小于 0
+    rate = np.where(np.isnan(dev_fee_rate) | (dev_fee_rate == 0), float(P.DEFAULT_DEV_FEE_RATE), dev_fee_rate)
+    commission = round_half_up(np.maximum(0.0, capacity_mw * rate * 100 - extra_investment))
+
+    # 资源费分成：按各行的分成方案在累计断点上 searchsorted
+    resource = round_half_up(share_batch(fee, schedule_ids, schedules))
+
+    total = round_half_up(commission + resource)
+    invested = dengpin_cost > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(invested, round_half_up((total - dengpin_cost) / dengpin_cost * 100), 0.0)
+    net_profit = np.where(invested, total - dengpin_cost, total)
+    return dict(zip(PROFIT_FIELDS, (commission, resource, total, net_profit, roi)))
+
+
+def check_projects(first_id, last_id, names=tuple(CHECKS), tolerance=TOLERANCE):
+    """
+    重新计算 id 在 [first_id, last_id] 区间内项目的存量结果，返回超出允许误差的差异
+
+    Args:
+        first_id (int): 区间起点（含）
+        last_id (int): 区间终点（含）
+        names (tuple): 要执行的检查，CHECKS 的子集
+        tolerance (float): 允许误差
+
+    Returns:
+        dict: 检查名称 -> Diff 列表
+    """
+    from app.models import ProfitAnalysis as A, Project, ProjectCostDetail as D
+
+    results = {name: [] for name in names}
+
+    if 'costs' in names or 'totals' in names:
+        detail_ids, project_ids, unit_costs, unit_labels, stored, capacities = fetch_columns(
+            select(D.id, D.project_id, D.unit_cost, D.unit_label, D.total_cost, Project.capacity_mw)
+            .join(Project, Project.id == D.project_id)
+            .where(D.project_id.between(first_id, last_id)).order_by(D.project_id, D.id),
+            (np.int64, np.int64, float, object, float, float))
+        valid = ~np.isnan(unit_costs) & ~np.isnan(capacities)
+        detail_ids, project_ids, stored = detail_ids[valid], project_ids[valid], stored[valid]
+        expected = cost_item_totals(unit_costs[valid], unit_labels[valid], capacities[valid])
+
+        if 'costs' in names:
+            results['costs'] = _mismatches('project_cost_detail', 'total_cost', detail_ids, project_ids,
+                                           stored, expected, tolerance)
+        if 'totals' in names:
+            # 同一项目按明细 id 顺序逐项累加，与收益分析页面的 sum() 结果相同
+            detail_projects, index = np.unique(project_ids, return_inverse=True)
+            sums = np.bincount(index, weights=expected, minlength=len(detail_projects))
+            analysis_ids, analysis_projects, stored_totals = fetch_columns(
+                select(A.id, A.project_id, A.total_project_cost)
+                .join(Project, Project.id == A.project_id)
+                .where(A.project_id.between(first_id, last_id)).order_by(A.project_id, A.id),
+                (np.int64, np.int64, float))
+            has_details = np.isin(analysis_projects, detail_projects)
+            position = np.searchsorted(detail_projects, analysis_projects[has_details])
+            results['totals'] = _mismatches('profit_analysis', 'total_project_cost', analysis_ids[has_details],
+                                            analysis_projects[has_details], stored_totals[has_details],
+                                            sums[position], tolerance)
+
+    if 'profits' in names:
+        columns = fetch_columns(
+            select(A.id, A.project_id, Project.capacity_mw, A.dev_fee_rate, A.extra_investment,
+                   A.resource_fee_total, A.dengpin_cost, A.revenue_share_schedule_id,
+                   *[getattr(A, field) for field in PROFIT_FIELDS])
+            .join(Project, Project.id == A.project_id)
+            .where(A.project_id.between(first_id, last_id)).order_by(A.project_id, A.id),
+            (np.int64, np.int64) + (float,) * (6 + len(PROFIT_FIELDS)))
+        valid = ~np.isnan(columns[2]) & (columns[2] != 0)
+        analysis_ids, project_ids, *inputs, schedule_ids = [column[valid] for column in columns[:8]]
+        schedules = get_revenue_share_schedules().compiled_by_id(np.unique(schedule_ids[~np.isnan(schedule_ids)]))
+        expected = profit_results(*inputs, schedule_ids=schedule_ids, schedules=schedules)
+        diffs = []
+        for field, stored in zip(PROFIT_FIELDS, columns[8:]):
+            diffs.extend(_mismatches('profit_analysis', field, analysis_ids, project_ids, stored[valid],
+                                     expected[field], tolerance))
+        diffs.sort(key=lambda diff: (diff.project_id, diff.entity_id, PROFIT_FIELDS.index(diff.field)))
+        results['profits'] = diffs
+    return results
+
+
+def fetch_columns(query, dtypes):
+    """执行查询，按列返回 numpy 数组（空值转为 NaN 或 None）。"""
+    # 经 Connection 执行，跳过 ORM 结果处理
+    rows = db.session.connection().execute(query).all()
+    columns = list(zip(*rows)) if rows else [()] * len(dtypes)
+    return [np.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes)]
+
+
+def _mismatches(entity, field, entity_ids, project_ids, stored, expected, tolerance):
+    stored_missing = np.isnan(stored)
+    expected_missing = np.isnan(expected)
+    with np.errstate(invalid='ignore'):
+        close = np.abs(stored - expected) <= tolerance
+    bad = np.flatnonzero(np.where(stored_missing | expected_missing, stored_missing != expected_missing, ~close))
+    return [Diff(entity, int(entity_ids[i]), int(project_ids[i]), field,
+                 None if stored_missing[i] else float(stored[i]),
+                 None if expected_missing[i] else float(expected[i]))
+            for i in bad]
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+造价模型版本
+
+CostModel 是按项目类型的"当前"造价模型，CostModelVersion 是它的不可变快照：
+
+- 新增造价模型，或修改 project_type、unit_cost_label、cost_items、cost_details 并 flush 时，
+  before_flush 事件自动追加一个版本（写时复制），CostModel.current_version 指向最新版本。
+  JSON 参数需要整体赋值，原地修改字典不会被识别为修改
+- 成本估算生成的 ProjectCostDetail 和 ProfitAnalysis 记录所使用的版本，历史估算可以按原版本复现
+- 版本不可修改（SQLite 上由触发器拒绝 UPDATE），同一版本 id 对同一容量的计算结果永远相同，
+  CostVersionCache 按 (版本id, 装机容量) 缓存造价，报表重复导出时不再重复计算；
+  outdated_analyses 找出估算版本已不是当前版本的收益分析，只需重算这些项目
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, func, inspect
+
+from app import db
+
+# 变化时生成新版本的字段
+VERSIONED_FIELDS = ('project_type', 'unit_cost_label', 'cost_items', 'cost_details')
+
+
+class CostVersionCache:
+    """按版本缓存的造价计算结果（LRU），COST_VERSION_CACHE_SIZE 为 0 时关闭。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COST_VERSION_CACHE_SIZE', 100000)
+        self.app = app
+        self.max_size = app.config['COST_VERSION_CACHE_SIZE']
+        app.extensions['cost_version_cache'] = self
+        _register_session_events()
+
+    def total_cost(self, version, capacity_mw):
+        """版本 version 下装机容量为 capacity_mw 的项目总造价（万元）。"""
+        return self._get(('total', version.id, capacity_mw), lambda: version.calculate_total_cost(capacity_mw))
+
+    def cost_breakdown(self, version, capacity_mw):
+        """版本 version 下的分类造价，返回副本，调用方可以修改。"""
+        breakdown = self._get(('breakdown', version.id, capacity_mw), lambda: version.get_cost_breakdown(capacity_mw))
+        return dict(breakdown)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, compute):
+        if self.max_size <= 0 or key[1] is None:
+            return compute()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+
+def get_cost_version_cache(app=None):
+    return (app or current_app).extensions['cost_version_cache']
+
+
+def current_versions():
+    """项目类型 -> 当前造价模型版本。"""
+    from app.models import CostModel, CostModelVersion
+
+    rows = db.session.query(CostModel.project_type, CostModelVersion) \
+        .join(CostModelVersion, CostModel.current_version_id == CostModelVersion.id)
+    return {project_type: version for project_type, version in rows}
+
+
+def version_for_project(project, profit_analysis=None):
+    """
+    项目报告使用的造价模型版本：已有收益分析时取估算时的版本，以复现当时的结果，否则取当前版本
+
+    Returns:
+        CostModelVersion: 没有对应的造价模型时返回 None
+    """
+    from app.models import CostModel
+
+    if profit_analysis is not None and profit_analysis.cost_model_version is not None:
+        return profit_analysis.cost_model_version
+    cost_model = CostModel.query.filter_by(project_type=project.project_type).first()
+    return cost_model.current_version if cost_model else None
+
+
+def outdated_analyses():
+    """估算时使用的造价模型版本不是当前版本（或未记录版本）的收益分析查询。"""
+    from app.models import CostModel, ProfitAnalysis, Project
+
+    return ProfitAnalysis.query.join(Project, ProfitAnalysis.project_id == Project.id) \
+        .join(CostModel, CostModel.project_type == Project.project_type) \
+        .filter(db.or_(ProfitAnalysis.cost_model_version_id.is_(None),
+                       ProfitAnalysis.cost_model_version_id != CostModel.current_version_id))
+
+
+# ----------------------------------------------------------------------
+# 会话事件：造价模型新增或修改时生成版本
+# ----------------------------------------------------------------------
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'before_flush', _create_versions)
+    _events_registered = True
+
+
+def _create_versions(session, flush_context, instances):
+    from app.models import CostModel
+
+    changed = [obj for obj in session.new if isinstance(obj, CostModel)]
+    changed += [obj for obj in session.dirty if isinstance(obj, CostModel) and _params_changed(obj)]
+    for model in changed:
+        _add_version(session, model)
+
+
+def _params_changed(model):
+    state = inspect(model)
+    return any(state.attrs[key].history.has_changes() for key in VERSIONED_FIELDS)
+
+
+def _add_version(session, model):
+    from app.audit import current_actor
+    from app.models import CostModelVersion
+
+    number = 1
+    if model.id is not None:
+        with session.no_autoflush:
+            latest = session.query(func.max(CostModelVersion.version)) \
+                .filter(CostModelVersion.cost_model_id == model.id).scalar()
+        number = (latest or 0) + 1
+    version = CostModelVersion(
+        cost_model=model,
+        version=number,
+        project_type=model.project_type,
+        cost_items=model.cost_items,
+        cost_details=model.cost_details,
+        unit_cost_label=model.unit_cost_label,
+        created_by=current_actor()[0],
+    )
+    session.add(version)
+    model.current_version = version
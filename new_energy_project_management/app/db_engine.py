@@ -0,0 +1,205 @@
+"""
+数据库引擎配置
+
+SQLite 在多个 gunicorn 工作进程下默认的回滚日志模式会让写事务互相阻塞、读请求等待写锁，
+容易出现 "database is locked"。这里在每个新连接上设置 PRAGMA：
+
+- journal_mode=WAL：读写互不阻塞，写事务只需追加日志
+- synchronous=NORMAL：WAL 模式下仍保证一致性，提交时不再每次 fsync
+- mmap_size / cache_size：减少读取时的系统调用和页缓存未命中
+- busy_timeout：遇到锁时等待而不是立即失败
+
+WAL 下读事务升级为写事务时如果快照已过期，SQLite 会立即返回 SQLITE_BUSY 而不等待，
+因此写操作通过 commit_with_retry 执行：锁冲突时回滚、按指数退避重新执行整个写单元。
+
+连接池（PostgreSQL、MySQL 等服务端数据库生效，SQLite 保持 Flask-SQLAlchemy 的默认连接池）：
+- DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT: 常驻连接数、突发时额外连接数、等待连接的秒数
+- DB_POOL_RECYCLE: 连接最长使用秒数，避免被服务端或中间件超时断开
+- DB_POOL_PRE_PING: 取出连接时先检测是否可用
+
+只读副本见 app.db_routing，DATABASE_REPLICA_URL 配置后由 DatabaseEngine 创建副本引擎（同样应用连接池参数）。
+
+配置项：
+- SQLITE_PRAGMAS: 连接时设置的 PRAGMA，设为空字典可关闭
+- DB_LOCK_RETRIES: 锁冲突时的最大重试次数
+- DB_LOCK_RETRY_DELAY: 退避基数（秒），第 n 次重试等待约 base * 2^n
+"""
+
+import logging
+import random
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.db_routing import STICKY_SESSION_KEY
+from app.metrics import DB_LOCK_RETRIES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # 负数表示 KiB，即 64MB
+    'busy_timeout': 5000,
+}
+
+# 只对文件数据库有意义的 PRAGMA
+_FILE_ONLY_PRAGMAS = {'journal_mode', 'mmap_size'}
+
+_LOCK_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+
+_flush_listener_registered = False
+
+
+def engine_options(config, url):
+    """
+    生成数据库 URL 对应的引擎参数
+
+    服务端数据库使用连接池参数，SQLite 不设置；显式的 SQLALCHEMY_ENGINE_OPTIONS 优先。
+    """
+    options = {}
+    if make_url(url).get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=config.get('DB_POOL_SIZE', 10),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 20),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+            pool_pre_ping=config.get('DB_POOL_PRE_PING', True),
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def configure_engines(app):
+    """生成主库引擎参数，须在 db.init_app 之前调用。"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+
+
+class DatabaseEngine:
+    """在 create_app 中紧随 db.init_app 注册，为 SQLite 引擎挂载连接事件，配置副本时维护读写粘滞。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.replica = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_SQLITE_PRAGMAS))
+        app.config.setdefault('DB_LOCK_RETRIES', 5)
+        app.config.setdefault('DB_LOCK_RETRY_DELAY', 0.02)
+        app.config.setdefault('DB_REPLICA_STICKY_SECONDS', 5)
+        app.extensions['db_engine'] = self
+
+        # 副本引擎不注册为 Flask-SQLAlchemy 的 bind，避免 db.create_all 在副本上建表
+        replica_url = app.config.get('DATABASE_REPLICA_URL')
+        self.replica = create_engine(replica_url, **engine_options(app.config, replica_url)) if replica_url else None
+
+        pragmas = app.config['SQLITE_PRAGMAS'] or {}
+        with app.app_context():
+            engines = list(db.engines.values())
+        if self.replica is not None:
+            engines.append(self.replica)
+        for engine in engines:
+            if engine.dialect.name == 'sqlite' and pragmas:
+                in_memory = engine.url.database in (None, '', ':memory:')
+                event.listen(engine, 'connect', _pragma_listener(pragmas, in_memory))
+
+        if self.replica is not None:
+            _register_flush_listener()
+            app.after_request(_stick_to_primary)
+
+
+def _register_flush_listener():
+    global _flush_listener_registered
+    if not _flush_listener_registered:
+        event.listen(db.session, 'after_flush', _mark_write)
+        _flush_listener_registered = True
+
+
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g._db_wrote = True
+
+
+def _stick_to_primary(response):
+    """本次请求写入过数据时，该用户之后一段时间的只读请求仍走主库。"""
+    if g.pop('_db_wrote', False):
+        flask_session[STICKY_SESSION_KEY] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+    return response
+
+
+def _pragma_listener(pragmas, in_memory):
+    statements = [
+        f'PRAGMA {name}={value}' for name, value in pragmas.items()
+        if not (in_memory and name in _FILE_ONLY_PRAGMAS)
+    ]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return set_pragmas
+
+
+def get_db_engine(app=None):
+    app = app or current_app
+    return app.extensions['db_engine']
+
+
+def is_lock_error(error):
+    """判断异常是否为 SQLite 锁冲突。"""
+    message = str(getattr(error, 'orig', error)).lower()
+    return any(text in message for text in _LOCK_MESSAGES)
+
+
+def commit_with_retry(work, session=None, retries=None, base_delay=None):
+    """
+    执行一个写单元并提交，遇到锁冲突时回滚后重试
+
+    回滚会使会话中的对象过期、丢弃未提交的修改，所以 work 必须包含本次写入的全部修改，
+    重试时整体重新执行。
+
+    Args:
+        work (callable): 无参函数，在会话中完成修改（不需要提交），返回值原样返回
+        session: 默认为 db.session
+        retries (int): 最大重试次数，默认取 DB_LOCK_RETRIES
+        base_delay (float): 退避基数（秒），默认取 DB_LOCK_RETRY_DELAY
+
+    Returns:
+        work 的返回值
+    """
+    session = session or db.session
+    config = current_app.config if has_app_context() else {}
+    if retries is None:
+        retries = config.get('DB_LOCK_RETRIES', 5)
+    if base_delay is None:
+        base_delay = config.get('DB_LOCK_RETRY_DELAY', 0.02)
+
+    attempt = 0
+    while True:
+        try:
+            result = work()
+            session.commit()
+            return result
+        except OperationalError as e:
+            session.rollback()
+            if not is_lock_error(e) or attempt >= retries:
+                if is_lock_error(e):
+                    DB_LOCK_RETRIES.inc(('exhausted',))
+                raise
+            DB_LOCK_RETRIES.inc(('retry',))
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            logger.info('数据库锁冲突，%.3fs 后第 %d 次重试', delay, attempt + 1)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,60 @@
+"""
+读写分离
+
+配置 DATABASE_REPLICA_URL 后，DatabaseEngine 为只读副本创建单独的引擎。标记为只读的视图
+（看板、列表页、导出、查询接口）中的查询发送到副本，写入（flush）和未标记的视图仍使用主库。
+未配置副本时所有查询都走主库，标记不产生任何影响。
+
+- @read_only: 视图装饰器，放在 @login_required 之后
+- replica_reads(): 在视图以外（脚本、后台任务）临时将查询发送到副本
+- 用户在请求中写入后的 DB_REPLICA_STICKY_SECONDS 秒内，其只读请求仍走主库，
+  避免复制延迟导致刚保存的数据在跳转后的页面上看不到（由 DatabaseEngine 维护）
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+STICKY_SESSION_KEY = '_db_primary_until'
+
+
+class RoutingSession(Session):
+    """只读标记生效且存在副本时，查询使用副本引擎；flush 和 DML 始终使用主库。"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('read_only') and not self._flushing
+                and not isinstance(clause, UpdateBase)):
+            replica = getattr(current_app.extensions.get('db_engine'), 'replica', None)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _recently_wrote():
+    return has_request_context() and flask_session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+@contextmanager
+def replica_reads():
+    """在代码块内将当前会话的查询发送到只读副本。"""
+    session = current_app.extensions['sqlalchemy'].session
+    previous = session.info.get('read_only', False)
+    session.info['read_only'] = not _recently_wrote()
+    try:
+        yield
+    finally:
+        session.info['read_only'] = previous
+
+
+def read_only(view):
+    """标记只读视图。"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    wrapper.read_only = True
+    return wrapper
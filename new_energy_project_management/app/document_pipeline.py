@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档后处理流水线
+
+文档上传后在后台线程池中异步处理，不占用请求时间：
+- 提取正文文本（供预览和全文检索使用）
+- 统计页数（PDF）
+- 生成首页 PNG 缩略图（PDF 需要 pypdfium2 或 PyMuPDF，图片需要 Pillow）
+
+处理结果保存在 DocumentPreview 中，文档列表页直接读取，无需访问原文件。
+处理具备幂等性和重试机制：
+- 同一内容哈希已处理过时直接复用结果
+- 通过条件更新领取任务，同一文档不会被并发重复处理
+- 失败后按指数退避重试，超过最大次数标记为 failed，可通过积压处理脚本重新执行
+- 缺少解析或渲染所需的依赖时标记为 unavailable，安装依赖后由积压处理脚本补齐
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.blob_store import get_blob_store
+from app.text_extraction import DependencyUnavailable, extract_text, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
+
+# 处理中状态超过该时长视为工作进程已退出，可被重新领取
+STALE_PROCESSING = timedelta(minutes=30)
+
+
+class PreviewUnavailable(DependencyUnavailable):
+    """当前环境缺少生成缩略图所需的依赖。"""
+
+
+class DocumentPipeline:
+    """文档后处理流水线：线程池执行、重试调度和积压处理。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DOCUMENT_PIPELINE_WORKERS', 2)
+        app.config.setdefault('DOCUMENT_PIPELINE_SYNC', False)
+        app.config.setdefault('DOCUMENT_PIPELINE_MAX_ATTEMPTS', 3)
+        app.config.setdefault('DOCUMENT_PIPELINE_RETRY_DELAY', 30)
+        app.config.setdefault('THUMBNAIL_DIR', os.path.join(os.path.dirname(app.root_path), 'uploads', 'thumbnails'))
+        app.config.setdefault('THUMBNAIL_SIZE', (320, 320))
+        self.app = app
+        app.extensions['document_pipeline'] = self
+
+    # ------------------------------------------------------------------
+    # 任务投递
+    # ------------------------------------------------------------------
+
+    def submit(self, document_id, delay=0):
+        """投递文档处理任务，delay 秒后执行（用于失败重试）。"""
+        if self.app.config['DOCUMENT_PIPELINE_SYNC']:
+            self.process(document_id)
+            return None
+        if delay:
+            timer = threading.Timer(delay, self.submit, args=(document_id,))
+            timer.daemon = True
+            timer.start()
+            return None
+        return self._get_executor().submit(self._safe_process, document_id)
+
+    def process_backlog(self, retry_failed=False, limit=None):
+        """
+        处理积压文档：尚未处理、待重试、处理中断或曾缺少依赖的文档
+
+        Args:
+            retry_failed (bool): 是否重置并重新处理已达到最大重试次数的文档
+            limit (int): 最多处理的文档数
+
+        Returns:
+            dict: 各状态的文档数量统计
+        """
+        from app.models import ProjectDocument, DocumentPreview
+
+        with self.app.app_context():
+            now = datetime.utcnow()
+            if retry_failed:
+                DocumentPreview.query.filter_by(status='failed').update(
+                    {'status': 'pending', 'attempts': 0, 'next_attempt_at': None},
+                    synchronize_session=False)
+            DocumentPreview.query.filter(
+                DocumentPreview.status == 'processing',
+                DocumentPreview.updated_at < now - STALE_PROCESSING
+            ).update({'status': 'pending'}, synchronize_session=False)
+            db.session.commit()
+
+            query = db.session.query(ProjectDocument.id).outerjoin(
+                DocumentPreview, DocumentPreview.document_id == ProjectDocument.id
+            ).filter(db.or_(
+                DocumentPreview.id.is_(None),
+                db.and_(DocumentPreview.status == 'pending',
+                        db.or_(DocumentPreview.next_attempt_at.is_(None),
+                               DocumentPreview.next_attempt_at <= now)),
+                # 缺少依赖时未能完整处理，依赖安装后重新处理
+                DocumentPreview.status == 'unavailable',
+                # 内容哈希变化（如历史文件迁移到内容寻址存储后）需要重新处理
+                db.and_(DocumentPreview.status == 'done',
+                        DocumentPreview.content_hash != ProjectDocument.content_hash),
+            )).order_by(ProjectDocument.id)
+            if limit:
+                query = query.limit(limit)
+            document_ids = [row[0] for row in query]
+
+        if self.app.config['DOCUMENT_PIPELINE_SYNC']:
+            for document_id in document_ids:
+                self.process(document_id)
+        else:
+            wait([self._get_executor().submit(self._safe_process, did) for did in document_ids])
+
+        with self.app.app_context():
+            counts = dict(db.session.query(DocumentPreview.status, db.func.count(DocumentPreview.id))
+                          .group_by(DocumentPreview.status).all())
+        counts['submitted'] = len(document_ids)
+        return counts
+
+    def shutdown(self, wait_for_tasks=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait_for_tasks)
+            self._executor = None
+
+    def _get_executor(self):
+        # gunicorn 预加载时线程池不会随 fork 复制，按进程号检查并重新创建
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['DOCUMENT_PIPELINE_WORKERS'],
+                    thread_name_prefix='document-pipeline')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _safe_process(self, document_id):
+        try:
+            self.process(document_id)
+        except Exception:
+            logger.exception('文档 %s 后处理失败', document_id)
+
+    # ------------------------------------------------------------------
+    # 处理逻辑
+    # ------------------------------------------------------------------
+
+    def process(self, document_id):
+        """
+        处理单个文档，可重复调用
+
+        Returns:
+            str: 处理后的状态，文档不存在时返回 None
+        """
+        from app.models import ProjectDocument, DocumentPreview
+
+        with self.app.app_context():
+            document = db.session.get(ProjectDocument, document_id)
+            if document is None:
+                return None
+
+            preview = DocumentPreview.query.filter_by(document_id=document_id).first()
+            if preview is None:
+                preview = DocumentPreview(document_id=document_id, status='pending', attempts=0)
+                db.session.add(preview)
+                db.session.commit()
+
+            if preview.status == 'done' and preview.content_hash == document.content_hash:
+                return preview.status
+
+            # 相同内容已经处理过时直接复用结果
+            if document.content_hash:
+                source = DocumentPreview.query.filter(
+                    DocumentPreview.content_hash == document.content_hash,
+                    DocumentPreview.status == 'done',
+                    DocumentPreview.id != preview.id
+                ).first()
+                if source is not None:
+                    preview.copy_results_from(source)
+                    db.session.commit()
+                    self._reindex(document_id)
+                    return preview.status
+
+            if not self._claim(preview):
+                return preview.status
+
+            try:
+                results = self._run(document)
+            except Exception as e:
+                db.session.rollback()
+                return self._record_failure(preview, e)
+
+            preview.content_hash = document.content_hash
+            preview.text_content = results['text']
+            preview.page_count = results['page_count']
+            preview.thumbnail_path = results['thumbnail_path']
+            preview.status = 'unavailable' if results['missing'] else 'done'
+            preview.last_error = '；'.join(results['missing']) or None
+            preview.next_attempt_at = None
+            preview.processed_at = datetime.utcnow()
+            status = preview.status
+            db.session.commit()
+
+        self._reindex(document_id)
+        return status
+
+    def _claim(self, preview):
+        """以条件更新领取任务，保证同一文档同时只有一个线程在处理。"""
+        from app.models import DocumentPreview
+
+        claimed = DocumentPreview.query.filter(
+            DocumentPreview.id == preview.id,
+            DocumentPreview.status.in_(['pending', 'done', 'unavailable'])
+        ).update({
+            'status': 'processing',
+            'attempts': DocumentPreview.attempts + 1,
+            'updated_at': datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(preview)
+        return claimed == 1
+
+    def _record_failure(self, preview, error):
+        max_attempts = self.app.config['DOCUMENT_PIPELINE_MAX_ATTEMPTS']
+        preview.last_error = str(error)[:500]
+        if preview.attempts >= max_attempts:
+            preview.status = 'failed'
+            preview.next_attempt_at = None
+            db.session.commit()
+            logger.warning('文档 %s 后处理失败，已达到最大重试次数: %s', preview.document_id, error)
+            return 'failed'
+
+        # 指数退避：30s、60s、120s...
+        delay = self.app.config['DOCUMENT_PIPELINE_RETRY_DELAY'] * (2 ** (preview.attempts - 1))
+        preview.status = 'pending'
+        preview.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+        if not self.app.config['DOCUMENT_PIPELINE_SYNC']:
+            self.submit(preview.document_id, delay=delay)
+        return 'pending'
+
+    def _run(self, document):
+        path = get_blob_store(self.app).path_for(document.content_hash) \
+            if document.content_hash else document.file_path
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f'文档文件不存在: {path}')
+
+        ext = os.path.splitext(document.filename or '')[1].lower()
+        # 缺少依赖不算失败，不按退避重试；记录缺少的依赖，文档标记为 unavailable
+        results = {'text': '', 'page_count': None, 'thumbnail_path': None, 'missing': []}
+        try:
+            results['text'] = extract_text(path, document.filename,
+                                           max_chars=self.app.config.get('SEARCH_MAX_BODY_CHARS'))
+            if ext == '.pdf':
+                results['page_count'] = pdf_page_count(path)
+        except DependencyUnavailable as e:
+            results['missing'].append(str(e))
+        if ext in IMAGE_EXTENSIONS:
+            results['page_count'] = 1
+
+        if ext == '.pdf' or ext in IMAGE_EXTENSIONS:
+            name = (document.content_hash or f'document_{document.id}') + '.png'
+            try:
+                self._write_thumbnail(path, ext, name)
+                results['thumbnail_path'] = name
+            except PreviewUnavailable as e:
+                results['missing'].append(str(e))
+        return results
+
+    def _write_thumbnail(self, path, ext, name):
+        target = os.path.join(self.app.config['THUMBNAIL_DIR'], name)
+        if os.path.exists(target):
+            return
+        image = _render_pdf_first_page(path) if ext == '.pdf' else _open_image(path)
+        image.thumbnail(self.app.config['THUMBNAIL_SIZE'])
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = target + '.tmp'
+        image.save(tmp_path, format='PNG', optimize=True)
+        os.replace(tmp_path, target)
+
+    def _reindex(self, document_id):
+        # 处理完成后用提取的正文刷新全文索引
+        indexer = self.app.extensions.get('search_indexer')
+        if indexer is not None:
+            indexer.enqueue([('document', document_id, False)])
+
+
+def get_document_pipeline(app=None):
+    return (app or current_app).extensions['document_pipeline']
+
+
+def thumbnail_file(preview, app=None):
+    """返回缩略图的绝对路径，没有缩略图时返回 None。"""
+    if preview is None or not preview.thumbnail_path:
+        return None
+    return os.path.join((app or current_app).config['THUMBNAIL_DIR'], preview.thumbnail_path)
+
+
+def _open_image(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PreviewUnavailable('未安装 Pillow，无法生成图片缩略图')
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def _render_pdf_first_page(path):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return pdf[0].render(scale=1).to_pil()
+        finally:
+            pdf.close()
+
+    try:
+        import fitz
+    except ImportError:
+        raise PreviewUnavailable('未安装 pypdfium2 或 PyMuPDF，无法生成PDF缩略图')
+
+    from PIL import Image
+    with fitz.open(path) as pdf:
+        pixmap = pdf[0].get_pixmap()
+        return Image.open(io.BytesIO(pixmap.tobytes('png')))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档下载模块
+
+为项目文档下载提供：
+- 基于内容哈希的强 ETag 和基于 uploaded_at 的 Last-Modified，支持条件请求（304）
+- 字节范围请求（Range / 206），支持断点续传和在线预览跳页
+- 可选的前端代理卸载：配置 DOCUMENT_SENDFILE_BACKEND 后只返回
+  X-Accel-Redirect / X-Sendfile 头，由 Nginx/Apache 发送文件内容，
+  Python 工作进程在权限校验通过后立即释放
+"""
+
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.wrappers import Response
+
+from app.blob_store import get_blob_store
+
+SENDFILE_BACKENDS = ('x-accel-redirect', 'x-sendfile')
+
+
+def resolve_document_path(document):
+    """返回文档的实际文件路径：内容寻址文档按哈希定位，旧版文档使用 file_path。"""
+    if document.content_hash:
+        return get_blob_store().path_for(document.content_hash)
+    return document.file_path
+
+
+def send_document(document, as_attachment=True):
+    """
+    生成文档下载响应
+
+    Args:
+        document (ProjectDocument): 已通过权限校验的文档记录
+        as_attachment (bool): 是否以附件形式下载
+
+    Returns:
+        Response: 下载响应（可能为 200/206/304）
+
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    path = resolve_document_path(document)
+    if not path or not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    backend = current_app.config.get('DOCUMENT_SENDFILE_BACKEND')
+    if backend in SENDFILE_BACKENDS:
+        response = _offload_response(document, path, backend, as_attachment)
+        if response is not None:
+            return response
+
+    response = send_file(
+        path,
+        mimetype=document.file_type if document.file_type and '/' in document.file_type else None,
+        as_attachment=as_attachment,
+        download_name=document.filename,
+        conditional=True,
+        etag=document.content_hash or True,
+        last_modified=document.uploaded_at,
+    )
+    _apply_cache_headers(response)
+    return response
+
+
+def _offload_response(document, path, backend, as_attachment):
+    """构造交由前端代理发送文件的空响应，无法卸载时返回 None。"""
+    if backend == 'x-accel-redirect':
+        # X-Accel-Redirect 需要映射到 Nginx internal location，只支持存储目录内的文件
+        store_root = get_blob_store().root
+        relative = os.path.relpath(os.path.abspath(path), store_root)
+        if relative.startswith('..'):
+            return None
+        prefix = current_app.config.get('DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected-blobs/')
+        header_name, header_value = 'X-Accel-Redirect', prefix.rstrip('/') + '/' + quote(relative.replace(os.sep, '/'))
+    else:
+        header_name, header_value = 'X-Sendfile', os.path.abspath(path)
+
+    response = Response(mimetype=document.file_type if document.file_type and '/' in document.file_type
+                        else 'application/octet-stream')
+    response.headers[header_name] = header_value
+    response.headers['Content-Disposition'] = _content_disposition(document.filename, as_attachment)
+    if document.content_hash:
+        response.set_etag(document.content_hash)
+    if document.uploaded_at:
+        response.last_modified = document.uploaded_at
+    _apply_cache_headers(response)
+
+    # 条件请求在此处直接返回304，范围请求由前端代理处理
+    response = response.make_conditional(request, accept_ranges=False)
+    if response.status_code == 304:
+        response.headers.pop(header_name, None)
+    return response
+
+
+def _apply_cache_headers(response):
+    # 文档需要登录访问，只允许浏览器私有缓存；内容按哈希不可变，可在有效期内直接复用
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = None
+    response.cache_control.max_age = current_app.config.get('DOCUMENT_CACHE_MAX_AGE', 0)
+
+
+def _content_disposition(filename, as_attachment):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        # 非ASCII文件名使用 RFC 5987 编码
+        return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+    return f'{disposition}; filename="{filename}"'
@@ -101,6 +101,9 @@ class ProfitAnalysisForm(FlaskForm):
                                    default=0,
                                    validators=[Optional()],
                                    description='沃太能源获取的资源费总额，将按累进比例分成')
+    revenue_share_schedule_id = SelectField('资源费分成方案', coerce=int, default=0,
+                                            validators=[Optional()],
+                                            description='按合作合同选择累进分级，默认 4000/8000万元分级')
     
     # ROI计算参数
     dengpin_cost = FloatField('登品自身投入成本 (万元)', 
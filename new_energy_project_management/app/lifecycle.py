@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目生命周期：阶段流转记录与分析
+
+Project.current_stage 只保存当前阶段。change_stage 在修改阶段的同时向
+project_stage_transition 追加一行流转记录，记录离开的阶段、进入的阶段、在原阶段停留的秒数，
+以及流转时的项目类型和项目经理（冗余保存，分析时无需关联 project 表）。
+
+在流转记录之上提供三类分析，均可按阶段、项目类型或项目经理分组，并按时间范围过滤：
+
+- dwell_times: 各阶段停留时长的分布（次数、平均值和分位数，单位：天）
+- conversion_funnel: 转化漏斗，到达每个阶段（含跳过该阶段直接进入后续阶段）的项目数和转化率
+- stage_throughput: 按月（或日、周、年）统计进入各阶段的项目数
+
+查询只读取覆盖索引（见 ProjectStageTransition.__table_args__），多年的流转记录也能在毫秒级返回。
+"""
+
+from datetime import datetime
+
+from sqlalchemy import case, func, inspect
+
+from app import db
+from app.models import ProjectStageTransition
+
+# 与项目表单一致的阶段顺序
+STAGES = ['机会挖掘', '前期开发', '投资决策', '建设执行', '并网运营']
+
+# 可用的分组维度 -> 流转记录上的列
+GROUP_COLUMNS = {
+    'project_type': ProjectStageTransition.project_type,
+    'manager_id': ProjectStageTransition.manager_id,
+}
+
+DEFAULT_PERCENTILES = (50, 75, 90)
+
+# 吞吐量统计周期 -> (SQLite strftime 格式, PostgreSQL to_char 格式)
+PERIOD_FORMATS = {
+    'day': ('%Y-%m-%d', 'YYYY-MM-DD'),
+    'week': ('%Y-W%W', 'IYYY-"W"IW'),
+    'month': ('%Y-%m', 'YYYY-MM'),
+    'year': ('%Y', 'YYYY'),
+}
+
+# SQLite 中 DateTime 存为 ISO 格式文本，日、月、年直接截取前缀，比 strftime 逐行解析快
+SQLITE_PREFIX_LENGTHS = {'day': 10, 'month': 7, 'year': 4}
+
+SECONDS_PER_DAY = 86400
+
+
+def change_stage(project, stage, user_id=None, at=None):
+    """
+    修改项目阶段并追加流转记录
+
+    新建（尚未持久化）的项目记录进入初始阶段；已有项目阶段未变化时不记录。
+    在修改项目类型和项目经理之后调用，流转记录保存修改后的值。调用方负责提交事务。
+
+    Args:
+        project (Project): 项目
+        stage (str): 新阶段
+        user_id (int): 操作人
+        at (datetime): 流转时间，默认当前时间
+
+    Returns:
+        ProjectStageTransition: 新增的流转记录，阶段未变化时返回 None
+    """
+    is_new = not inspect(project).has_identity
+    previous = None if is_new else project.current_stage
+    if not is_new and stage == previous:
+        return None
+
+    at = at or datetime.utcnow()
+    entered_at = stage_entered_at(project) if previous is not None else None
+    transition = ProjectStageTransition(
+        project=project,
+        from_stage=previous,
+        to_stage=stage,
+        project_type=project.project_type,
+        manager_id=project.manager_id,
+        user_id=user_id,
+        entered_at=entered_at,
+        transitioned_at=at,
+        dwell_seconds=int((at - entered_at).total_seconds()) if entered_at else None,
+    )
+    project.current_stage = stage
+    db.session.add(transition)
+    return transition
+
+
+def stage_entered_at(project):
+    """项目进入当前阶段的时间；没有流转记录的历史项目取创建时间。"""
+    with db.session.no_autoflush:
+        entered_at = db.session.query(ProjectStageTransition.transitioned_at) \
+            .filter(ProjectStageTransition.project_id == project.id) \
+            .order_by(ProjectStageTransition.transitioned_at.desc(), ProjectStageTransition.id.desc()) \
+            .limit(1).scalar()
+    return entered_at or project.created_at
+
+
+def stage_timeline(project_id):
+    """单个项目的阶段流转记录，按时间先后排列。"""
+    return ProjectStageTransition.query.filter_by(project_id=project_id) \
+        .order_by(ProjectStageTransition.transitioned_at, ProjectStageTransition.id).all()
+
+
+def dwell_times(group_by=None, since=None, until=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    各阶段停留时长分布，只统计已离开的停留（流转时间在 [since, until) 内）
+
+    Args:
+        group_by (str): None、'project_type' 或 'manager_id'
+        since (datetime): 起始时间（含）
+        until (datetime): 截止时间（不含）
+        percentiles (tuple): 需要计算的分位数
+
+    Returns:
+        list: [{'stage', 'group', 'count', 'mean_days', 'max_days', 'p50_days', ...}]，按阶段顺序排列
+    """
+    group_column = _group_column(group_by)
+    T = ProjectStageTransition
+    query = db.session.query(T.from_stage, group_column, T.dwell_seconds) \
+        .filter(T.from_stage.isnot(None), T.dwell_seconds.isnot(None))
+    query = _time_range(query, since, until)
+
+    samples = {}
+    for stage, group, seconds in query:
+        samples.setdefault((stage, group), []).append(seconds)
+
+    results = []
+    for (stage, group), values in sorted(samples.items(), key=lambda item: _sort_key(*item[0])):
+        values.sort()
+        row = {
+            'stage': stage,
+            'group': group,
+            'count': len(values),
+            'mean_days': round(sum(values) / len(values) / SECONDS_PER_DAY, 2),
+            'max_days': round(values[-1] / SECONDS_PER_DAY, 2),
+        }
+        for p in percentiles:
+            row[f'p{p}_days'] = round(_percentile(values, p) / SECONDS_PER_DAY, 2)
+        results.append(row)
+    return results
+
+
+def conversion_funnel(group_by=None, since=None, until=None):
+    """
+    转化漏斗：统计时间范围内有流转的项目到达的最远阶段
+
+    跳过中间阶段的项目计入被跳过的阶段，因此各阶段的到达数单调不增。
+
+    Returns:
+        list: [{'stage', 'group', 'reached', 'conversion', 'overall'}]；conversion 为相对上一阶段的
+        转化率，overall 为相对第一个阶段的转化率（百分比）
+    """
+    group_column = _group_column(group_by)
+    T = ProjectStageTransition
+    stage_index = case({stage: index for index, stage in enumerate(STAGES)}, value=T.to_stage, else_=-1)
+    furthest = _time_range(
+        db.session.query(group_column.label('grp'), func.max(stage_index).label('furthest'))
+        .group_by(T.project_id, *_grouping(group_by)), since, until).subquery()
+    # 按最远阶段计数后再累加，数据库只返回 分组数 x 阶段数 行
+    query = db.session.query(furthest.c.grp, furthest.c.furthest, func.count()) \
+        .group_by(furthest.c.grp, furthest.c.furthest)
+
+    reached = {}
+    for group, index, count in query:
+        counts = reached.setdefault(group, [0] * len(STAGES))
+        for reached_index in range(index + 1):
+            counts[reached_index] += count
+
+    results = []
+    for group in sorted(reached, key=_group_sort_key):
+        counts = reached[group]
+        for index, stage in enumerate(STAGES):
+            previous = counts[index - 1] if index else counts[0]
+            results.append({
+                'stage': stage,
+                'group': group,
+                'reached': counts[index],
+                'conversion': _rate(counts[index], previous),
+                'overall': _rate(counts[index], counts[0]),
+            })
+    return results
+
+
+def stage_throughput(period='month', group_by=None, since=None, until=None):
+    """
+    吞吐量：每个周期内进入各阶段的次数
+
+    Args:
+        period (str): 'day'、'week'、'month' 或 'year'
+
+    Returns:
+        list: [{'period', 'stage', 'group', 'count'}]，按周期和阶段顺序排列
+    """
+    group_column = _group_column(group_by)
+    T = ProjectStageTransition
+    bucket = period_expression(period, T.transitioned_at)
+    query = db.session.query(bucket, T.to_stage, group_column, func.count()) \
+        .group_by(bucket, T.to_stage, *_grouping(group_by))
+    query = _time_range(query, since, until)
+
+    rows = [{'period': bucket_value, 'stage': stage, 'group': group, 'count': count}
+            for bucket_value, stage, group, count in query]
+    rows.sort(key=lambda row: (row['period'],) + _sort_key(row['stage'], row['group']))
+    return rows
+
+
+def _group_column(group_by):
+    if group_by is None:
+        return db.null()
+    try:
+        return GROUP_COLUMNS[group_by]
+    except KeyError:
+        raise ValueError(f'不支持的分组维度: {group_by}') from None
+
+
+def _grouping(group_by):
+    # PostgreSQL 不接受 GROUP BY 常量，不分组时只查询 NULL 列而不加入 GROUP BY
+    return [GROUP_COLUMNS[group_by]] if group_by is not None else []
+
+
+def _time_range(query, since, until):
+    if since is not None:
+        query = query.filter(ProjectStageTransition.transitioned_at >= since)
+    if until is not None:
+        query = query.filter(ProjectStageTransition.transitioned_at < until)
+    return query
+
+
+def period_expression(period, column):
+    """按统计周期截取时间列的 SQL 表达式，结果为可按字符串排序的周期标签（如 2024-03）。"""
+    try:
+        sqlite_format, postgres_format = PERIOD_FORMATS[period]
+    except KeyError:
+        raise ValueError(f'不支持的统计周期: {period}') from None
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.to_char(column, postgres_format)
+    if dialect == 'sqlite' and period in SQLITE_PREFIX_LENGTHS:
+        return func.substr(column, 1, SQLITE_PREFIX_LENGTHS[period])
+    return func.strftime(sqlite_format, column)
+
+
+def _percentile(sorted_values, p):
+    """线性插值分位数，与 numpy.percentile 的默认方法一致。"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _rate(numerator, denominator):
+    return round(numerator * 100 / denominator, 1) if denominator else None
+
+
+def _sort_key(stage, group):
+    order = STAGES.index(stage) if stage in STAGES else len(STAGES)
+    return (order, stage or '') + _group_sort_key(group)
+
+
+def _group_sort_key(group):
+    return (group is not None, str(group) if group is not None else '')
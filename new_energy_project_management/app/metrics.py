@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+运行指标模块（Prometheus 文本格式）
+
+通过 /metrics 暴露以下指标：
+- http_request_duration_seconds：按蓝图端点（main.*、auth.*）统计的请求延迟直方图
+- db_queries_total / db_query_duration_seconds_total：按端点统计的SQL语句数和耗时
+- report_generation_seconds / report_size_bytes：报表生成耗时和文件大小直方图
+- profit_calculator_calls_total：收益计算调用次数
+- document_upload_bytes_total / document_uploads_total：文档上传字节数和次数
+
+存储方式：每个进程把数值写入 METRICS_DIR 下自己的 mmap 文件（metrics_<pid>.db），
+写入只涉及本进程文件，进程之间无需加锁；抓取时读取目录下所有文件并求和，
+因此 gunicorn 多进程部署时任一工作进程都能返回全局汇总。
+多进程部署需要显式配置 METRICS_DIR，并在启动前清空该目录。
+
+/metrics 默认只允许本机抓取；配置 METRICS_AUTH_TOKEN 后改为校验 Bearer 令牌，
+METRICS_PUBLIC 为 True 时不做限制。
+"""
+
+import atexit
+import functools
+import glob
+import hmac
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from flask import Response, abort, current_app, g, has_request_context, request
+
+from app.profiling import add_query_observer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REPORT_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+REPORT_SIZE_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 5e6, 10e6, 50e6)
+
+
+class MmapValues:
+    """
+    单进程的 mmap 数值文件
+
+    文件格式：前8字节为已用长度，之后依次为条目 [键长度 int32][键 UTF-8，补齐到8字节][值 float64]。
+    """
+
+    INITIAL_SIZE = 1 << 16
+    _HEADER = struct.Struct('i')
+    _VALUE = struct.Struct('d')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = self._HEADER.unpack_from(self._map, 0)[0]
+        if self._used == 0:
+            self._used = 8
+            self._HEADER.pack_into(self._map, 0, self._used)
+        for key, _value, position in _read_entries(self._map, self._used):
+            self._positions[key] = position
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._allocate(key)
+            value = self._VALUE.unpack_from(self._map, position)[0]
+            self._VALUE.pack_into(self._map, position, value + amount)
+
+    def _allocate(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+
+        self._map[self._used:self._used + len(entry)] = entry
+        position = self._used + 4 + len(padded)
+        # 先写条目再更新长度，读取方只会看到完整条目
+        self._used += len(entry)
+        self._HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _read_entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        padded_length = length + (8 - (length + 4) % 8)
+        key = bytes(data[position + 4:position + 4 + length]).decode('utf-8')
+        position += 4 + padded_length
+        value = struct.unpack_from('d', data, position)[0]
+        yield key, value, position
+        position += 8
+
+
+def read_file(path):
+    """读取单个进程的指标文件，返回 {键: 值}。"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return {}
+    used = struct.unpack_from('i', data, 0)[0]
+    return {key: value for key, value, _ in _read_entries(data, min(used, len(data)))}
+
+
+class Metric:
+    """指标定义。样本以 JSON 数组 [指标名, 样本后缀, 标签值, le] 作为键存储。"""
+
+    def __init__(self, registry, name, documentation, labelnames=(), kind='counter', buckets=None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self.buckets = tuple(buckets or ())
+        registry.register(self)
+
+    def _key(self, suffix, labelvalues, le=None):
+        return json.dumps([self.name, suffix, [str(v) for v in labelvalues], le], ensure_ascii=False)
+
+    def inc(self, labelvalues=(), amount=1.0):
+        self.registry.values().inc(self._key('', labelvalues), amount)
+
+    def observe(self, value, labelvalues=()):
+        store = self.registry.values()
+        for bound in self.buckets:
+            if value <= bound:
+                store.inc(self._key('_bucket', labelvalues, _format_value(bound)))
+                break
+        else:
+            store.inc(self._key('_bucket', labelvalues, '+Inf'))
+        store.inc(self._key('_sum', labelvalues), value)
+        store.inc(self._key('_count', labelvalues))
+
+
+class MetricsRegistry:
+    """进程内指标注册表，负责打开本进程的 mmap 文件和汇总输出。"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._directory = None
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # 未配置目录时创建的临时目录及创建它的进程号
+        self._temporary = None
+        # 在导入时注册，晚于其他退出回调执行（退出时写入剩余审计日志也会记录SQL指标）
+        atexit.register(self._remove_temporary)
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+
+    def configure(self, directory):
+        with self._lock:
+            if directory == self._directory:
+                return
+            os.makedirs(directory, exist_ok=True)
+            self._directory = directory
+            self._reset_values()
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            # 未配置时使用本进程专属的临时目录，仅汇总当前进程及其 fork 出的子进程，进程退出时删除
+            directory = tempfile.mkdtemp(prefix='nepm-metrics-')
+            self._temporary = (directory, os.getpid())
+            self.configure(directory)
+        return self._directory
+
+    def values(self):
+        # fork 后的子进程不能继续写父进程的文件，按进程号重新打开
+        if self._values is None or self._pid != os.getpid():
+            directory = self.directory
+            with self._lock:
+                if self._values is None or self._pid != os.getpid():
+                    self._values = MmapValues(os.path.join(directory, f'metrics_{os.getpid()}.db'))
+                    self._pid = os.getpid()
+        return self._values
+
+    def _remove_temporary(self):
+        # fork 出的子进程继承了 atexit 注册，只由创建目录的进程删除
+        if self._temporary is None or self._temporary[1] != os.getpid():
+            return
+        directory = self._temporary[0]
+        self._temporary = None
+        with self._lock:
+            if self._directory == directory:
+                self._reset_values()
+                self._directory = None
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _reset_values(self):
+        if self._values is not None and self._pid == os.getpid():
+            self._values.close()
+        self._values = None
+        self._pid = None
+
+    def collect(self):
+        """汇总目录下所有进程文件，返回 {键: 值}。"""
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            try:
+                values = read_file(path)
+            except OSError:
+                continue
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """生成 Prometheus 文本格式输出。"""
+        samples = {}
+        for key, value in self.collect().items():
+            name, suffix, labelvalues, le = json.loads(key)
+            samples.setdefault(name, []).append((suffix, tuple(labelvalues), le, value))
+
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            entries = samples.get(name, [])
+            if metric.kind == 'histogram':
+                lines.extend(_render_histogram(metric, entries))
+            else:
+                for suffix, labelvalues, _le, value in sorted(entries):
+                    lines.append(f'{name}{suffix}{_format_labels(metric.labelnames, labelvalues)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(metric, entries):
+    series = {}
+    for suffix, labelvalues, le, value in entries:
+        item = series.setdefault(labelvalues, {'buckets': {}, 'sum': 0.0, 'count': 0.0})
+        if suffix == '_bucket':
+            item['buckets'][le] = value
+        elif suffix == '_sum':
+            item['sum'] = value
+        elif suffix == '_count':
+            item['count'] = value
+
+    lines = []
+    bounds = [_format_value(bound) for bound in metric.buckets] + ['+Inf']
+    for labelvalues in sorted(series):
+        item = series[labelvalues]
+        cumulative = 0.0
+        # 存储的是各区间计数，输出时累加为 Prometheus 的累计桶
+        for le in bounds:
+            cumulative += item['buckets'].get(le, 0.0)
+            labels = _format_labels(metric.labelnames + ('le',), labelvalues + (le,))
+            lines.append(f'{metric.name}_bucket{labels} {_format_value(cumulative)}')
+        labels = _format_labels(metric.labelnames, labelvalues)
+        lines.append(f"{metric.name}_sum{labels} {_format_value(item['sum'])}")
+        lines.append(f"{metric.name}_count{labels} {_format_value(item['count'])}")
+    return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+# ----------------------------------------------------------------------
+# 指标定义
+# ----------------------------------------------------------------------
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = Metric(REGISTRY, 'http_request_duration_seconds', '请求处理耗时（秒）',
+                         ('endpoint', 'method', 'status'), kind='histogram', buckets=LATENCY_BUCKETS)
+DB_QUERIES = Metric(REGISTRY, 'db_queries_total', 'SQL语句执行次数', ('endpoint',))
+DB_QUERY_SECONDS = Metric(REGISTRY, 'db_query_duration_seconds_total', 'SQL语句累计执行耗时（秒）', ('endpoint',))
+REPORT_DURATION = Metric(REGISTRY, 'report_generation_seconds', '报表生成耗时（秒）',
+                         ('report',), kind='histogram', buckets=REPORT_DURATION_BUCKETS)
+REPORT_SIZE = Metric(REGISTRY, 'report_size_bytes', '报表文件大小（字节）',
+                     ('report',), kind='histogram', buckets=REPORT_SIZE_BUCKETS)
+PROFIT_CALCULATOR_CALLS = Metric(REGISTRY, 'profit_calculator_calls_total', '收益计算调用次数', ('method',))
+UPLOAD_BYTES = Metric(REGISTRY, 'document_upload_bytes_total', '文档上传字节数')
+UPLOADS = Metric(REGISTRY, 'document_uploads_total', '文档上传次数', ('deduplicated',))
+DB_LOCK_RETRIES = Metric(REGISTRY, 'db_lock_retries_total', '数据库锁冲突次数（retry: 已重试，exhausted: 重试耗尽）', ('outcome',))
+USER_CACHE_LOOKUPS = Metric(REGISTRY, 'user_cache_lookups_total', '登录用户缓存查找次数', ('result',))
+
+
+# ----------------------------------------------------------------------
+# 埋点工具
+# ----------------------------------------------------------------------
+
+def observe_report(report):
+    """装饰报表生成函数，记录耗时和返回的 BytesIO 大小。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            buffer = func(*args, **kwargs)
+            REPORT_DURATION.observe(time.perf_counter() - started, (report,))
+            if hasattr(buffer, 'getbuffer'):
+                REPORT_SIZE.observe(buffer.getbuffer().nbytes, (report,))
+            return buffer
+        return wrapper
+    return decorator
+
+
+def count_calls(method):
+    """装饰收益计算方法，统计调用次数。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            PROFIT_CALCULATOR_CALLS.inc((method,))
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_upload(size, deduplicated=False):
+    UPLOAD_BYTES.inc(amount=size)
+    UPLOADS.inc(('true' if deduplicated else 'false',))
+
+
+# ----------------------------------------------------------------------
+# Flask 扩展
+# ----------------------------------------------------------------------
+
+class Metrics:
+    """在 create_app 中注册：请求延迟埋点、SQL计数和 /metrics 端点。"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', None)
+        app.config.setdefault('METRICS_AUTH_TOKEN', None)
+        app.config.setdefault('METRICS_PUBLIC', False)
+
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        if app.config['METRICS_DIR']:
+            REGISTRY.configure(app.config['METRICS_DIR'])
+
+        app.before_request(_start_timer)
+        app.after_request(_record_status)
+        app.teardown_request(_observe_request)
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+        # SQL耗时由请求剖析模块的 cursor 事件统一计时，这里只按端点累计
+        add_query_observer(_record_query)
+
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def metrics_view():
+    token = current_app.config['METRICS_AUTH_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif not current_app.config['METRICS_PUBLIC'] and request.remote_addr not in LOCAL_ADDRESSES:
+        # 未配置令牌时只允许本机抓取（同机反向代理转发的请求也来自本机，此时应配置令牌）
+        abort(403)
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _observe_request(exc=None):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return
+    status = getattr(g, '_metrics_status', None) or (500 if exc is not None else 200)
+    REQUEST_LATENCY.observe(time.perf_counter() - started,
+                            (request.endpoint or '<unmatched>', request.method, status))
+
+
+def _record_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _record_query(elapsed):
+    endpoint = (request.endpoint or '<unmatched>') if has_request_context() else '<background>'
+    DB_QUERIES.inc((endpoint,))
+    DB_QUERY_SECONDS.inc((endpoint,), elapsed)
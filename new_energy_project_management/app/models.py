@@ -4,6 +4,7 @@ from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
 from app import db, login
 
 class User(UserMixin, db.Model):
@@ -20,12 +21,23 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def permission_mask(self):
+        from app.permissions import permission_mask
+        return permission_mask(self.role)
+
+    def has_permission(self, permission_name):
+        from app.permissions import can
+        return can(self, permission_name)
+
     def __repr__(self):
         return f'<User {self.username}>'
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    """返回用户只读快照，缓存命中时不查询数据库。"""
+    from app.user_cache import get_user_cache
+    return get_user_cache().get(int(id))
 
 class Project(db.Model):
     """项目模型，用于存储项目的核心信息。"""
@@ -51,14 +63,8 @@ class Project(db.Model):
     def __repr__(self):
         return f'<Project {self.name}>'
 
-class CostModel(db.Model):
-    """标准化造价模型参数 - 严格按照计算模型技术文档V2.0实现。"""
-    id = db.Column(db.Integer, primary_key=True)
-    project_type = db.Column(db.String(64), unique=True) # '集中式光伏' or '陆上风电'
-    cost_items = db.Column(db.JSON) # 存储成本构成总览，例如：{'设备费': 2.0, '工程费': 1.5, ...}
-    cost_details = db.Column(db.JSON) # 存储详细成本构成，例如：{'设备费': {'光伏组件': 1.10, '逆变器': 0.15, ...}, ...}
-    unit_cost_label = db.Column(db.String(20)) # '元/W' or '万元/MW'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+class CostModelCalculation:
+    """造价模型与其版本共用的计算方法，依赖 cost_items 和 unit_cost_label。"""
 
     def calculate_total_cost(self, capacity_mw):
         """
@@ -123,13 +129,65 @@ class CostModel(db.Model):
         
         return breakdown
 
+
+class CostModel(CostModelCalculation, db.Model):
+    """标准化造价模型参数 - 严格按照计算模型技术文档V2.0实现。"""
+    id = db.Column(db.Integer, primary_key=True)
+    project_type = db.Column(db.String(64), unique=True) # '集中式光伏' or '陆上风电'
+    cost_items = db.Column(db.JSON) # 存储成本构成总览，例如：{'设备费': 2.0, '工程费': 1.5, ...}
+    cost_details = db.Column(db.JSON) # 存储详细成本构成，例如：{'设备费': {'光伏组件': 1.10, '逆变器': 0.15, ...}, ...}
+    unit_cost_label = db.Column(db.String(20)) # '元/W' or '万元/MW'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 当前生效的版本，新增或修改上述参数并 flush 时自动生成新版本
+    current_version_id = db.Column(db.Integer, db.ForeignKey(
+        'cost_model_version.id', use_alter=True, name='fk_cost_model_current_version'))
+
+    current_version = db.relationship('CostModelVersion', foreign_keys=[current_version_id], post_update=True)
+
     def __repr__(self):
         return f'<CostModel {self.project_type}>'
 
+class CostModelVersion(CostModelCalculation, db.Model):
+    """造价模型的不可变版本：成本估算和收益分析引用计算时使用的版本，历史结果可以复现。"""
+    __tablename__ = 'cost_model_version'
+    __table_args__ = (db.UniqueConstraint('cost_model_id', 'version', name='uq_cost_model_version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    cost_model_id = db.Column(db.Integer, db.ForeignKey('cost_model.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # 同一造价模型内从1递增
+    project_type = db.Column(db.String(64))
+    cost_items = db.Column(db.JSON)
+    cost_details = db.Column(db.JSON)
+    unit_cost_label = db.Column(db.String(20))
+    created_by = db.Column(db.Integer)  # 操作人，不设外键
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    cost_model = db.relationship('CostModel', foreign_keys=[cost_model_id], backref=db.backref(
+        'versions', order_by='CostModelVersion.version', lazy='dynamic'))
+
+    def __repr__(self):
+        return f'<CostModelVersion {self.project_type} v{self.version}>'
+
+class RevenueShareSchedule(db.Model):
+    """资源费分成方案：按合作合同配置的累进分级，收益分析引用；由 app.revenue_share 校验、编译并缓存。"""
+    __tablename__ = 'revenue_share_schedule'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), unique=True, nullable=False)  # 合同或方案名称
+    description = db.Column(db.Text)
+    # 各级起点和分成比例，按起点升序，第一级起点为0，例如：[{'threshold': 0, 'rate': 0.25}, {'threshold': 4000, 'rate': 0.75}]
+    tiers = db.Column(db.JSON, nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=1)  # 分级每次修改时加1，编译结果按 (id, revision) 缓存
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RevenueShareSchedule {self.name} r{self.revision}>'
+
 class ProjectCostDetail(db.Model):
     """项目独立成本明细模型，用于存储每个项目的自定义成本构成。"""
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False, index=True)
     cost_category = db.Column(db.String(64), nullable=False)  # 成本类别，如'设备费'、'工程费'等
     cost_item = db.Column(db.String(128), nullable=False)  # 具体成本项，如'光伏组件'、'逆变器'等
     unit_cost = db.Column(db.Float, nullable=False)  # 单位成本
@@ -137,11 +195,13 @@ class ProjectCostDetail(db.Model):
     total_cost = db.Column(db.Float)  # 该项的总成本（万元）
     description = db.Column(db.Text)  # 成本项描述
     is_custom = db.Column(db.Boolean, default=True)  # 是否为项目自定义成本项
+    cost_model_version_id = db.Column(db.Integer, db.ForeignKey('cost_model_version.id'), index=True)  # 默认成本项来源的造价模型版本
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     project = db.relationship('Project', backref='cost_details')
+    cost_model_version = db.relationship('CostModelVersion')
     
     def calculate_total_cost(self, capacity_mw):
         """
@@ -153,25 +213,30 @@ class ProjectCostDetail(db.Model):
         Returns:
             float: 该成本项的总成本，单位为万元
         """
+        self.total_cost = self.compute_total_cost(self.unit_cost, self.unit_label, capacity_mw)
+        return self.total_cost
+    
+    @staticmethod
+    def compute_total_cost(unit_cost, unit_label, capacity_mw):
+        """按单价、单位和装机容量计算成本项总成本（万元），不修改记录，供批量校验使用。"""
         from decimal import Decimal, ROUND_HALF_UP
         
         capacity_mw = Decimal(str(capacity_mw))
-        unit_cost = Decimal(str(self.unit_cost))
+        unit_cost = Decimal(str(unit_cost))
         
-        if self.unit_label == '元/W':
+        if unit_label == '元/W':
             # 元/W -> 万元
             total = (capacity_mw * Decimal('1000000') * unit_cost) / Decimal('10000')
-        elif self.unit_label == '万元/MW':
+        elif unit_label == '万元/MW':
             # 万元/MW -> 万元
             total = capacity_mw * unit_cost
-        elif self.unit_label == '万元':
+        elif unit_label == '万元':
             # 固定成本
             total = unit_cost
         else:
             total = Decimal('0')
         
-        self.total_cost = float(total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
-        return self.total_cost
+        return float(total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     def __repr__(self):
         return f'<ProjectCostDetail {self.cost_item} for Project {self.project_id}>'
@@ -179,7 +244,7 @@ class ProjectCostDetail(db.Model):
 class ProfitAnalysis(db.Model):
     """收益与盈利能力分析结果 - 严格按照计算模型技术文档V2.0实现。"""
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('project.id'))
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), index=True)
     
     # 基础参数
     total_project_cost = db.Column(db.Float) # 项目工程总造价 (P_total, 万元)
@@ -203,11 +268,16 @@ class ProfitAnalysis(db.Model):
     
     # 兼容性字段（废弃，保留用于数据迁移）
     market_profit_rate = db.Column(db.Float) # 已废弃：市场公允利润率 (%)
+
+    cost_model_version_id = db.Column(db.Integer, db.ForeignKey('cost_model_version.id'), index=True) # 成本估算使用的造价模型版本
+    revenue_share_schedule_id = db.Column(db.Integer, db.ForeignKey('revenue_share_schedule.id'), index=True) # 资源费分成方案，为空时按默认累进分级
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     project = db.relationship('Project', backref='analyses')
+    cost_model_version = db.relationship('CostModelVersion')
+    revenue_share_schedule = db.relationship('RevenueShareSchedule')
     
     def calculate_profit_analysis(self):
         """
@@ -217,6 +287,7 @@ class ProfitAnalysis(db.Model):
             dict: 包含所有计算结果的字典
         """
         from app.profit_calculator import ProfitCalculator
+        from app.revenue_share import compiled_schedule
         
         if not self.project or not self.project.capacity_mw:
             raise ValueError("项目容量信息缺失，无法进行收益分析")
@@ -227,7 +298,8 @@ class ProfitAnalysis(db.Model):
             dev_fee_rate=self.dev_fee_rate,
             extra_investment=self.extra_investment or 0,
             resource_fee_total=self.resource_fee_total or 0,
-            dengpin_cost=self.dengpin_cost or 0
+            dengpin_cost=self.dengpin_cost or 0,
+            schedule=compiled_schedule(self.revenue_share_schedule)
         )
         
         # 更新计算结果
@@ -273,6 +345,46 @@ class ProfitAnalysis(db.Model):
     def __repr__(self):
         return f'<ProfitAnalysis for Project {self.project_id}>'
 
+class ProfitAnalysisSnapshot(db.Model):
+    """收益分析快照：每次重新计算收益分析时追加一行输入参数和计算结果（只追加，由 app.profit_history 写入）。"""
+    __tablename__ = 'profit_analysis_snapshot'
+    __table_args__ = (db.Index('ix_profit_snapshot_project', 'project_id', 'taken_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, nullable=False)  # 不设外键，删除项目后历史仍保留
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    cost_model_version_id = db.Column(db.Integer)
+
+    # 输入参数
+    capacity_mw = db.Column(db.Float)
+    total_project_cost = db.Column(db.Float)
+    dev_fee_rate = db.Column(db.Float)
+    extra_investment = db.Column(db.Float)
+    resource_fee_total = db.Column(db.Float)
+    dengpin_cost = db.Column(db.Float)
+
+    # 计算结果
+    commission_income = db.Column(db.Float)
+    resource_income = db.Column(db.Float)
+    total_income = db.Column(db.Float)
+    net_profit = db.Column(db.Float)
+    roi_percentage = db.Column(db.Float)
+
+    # 金额相对该项目上一条快照的变化量（第一条为初值），按周期求和即得组合合计的变化
+    total_project_cost_change = db.Column(db.Float)
+    dengpin_cost_change = db.Column(db.Float)
+    commission_income_change = db.Column(db.Float)
+    resource_income_change = db.Column(db.Float)
+    total_income_change = db.Column(db.Float)
+    net_profit_change = db.Column(db.Float)
+    # 项目删除或不再有收益分析时追加的移除快照（金额为空，变化量为上一条快照的负值）
+    removed = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # 组合项目数的变化：首次或移除后再次有收益分析为 1，移除为 -1，其余为 0
+    projects_change = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<ProfitAnalysisSnapshot project={self.project_id} {self.taken_at}>'
+
 class ProjectDocument(db.Model):
     """项目文档模型，用于存储项目相关文档。"""
     id = db.Column(db.Integer, primary_key=True)
@@ -286,10 +398,144 @@ class ProjectDocument(db.Model):
     description = db.Column(db.Text)  # 文档描述
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content_hash = db.Column(db.String(64), db.ForeignKey('document_blob.sha256'), index=True)  # 内容SHA-256哈希（内容寻址存储）
     
     # 关系
     project = db.relationship('Project', backref='documents')
     uploader = db.relationship('User', backref='uploaded_documents')
+    blob = db.relationship('DocumentBlob')
     
     def __repr__(self):
-        return f'<ProjectDocument {self.filename} for Project {self.project_id}>'
\ No newline at end of file
+        return f'<ProjectDocument {self.filename} for Project {self.project_id}>'
+
+class DocumentBlob(db.Model):
+    """内容寻址存储的文档实体，相同内容只保存一份，由ProjectDocument引用计数。"""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), index=True, unique=True, nullable=False)  # 内容哈希，同时决定存储路径
+    size = db.Column(db.Integer, nullable=False)  # 文件大小（字节）
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # 引用该实体的文档记录数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DocumentBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+
+class DocumentPreview(db.Model):
+    """文档后处理结果：提取的正文、页数和缩略图，由后台流水线异步生成。"""
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('project_document.id'), unique=True, nullable=False)
+    content_hash = db.Column(db.String(64), index=True)  # 生成结果时文档的内容哈希，用于复用和判断是否过期
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, processing, done, failed, unavailable
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 已尝试处理次数
+    next_attempt_at = db.Column(db.DateTime)  # 下次重试时间
+    last_error = db.Column(db.Text)  # 最近一次错误或处理说明
+    text_content = db.Column(db.Text)  # 提取的正文文本
+    page_count = db.Column(db.Integer)  # 页数（PDF）
+    thumbnail_path = db.Column(db.String(255))  # 缩略图文件名（相对 THUMBNAIL_DIR）
+    processed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    document = db.relationship('ProjectDocument', backref=db.backref(
+        'preview', uselist=False, cascade='all, delete-orphan'))
+
+    def copy_results_from(self, other):
+        """复用相同内容文档的处理结果。"""
+        self.content_hash = other.content_hash
+        self.text_content = other.text_content
+        self.page_count = other.page_count
+        self.thumbnail_path = other.thumbnail_path
+        self.last_error = other.last_error
+        self.status = 'done'
+        self.next_attempt_at = None
+        self.processed_at = datetime.utcnow()
+
+    @property
+    def excerpt(self):
+        """列表页展示的正文摘要。"""
+        if not self.text_content:
+            return ''
+        text = ' '.join(self.text_content.split())
+        return text[:120] + ('…' if len(text) > 120 else '')
+
+    def __repr__(self):
+        return f'<DocumentPreview document={self.document_id} {self.status}>'
+
+
+class ProjectStageTransition(db.Model):
+    """项目阶段流转记录：每次阶段变化追加一行，由 app.lifecycle.change_stage 写入。"""
+    __tablename__ = 'project_stage_transition'
+    __table_args__ = (
+        # 单个项目的时间线、查询进入当前阶段的时间
+        db.Index('ix_stage_transition_project', 'project_id', 'transitioned_at'),
+        # 覆盖索引：停留时长按离开的阶段和时间范围查询，无需回表
+        db.Index('ix_stage_transition_from', 'from_stage', 'transitioned_at', 'dwell_seconds',
+                 'project_type', 'manager_id'),
+        # 覆盖索引：吞吐量和转化漏斗按进入的阶段和时间范围查询
+        db.Index('ix_stage_transition_to', 'to_stage', 'transitioned_at', 'project_id',
+                 'project_type', 'manager_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    from_stage = db.Column(db.String(64))  # 离开的阶段，新建项目为空
+    to_stage = db.Column(db.String(64), nullable=False)  # 进入的阶段
+    project_type = db.Column(db.String(64))  # 流转时的项目类型
+    manager_id = db.Column(db.Integer)  # 流转时的项目经理
+    user_id = db.Column(db.Integer)  # 操作人，不设外键，删除用户后记录仍保留
+    entered_at = db.Column(db.DateTime)  # 进入 from_stage 的时间
+    transitioned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    dwell_seconds = db.Column(db.Integer)  # 在 from_stage 停留的秒数
+
+    project = db.relationship('Project', backref=db.backref(
+        'stage_transitions', cascade='all, delete-orphan', order_by='ProjectStageTransition.transitioned_at'))
+
+    def __repr__(self):
+        return f'<ProjectStageTransition {self.project_id} {self.from_stage}->{self.to_stage}>'
+
+
+class AuditLog(db.Model):
+    """审计日志：记录关键业务数据的新增、修改和删除（只追加，由 app.audit 后台批量写入）。"""
+    __tablename__ = 'audit_log'
+    __table_args__ = (db.Index('ix_audit_log_entity', 'entity', 'entity_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(50), nullable=False)  # 表名，如 project、profit_analysis
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # create, update, delete
+    changes = db.Column(db.JSON)  # {字段: [修改前, 修改后]}
+    user_id = db.Column(db.Integer, index=True)  # 操作人，不设外键，删除用户后记录仍保留
+    username = db.Column(db.String(64))  # 操作时的用户名
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<AuditLog {self.action} {self.entity}#{self.entity_id}>'
+
+
+# 只追加：SQLite 上用触发器拒绝修改和删除审计记录（迁移中创建同样的触发器）
+AUDIT_LOG_TRIGGERS = (
+    "CREATE TRIGGER audit_log_no_update BEFORE UPDATE ON audit_log "
+    "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END",
+    "CREATE TRIGGER audit_log_no_delete BEFORE DELETE ON audit_log "
+    "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END",
+)
+for _statement in AUDIT_LOG_TRIGGERS:
+    event.listen(AuditLog.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+# 造价模型版本不可修改（迁移中创建同样的触发器）
+COST_MODEL_VERSION_TRIGGERS = (
+    "CREATE TRIGGER cost_model_version_no_update BEFORE UPDATE ON cost_model_version "
+    "BEGIN SELECT RAISE(ABORT, 'cost_model_version is immutable'); END",
+)
+for _statement in COST_MODEL_VERSION_TRIGGERS:
+    event.listen(CostModelVersion.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+# 收益分析快照只追加（迁移中创建同样的触发器）
+PROFIT_SNAPSHOT_TRIGGERS = (
+    "CREATE TRIGGER profit_analysis_snapshot_no_update BEFORE UPDATE ON profit_analysis_snapshot "
+    "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END",
+    "CREATE TRIGGER profit_analysis_snapshot_no_delete BEFORE DELETE ON profit_analysis_snapshot "
+    "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END",
+)
+for _statement in PROFIT_SNAPSHOT_TRIGGERS:
+    event.listen(ProfitAnalysisSnapshot.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
@@ -54,31 +54,76 @@ ROLE_PERMISSIONS = {
     }
 }
 
+def compile_role_masks(role_permissions):
+    """
+    将角色权限表编译为整数位掩码
+
+    Returns:
+        tuple: (权限名 -> 权限位, 角色 -> 权限掩码)
+    """
+    bits = {}
+    for permissions in role_permissions.values():
+        for name in permissions:
+            bits.setdefault(name, 1 << len(bits))
+    masks = {
+        role: sum(bits[name] for name, granted in permissions.items() if granted)
+        for role, permissions in role_permissions.items()
+    }
+    return bits, masks
+
+# 启动时编译，权限判断只做位运算
+PERMISSION_BITS, ROLE_MASKS = compile_role_masks(ROLE_PERMISSIONS)
+
+# 项目级操作：具有对应权限位时可作用于所有项目，否则只能作用于自己管理的项目
+PROJECT_ACTIONS = {
+    'view': 'can_view_all_projects',
+    'edit': 'can_edit_all_projects',
+    'delete': 'can_delete_projects',
+    'documents': 'can_edit_all_projects',  # 查看、上传、下载项目文档
+}
+ACTION_BITS = {action: PERMISSION_BITS[name] for action, name in PROJECT_ACTIONS.items()}
+
+def permission_mask(role):
+    """返回角色的权限掩码，未知角色为 0"""
+    return ROLE_MASKS.get(role, 0)
+
+def can(user, action, project=None):
+    """
+    授权判断，只比较用户 id 和权限掩码，不访问 ORM 关系
+
+    Args:
+        user: current_user、SessionUser 或 User
+        action (str): PROJECT_ACTIONS 中的项目级操作，或 ROLE_PERMISSIONS 中的权限名
+        project: 具有 manager_id 属性的对象（Project、查询结果行），项目级操作需要
+
+    Returns:
+        bool
+    """
+    if user is None or not user.is_authenticated:
+        return False
+    mask = user.permission_mask
+    bit = ACTION_BITS.get(action)
+    if bit is None:
+        return bool(mask & PERMISSION_BITS.get(action, 0))
+    if mask & bit:
+        return True
+    return project is not None and project.manager_id == user.id
+
+def filter_allowed(user, action, projects):
+    """批量过滤列表中用户可以执行指定操作的项目"""
+    if user is None or not user.is_authenticated:
+        return []
+    if user.permission_mask & ACTION_BITS[action]:
+        return list(projects)
+    return [project for project in projects if project.manager_id == user.id]
+
 def has_permission(permission_name):
     """检查当前用户是否具有指定权限"""
-    if not current_user.is_authenticated:
-        return False
-    
-    user_role = current_user.role
-    if user_role not in ROLE_PERMISSIONS:
-        return False
-    
-    return ROLE_PERMISSIONS[user_role].get(permission_name, False)
+    return can(current_user, permission_name)
 
 def can_edit_project(project):
     """检查当前用户是否可以编辑指定项目"""
-    if not current_user.is_authenticated:
-        return False
-    
-    # 管理员可以编辑所有项目
-    if has_permission('can_edit_all_projects'):
-        return True
-    
-    # 项目经理只能编辑自己管理的项目
-    if current_user.role == '项目经理' and project.manager_id == current_user.id:
-        return True
-    
-    return False
+    return can(current_user, 'edit', project)
 
 def require_permission(permission_name):
     """权限装饰器，要求用户具有指定权限"""
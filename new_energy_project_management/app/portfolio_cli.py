@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目组合批量维护命令（flask portfolio ...）
+
+在一个进程中完成此前由各自创建应用的临时脚本承担的批量维护：
+
+- recompute-costs：按项目装机容量重新计算成本明细的总成本
+- rebuild-totals：按成本明细汇总重建收益分析中的项目总造价
+- recompute-profits：按收益分析的输入参数重新计算委托费、资源费分成、总收益、净利润和ROI
+- recompute-all：一次完成以上三项
+- verify：比较已保存的值与重新计算的结果，不写入，有差异时以非0退出，可作为定时任务运行
+
+按项目 id 区间分块处理：每块先由 app.consistency 向量化计算差异（--workers 大于1时在子进程中
+并行计算，子进程只读），再由主进程加载有差异的记录修改并提交，每块一次写事务。修改经 ORM 完成，
+审计日志和收益分析快照照常记录。--dry-run 只报告差异，不写入；--report 将结果写入 JSON 文件。
+"""
+
+import json
+import multiprocessing
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.db_engine import commit_with_retry
+
+# 全部检查（与 app.consistency.CHECKS 一致；numpy 只在执行命令时才加载）
+ALL_CHECKS = ('costs', 'totals', 'profits')
+
+portfolio_cli = AppGroup('portfolio', help='项目组合批量维护：重新计算成本明细和收益分析，校验已保存的结果。')
+
+
+# ----------------------------------------------------------------------
+# 分块执行
+# ----------------------------------------------------------------------
+
+def run_checks(names, chunk_size=5000, workers=1, dry_run=False, progress=False):
+    """
+    对全部项目分块执行检查，非 dry_run 时每块修正后提交一次
+
+    Args:
+        names (list): app.consistency.CHECKS 中的检查名称
+        chunk_size (int): 每块的项目数
+        workers (int): 计算差异的子进程数，1 表示在当前进程中计算
+        dry_run (bool): 为 True 时只返回差异，不写入
+        progress (bool): 是否显示进度条
+
+    Returns:
+        dict: 检查名称 -> 差异列表（app.consistency.Diff），按 CHECKS 的顺序
+    """
+    from app.consistency import CHECKS
+    from app.models import Project
+
+    names = tuple(name for name in CHECKS if name in names)
+    project_ids = [project_id for (project_id,) in db.session.query(Project.id).order_by(Project.id)]
+    chunks = [project_ids[i:i + chunk_size] for i in range(0, len(project_ids), chunk_size)]
+    ranges = [(chunk[0], chunk[-1], names) for chunk in chunks]
+    db.session.commit()
+
+    pool = _worker_pool(workers) if workers > 1 and chunks else None
+    results = {name: [] for name in names}
+    try:
+        if pool is not None:
+            computed = pool.imap(_check_range, ranges)
+        else:
+            computed = (_check_in_session(*args) for args in ranges)
+        label = '、'.join(CHECKS[name] for name in names)
+        with click.progressbar(length=len(project_ids), label=label, hidden=not progress) as bar:
+            for chunk, chunk_results in zip(chunks, computed):
+                chunk_diffs = [diff for name in names for diff in chunk_results[name]]
+                if chunk_diffs and not dry_run:
+                    apply_diffs(chunk_diffs)
+                for name in names:
+                    results[name].extend(chunk_results[name])
+                bar.update(len(chunk))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def apply_diffs(diffs):
+    """将差异中的重新计算结果写回记录，作为一个写事务提交。"""
+    from app.models import ProfitAnalysis, ProjectCostDetail
+
+    models = {'project_cost_detail': ProjectCostDetail, 'profit_analysis': ProfitAnalysis}
+    by_entity = {}
+    for diff in diffs:
+        by_entity.setdefault(diff.entity, []).append(diff)
+
+    def update_records():
+        for entity, entity_diffs in by_entity.items():
+            model = models[entity]
+            ids = {diff.entity_id for diff in entity_diffs}
+            records = {record.id: record for record in model.query.filter(model.id.in_(ids))}
+            for diff in entity_diffs:
+                if diff.entity_id in records:
+                    setattr(records[diff.entity_id], diff.field, diff.expected)
+
+    commit_with_retry(update_records)
+
+
+def _check_in_session(first_id, last_id, names):
+    from app.consistency import check_projects
+
+    try:
+        return check_projects(first_id, last_id, names)
+    finally:
+        # 只读查询，结束读事务，避免长时间持有快照
+        db.session.commit()
+
+
+def _worker_pool(workers):
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        raise click.UsageError('内存数据库不能在多个进程间共享，请使用 --workers 1')
+    config = {key: value for key, value in current_app.config.items() if key.isupper()}
+    # spawn：子进程不继承父进程的数据库连接和后台线程
+    context = multiprocessing.get_context('spawn')
+    return context.Pool(workers, initializer=_init_worker, initargs=(config,))
+
+
+_worker_app = None
+
+
+def _init_worker(config):
+    global _worker_app
+    from app import create_app
+
+    _worker_app = create_app(type('PortfolioWorkerConfig', (), config))
+
+
+def _check_range(args):
+    from app.consistency import check_projects
+
+    first_id, last_id, names = args
+    with _worker_app.app_context():
+        try:
+            return check_projects(first_id, last_id, names)
+        finally:
+            db.session.remove()
+
+
+# ----------------------------------------------------------------------
+# 命令
+# ----------------------------------------------------------------------
+
+def _batch_options(dry_run=True):
+    def decorator(func):
+        func = click.option('--report', type=click.Path(dir_okay=False, writable=True),
+                            help='将结果（各项差异数和前 --show 条差异）写入 JSON 文件')(func)
+        func = click.option('--show', default=20, show_default=True, type=click.IntRange(0),
+                            help='最多列出的差异条数')(func)
+        func = click.option('--workers', default=1, show_default=True, type=click.IntRange(1),
+                            help='并行计算差异的进程数')(func)
+        func = click.option('--chunk-size', default=5000, show_default=True, type=click.IntRange(1),
+                            help='每块处理的项目数，每块提交一次')(func)
+        if dry_run:
+            func = click.option('--dry-run', is_flag=True, help='只报告差异，不写入')(func)
+        return func
+    return decorator
+
+
+def _run(names, chunk_size, workers, dry_run, show, report):
+    from app.consistency import CHECKS
+
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+    results = run_checks(names, chunk_size=chunk_size, workers=workers, dry_run=dry_run, progress=True)
+    duration = time.perf_counter() - start
+
+    summary = {'started_at': started_at.isoformat(), 'duration_seconds': round(duration, 3),
+               'dry_run': dry_run, 'checks': {}}
+    for name, diffs in results.items():
+        fields = dict(sorted(Counter(diff.field for diff in diffs).items()))
+        summary['checks'][name] = {'label': CHECKS[name], 'mismatches': len(diffs), 'fields': fields,
+                                   'samples': [diff._asdict() for diff in diffs[:show]]}
+        action = '未写入' if dry_run else '已修正'
+        click.echo(f'{CHECKS[name]}：差异 {len(diffs)} 处' + (f'（{action}）' if diffs else ''))
+        for field, count in fields.items():
+            click.echo(f'  {field}: {count}')
+        for diff in diffs[:show]:
+            click.echo(f'  {diff.entity}#{diff.entity_id}（项目 {diff.project_id}）{diff.field}: '
+                       f'{diff.stored} -> {diff.expected}')
+        if len(diffs) > show:
+            click.echo(f'  …… 另有 {len(diffs) - show} 处')
+    click.echo(f'用时 {duration:.2f}s')
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return sum(len(diffs) for diffs in results.values())
+
+
+@portfolio_cli.command('recompute-costs')
+@_batch_options()
+def recompute_costs(chunk_size, workers, dry_run, show, report):
+    """按项目装机容量重新计算全部成本明细的总成本。"""
+    _run(['costs'], chunk_size, workers, dry_run, show, report)
+
+
+@portfolio_cli.command('rebuild-totals')
+@_batch_options()
+def rebuild_totals(chunk_size, workers, dry_run, show, report):
+    """按成本明细汇总重建收益分析中的项目总造价。"""
+    _run(['totals'], chunk_size, workers, dry_run, show, report)
+
+
+@portfolio_cli.command('recompute-profits')
+@_batch_options()
+def recompute_profits(chunk_size, workers, dry_run, show, report):
+    """按输入参数重新计算全部收益分析的结果。"""
+    _run(['profits'], chunk_size, workers, dry_run, show, report)
+
+
+@portfolio_cli.command('recompute-all')
+@_batch_options()
+def recompute_all(chunk_size, workers, dry_run, show, report):
+    """重新计算成本明细、重建项目总造价、重新计算收益分析。"""
+    _run(ALL_CHECKS, chunk_size, workers, dry_run, show, report)
+
+
+@portfolio_cli.command('verify')
+@_batch_options(dry_run=False)
+def verify(chunk_size, workers, show, report):
+    """校验已保存的成本明细、项目总造价和收益分析结果，有差异时以非0退出。"""
+    if _run(ALL_CHECKS, chunk_size, workers, True, show, report):
+        raise click.exceptions.Exit(1)
@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+投资组合优化：在资金和容量约束下选择推进到投资决策的项目
+
+按登品预算、各类型容量和各省份项目数上限求解 0/1 背包，使净利润或总收益之和最大，
+并给出各约束和各项目的边际价值；不依赖外部求解器。
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+from sqlalchemy import select
+
+from app.consistency import UNIT_CAPACITY_FACTORS, fetch_columns, profit_results, round_half_up
+from app.revenue_share import get_revenue_share_schedules
+
+# 可优化的目标（收益分析结果字段）
+OBJECTIVES = ('net_profit', 'total_income')
+
+# 预算约束的投入口径 -> 说明
+COST_BASES = {'investment': '工程总造价（标准造价模型）', 'dengpin_cost': '登品投入'}
+
+# 默认候选项目：处于前期开发、待进入投资决策的项目
+DEFAULT_STAGES = ('前期开发',)
+
+# 求解状态：optimal 已证明最优；node_limit 分支定界节点数达到上限，返回当前最优解
+STATUS_OPTIMAL, STATUS_NODE_LIMIT = 'optimal', 'node_limit'
+
+DEFAULT_NODE_LIMIT = 1000000
+DEFAULT_GAP = 0.0
+
+# 坐标下降求乘子的最大轮数；其后次梯度法的最大迭代次数、步长系数连续未改进多少次后减半及其下限
+_MAX_SWEEPS = 50
+_SUBGRADIENT_ITERATIONS = 500
+_SUBGRADIENT_PATIENCE = 20
+_MIN_STEP_SCALE = 1e-6
+
+# 比较目标值和资源占用时的误差（金额保存到分，远大于该值）
+_EPSILON = 1e-6
+
+
+def optimize(values, costs, budget, capacity_mw=None, project_types=None, provinces=None,
+             capacity_limits=None, province_limits=None, node_limit=DEFAULT_NODE_LIMIT, gap=DEFAULT_GAP):
+    """
+    求解 0/1 项目选择问题
+
+    先用拉格朗日松弛求各约束的乘子（边际价值）和上界，按边际价值贪心得到可行解并固定变量，
+    其余项目深度优先分支定界；节点数达到上限时返回当前最优解和上界（status 为 node_limit）。
+
+    Args:
+        values: 各项目的目标值（万元），不大于 0 的项目不入选
+        costs: 各项目的投入（万元）
+        budget (float): 投入之和的上限（万元）
+        capacity_mw: 各项目装机容量（MW），有容量上限时需要
+        project_types: 各项目类型，有容量上限时需要
+        provinces: 各项目省份，有省份上限时需要
+        capacity_limits (dict): 项目类型 -> 入选容量上限（MW）
+        province_limits (dict): 省份 -> 入选项目数上限
+        node_limit (int): 分支定界的节点数上限
+        gap (float): 相对误差，证明不存在比当前解高出该比例以上的解即停止；为 0 时求精确最优解
+
+    Returns:
+        dict: selected（是否入选的布尔数组）、objective（目标值之和）、upper_bound（最优值的上界）、
+            status、nodes（分支定界节点数）、constraints（各约束的上限、占用和边际价值）、
+            marginal_values（各项目的边际价值）
+
+    Raises:
+        ValueError: 预算、上限或相对误差不合法
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+    n = len(values)
+    gap = _limit(gap, '相对误差')
+    rows = _constraint_rows(n, costs, budget, capacity_mw, project_types, provinces,
+                            capacity_limits or {}, province_limits or {})
+    limits = np.array([row['limit'] for row in rows])
+    usage = np.array([row['usage'] for row in rows]).reshape(len(rows), n)
+
+    # 单独入选就超出某项上限，或目标不为正的项目不参与求解
+    eligible = (values > 0) & np.all(usage <= limits[:, None] + _EPSILON, axis=0)
+    items = np.flatnonzero(eligible)
+    # 归一化：各约束除以上限；上限为 0 的约束不占用任何候选项目，不参与松弛
+    positive = limits > 0
+    scaled = np.zeros((len(rows), len(items)))
+    scaled[positive] = usage[positive][:, items] / limits[positive, None]
+
+    item_values, item_usage = values[items], usage[:, items]
+    multipliers, bound, lower, incumbent = _lagrangian_multipliers(item_values, scaled, item_usage, limits)
+    # 代理约束：各约束按乘子加权合并，项目的边际价值 = 目标 - 代理占用
+    weights = multipliers @ scaled
+    reduced = item_values - weights
+
+    upper = bound
+    status, nodes, free_count = STATUS_OPTIMAL, 0, None
+    while True:
+        # 按边际价值固定变量：只有同时满足全部固定条件的解才可能比下界高出 margin 以上
+        margin = max(_EPSILON, gap * abs(lower))
+        fixed_in = (reduced > 0) & (bound - reduced <= lower + margin)
+        fixed_out = (reduced <= 0) & (bound + reduced <= lower + margin)
+        free = np.flatnonzero(~fixed_in & ~fixed_out)
+        residual = limits - item_usage[:, fixed_in].sum(axis=1)
+        if np.any(residual < -_EPSILON):
+            break
+        if not len(free):
+            if item_values[fixed_in].sum() > lower + _EPSILON:
+                lower, incumbent = float(item_values[fixed_in].sum()), list(np.flatnonzero(fixed_in))
+            break
+        capacity = float(multipliers.sum() - weights[fixed_in].sum())
+        fixed_value = float(item_values[fixed_in].sum())
+        upper = min(upper, fixed_value + _fractional_bound(item_values[free], weights[free], max(capacity, 0.0)))
+        # 找到更优解后固定更多变量、重新搜索；固定变量不再减少时一直搜索到结束
+        restart = free_count is None or len(free) < free_count
+        free_count = len(free)
+        found, best, searched, complete = _branch_and_bound(
+            item_values[free], weights[free], item_usage[:, free], residual, capacity,
+            lower - fixed_value, margin, node_limit - nodes, restart)
+        nodes += searched
+        if found is not None:
+            lower = best + fixed_value
+            incumbent = list(np.flatnonzero(fixed_in)) + [int(free[j]) for j in found]
+        if complete:
+            break
+        if nodes >= node_limit:
+            status = STATUS_NODE_LIMIT
+            break
+    if status == STATUS_OPTIMAL:
+        upper = min(upper, lower + margin) if gap else lower
+
+    selected = np.zeros(n, dtype=bool)
+    selected[items[np.asarray(incumbent, dtype=np.int64)]] = True
+    prices = np.where(positive, multipliers / np.where(positive, limits, 1.0), np.nan)
+    used = usage[:, selected].sum(axis=1)
+    constraints = [{'kind': row['kind'], 'key': row['key'], 'limit': float(row['limit']),
+                    'used': round(float(used[k]), 4),
+                    'marginal_value': None if np.isnan(prices[k]) else round(float(prices[k]), 6)}
+                   for k, row in enumerate(rows)]
+    marginal_values = values - np.nan_to_num(prices) @ usage
+    return {'selected': selected, 'objective': round(float(values[selected].sum()), 2),
+            'upper_bound': round(float(max(upper, lower)), 2), 'status': status, 'nodes': nodes,
+            'constraints': constraints, 'marginal_values': marginal_values}
+
+
+def _constraint_rows(n, costs, budget, capacity_mw, project_types, provinces, capacity_limits, province_limits):
+    """约束行：预算在第一行，其后为各类型容量和各省份项目数，每行为上限和各项目的占用。"""
+    rows = [{'kind': 'budget', 'key': None, 'limit': _limit(budget, '预算'),
+             'usage': np.maximum(np.nan_to_num(np.asarray(costs, dtype=float)), 0.0)}]
+    if capacity_limits:
+        capacity = np.maximum(np.nan_to_num(np.asarray(capacity_mw, dtype=float)), 0.0)
+        types = np.asarray(project_types, dtype=object)
+        for project_type, limit in capacity_limits.items():
+            rows.append({'kind': 'capacity', 'key': project_type,
+                         'limit': _limit(limit, f'{project_type}容量上限'),
+                         'usage': np.where(types == project_type, capacity, 0.0)})
+    if province_limits:
+        regions = np.asarray(provinces, dtype=object)
+        for province, limit in province_limits.items():
+            rows.append({'kind': 'province', 'key': province, 'limit': _limit(limit, f'{province}项目数上限'),
+                         'usage': (regions == province).astype(float)})
+    for row in rows:
+        if len(row['usage']) != n:
+            raise ValueError('各项目参数的长度必须相同')
+    return rows
+
+
+def _limit(value, label):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{label}必须是数值')
+    if not np.isfinite(value) or value < 0:
+        raise ValueError(f'{label}必须是不小于0的有限数值')
+    return value
+
+
+def _greedy(order, values, usage, limits):
+    """
+    按给定顺序逐个选入仍满足全部约束的项目，返回 (目标值之和, 入选项目下标)
+
+    按轮向量化：累加剩余项目的占用，选入第一个超出上限的项目之前的全部项目并跳过该项目，再去掉单独
+    也放不下的项目后进入下一轮。
+    """
+    residual = np.asarray(limits, dtype=float) + _EPSILON
+    order = np.asarray(order, dtype=np.int64)
+    chosen = []
+    while len(order):
+        order = order[np.all(usage[:, order] <= residual[:, None], axis=0)]
+        cumulative = np.cumsum(usage[:, order], axis=1)
+        over = np.flatnonzero(np.any(cumulative > residual[:, None], axis=0))
+        accepted = over[0] if len(over) else len(order)
+        if accepted:
+            chosen.append(order[:accepted])
+            residual -= cumulative[:, accepted - 1]
+        order = order[accepted + 1:]
+    chosen = np.concatenate(chosen) if chosen else np.zeros(0, dtype=np.int64)
+    return float(values[chosen].sum()), chosen.tolist()
+
+
+def _lagrangian_multipliers(values, scaled, usage, limits):
+    """
+    求归一化约束的拉格朗日乘子，同时用乘子下的贪心解改进下界
+
+    L(λ) 是凸的分段线性函数。先坐标下降：固定其余乘子时，按 (剩余边际价值 / 占用) 降序选入项目直到
+    占满约束 k，下一个项目的该比值即为约束 k 的最优乘子（上限增加时才能选入的项目的价格），排序后一次
+    求得；各约束轮流更新到上界不再下降后，坐标下降可能停在折点上，再用次梯度法（Polyak 步长）继续下降。
+
+    Returns:
+        tuple: (乘子数组, 上界 L(λ), 下界, 下界对应的入选项目下标)
+    """
+    multipliers = np.zeros(scaled.shape[0])
+    reduced = values.copy()
+    lower, incumbent = _greedy(_ratio_order(values, scaled.sum(axis=0)), values, usage, limits)
+    upper = float(values.sum())
+    for _ in range(_MAX_SWEEPS):
+        for k in np.flatnonzero(scaled.any(axis=1)):
+            reduced += multipliers[k] * scaled[k]
+            candidates = np.flatnonzero((scaled[k] > 0) & (reduced > 0))
+            prices = reduced[candidates] / scaled[k, candidates]
+            order = np.argsort(-prices, kind='stable')
+            filled = np.searchsorted(np.cumsum(scaled[k, candidates[order]]), 1.0, side='right')
+            multipliers[k] = prices[order[filled]] if filled < len(order) else 0.0
+            reduced -= multipliers[k] * scaled[k]
+        bound = float(multipliers.sum() + reduced[reduced > 0].sum())
+        value, chosen = _greedy(np.argsort(-reduced, kind='stable'), values, usage, limits)
+        if value > lower:
+            lower, incumbent = value, chosen
+        # 每次坐标更新都不增大 L(λ)，最后一轮的乘子即为当前最优
+        improved = bound < upper - _EPSILON * max(1.0, abs(upper))
+        upper = bound
+        if not improved or upper - lower <= _EPSILON:
+            break
+
+    best = multipliers.copy()
+    step_scale, stalled = 0.5, 0
+    for iteration in range(_SUBGRADIENT_ITERATIONS):
+        if upper - lower <= _EPSILON or step_scale < _MIN_STEP_SCALE:
+            break
+        reduced = values - multipliers @ scaled
+        chosen = reduced > 0
+        bound = float(multipliers.sum() + reduced[chosen].sum())
+        if bound < upper - _EPSILON:
+            best, upper, stalled = multipliers, bound, 0
+        else:
+            stalled += 1
+            if stalled >= _SUBGRADIENT_PATIENCE:
+                step_scale, stalled = step_scale / 2, 0
+        if iteration % _SUBGRADIENT_PATIENCE == 0:
+            value, chosen_items = _greedy(np.argsort(-reduced, kind='stable'), values, usage, limits)
+            if value > lower:
+                lower, incumbent = value, chosen_items
+        gradient = 1.0 - scaled[:, chosen].sum(axis=1)
+        # 乘子为 0 且约束未占满的方向不再减小
+        gradient[(multipliers <= 0) & (gradient > 0)] = 0.0
+        norm = float(gradient @ gradient)
+        if norm == 0:
+            break
+        multipliers = np.maximum(multipliers - step_scale * (bound - lower) / norm * gradient, 0.0)
+    return best, upper, lower, incumbent
+
+
+def _fractional_bound(values, costs, budget):
+    """只考虑一个约束、允许选入部分项目时的最大目标值（分数背包），是 0/1 问题的上界。"""
+    values, costs = np.asarray(values, dtype=float), np.asarray(costs, dtype=float)
+    order = _ratio_order(values, costs)
+    cumulative = np.cumsum(costs[order])
+    whole = int(np.searchsorted(cumulative, budget + _EPSILON, side='right'))
+    bound = float(values[order[:whole]].sum())
+    if whole < len(order):
+        spent = float(cumulative[whole - 1]) if whole else 0.0
+        bound += (budget - spent) / costs[order[whole]] * values[order[whole]]
+    return bound
+
+
+def _ratio_order(values, costs):
+    """按单位占用的目标值降序（不占用的项目在前）。"""
+    with np.errstate(divide='ignore'):
+        ratio = np.where(costs > 0, values / np.where(costs > 0, costs, 1.0), np.inf)
+    return np.argsort(-ratio, kind='stable')
+
+
+def _branch_and_bound(values, weights, usage, limits, capacity, lower, margin, node_limit, restart=False):
+    """
+    深度优先分支定界，先选入后不选
+
+    按乘子合并各约束为一个代理约束（项目占用 weights，剩余容量 capacity），剩余项目按单位代理占用的
+    目标降序排列，节点上界为代理约束的分数背包上界，不超过当前最优值加 margin 时剪枝；选入项目时检查
+    usage 中的全部约束。restart 为真时找到优于 lower 的解后在回溯前返回，由调用方固定更多变量后重新搜索。
+
+    Returns:
+        tuple: (最优解的下标列表，未找到优于 lower 的解时为 None, 其目标值, 节点数, 是否搜索完毕)
+    """
+    order = _ratio_order(values, weights)
+    values = [float(values[i]) for i in order]
+    weights = [float(weights[i]) for i in order]
+    # 每个项目只占用少数几项约束，保存为 (约束序号, 占用) 列表
+    item_usage = [[(int(k), float(usage[k, i])) for k in np.flatnonzero(usage[:, i] > 0)] for i in order]
+    count = len(order)
+    prefix_weights, prefix_values = [0.0], [0.0]
+    for weight, value in zip(weights, values):
+        prefix_weights.append(prefix_weights[-1] + weight)
+        prefix_values.append(prefix_values[-1] + value)
+
+    residual = [float(limit) + _EPSILON for limit in limits]
+    chosen = []
+    best, found = lower, None
+    value = 0.0
+    depth = nodes = 0
+    while True:
+        nodes += 1
+        if value > best + _EPSILON:
+            best, found = value, list(chosen)
+        if depth < count:
+            end = prefix_weights[depth] + max(capacity, 0.0) + _EPSILON
+            whole = bisect_right(prefix_weights, end, depth) - 1
+            bound = value + prefix_values[whole] - prefix_values[depth]
+            if whole < count and weights[whole] > 0:
+                bound += (end - prefix_weights[whole]) / weights[whole] * values[whole]
+            if bound > best + margin:
+                if nodes >= node_limit:
+                    return _positions(order, found), best, nodes, False
+                usage = item_usage[depth]
+                if all(residual[k] >= amount for k, amount in usage):
+                    for k, amount in usage:
+                        residual[k] -= amount
+                    value += values[depth]
+                    capacity -= weights[depth]
+                    chosen.append(depth)
+                depth += 1
+                continue
+        # 回溯：最近选入的项目改为不选
+        if restart and found is not None:
+            return _positions(order, found), best, nodes, False
+        if not chosen:
+            return _positions(order, found), best, nodes, True
+        last = chosen.pop()
+        for k, amount in item_usage[last]:
+            residual[k] += amount
+        value -= values[last]
+        capacity += weights[last]
+        depth = last + 1
+
+
+def _positions(order, found):
+    return None if found is None else [int(order[i]) for i in found]
+
+
+def investment_costs(project_types, capacity_mw, stored_costs):
+    """
+    按当前标准造价模型计算各项目的工程总造价（万元），与 CostModel.calculate_total_cost 相同
+
+    没有造价模型的项目类型取 stored_costs（收益分析中保存的总造价）。
+    """
+    from app.models import CostModel
+
+    unit_costs = {model.project_type: sum(float(cost) for cost in (model.cost_items or {}).values())
+                  * UNIT_CAPACITY_FACTORS.get(model.unit_cost_label, 0.0)
+                  for model in CostModel.query.all()}
+    project_types = np.asarray(project_types, dtype=object)
+    factors = np.array([unit_costs.get(project_type, np.nan) for project_type in project_types], dtype=float)
+    estimated = round_half_up(np.asarray(capacity_mw, dtype=float) * factors)
+    return np.where(np.isnan(factors), np.asarray(stored_costs, dtype=float), estimated)
+
+
+def optimize_portfolio(budget, objective='net_profit', cost_basis='investment', capacity_limits=None,
+                       province_limits=None, stages=DEFAULT_STAGES, project_ids=None,
+                       node_limit=DEFAULT_NODE_LIMIT, gap=DEFAULT_GAP):
+    """
+    对有收益分析的候选项目求解最优组合
+
+    Args:
+        budget (float): 预算（万元）
+        objective (str): 目标，OBJECTIVES 之一
+        cost_basis (str): 预算约束的投入口径，COST_BASES 之一
+        capacity_limits (dict): 项目类型 -> 入选容量上限（MW）
+        province_limits (dict): 省份 -> 入选项目数上限
+        stages (tuple): 候选项目所处阶段，为空时不限
+        project_ids (list): 只考虑这些项目
+        node_limit (int): 分支定界的节点数上限
+        gap (float): 相对误差，见 optimize
+
+    Returns:
+        dict: 求解状态、目标值之和及上界、各约束的占用和边际价值，以及每个候选项目的投入、目标值、
+            是否入选和边际价值；缺少装机容量或投入的项目不参与求解，计入 skipped
+    """
+    from app.models import ProfitAnalysis as A, Project
+
+    if objective not in OBJECTIVES:
+        raise ValueError(f'不支持的目标：{objective}，可选 {", ".join(OBJECTIVES)}')
+    if cost_basis not in COST_BASES:
+        raise ValueError(f'不支持的投入口径：{cost_basis}，可选 {", ".join(COST_BASES)}')
+
+    query = (select(A.project_id, Project.name, Project.project_type, Project.province, Project.capacity_mw,
+                    A.dev_fee_rate, A.extra_investment, A.resource_fee_total, A.dengpin_cost,
+                    A.revenue_share_schedule_id, A.total_project_cost)
+             .join(Project, Project.id == A.project_id).order_by(A.project_id, A.id))
+    if stages:
+        query = query.where(Project.current_stage.in_(stages))
+    if project_ids is not None:
+        query = query.where(A.project_id.in_(project_ids))
+    columns = fetch_columns(query, (np.int64, object, object, object) + (float,) * 7)
+    # 每个项目取最新的收益分析
+    ids = columns[0]
+    last = len(ids) - 1 - np.unique(ids[::-1], return_index=True)[1]
+    (ids, names, project_types, provinces, capacity, rate, extra, fee, dengpin,
+     schedule_ids, stored_costs) = (column[last] for column in columns)
+
+    schedules = get_revenue_share_schedules().compiled_by_id(np.unique(schedule_ids[~np.isnan(schedule_ids)]))
+    values = profit_results(capacity, rate, extra, fee, dengpin, schedule_ids=schedule_ids,
+                            schedules=schedules)[objective]
+    if cost_basis == 'investment':
+        costs = investment_costs(project_types, capacity, stored_costs)
+    else:
+        costs = np.nan_to_num(dengpin)
+    valid = ~np.isnan(values) & ~np.isnan(costs)
+
+    result = optimize(values[valid], costs[valid], budget, capacity[valid], project_types[valid],
+                      provinces[valid], capacity_limits, province_limits, node_limit, gap)
+    selected, marginal_values = result.pop('selected'), result.pop('marginal_values')
+    rows = np.flatnonzero(valid)
+    result.update({
+        'objective_field': objective,
+        'cost_basis': cost_basis,
+        'candidates': int(valid.sum()),
+        'skipped': int((~valid).sum()),
+        'selected_count': int(selected.sum()),
+        'projects': [{'project_id': int(ids[i]), 'name': names[i], 'project_type': project_types[i],
+                      'province': provinces[i], 'capacity_mw': float(capacity[i]),
+                      'cost': float(costs[i]), 'value': float(values[i]), 'selected': bool(selected[j]),
+                      'marginal_value': round(float(marginal_values[j]), 2)}
+                     for j, i in enumerate(rows)],
+    })
+    return result
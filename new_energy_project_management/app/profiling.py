@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求性能剖析模块
+
+为每个请求记录耗时构成，定位慢页面的原因：
+- 总耗时、SQL语句数和SQL总耗时（SQLAlchemy cursor 事件）
+- 模板渲染耗时（Flask 模板信号）
+- 内存分配峰值（tracemalloc，可选，开启后有一定开销）
+
+超过阈值的请求以 JSON 行写入慢请求日志；按采样率对请求做 cProfile
+（或 pyinstrument）剖析并保存剖析文件。各端点的汇总统计保存在进程内，
+可在管理员后台"性能分析"页面查看最慢的端点。
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+from flask import g, request, has_request_context, template_rendered, before_render_template, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('app.slow_requests')
+
+_sql_events_registered = False
+# SQL语句耗时回调，由运行指标等模块注册，共用本模块的 cursor 事件监听
+_query_observers = []
+
+
+class RequestStats:
+    """单个请求的耗时统计。"""
+
+    __slots__ = ('started', 'sql_count', 'sql_ms', 'template_ms', 'template_depth',
+                 'template_started', 'profiler', 'status_code', 'finished')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+        self.profiler = None
+        self.status_code = None
+        self.finished = False
+
+
+class EndpointStats:
+    """单个端点的累计统计，保留最近的耗时样本用于计算分位数。"""
+
+    def __init__(self, endpoint, sample_size):
+        self.endpoint = endpoint
+        self.count = 0
+        self.slow_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.peak_kb = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, record, slow):
+        self.count += 1
+        self.slow_count += int(slow)
+        self.total_ms += record['duration_ms']
+        self.max_ms = max(self.max_ms, record['duration_ms'])
+        self.sql_count += record['sql_count']
+        self.sql_ms += record['sql_ms']
+        self.template_ms += record['template_ms']
+        if record.get('peak_kb') is not None:
+            self.peak_kb = max(self.peak_kb, record['peak_kb'])
+        self.samples.append(record['duration_ms'])
+
+    def summary(self):
+        samples = sorted(self.samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+        count = self.count or 1
+        return {
+            'endpoint': self.endpoint,
+            'count': self.count,
+            'slow_count': self.slow_count,
+            'avg_ms': round(self.total_ms / count, 2),
+            'p95_ms': round(p95, 2),
+            'max_ms': round(self.max_ms, 2),
+            'total_ms': round(self.total_ms, 2),
+            'avg_sql_count': round(self.sql_count / count, 1),
+            'avg_sql_ms': round(self.sql_ms / count, 2),
+            'avg_template_ms': round(self.template_ms / count, 2),
+            'max_peak_kb': round(self.peak_kb, 1) if self.peak_kb else None,
+        }
+
+
+class RequestProfiler:
+    """请求剖析扩展，在 create_app 中注册。"""
+
+    SORT_KEYS = ('avg_ms', 'p95_ms', 'max_ms', 'total_ms', 'avg_sql_count', 'avg_sql_ms', 'count')
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow_requests = deque()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 每个请求都有统计开销，未配置时只在调试模式下开启
+        app.config.setdefault('PROFILING_ENABLED', app.debug)
+        app.config.setdefault('PROFILING_SLOW_THRESHOLD_MS', 500)
+        app.config.setdefault('PROFILING_SLOW_LOG', None)
+        app.config.setdefault('PROFILING_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILING_ENGINE', 'cprofile')
+        app.config.setdefault('PROFILING_PROFILE_DIR', os.path.join(os.path.dirname(app.root_path), 'profiles'))
+        app.config.setdefault('PROFILING_TRACEMALLOC', False)
+        app.config.setdefault('PROFILING_RECENT_SLOW', 100)
+        app.config.setdefault('PROFILING_SAMPLE_SIZE', 200)
+
+        self.app = app
+        self._slow_requests = deque(maxlen=app.config['PROFILING_RECENT_SLOW'])
+        app.extensions['request_profiler'] = self
+        if not app.config['PROFILING_ENABLED']:
+            return
+
+        if app.config['PROFILING_SLOW_LOG']:
+            _attach_slow_log_handler(app.config['PROFILING_SLOW_LOG'])
+        if app.config['PROFILING_TRACEMALLOC'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        _register_sql_events()
+
+    # ------------------------------------------------------------------
+    # 请求钩子
+    # ------------------------------------------------------------------
+
+    def _before_request(self):
+        stats = RequestStats()
+        g._request_stats = stats
+
+        if self.app.config['PROFILING_TRACEMALLOC'] and tracemalloc.is_tracing():
+            # 峰值为进程级数据，多线程并发时只能作为参考
+            tracemalloc.reset_peak()
+
+        rate = self.app.config['PROFILING_SAMPLE_RATE']
+        if rate and random.random() < rate:
+            stats.profiler = _start_profiler(self.app.config['PROFILING_ENGINE'])
+
+    def _after_request(self, response):
+        stats = g.get('_request_stats')
+        if stats is not None:
+            stats.status_code = response.status_code
+            duration_ms = (time.perf_counter() - stats.started) * 1000
+            response.headers['Server-Timing'] = (
+                f'app;dur={duration_ms:.1f}, db;dur={stats.sql_ms:.1f};desc="{stats.sql_count} queries", '
+                f'tpl;dur={stats.template_ms:.1f}'
+            )
+        return response
+
+    def _teardown_request(self, exc=None):
+        stats = g.pop('_request_stats', None)
+        if stats is None or stats.finished:
+            return
+        stats.finished = True
+
+        duration_ms = (time.perf_counter() - stats.started) * 1000
+        endpoint = request.endpoint or '<unmatched>'
+        record = {
+            'timestamp': datetime.utcnow().isoformat(timespec='milliseconds') + 'Z',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': stats.status_code or (500 if exc is not None else None),
+            'duration_ms': round(duration_ms, 2),
+            'sql_count': stats.sql_count,
+            'sql_ms': round(stats.sql_ms, 2),
+            'template_ms': round(stats.template_ms, 2),
+            'peak_kb': None,
+        }
+        if self.app.config['PROFILING_TRACEMALLOC'] and tracemalloc.is_tracing():
+            record['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        if stats.profiler is not None:
+            record['profile'] = self._save_profile(stats.profiler, endpoint)
+
+        slow = duration_ms >= self.app.config['PROFILING_SLOW_THRESHOLD_MS']
+        with self._lock:
+            endpoint_stats = self._endpoints.get(endpoint)
+            if endpoint_stats is None:
+                endpoint_stats = self._endpoints[endpoint] = EndpointStats(
+                    endpoint, self.app.config['PROFILING_SAMPLE_SIZE'])
+            endpoint_stats.add(record, slow)
+            if slow:
+                self._slow_requests.append(record)
+
+        if slow:
+            slow_logger.warning(json.dumps(record, ensure_ascii=False))
+
+    def _save_profile(self, profiler, endpoint):
+        profile_dir = self.app.config['PROFILING_PROFILE_DIR']
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+            name = f"{endpoint.replace('.', '_').strip('<>')}_{stamp}"
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+                name += '.prof'
+                profiler.dump_stats(os.path.join(profile_dir, name))
+            else:
+                profiler.stop()
+                name += '.html'
+                with open(os.path.join(profile_dir, name), 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+            return name
+        except Exception:
+            logger.exception('保存剖析文件失败')
+            return None
+
+    # ------------------------------------------------------------------
+    # 查询接口
+    # ------------------------------------------------------------------
+
+    def worst_endpoints(self, sort='avg_ms', limit=20):
+        """按指定指标降序返回端点统计。"""
+        if sort not in self.SORT_KEYS:
+            sort = 'avg_ms'
+        with self._lock:
+            summaries = [stats.summary() for stats in self._endpoints.values()]
+        summaries.sort(key=lambda item: item[sort], reverse=True)
+        return summaries[:limit]
+
+    def slow_requests(self, limit=50):
+        with self._lock:
+            return list(reversed(self._slow_requests))[:limit]
+
+    def list_profiles(self, limit=50):
+        profile_dir = self.app.config['PROFILING_PROFILE_DIR']
+        if not os.path.isdir(profile_dir):
+            return []
+        names = [name for name in os.listdir(profile_dir) if name.endswith(('.prof', '.html'))]
+        names.sort(key=lambda name: os.path.getmtime(os.path.join(profile_dir, name)), reverse=True)
+        return names[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slow_requests.clear()
+
+
+def get_request_profiler(app=None):
+    return (app or current_app).extensions['request_profiler']
+
+
+def _start_profiler(engine):
+    if engine == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning('未安装 pyinstrument，改用 cProfile')
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ 同一时间只允许一个剖析器，并发采样时跳过本次
+        return None
+    return profiler
+
+
+def _attach_slow_log_handler(path):
+    path = os.path.abspath(path)
+    for handler in slow_logger.handlers:
+        if getattr(handler, 'baseFilename', None) == path:
+            return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_logger.addHandler(handler)
+    slow_logger.setLevel(logging.WARNING)
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is None:
+        return
+    if stats.template_depth == 0:
+        stats.template_started = time.perf_counter()
+    stats.template_depth += 1
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is None or stats.template_depth == 0:
+        return
+    stats.template_depth -= 1
+    if stats.template_depth == 0:
+        stats.template_ms += (time.perf_counter() - stats.template_started) * 1000
+
+
+def add_query_observer(callback):
+    """注册SQL语句耗时回调 callback(elapsed_seconds)，在每条语句执行后调用（包括后台线程）。"""
+    if callback not in _query_observers:
+        _query_observers.append(callback)
+    _register_sql_events()
+
+
+def _register_sql_events():
+    # 监听所有 Engine，请求统计只计入处于请求上下文中的语句（后台线程不计入）
+    global _sql_events_registered
+    if _sql_events_registered:
+        return
+    _sql_events_registered = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats = _current_stats()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_ms += elapsed * 1000
+        for callback in _query_observers:
+            callback(elapsed)
+
+    @event.listens_for(Engine, 'handle_error')
+    def _handle_error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get('_query_start'):
+            conn.info['_query_start'].pop()
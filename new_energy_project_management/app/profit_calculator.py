@@ -9,6 +9,9 @@
 
 from decimal import Decimal, ROUND_HALF_UP
 
+from app.metrics import count_calls
+from app.revenue_share import default_schedule
+
 
 class ProfitCalculator:
     """收益计算器 - 实现技术文档中定义的所有计算模型"""
@@ -25,6 +28,7 @@ class ProfitCalculator:
     DEFAULT_DEV_FEE_RATE = Decimal('0.1')  # 0.1元/W
     
     @staticmethod
+    @count_calls('calculate_commission_revenue')
     def calculate_commission_revenue(capacity_mw, dev_fee_rate=None, extra_investment=0):
         """
         计算委托费收益 - Model 4.1
@@ -63,20 +67,24 @@ class ProfitCalculator:
         return float(final_revenue.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     @staticmethod
-    def calculate_resource_share_revenue(resource_fee_total):
+    @count_calls('calculate_resource_share_revenue')
+    def calculate_resource_share_revenue(resource_fee_total, schedule=None):
         """
         计算资源费分成收益 - Model 4.2
         
         业务逻辑：登品科技与沃太能源合作的收益，根据沃太获取的资源费总额，
         按累进分级的比例进行分成。
         
-        累进分级规则：
+        默认累进分级规则：
         - 0-4000万元：25%分成
         - 4000-8000万元：75%分成  
         - 8000万元以上：66.67%分成
         
+        其他合同的分级由资源费分成方案（app.revenue_share）配置。
+        
         Args:
             resource_fee_total (float): 资源费总额，单位为万元
+            schedule (CompiledSchedule): 编译后的分成方案，默认使用上述分级
             
         Returns:
             float: 资源费分成收益，单位为万元
@@ -86,30 +94,14 @@ class ProfitCalculator:
         if resource_fee_total <= 0:
             return 0.0
         
-        total_revenue = Decimal('0')
-        
-        # 第一级收益计算 (0-4000万元，25%分成)
-        if resource_fee_total > 0:
-            amount_in_tier_1 = min(resource_fee_total, ProfitCalculator.TIER_1_LIMIT)
-            tier_1_revenue = amount_in_tier_1 * ProfitCalculator.RATE_1
-            total_revenue += tier_1_revenue
-        
-        # 第二级收益计算 (4000-8000万元，75%分成)
-        if resource_fee_total > ProfitCalculator.TIER_1_LIMIT:
-            amount_in_tier_2 = min(resource_fee_total, ProfitCalculator.TIER_2_LIMIT) - ProfitCalculator.TIER_1_LIMIT
-            tier_2_revenue = amount_in_tier_2 * ProfitCalculator.RATE_2
-            total_revenue += tier_2_revenue
-        
-        # 第三级收益计算 (8000万元以上，66.67%分成)
-        if resource_fee_total > ProfitCalculator.TIER_2_LIMIT:
-            amount_in_tier_3 = resource_fee_total - ProfitCalculator.TIER_2_LIMIT
-            tier_3_revenue = amount_in_tier_3 * ProfitCalculator.RATE_3
-            total_revenue += tier_3_revenue
+        # 二分查找所在分级：该级起点的累计分成 + 超出起点部分 × 该级比例
+        total_revenue = (schedule or default_schedule()).share(resource_fee_total)
         
         # 返回浮点数结果，保留2位小数
         return float(total_revenue.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     @staticmethod
+    @count_calls('calculate_total_revenue')
     def calculate_total_revenue(commission_revenue, resource_share_revenue):
         """
         计算项目总收益 - Model 5.1
@@ -129,6 +121,7 @@ class ProfitCalculator:
         return float(total_revenue.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     @staticmethod
+    @count_calls('calculate_roi')
     def calculate_roi(total_revenue, dengpin_cost):
         """
         计算投资回报率(ROI) - Model 5.2
@@ -155,9 +148,10 @@ class ProfitCalculator:
         return float(roi_percentage.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
     
     @classmethod
+    @count_calls('calculate_comprehensive_profit_analysis')
     def calculate_comprehensive_profit_analysis(cls, capacity_mw, dev_fee_rate=None, 
                                               extra_investment=0, resource_fee_total=0,
-                                              dengpin_cost=0):
+                                              dengpin_cost=0, schedule=None):
         """
         综合收益分析计算 - 一次性计算所有收益指标
         
@@ -167,6 +161,7 @@ class ProfitCalculator:
             extra_investment (float): 政府要求额外投资，单位为万元
             resource_fee_total (float): 资源费总额，单位为万元
             dengpin_cost (float): 登品自身投入成本，单位为万元
+            schedule (CompiledSchedule): 资源费分成方案，默认使用类中定义的累进分级
             
         Returns:
             dict: 包含所有收益分析结果的字典
@@ -177,7 +172,7 @@ class ProfitCalculator:
         )
         
         # 计算资源费分成收益
-        resource_share_revenue = cls.calculate_resource_share_revenue(resource_fee_total)
+        resource_share_revenue = cls.calculate_resource_share_revenue(resource_fee_total, schedule)
         
         # 计算项目总收益
         total_revenue = cls.calculate_total_revenue(commission_revenue, resource_share_revenue)
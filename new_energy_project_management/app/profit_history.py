@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+收益分析历史快照
+
+每次新增或重新计算收益分析时，在同一事务中向只追加的 profit_analysis_snapshot 写入一行输入参数和结果；
+项目不再有收益分析时追加移除快照。提供单个项目的快照序列和组合按周期的收益趋势。
+"""
+
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+
+from app import db
+from app.lifecycle import PERIOD_FORMATS, period_expression
+
+# 快照保存的输入参数和计算结果（与 ProfitAnalysis 同名）
+INPUT_FIELDS = ('total_project_cost', 'dev_fee_rate', 'extra_investment', 'resource_fee_total', 'dengpin_cost')
+RESULT_FIELDS = ('commission_income', 'resource_income', 'total_income', 'net_profit', 'roi_percentage')
+SNAPSHOT_FIELDS = ('cost_model_version_id',) + INPUT_FIELDS + RESULT_FIELDS
+
+# 组合历史按周期汇总的金额（万元）
+PORTFOLIO_MEASURES = ('total_project_cost', 'dengpin_cost', 'commission_income', 'resource_income',
+                      'total_income', 'net_profit')
+CHANGE_FIELDS = tuple(f'{measure}_change' for measure in PORTFOLIO_MEASURES)
+SNAPSHOT_COLUMNS = ('project_id', 'taken_at', 'capacity_mw', 'removed') + SNAPSHOT_FIELDS + CHANGE_FIELDS
+
+
+class ProfitHistory:
+    """收益分析快照的写入开关，PROFIT_SNAPSHOTS_ENABLED 为 False 时不记录快照。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFIT_SNAPSHOTS_ENABLED', True)
+        self.app = app
+        self.enabled = app.config['PROFIT_SNAPSHOTS_ENABLED']
+        app.extensions['profit_history'] = self
+        if self.enabled:
+            _register_session_events()
+
+
+def snapshot_dict(snapshot):
+    """快照记录转换为可序列化为 JSON 的字典。"""
+    data = {'project_id': snapshot.project_id, 'taken_at': snapshot.taken_at.isoformat(),
+            'capacity_mw': snapshot.capacity_mw, 'removed': snapshot.removed}
+    data.update((field, getattr(snapshot, field)) for field in SNAPSHOT_FIELDS)
+    return data
+
+
+def project_history(project_id, since=None, until=None):
+    """
+    单个项目的收益分析快照，按时间先后排列
+
+    Args:
+        project_id (int): 项目ID
+        since (datetime): 起始时间（含），默认不限
+        until (datetime): 截止时间（不含），默认不限
+
+    Returns:
+        list: ProfitAnalysisSnapshot 列表
+    """
+    from app.models import ProfitAnalysisSnapshot as S
+
+    query = S.query.filter(S.project_id == project_id)
+    if since is not None:
+        query = query.filter(S.taken_at >= since)
+    if until is not None:
+        query = query.filter(S.taken_at < until)
+    return query.order_by(S.taken_at, S.id).all()
+
+
+def portfolio_history(period='month', since=None, until=None, project_ids=None):
+    """
+    组合收益的历史趋势：每个周期末各项目最新快照的合计
+
+    周期内没有快照的项目沿用之前的最新快照，没有任何重新计算的周期也会输出（值与上一周期相同）。
+
+    Args:
+        period (str): 统计周期，day / week / month / year
+        since (datetime): 起始时间，之前的快照作为期初值，默认从第一条快照开始
+        until (datetime): 截止时间（不含），默认到最后一条快照
+        project_ids (list): 只统计这些项目，默认全部
+
+    Returns:
+        list: [{'period', 'projects', 'recalculations', <PORTFOLIO_MEASURES>...}]，
+        projects 为该周期末有收益分析的项目数，recalculations 为该周期内的快照数（含移除快照）
+    """
+    from app.models import ProfitAnalysisSnapshot as S
+
+    if period not in PERIOD_FORMATS:
+        raise ValueError(f'不支持的统计周期: {period}')
+    if since is not None and until is not None and since >= until:
+        return []
+
+    def restrict(query, taken_at):
+        if until is not None:
+            query = query.filter(taken_at < until)
+        if project_ids is not None:
+            query = query.filter(S.project_id.in_(project_ids))
+        return query
+
+    # 各周期的快照数、项目数变化和金额变化量之和
+    bucket = period_expression(period, S.taken_at)
+    query = db.session.query(bucket, func.count(), func.sum(S.projects_change),
+                             *[func.sum(getattr(S, field)) for field in CHANGE_FIELDS])
+    changes = {label: row for label, *row in restrict(query, S.taken_at).group_by(bucket)}
+    if not changes:
+        return []
+
+    first_label = min(changes)
+    last_label = max(changes)
+    if since is not None:
+        first_label = min(first_label, period_label(period, since))
+        last_label = max(last_label, period_label(period, since))
+    if until is not None:
+        last_label = max(last_label, period_label(period, until, exclusive=True))
+    calendar = _period_calendar(period, first_label, last_label)
+
+    empty = (0, None) + (None,) * len(CHANGE_FIELDS)
+    recalculations = [changes.get(label, empty)[0] for label in calendar]
+    projects = list(accumulate(changes.get(label, empty)[1] or 0 for label in calendar))
+    totals = [list(accumulate(changes.get(label, empty)[j + 2] or 0.0 for label in calendar))
+              for j in range(len(PORTFOLIO_MEASURES))]
+
+    start = calendar.index(period_label(period, since)) if since is not None else 0
+    return [
+        dict(period=calendar[i], projects=projects[i], recalculations=recalculations[i],
+             **{measure: round(totals[j][i], 2) for j, measure in enumerate(PORTFOLIO_MEASURES)})
+        for i in range(start, len(calendar))
+    ]
+
+
+# 快照同时保存金额相对该项目上一条快照的变化量（*_change 列）和项目数变化（projects_change）。
+# 组合在某周期末的合计（各项目截至该周期的最新快照之和）等于此前各周期变化量之和，portfolio_history
+# 因此只需按周期 GROUP BY 求和再累加，不必读取全部快照逐项目比较。移除快照的变化量为上一条快照的负值。
+# 同一项目的重新计算在更新 profit_analysis 行时已持有该行的写锁，变化量按提交顺序计算。
+def append_snapshots(connection, rows):
+    """
+    追加快照并补全金额变化量列
+
+    rows 为快照字典（至少包含 project_id 和 taken_at，移除快照 removed 为真），按 taken_at 先后计算相对
+    该项目上一条快照的变化量和项目数变化，同一批中同一项目的多条快照依次计算。快照须按时间顺序追加。
+
+    Args:
+        connection: 当前事务的数据库连接（Session.connection()）
+        rows (list): 快照字典列表
+    """
+    from app.models import ProfitAnalysisSnapshot
+
+    table = ProfitAnalysisSnapshot.__table__
+    rows = sorted(rows, key=lambda row: row['taken_at'])
+    # 项目ID -> (上一条快照的金额, 是否计入组合)
+    latest = {}
+    for project_id in {row['project_id'] for row in rows}:
+        previous = connection.execute(
+            select(table.c.removed, *[table.c[measure] for measure in PORTFOLIO_MEASURES])
+            .where(table.c.project_id == project_id)
+            .order_by(table.c.taken_at.desc(), table.c.id.desc()).limit(1)).first()
+        if previous is None:
+            latest[project_id] = ([0.0] * len(PORTFOLIO_MEASURES), False)
+        else:
+            latest[project_id] = ([value or 0.0 for value in previous[1:]], not previous.removed)
+
+    records = []
+    for row in rows:
+        removed = bool(row.get('removed'))
+        values = [0.0 if removed else row.get(measure) or 0.0 for measure in PORTFOLIO_MEASURES]
+        previous, present = latest[row['project_id']]
+        record = {column: row.get(column) for column in SNAPSHOT_COLUMNS}
+        record['removed'] = removed
+        record['projects_change'] = int(not removed) - int(present)
+        record.update((field, value - old) for field, value, old in zip(CHANGE_FIELDS, values, previous))
+        records.append(record)
+        latest[row['project_id']] = (values, not removed)
+    connection.execute(table.insert(), records)
+
+
+def period_label(period, value, exclusive=False):
+    """Python 端与 period_expression 一致的周期标签；exclusive 为 True 时取 value 之前最后一刻所在的周期。"""
+    if exclusive:
+        value = value - timedelta(microseconds=1)
+    if period == 'week' and db.session.get_bind().dialect.name == 'postgresql':
+        return value.strftime('%G-W%V')
+    return value.strftime(PERIOD_FORMATS[period][0])
+
+
+def _period_calendar(period, first_label, last_label):
+    """first_label 到 last_label 之间（含）的全部周期标签。"""
+    if period == 'year':
+        return [str(year) for year in range(int(first_label), int(last_label) + 1)]
+    if period == 'month':
+        year, month = map(int, first_label.split('-'))
+        labels = []
+        while True:
+            label = f'{year:04d}-{month:02d}'
+            labels.append(label)
+            if label >= last_label:
+                return labels
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    # 日、周：逐日生成标签后去重，跨年的一周在 SQLite 上分属两个年份的周编号，逐日生成才不会遗漏
+    day = _period_start(period, first_label)
+    labels = []
+    while True:
+        label = period_label(period, day)
+        if label >= first_label and (not labels or labels[-1] != label):
+            labels.append(label)
+        if label >= last_label:
+            return labels
+        day += timedelta(days=1)
+
+
+def _period_start(period, label):
+    if period == 'day':
+        return datetime.strptime(label, '%Y-%m-%d')
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return datetime.strptime(label + '-1', '%G-W%V-%u')
+    return datetime.strptime(label + '-1', '%Y-W%W-%w')
+
+
+# ----------------------------------------------------------------------
+# 会话事件：收益分析新增或重新计算时追加快照
+# ----------------------------------------------------------------------
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'after_flush', _record_snapshots)
+    _events_registered = True
+
+
+def _record_snapshots(session, flush_context):
+    """flush 后按属性历史找出新增或参数、结果有变化的收益分析，以及不再有收益分析的项目，追加快照。"""
+    from app.models import ProfitAnalysis
+
+    if not has_app_context():
+        return
+    history = current_app.extensions.get('profit_history')
+    if history is None or not history.enabled:
+        return
+
+    changed = [obj for obj in session.new if isinstance(obj, ProfitAnalysis)]
+    changed += [obj for obj in session.dirty if isinstance(obj, ProfitAnalysis) and _recalculated(obj)]
+    changed = [obj for obj in changed if obj.project_id is not None]
+    # 删除的收益分析，以及被置空或改挂 project_id 的收益分析原来所属的项目
+    detached = {obj.project_id for obj in session.deleted
+                if isinstance(obj, ProfitAnalysis) and obj.project_id is not None}
+    for obj in session.dirty:
+        if isinstance(obj, ProfitAnalysis):
+            detached.update(project_id for project_id in inspect(obj).attrs.project_id.history.deleted
+                            if project_id is not None and project_id != obj.project_id)
+    if detached:
+        # 项目还有其他收益分析时不算移除
+        remaining = session.connection().execute(
+            select(ProfitAnalysis.project_id).where(ProfitAnalysis.project_id.in_(detached))).scalars()
+        detached -= set(remaining)
+    if not changed and not detached:
+        return
+    now = datetime.utcnow()
+    rows = [{'project_id': project_id, 'taken_at': now, 'removed': True} for project_id in sorted(detached)]
+    with session.no_autoflush:
+        rows += [_snapshot_row(obj, now) for obj in changed]
+    append_snapshots(session.connection(), rows)
+
+
+def _recalculated(analysis):
+    state = inspect(analysis)
+    return any(state.attrs[key].history.has_changes() for key in SNAPSHOT_FIELDS + ('project_id',))
+
+
+def _snapshot_row(analysis, taken_at):
+    row = {field: getattr(analysis, field) for field in SNAPSHOT_FIELDS}
+    project = analysis.project
+    row.update(project_id=analysis.project_id, taken_at=taken_at,
+               capacity_mw=project.capacity_mw if project is not None else None)
+    return row
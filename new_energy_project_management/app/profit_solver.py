@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+收益反算：达到目标收益、净利润或ROI所需的资源费总额或开发收益费率
+
+ProfitCalculator 的委托费模型和资源费累进分成都是分段线性的：
+
+- 委托费收益 = max(0, 容量(MW) × 费率(元/W) × 100 - 额外投资)
+- 资源费分成 = 按收益分析引用的分成方案（默认 TIER_1_LIMIT、TIER_2_LIMIT 三级）分段，斜率为各级比例
+
+先把目标换算成所需的项目总收益，扣除不求解的一项收益后按分段直接反解（资源费分成在编译后方案的
+累计分成断点上 searchsorted 定位所在分级）。各项结果保留到分后有舍入，反解值附近再用向量化二分
+在输入的最小单位（资源费 0.01 万元、费率 0.0001 元/W）上找满足目标的最小值；反解值不能给出上界时
+从 0 开始倍增上界后二分。全部计算对整个组合的数组一次完成。
+"""
+
+import numpy as np
+
+from app.consistency import fetch_columns, profit_results
+from app.revenue_share import fee_for_share_batch, get_revenue_share_schedules
+
+# 可作为目标的收益分析结果字段
+TARGETS = ('total_income', 'net_profit', 'roi_percentage')
+
+# 可求解的输入 -> 最小单位
+SOLVE_FOR = {'resource_fee_total': 0.01, 'dev_fee_rate': 0.0001}
+
+# 求解状态：ok 已求出；met 不需要该项收益即可达到目标（所需值为 0）；unreachable 无法达到
+STATUS_OK, STATUS_MET, STATUS_UNREACHABLE = 'ok', 'met', 'unreachable'
+
+# 反解值附近的二分区间（最小单位个数），以及没有可用上界时倍增上界的次数
+_BRACKET_STEPS = 2
+_MAX_DOUBLINGS = 40
+
+
+def required_resource_fee(share, schedule_ids=None, schedules=None):
+    """资源费分成的反函数：得到指定分成（万元）所需的资源费总额（万元），不含舍入。"""
+    return fee_for_share_batch(share, schedule_ids, schedules)
+
+
+def required_total_income(target, value, dengpin_cost):
+    """把目标换算为所需的项目总收益（万元），ROI 目标在没有登品投入时为 NaN。"""
+    dengpin_cost = np.nan_to_num(np.asarray(dengpin_cost, dtype=float))
+    invested = dengpin_cost > 0
+    if target == 'total_income':
+        return np.full(dengpin_cost.shape, float(value))
+    if target == 'net_profit':
+        return np.where(invested, value + dengpin_cost, float(value))
+    if target == 'roi_percentage':
+        return np.where(invested, dengpin_cost * (1 + value / 100), np.nan)
+    raise ValueError(f'不支持的目标：{target}，可选 {", ".join(TARGETS)}')
+
+
+def solve(target, value, solve_for, capacity_mw, dev_fee_rate, extra_investment, resource_fee_total,
+          dengpin_cost, schedule_ids=None, schedules=None):
+    """
+    求达到目标所需的最小输入，其余输入保持不变
+
+    Args:
+        target (str): 目标字段，TARGETS 之一
+        value (float): 目标值（万元，ROI 为百分比）
+        solve_for (str): 求解的输入，SOLVE_FOR 之一
+        其余参数: 与 ProfitCalculator.calculate_comprehensive_profit_analysis 相同的等长数组，空值按收益分析页面处理；
+            schedule_ids、schedules 为各行的资源费分成方案，见 app.consistency.profit_results
+
+    Returns:
+        dict: required（所需值，无法达到时为 NaN）、status（状态数组）、achieved（按所需值计算的目标字段）
+    """
+    if solve_for not in SOLVE_FOR:
+        raise ValueError(f'不支持的求解参数：{solve_for}，可选 {", ".join(SOLVE_FOR)}')
+    value = float(value)
+    inputs = {
+        'capacity_mw': np.atleast_1d(np.asarray(capacity_mw, dtype=float)),
+        'dev_fee_rate': np.atleast_1d(np.asarray(dev_fee_rate, dtype=float)),
+        'extra_investment': np.atleast_1d(np.asarray(extra_investment, dtype=float)),
+        'resource_fee_total': np.atleast_1d(np.asarray(resource_fee_total, dtype=float)),
+        'dengpin_cost': np.atleast_1d(np.asarray(dengpin_cost, dtype=float)),
+    }
+    if schedule_ids is not None:
+        schedule_ids = np.atleast_1d(np.asarray(schedule_ids, dtype=float))
+    step = SOLVE_FOR[solve_for]
+    required_total = required_total_income(target, value, inputs['dengpin_cost'])
+    current = profit_results(**inputs, schedule_ids=schedule_ids, schedules=schedules)
+
+    # 扣除不求解的一项收益后按分段反解
+    if solve_for == 'resource_fee_total':
+        needed = required_total - current['commission_income']
+        closed_form = required_resource_fee(needed, schedule_ids, schedules)
+    else:
+        needed = required_total - current['resource_income']
+        capacity = np.nan_to_num(inputs['capacity_mw'])
+        extra = np.nan_to_num(inputs['extra_investment'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            closed_form = np.where(capacity > 0, (needed + extra) / (capacity * 100), np.nan)
+
+    status = np.full(needed.shape, STATUS_OK, dtype=object)
+    status[needed <= 0] = STATUS_MET
+    status[np.isnan(needed) | (np.isnan(closed_form) & (needed > 0))] = STATUS_UNREACHABLE
+
+    def meets(units, rows):
+        candidate = {key: column[rows] for key, column in inputs.items()}
+        candidate[solve_for] = units * step
+        row_schedules = None if schedule_ids is None else schedule_ids[rows]
+        with np.errstate(invalid='ignore'):
+            return profit_results(**candidate, schedule_ids=row_schedules, schedules=schedules)[target] >= value
+
+    rows = np.flatnonzero(status == STATUS_OK)
+    # 费率为 0 时按默认费率计算，费率最小取一个单位
+    floor_units = 1 if solve_for == 'dev_fee_rate' else 0
+    lo = np.maximum(np.floor(closed_form[rows] / step) - _BRACKET_STEPS, floor_units).astype(np.int64)
+    hi = np.maximum(np.ceil(closed_form[rows] / step) + _BRACKET_STEPS, floor_units).astype(np.int64)
+    units = _bisect_units(meets, rows, lo, hi, floor_units)
+
+    required = np.where(status == STATUS_MET, 0.0, np.nan)
+    solved = ~np.isnan(units)
+    required[rows[solved]] = np.round(units[solved] * step, 4)
+    status[rows[~solved]] = STATUS_UNREACHABLE
+
+    achieved_inputs = dict(inputs)
+    achieved_inputs[solve_for] = np.where(status == STATUS_OK, required, inputs[solve_for])
+    achieved = profit_results(**achieved_inputs, schedule_ids=schedule_ids, schedules=schedules)[target]
+    return {'required': required, 'status': status,
+            'achieved': np.where(status == STATUS_UNREACHABLE, np.nan, achieved)}
+
+
+def _bisect_units(meets, rows, lo, hi, floor_units):
+    """在最小单位的整数网格上二分，返回满足目标的最小单位数（浮点，找不到时为 NaN）。"""
+    units = np.full(len(rows), np.nan)
+    if not len(rows):
+        return units
+
+    # 反解区间不满足时，从最小值开始倍增上界
+    at_hi = meets(hi, rows)
+    retry = np.flatnonzero(~at_hi)
+    lo[retry] = floor_units
+    for _ in range(_MAX_DOUBLINGS):
+        if not len(retry):
+            break
+        hi[retry] = np.maximum(hi[retry] * 2, floor_units + 1)
+        found = meets(hi[retry], rows[retry])
+        at_hi[retry[found]] = True
+        retry = retry[~found]
+
+    # 舍入可能使目标在反解值之前就已达到：下界满足时退回最小值，最小值满足时即为所求。
+    # 之后对其余行保持 meets(lo) 为假、meets(hi) 为真
+    active = np.flatnonzero(at_hi)
+    early = active[meets(lo[active], rows[active])]
+    lo[early] = floor_units
+    done = early[meets(lo[early], rows[early])]
+    hi[done] = lo[done]
+    active = active[hi[active] - lo[active] > 1]
+    while len(active):
+        mid = (lo[active] + hi[active]) // 2
+        ok = meets(mid, rows[active])
+        hi[active[ok]] = mid[ok]
+        lo[active[~ok]] = mid[~ok]
+        active = active[hi[active] - lo[active] > 1]
+    units[at_hi] = hi[at_hi]
+    return units
+
+
+def solve_portfolio(target, value, solve_for, project_ids=None):
+    """
+    对已有收益分析的项目按当前输入求解
+
+    Args:
+        target (str): 目标字段，TARGETS 之一
+        value (float): 目标值
+        solve_for (str): 求解的输入，SOLVE_FOR 之一
+        project_ids (list): 只计算这些项目，默认全部
+
+    Returns:
+        list: 每个项目一个 dict（project_id、当前值、所需值、状态、按所需值计算的目标字段）
+    """
+    from sqlalchemy import select
+    from app.models import ProfitAnalysis as A, Project
+
+    if target not in TARGETS:
+        raise ValueError(f'不支持的目标：{target}，可选 {", ".join(TARGETS)}')
+    query = (select(A.project_id, Project.capacity_mw, A.dev_fee_rate, A.extra_investment,
+                    A.resource_fee_total, A.dengpin_cost, A.revenue_share_schedule_id)
+             .join(Project, Project.id == A.project_id).order_by(A.project_id))
+    if project_ids is not None:
+        query = query.where(A.project_id.in_(project_ids))
+    project_ids, *columns, schedule_ids = fetch_columns(query, (np.int64,) + (float,) * 6)
+    schedules = get_revenue_share_schedules().compiled_by_id(np.unique(schedule_ids[~np.isnan(schedule_ids)]))
+    result = solve(target, value, solve_for, *columns, schedule_ids=schedule_ids, schedules=schedules)
+    current = columns[['capacity_mw', 'dev_fee_rate', 'extra_investment', 'resource_fee_total',
+                       'dengpin_cost'].index(solve_for)]
+    return [{'project_id': int(project_id),
+             'current': None if np.isnan(current[i]) else float(current[i]),
+             'required': None if np.isnan(result['required'][i]) else float(result['required'][i]),
+             'status': result['status'][i],
+             target: None if np.isnan(result['achieved'][i]) else float(result['achieved'][i])}
+            for i, project_id in enumerate(project_ids)]
@@ -0,0 +1,41 @@
+"""
+报表导出
+
+pandas、ReportLab 和字体都很重，只在首次导出时才导入对应的子模块：
+- pdf: 项目报告PDF
+- portfolio: 项目组合PDF
+- excel: 项目报告Excel和全部项目汇总Excel
+- pdfkit: PDF 中文字体注册和共享样式
+
+这样 gunicorn 工作进程和 flask 命令行脚本启动时不需要加载这些依赖。
+"""
+
+from app.metrics import observe_report
+
+
+@observe_report('project_pdf')
+def generate_project_report_pdf(project_id):
+    """生成项目详细报告PDF。"""
+    from app.reports.pdf import generate_project_report_pdf
+    return generate_project_report_pdf(project_id)
+
+
+@observe_report('project_excel')
+def generate_project_report_excel(project_id):
+    """生成项目详细报告Excel。"""
+    from app.reports.excel import generate_project_report_excel
+    return generate_project_report_excel(project_id)
+
+
+@observe_report('all_projects_excel')
+def generate_all_projects_excel():
+    """生成所有项目汇总Excel报告。"""
+    from app.reports.excel import generate_all_projects_excel
+    return generate_all_projects_excel()
+
+
+@observe_report('portfolio_pdf')
+def generate_portfolio_pdf(project_type=None, stage=None, progress=None):
+    """生成项目组合PDF报告（封面汇总、分类统计、目录和逐项目章节）。"""
+    from app.reports.portfolio import generate_portfolio_pdf
+    return generate_portfolio_pdf(project_type=project_type, stage=stage, progress=progress)
@@ -0,0 +1,91 @@
+"""
+项目报告PDF
+
+ReportLab 只在首次导出时随本模块加载，字体和样式见 app.reports.pdfkit。
+"""
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+from reportlab.lib.units import inch
+import io
+from app.models import Project, ProfitAnalysis
+from app.cost_versions import version_for_project
+from app.reports.pdfkit import get_pdf_kit
+
+
+def generate_project_report_pdf(project_id):
+    """生成项目详细报告PDF。"""
+    project = Project.query.get_or_404(project_id)
+    profit_analysis = ProfitAnalysis.query.filter_by(project_id=project_id).first()
+    cost_model = version_for_project(project, profit_analysis)
+    kit = get_pdf_kit()
+    styles = kit.styles
+    
+    # 创建PDF文档
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+    
+    # 标题
+    story.append(Paragraph(f"新能源项目详细报告", styles['title']))
+    story.append(Paragraph(f"项目名称: {project.name}", styles['heading']))
+    story.append(Spacer(1, 12))
+    
+    # 项目基本信息
+    story.append(Paragraph("项目基本信息", styles['heading']))
+    project_data = [
+        ['项目名称', project.name],
+        ['项目类型', project.project_type],
+        ['装机容量', f"{project.capacity_mw} MW"],
+        ['当前阶段', project.current_stage],
+        ['项目经理', project.manager.username if project.manager else '未分配'],
+        ['创建时间', project.created_at.strftime('%Y-%m-%d %H:%M:%S')]
+    ]
+    
+    project_table = Table(project_data, colWidths=[2*inch, 3*inch])
+    project_table.setStyle(kit.table_styles['key_value'])
+    story.append(project_table)
+    story.append(Spacer(1, 20))
+    
+    # 成本估算信息
+    if cost_model:
+        story.append(Paragraph("成本估算信息", styles['heading']))
+        total_cost = cost_model.calculate_total_cost(project.capacity_mw)
+        
+        cost_data = [['成本项目', '单位成本', '总成本(万元)']]
+        for item, unit_cost in cost_model.cost_items.items():
+            if cost_model.unit_cost_label == '元/W':
+                total_item_cost = unit_cost * project.capacity_mw * 1000 / 10000  # 转换为万元
+                cost_data.append([item, f"{unit_cost} 元/W", f"{total_item_cost:.2f}"])
+            else:
+                total_item_cost = unit_cost * project.capacity_mw
+                cost_data.append([item, f"{unit_cost} 万元/MW", f"{total_item_cost:.2f}"])
+        
+        cost_data.append(['总计', '', f"{total_cost:.2f}"])
+        
+        cost_table = Table(cost_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
+        cost_table.setStyle(kit.table_styles['grid_total'])
+        story.append(cost_table)
+        story.append(Spacer(1, 20))
+    
+    # 收益分析信息
+    if profit_analysis:
+        story.append(Paragraph("收益分析信息", styles['heading']))
+        profit_data = [
+            ['项目工程总造价', f"{profit_analysis.total_project_cost:.2f} 万元"],
+            ['市场公允利润率', f"{profit_analysis.market_profit_rate}%"],
+            ['政府要求额外投资', f"{profit_analysis.extra_investment:.2f} 万元"],
+            ['预计/实际资源费总额', f"{profit_analysis.resource_fee_total:.2f} 万元"],
+            ['登品收益_委托费', f"{profit_analysis.commission_income:.2f} 万元"],
+            ['登品收益_资源费', f"{profit_analysis.resource_income:.2f} 万元"],
+            ['项目总收益', f"{profit_analysis.total_income:.2f} 万元"]
+        ]
+        
+        profit_table = Table(profit_data, colWidths=[2.5*inch, 2.5*inch])
+        profit_table.setStyle(kit.table_styles['key_value'])
+        story.append(profit_table)
+    
+    # 生成PDF
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
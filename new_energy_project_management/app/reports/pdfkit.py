@@ -0,0 +1,139 @@
+"""
+PDF 渲染工具集
+
+每个进程只注册一次中文字体，并缓存编译好的段落样式和表格样式，供所有PDF报表共用：
+- 优先使用 PDF_FONT_PATH 或 PDF_FONT_SEARCH_PATHS 中找到的 TrueType 字体，
+  ReportLab 嵌入时只写入用到的字形子集
+- 都找不到时使用 PDF_CID_FONT（默认 STSong-Light），不嵌入字形，由阅读器提供
+
+用法:
+    kit = get_pdf_kit()
+    story.append(Paragraph('标题', kit.styles['title']))
+    table.setStyle(kit.table_styles['key_value'])
+"""
+
+import logging
+import os
+import threading
+
+from flask import current_app, has_app_context
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.platypus import TableStyle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CID_FONT = 'STSong-Light'
+TTF_FONT_NAME = 'CJKFont'
+
+_lock = threading.Lock()
+_kits = {}
+
+
+def register_cjk_font(font_path=None, subfont_index=0, search_paths=(), cid_font=DEFAULT_CID_FONT):
+    """
+    注册中文字体
+
+    Returns:
+        str: 已注册的字体名
+    """
+    candidates = [font_path] if font_path else []
+    candidates.extend(path for path in search_paths if path and os.path.exists(path))
+    for path in candidates:
+        name = f'{TTF_FONT_NAME}-{os.path.splitext(os.path.basename(path))[0]}-{subfont_index}'
+        if name in pdfmetrics.getRegisteredFontNames():
+            return name
+        try:
+            pdfmetrics.registerFont(TTFont(name, path, subfontIndex=subfont_index))
+            return name
+        except (OSError, TTFError) as e:
+            logger.warning('PDF字体 %s 注册失败: %s', path, e)
+
+    if cid_font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(cid_font))
+    return cid_font
+
+
+class PdfKit:
+    """已注册的字体和按该字体编译好的样式。"""
+
+    def __init__(self, font_name):
+        self.font_name = font_name
+        self.styles = self._build_styles(font_name)
+        self.table_styles = self._build_table_styles(font_name)
+
+    @staticmethod
+    def _build_styles(font_name):
+        base = getSampleStyleSheet()
+        return {
+            'title': ParagraphStyle('KitTitle', parent=base['Heading1'], fontName=font_name,
+                                    fontSize=18, spaceAfter=30, alignment=1),
+            'heading': ParagraphStyle('KitHeading', parent=base['Heading2'], fontName=font_name,
+                                      fontSize=14, spaceAfter=12),
+            'subheading': ParagraphStyle('KitSubheading', parent=base['Heading3'], fontName=font_name,
+                                         fontSize=12, spaceAfter=8),
+            'normal': ParagraphStyle('KitNormal', parent=base['Normal'], fontName=font_name,
+                                     fontSize=10, spaceAfter=6),
+            'small': ParagraphStyle('KitSmall', parent=base['Normal'], fontName=font_name,
+                                    fontSize=8, textColor=colors.grey),
+            # 目录各级条目
+            'toc0': ParagraphStyle('KitTOC0', parent=base['Normal'], fontName=font_name,
+                                   fontSize=12, leading=16, spaceBefore=6),
+            'toc1': ParagraphStyle('KitTOC1', parent=base['Normal'], fontName=font_name,
+                                   fontSize=10, leading=13, leftIndent=20),
+        }
+
+    @staticmethod
+    def _build_table_styles(font_name):
+        common = [
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]
+        header = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ]
+        return {
+            # 左列为标签、右列为值的两列表格
+            'key_value': TableStyle(common + [
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+                ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ]),
+            # 标签、值交替排列的多列表格
+            'fields': TableStyle(common[:2] + [
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+                ('BACKGROUND', (2, 0), (2, -1), colors.lightgrey),
+            ]),
+            # 首行为表头
+            'grid': TableStyle(common + header),
+            # 首行为表头、末行为合计
+            'grid_total': TableStyle(common + header + [
+                ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+            ]),
+        }
+
+
+def get_pdf_kit(app=None):
+    """返回当前进程按应用字体配置缓存的 PdfKit，首次调用时注册字体。"""
+    if app is None and has_app_context():
+        app = current_app
+    config = app.config if app is not None else {}
+    key = (config.get('PDF_FONT_PATH'), config.get('PDF_FONT_SUBFONT_INDEX', 0),
+           tuple(config.get('PDF_FONT_SEARCH_PATHS') or ()), config.get('PDF_CID_FONT') or DEFAULT_CID_FONT)
+    kit = _kits.get(key)
+    if kit is None:
+        with _lock:
+            kit = _kits.get(key)
+            if kit is None:
+                kit = _kits[key] = PdfKit(register_cjk_font(*key))
+    return kit
@@ -0,0 +1,318 @@
+"""
+项目组合PDF报告
+
+封面汇总（口径与项目看板KPI一致）、按类型和按阶段统计表、目录，以及每个项目一节。
+
+- 数据一次性批量加载为轻量的行对象，不逐个项目调用 generate_project_report_pdf
+- 项目章节按 chunk_size 分块生成 flowable，排版时按需补充，内存中只保留少量未排版的内容
+- 目录需要知道页码：第一遍排版收集各章节页码（目录条目预先占位，保证目录页数不变），
+  第二遍输出最终文档
+- progress 回调在每页结束时调用：progress(pass_no, page, projects_done, total_projects)
+"""
+
+import io
+from collections import namedtuple
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch, cm
+from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, PageBreak, Paragraph, Spacer, Table, \
+    KeepTogether
+from reportlab.platypus.tableofcontents import TableOfContents
+from sqlalchemy import func
+
+from app import db
+from app.models import Project, User, ProfitAnalysis, ProjectDocument
+from app.cost_versions import current_versions, get_cost_version_cache
+from app.reports.pdfkit import get_pdf_kit
+
+# 与项目看板相同的阶段顺序和投资估算口径（万元/MW）
+STAGES = ['机会挖掘', '前期开发', '投资决策', '建设执行', '并网运营']
+INVESTMENT_PER_MW = 400
+
+DEFAULT_CHUNK_SIZE = 50
+MAX_PASSES = 3
+
+ProjectRow = namedtuple('ProjectRow', [
+    'id', 'name', 'project_type', 'capacity_mw', 'current_stage', 'province', 'city', 'created_at',
+    'manager', 'documents', 'total_cost', 'analysis',
+])
+AnalysisRow = namedtuple('AnalysisRow', [
+    'total_project_cost', 'commission_income', 'resource_income', 'total_income', 'net_profit', 'roi_percentage',
+])
+
+
+def load_portfolio(project_type=None, stage=None):
+    """
+    批量加载组合报告所需的全部数据（固定4次查询，与项目数量无关）
+
+    Returns:
+        list[ProjectRow]: 按项目ID排序
+    """
+    query = db.session.query(
+        Project.id, Project.name, Project.project_type, Project.capacity_mw, Project.current_stage,
+        Project.province, Project.city, Project.created_at, User.username,
+    ).outerjoin(User, Project.manager_id == User.id)
+    if project_type:
+        query = query.filter(Project.project_type == project_type)
+    if stage:
+        query = query.filter(Project.current_stage == stage)
+    project_rows = query.order_by(Project.id).all()
+    selected = query.with_entities(Project.id).subquery()
+
+    # 每个项目取第一条收益分析，与单项目报告一致
+    analyses = {}
+    for row in db.session.query(
+        ProfitAnalysis.project_id, ProfitAnalysis.total_project_cost, ProfitAnalysis.commission_income,
+        ProfitAnalysis.resource_income, ProfitAnalysis.total_income, ProfitAnalysis.net_profit,
+        ProfitAnalysis.roi_percentage,
+    ).filter(ProfitAnalysis.project_id.in_(db.select(selected.c.id))).order_by(ProfitAnalysis.id):
+        analyses.setdefault(row[0], AnalysisRow(*row[1:]))
+
+    documents = dict(db.session.query(ProjectDocument.project_id, func.count(ProjectDocument.id))
+                     .filter(ProjectDocument.project_id.in_(db.select(selected.c.id)))
+                     .group_by(ProjectDocument.project_id))
+    # 造价按造价模型版本缓存，造价模型未修改时重复导出不再重新计算
+    versions = current_versions()
+    cache = get_cost_version_cache()
+
+    portfolio = []
+    for (project_id, name, ptype, capacity, current_stage, province, city, created_at, manager) in project_rows:
+        version = versions.get(ptype)
+        total_cost = cache.total_cost(version, capacity) if version and capacity else None
+        portfolio.append(ProjectRow(
+            project_id, name, ptype, capacity, current_stage, province, city, created_at,
+            manager, documents.get(project_id, 0), total_cost, analyses.get(project_id),
+        ))
+    return portfolio
+
+
+def portfolio_kpis(portfolio):
+    """按项目看板 calculate_dashboard_kpis 的口径，从已加载的数据计算封面指标。"""
+    total_capacity = sum(p.capacity_mw or 0 for p in portfolio)
+    total_investment = sum((p.capacity_mw or 0) * INVESTMENT_PER_MW for p in portfolio)
+    analysed = [p for p in portfolio if p.analysis]
+    total_profit = sum(p.analysis.net_profit or 0 for p in analysed)
+    roi_values = [
+        (p.analysis.net_profit or 0) / (p.capacity_mw * INVESTMENT_PER_MW) * 100
+        for p in analysed if p.capacity_mw
+    ]
+    return {
+        'total_projects': len(portfolio),
+        'total_capacity': total_capacity,
+        'total_investment': total_investment,
+        'total_profit': total_profit,
+        'avg_roi': sum(roi_values) / len(roi_values) if roi_values else 0,
+        'total_documents': sum(p.documents for p in portfolio),
+        'projects_with_analysis': len(analysed),
+    }
+
+
+def group_totals(portfolio, key, order=()):
+    """按类型或阶段汇总项目数、装机容量、造价和收益，返回 [(名称, 汇总)]。"""
+    groups = {name: {'count': 0, 'capacity': 0.0, 'cost': 0.0, 'income': 0.0} for name in order}
+    for project in portfolio:
+        group = groups.setdefault(key(project) or '未知', {'count': 0, 'capacity': 0.0, 'cost': 0.0, 'income': 0.0})
+        group['count'] += 1
+        group['capacity'] += project.capacity_mw or 0
+        group['cost'] += project.total_cost or 0
+        group['income'] += (project.analysis.total_income or 0) if project.analysis else 0
+    return list(groups.items())
+
+
+class ChunkedStory(list):
+    """
+    按需从分块生成器补充 flowable 的故事列表
+
+    Platypus 排版时从列表头部逐个取出 flowable，这里在剩余数量低于 low_water 时
+    才生成下一块，避免一次性为所有项目创建 flowable。
+    """
+
+    def __init__(self, chunks, low_water=32):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._low_water = low_water
+
+    def _fill(self):
+        # 排版过程中 len() 调用非常频繁，缓冲充足时直接返回
+        while self._chunks is not None and list.__len__(self) < self._low_water:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._chunks = None
+            else:
+                self.extend(chunk)
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+class PortfolioDocTemplate(BaseDocTemplate):
+    """记录目录条目和书签，并在每页结束时回调进度。"""
+
+    def __init__(self, buffer, kit, toc, total_projects, progress=None, pass_no=1, **kwargs):
+        super().__init__(buffer, pagesize=A4, title='新能源项目组合报告', **kwargs)
+        self.kit = kit
+        self.toc = toc
+        self.total_projects = total_projects
+        self.progress = progress
+        self.pass_no = pass_no
+        self.projects_done = 0
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='body')
+        self.addPageTemplates([PageTemplate(id='page', frames=[frame], onPage=self._draw_footer)])
+
+    def _draw_footer(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFont(self.kit.font_name, 8)
+        canvas.drawString(self.leftMargin, 1 * cm, '新能源项目组合报告')
+        canvas.drawRightString(self.pagesize[0] - self.rightMargin, 1 * cm, f'第 {doc.page} 页')
+        canvas.restoreState()
+
+    def afterFlowable(self, flowable):
+        entry = getattr(flowable, 'toc_entry', None)
+        if entry is None:
+            return
+        level, text, key, is_project = entry
+        self.canv.bookmarkPage(key)
+        self.toc.addEntry(level, text, self.page, key)
+        if is_project:
+            self.projects_done += 1
+
+    def afterPage(self):
+        if self.progress:
+            self.progress(self.pass_no, self.page, self.projects_done, self.total_projects)
+
+
+def _heading(text, style, level, key, is_project=False):
+    paragraph = Paragraph(escape(text), style)
+    paragraph.toc_entry = (level, escape(text), key, is_project)
+    return paragraph
+
+
+def _fmt(value, digits=2):
+    return f'{value:,.{digits}f}' if value is not None else '-'
+
+
+def _cover(kit, kpis, filters):
+    styles = kit.styles
+    story = [
+        Spacer(1, 2 * inch),
+        Paragraph('新能源项目组合报告', styles['title']),
+        Paragraph(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['normal']),
+    ]
+    if filters:
+        story.append(Paragraph(escape('筛选条件: ' + '，'.join(filters)), styles['normal']))
+    story.append(Spacer(1, 24))
+    rows = [
+        ['项目总数', f"{kpis['total_projects']}"],
+        ['总装机容量', f"{_fmt(kpis['total_capacity'], 1)} MW"],
+        ['估算总投资', f"{_fmt(kpis['total_investment'])} 万元"],
+        ['已完成收益分析', f"{kpis['projects_with_analysis']} 个"],
+        ['累计净利润', f"{_fmt(kpis['total_profit'])} 万元"],
+        ['平均ROI', f"{kpis['avg_roi']:.2f}%"],
+        ['项目文档', f"{kpis['total_documents']} 份"],
+    ]
+    table = Table(rows, colWidths=[2.5 * inch, 3 * inch])
+    table.setStyle(kit.table_styles['key_value'])
+    story.append(table)
+    return story
+
+
+def _group_table(kit, title, key, groups):
+    rows = [[title, '项目数', '装机容量(MW)', '造价合计(万元)', '收益合计(万元)']]
+    for name, totals in groups:
+        rows.append([name, totals['count'], _fmt(totals['capacity'], 1), _fmt(totals['cost']), _fmt(totals['income'])])
+    rows.append(['合计', sum(t['count'] for _, t in groups), _fmt(sum(t['capacity'] for _, t in groups), 1),
+                 _fmt(sum(t['cost'] for _, t in groups)), _fmt(sum(t['income'] for _, t in groups))])
+    table = Table(rows, colWidths=[1.4 * inch, 0.8 * inch, 1.2 * inch, 1.4 * inch, 1.4 * inch], repeatRows=1)
+    table.setStyle(kit.table_styles['grid_total'])
+    return [_heading(f'按{title}统计', kit.styles['heading'], 0, f'summary-{key}'), table, Spacer(1, 20)]
+
+
+def _project_section(kit, project):
+    analysis = project.analysis
+    region = ' '.join(part for part in (project.province, project.city) if part) or '-'
+    info = [
+        ['项目类型', project.project_type or '-', '当前阶段', project.current_stage or '-'],
+        ['装机容量', f'{_fmt(project.capacity_mw, 1)} MW', '项目经理', project.manager or '未分配'],
+        ['所在地区', region, '项目文档', f'{project.documents} 份'],
+        ['创建时间', project.created_at.strftime('%Y-%m-%d') if project.created_at else '-', '', ''],
+    ]
+    info_table = Table(info, colWidths=[1 * inch, 1.9 * inch, 1 * inch, 1.9 * inch])
+    info_table.setStyle(kit.table_styles['fields'])
+
+    if analysis:
+        finance = [
+            ['工程总造价', f'{_fmt(analysis.total_project_cost)} 万元', '委托费收益', f'{_fmt(analysis.commission_income)} 万元'],
+            ['资源费收益', f'{_fmt(analysis.resource_income)} 万元', '项目总收益', f'{_fmt(analysis.total_income)} 万元'],
+            ['净利润', f'{_fmt(analysis.net_profit)} 万元', 'ROI', f'{_fmt(analysis.roi_percentage)}%'],
+        ]
+    else:
+        finance = [['标准模型造价', f'{_fmt(project.total_cost)} 万元', '收益分析', '未完成']]
+    finance_table = Table(finance, colWidths=[1 * inch, 1.9 * inch, 1 * inch, 1.9 * inch])
+    finance_table.setStyle(kit.table_styles['fields'])
+
+    return [KeepTogether([
+        _heading(f'{project.name}', kit.styles['subheading'], 1, f'project-{project.id}', is_project=True),
+        info_table, Spacer(1, 4), finance_table, Spacer(1, 14),
+    ])]
+
+
+def _story_chunks(kit, toc, portfolio, kpis, filters, chunk_size):
+    """按块生成整个报告的 flowable。"""
+    yield _cover(kit, kpis, filters) + [PageBreak()]
+    yield [Paragraph('目录', kit.styles['title']), toc, PageBreak()]
+    yield (_group_table(kit, '类型', 'type', group_totals(portfolio, lambda p: p.project_type))
+           + _group_table(kit, '阶段', 'stage', group_totals(portfolio, lambda p: p.current_stage, STAGES))
+           + [PageBreak(), _heading('项目明细', kit.styles['heading'], 0, 'projects')])
+    for start in range(0, len(portfolio), chunk_size):
+        chunk = []
+        for project in portfolio[start:start + chunk_size]:
+            chunk.extend(_project_section(kit, project))
+        yield chunk
+
+
+def _placeholder_entries(portfolio):
+    """与最终目录条目数量相同的占位条目，使第一遍排版时目录已占用最终的页数。"""
+    entries = [(0, '按类型统计', 0, 'summary-type'), (0, '按阶段统计', 0, 'summary-stage'), (0, '项目明细', 0, 'projects')]
+    entries.extend((1, escape(project.name), 0, f'project-{project.id}') for project in portfolio)
+    return entries
+
+
+def generate_portfolio_pdf(project_type=None, stage=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    生成项目组合PDF报告
+
+    Args:
+        project_type (str): 只包含指定类型的项目
+        stage (str): 只包含指定阶段的项目
+        chunk_size (int): 每块生成的项目章节数
+        progress (callable): 每页结束时调用 progress(pass_no, page, projects_done, total_projects)
+
+    Returns:
+        io.BytesIO: PDF内容
+    """
+    kit = get_pdf_kit()
+    portfolio = load_portfolio(project_type, stage)
+    kpis = portfolio_kpis(portfolio)
+    filters = [f'{label}: {value}' for label, value in (('项目类型', project_type), ('阶段', stage)) if value]
+
+    toc = TableOfContents()
+    toc.levelStyles = [kit.styles['toc0'], kit.styles['toc1']]
+    toc._entries = _placeholder_entries(portfolio)
+
+    for pass_no in range(1, MAX_PASSES + 1):
+        toc.beforeBuild()
+        buffer = io.BytesIO()
+        doc = PortfolioDocTemplate(buffer, kit, toc, len(portfolio), progress, pass_no)
+        doc.build(ChunkedStory(_story_chunks(kit, toc, portfolio, kpis, filters, chunk_size)))
+        if toc.isSatisfied():
+            break
+
+    buffer.seek(0)
+    return buffer
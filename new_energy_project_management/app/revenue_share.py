@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+资源费分成方案
+
+不同合作合同的资源费分成使用不同的累进分级，方案保存在 revenue_share_schedule 表中，收益分析通过
+revenue_share_schedule_id 引用；未引用方案时使用 ProfitCalculator 中的默认分级（4000/8000万元，
+25%/75%/66.67%）。
+
+每个方案编译一次为 CompiledSchedule：各级起点、各级起点处的累计分成和各级比例。任意资源费总额
+用二分查找定位所在分级后一次乘加得到分成，不再逐级判断；批量计算时用 np.searchsorted 对整个数组
+定位（numpy 在首次批量计算时才加载）。编译结果由 RevenueShareSchedules 按方案 id 缓存：
+
+- 方案新增或分级修改并 flush 时校验分级，修改时 revision 在数据库中加1（并发修改不会丢失修订号），
+  并使本进程中该方案的缓存失效
+- 缓存命中要求 revision 一致，其他进程修改方案后本进程读到新的 revision 即重新编译
+"""
+
+import threading
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from app import db
+
+
+class CompiledSchedule:
+    """编译后的累进分成方案，金额单位为万元。"""
+
+    def __init__(self, tiers, schedule_id=None, revision=None):
+        """
+        Args:
+            tiers (list): [{'threshold': 起点, 'rate': 分成比例}, ...]，见 validate_tiers
+            schedule_id (int): 方案 id，默认分级为 None
+            revision (int): 编译时的方案修订号
+        """
+        self.schedule_id = schedule_id
+        self.revision = revision
+        tiers = validate_tiers(tiers)
+        self.thresholds = tuple(threshold for threshold, _ in tiers)
+        self.rates = tuple(rate for _, rate in tiers)
+        share_starts = [Decimal('0')]
+        for index in range(1, len(tiers)):
+            width = self.thresholds[index] - self.thresholds[index - 1]
+            share_starts.append(share_starts[-1] + width * self.rates[index - 1])
+        self.share_starts = tuple(share_starts)
+        self._arrays = None
+
+    def share(self, resource_fee_total):
+        """资源费总额（Decimal）对应的分成（Decimal，未舍入），总额不大于0时为0。"""
+        if resource_fee_total <= 0:
+            return Decimal('0')
+        tier = bisect_right(self.thresholds, resource_fee_total) - 1
+        return self.share_starts[tier] + (resource_fee_total - self.thresholds[tier]) * self.rates[tier]
+
+    def arrays(self):
+        """(各级起点, 累计分成, 分成比例) 的 numpy 数组，首次调用时生成。"""
+        if self._arrays is None:
+            import numpy as np
+
+            self._arrays = tuple(np.array([float(value) for value in values])
+                                 for values in (self.thresholds, self.share_starts, self.rates))
+        return self._arrays
+
+    def share_batch(self, fees):
+        """share 的向量化版本：资源费总额数组 -> 分成数组（未舍入）。"""
+        import numpy as np
+
+        thresholds, share_starts, rates = self.arrays()
+        fees = np.maximum(np.asarray(fees, dtype=float), 0.0)
+        tier = np.searchsorted(thresholds, fees, side='right') - 1
+        return share_starts[tier] + (fees - thresholds[tier]) * rates[tier]
+
+    def fee_for_share_batch(self, shares):
+        """分成的反函数：得到指定分成所需的资源费总额（未舍入），分成不大于0时为0。"""
+        import numpy as np
+
+        thresholds, share_starts, rates = self.arrays()
+        shares = np.maximum(np.asarray(shares, dtype=float), 0.0)
+        tier = np.searchsorted(share_starts, shares, side='right') - 1
+        return thresholds[tier] + (shares - share_starts[tier]) / rates[tier]
+
+    def to_list(self):
+        return [{'threshold': float(threshold), 'rate': float(rate)}
+                for threshold, rate in zip(self.thresholds, self.rates)]
+
+    def __repr__(self):
+        return f'<CompiledSchedule {self.schedule_id} r{self.revision} {self.to_list()}>'
+
+
+def validate_tiers(tiers):
+    """
+    校验分级：至少一级，第一级起点为0，起点严格递增，分成比例大于0且不超过1
+
+    Returns:
+        list: [(起点, 比例), ...]，均为 Decimal
+
+    Raises:
+        ValueError: 分级不合法
+    """
+    if not isinstance(tiers, (list, tuple)) or not tiers:
+        raise ValueError('分成方案至少需要一级')
+    parsed = []
+    for index, tier in enumerate(tiers, 1):
+        try:
+            threshold = Decimal(str(tier['threshold']))
+            rate = Decimal(str(tier['rate']))
+        except (KeyError, TypeError, InvalidOperation):
+            raise ValueError(f'第{index}级需要数值 threshold（起点，万元）和 rate（分成比例）')
+        if not threshold.is_finite() or not rate.is_finite():
+            raise ValueError(f'第{index}级的起点和分成比例必须是有限数值')
+        if not 0 < rate <= 1:
+            raise ValueError(f'第{index}级的分成比例必须大于0且不超过1')
+        if parsed and threshold <= parsed[-1][0]:
+            raise ValueError(f'第{index}级的起点必须大于上一级')
+        parsed.append((threshold, rate))
+    if parsed[0][0] != 0:
+        raise ValueError('第1级的起点必须为0')
+    return parsed
+
+
+_default_schedule = None
+
+
+def default_schedule():
+    """ProfitCalculator 中的默认累进分级。"""
+    global _default_schedule
+    if _default_schedule is None:
+        from app.profit_calculator import ProfitCalculator as P
+
+        _default_schedule = CompiledSchedule([
+            {'threshold': 0, 'rate': P.RATE_1},
+            {'threshold': P.TIER_1_LIMIT, 'rate': P.RATE_2},
+            {'threshold': P.TIER_2_LIMIT, 'rate': P.RATE_3},
+        ])
+    return _default_schedule
+
+
+class RevenueShareSchedules:
+    """编译后分成方案的进程内缓存（按方案 id），方案修改或删除时失效。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['revenue_share_schedules'] = self
+        _register_session_events()
+
+    def compiled(self, schedule):
+        """方案记录对应的编译结果，schedule 为 None 时返回默认分级。"""
+        if schedule is None:
+            return default_schedule()
+        entry = self._entries.get(schedule.id)
+        if entry is not None and entry.revision == schedule.revision:
+            return entry
+        return self._store(CompiledSchedule(schedule.tiers, schedule.id, schedule.revision))
+
+    def compiled_by_id(self, schedule_ids):
+        """
+        批量获取编译结果，只读取修订号，缓存过期或缺失的方案才读取分级重新编译
+
+        Returns:
+            dict: 方案 id -> CompiledSchedule（不存在的 id 不返回）
+        """
+        from app.models import RevenueShareSchedule
+
+        schedule_ids = {int(schedule_id) for schedule_id in schedule_ids}
+        if not schedule_ids:
+            return {}
+        revisions = dict(db.session.query(RevenueShareSchedule.id, RevenueShareSchedule.revision)
+                         .filter(RevenueShareSchedule.id.in_(schedule_ids)))
+        result = {}
+        stale = []
+        for schedule_id, revision in revisions.items():
+            entry = self._entries.get(schedule_id)
+            if entry is not None and entry.revision == revision:
+                result[schedule_id] = entry
+            else:
+                stale.append(schedule_id)
+        if stale:
+            rows = db.session.query(RevenueShareSchedule.id, RevenueShareSchedule.revision,
+                                    RevenueShareSchedule.tiers).filter(RevenueShareSchedule.id.in_(stale))
+            for schedule_id, revision, tiers in rows:
+                result[schedule_id] = self._store(CompiledSchedule(tiers, schedule_id, revision))
+        return result
+
+    def invalidate(self, schedule_id):
+        with self._lock:
+            self._entries.pop(schedule_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, compiled):
+        with self._lock:
+            self._entries[compiled.schedule_id] = compiled
+        return compiled
+
+
+def get_revenue_share_schedules(app=None):
+    return (app or current_app).extensions['revenue_share_schedules']
+
+
+def compiled_schedule(schedule):
+    """收益分析引用的方案的编译结果（None 为默认分级），没有应用上下文时不使用缓存。"""
+    if schedule is None:
+        return default_schedule()
+    if has_app_context() and 'revenue_share_schedules' in current_app.extensions:
+        return get_revenue_share_schedules().compiled(schedule)
+    return CompiledSchedule(schedule.tiers, schedule.id, schedule.revision)
+
+
+def recompute_analyses(schedule):
+    """
+    按方案当前的分级重新计算引用它的收益分析，只在当前会话中修改，由调用方在同一事务中提交
+
+    Args:
+        schedule (RevenueShareSchedule): 已 flush 的方案
+
+    Returns:
+        int: 重新计算的收益分析条数（项目已删除或未填写装机容量的不计算）
+    """
+    from sqlalchemy.orm import contains_eager
+
+    from app.models import ProfitAnalysis, Project
+    from app.profit_calculator import ProfitCalculator
+
+    compiled = compiled_schedule(schedule)
+    analyses = (ProfitAnalysis.query.join(Project, Project.id == ProfitAnalysis.project_id)
+                .filter(ProfitAnalysis.revenue_share_schedule_id == schedule.id, Project.capacity_mw.isnot(None))
+                .options(contains_eager(ProfitAnalysis.project)).all())
+    for analysis in analyses:
+        result = ProfitCalculator.calculate_comprehensive_profit_analysis(
+            capacity_mw=analysis.project.capacity_mw,
+            dev_fee_rate=analysis.dev_fee_rate,
+            extra_investment=analysis.extra_investment,
+            resource_fee_total=analysis.resource_fee_total,
+            dengpin_cost=analysis.dengpin_cost,
+            schedule=compiled
+        )
+        analysis.commission_income = float(result['commission_revenue'])
+        analysis.resource_income = float(result['resource_share_revenue'])
+        analysis.total_income = float(result['total_revenue'])
+        analysis.net_profit = float(result['net_profit'])
+        analysis.roi_percentage = float(result['roi']) if result['roi'] != 'N/A' else 0.0
+    return len(analyses)
+
+
+def share_batch(fees, schedule_ids=None, schedules=None):
+    """
+    按各行的分成方案批量计算资源费分成（未舍入）
+
+    Args:
+        fees: 资源费总额数组
+        schedule_ids: 各行的方案 id 数组，空值（NaN）或为 None 时使用默认分级
+        schedules (dict): 方案 id -> CompiledSchedule，见 RevenueShareSchedules.compiled_by_id
+
+    Returns:
+        numpy.ndarray: 分成数组
+    """
+    return _by_schedule('share_batch', fees, schedule_ids, schedules)
+
+
+def fee_for_share_batch(shares, schedule_ids=None, schedules=None):
+    """share_batch 的反函数：各行达到指定分成所需的资源费总额（未舍入）。"""
+    return _by_schedule('fee_for_share_batch', shares, schedule_ids, schedules)
+
+
+def _by_schedule(method, values, schedule_ids, schedules):
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    if schedule_ids is None:
+        return getattr(default_schedule(), method)(values)
+    schedule_ids = np.asarray(schedule_ids, dtype=float)
+    result = np.empty(values.shape)
+    missing = np.isnan(schedule_ids)
+    result[missing] = getattr(default_schedule(), method)(values[missing])
+    for schedule_id in np.unique(schedule_ids[~missing]):
+        rows = schedule_ids == schedule_id
+        compiled = (schedules or {}).get(int(schedule_id), default_schedule())
+        result[rows] = getattr(compiled, method)(values[rows])
+    return result
+
+
+# ----------------------------------------------------------------------
+# 会话事件：校验分级，修改时递增修订号并使缓存失效
+# ----------------------------------------------------------------------
+
+_events_registered = False
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'before_flush', _check_schedules)
+    _events_registered = True
+
+
+def _check_schedules(session, flush_context, instances):
+    from app.models import RevenueShareSchedule
+
+    cache = current_app.extensions.get('revenue_share_schedules') if has_app_context() else None
+    for obj in session.new:
+        if isinstance(obj, RevenueShareSchedule):
+            validate_tiers(obj.tiers)
+    for obj in session.dirty:
+        if isinstance(obj, RevenueShareSchedule) and inspect(obj).attrs.tiers.history.has_changes():
+            validate_tiers(obj.tiers)
+            # 在 UPDATE 语句中加1，不依赖会话中读到的旧值
+            obj.revision = RevenueShareSchedule.revision + 1
+            if cache is not None:
+                cache.invalidate(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, RevenueShareSchedule) and cache is not None:
+            cache.invalidate(obj.id)
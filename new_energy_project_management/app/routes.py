@@ -1,22 +1,36 @@
-from flask import render_template, flash, redirect, url_for, request, make_response, send_file, jsonify, Blueprint, current_app
+from flask import render_template, flash, redirect, url_for, request, make_response, send_file, send_from_directory, jsonify, Blueprint, current_app
 from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlparse
 from datetime import datetime, timedelta
 import json
 import os
 from werkzeug.utils import secure_filename
-from sqlalchemy import func
+from sqlalchemy import func, inspect
+from sqlalchemy.exc import IntegrityError
 from app import db
-from app.models import User, Project, CostModel, ProfitAnalysis, ProjectDocument
+from app.models import User, Project, CostModel, ProfitAnalysis, ProjectDocument, RevenueShareSchedule
 from app.forms import LoginForm, RegistrationForm, ProjectForm, CostEstimationForm, ProfitAnalysisForm, ProjectCostDetailForm, UserForm, CostModelForm, ProjectEditForm, DocumentUploadForm
-from app.reports import generate_project_report_pdf, generate_project_report_excel, generate_all_projects_excel
-from app.permissions import require_admin, require_permission, has_permission, get_available_roles
+from app.reports import generate_project_report_pdf, generate_project_report_excel, generate_all_projects_excel, \
+    generate_portfolio_pdf
+from app.permissions import require_admin, require_permission, can, get_available_roles
+from app.blob_store import get_blob_store, acquire_blob, release_blob
+from app.downloads import send_document
+from app.document_pipeline import get_document_pipeline, thumbnail_file
+from app.profiling import get_request_profiler
+from app.metrics import record_upload
+from app.db_engine import commit_with_retry
+from app.db_routing import read_only
+from app.user_cache import invalidate_user
+from app.lifecycle import change_stage, dwell_times, conversion_funnel, stage_throughput
+from app.profit_history import project_history, portfolio_history, snapshot_dict
+from app.revenue_share import compiled_schedule, recompute_analyses
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
 @main.route('/index')
 @login_required
+@read_only
 def index():
     projects = Project.query.all()
     
@@ -198,6 +212,7 @@ def login():
 @main.route('/admin')
 @login_required
 @require_admin()
+@read_only
 def admin_dashboard():
     """管理员仪表板。"""
     total_users = User.query.count()
@@ -218,6 +233,7 @@ def admin_dashboard():
 @main.route('/admin/users')
 @login_required
 @require_admin()
+@read_only
 def admin_users():
     """用户管理页面。"""
     users = User.query.all()
@@ -266,6 +282,7 @@ def admin_edit_user(user_id):
             user.set_password(form.password.data)
         
         db.session.commit()
+        invalidate_user(user.id)
         flash(f'用户 {user.username} 更新成功！')
         return redirect(url_for('main.admin_users'))
     
@@ -283,12 +300,14 @@ def admin_delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
     flash(f'用户 {user.username} 删除成功！')
     return redirect(url_for('main.admin_users'))
 
 @main.route('/admin/cost_models')
 @login_required
 @require_admin()
+@read_only
 def admin_cost_models():
     """造价模型管理页面。"""
     cost_models = CostModel.query.all()
@@ -297,6 +316,7 @@ def admin_cost_models():
 @main.route('/admin/cost_models/<int:model_id>/details')
 @login_required
 @require_admin()
+@read_only
 def admin_cost_model_details(model_id):
     """获取造价模型详情API。"""
     cost_model = CostModel.query.get_or_404(model_id)
@@ -330,17 +350,78 @@ def admin_edit_cost_model(model_id):
             cost_model.cost_items = json.loads(form.cost_items_json.data)
             cost_model.cost_details = json.loads(form.cost_details_json.data)
             
+            # 参数有变化时提交会生成新版本，已有估算仍引用原版本
             db.session.commit()
-            flash(f'造价模型 {cost_model.project_type} 更新成功！')
+            flash(f'造价模型 {cost_model.project_type} 更新成功（当前版本 v{cost_model.current_version.version}）！')
             return redirect(url_for('main.admin_cost_models'))
         except json.JSONDecodeError as e:
             flash(f'JSON格式错误: {str(e)}')
     
     return render_template('admin/cost_model_form.html', title='编辑造价模型', form=form, cost_model=cost_model)
 
+@main.route('/admin/revenue_share_schedules')
+@login_required
+@require_admin()
+@read_only
+def admin_revenue_share_schedules():
+    """资源费分成方案列表API。"""
+    counts = dict(db.session.query(ProfitAnalysis.revenue_share_schedule_id, func.count(ProfitAnalysis.id))
+                  .filter(ProfitAnalysis.revenue_share_schedule_id.isnot(None))
+                  .group_by(ProfitAnalysis.revenue_share_schedule_id))
+    schedules = RevenueShareSchedule.query.order_by(RevenueShareSchedule.name).all()
+    return jsonify({'schedules': [_schedule_dict(schedule, counts.get(schedule.id, 0)) for schedule in schedules]})
+
+@main.route('/admin/revenue_share_schedules', methods=['POST'])
+@main.route('/admin/revenue_share_schedules/<int:schedule_id>', methods=['PUT'])
+@login_required
+@require_admin()
+def admin_save_revenue_share_schedule(schedule_id=None):
+    """新增或修改资源费分成方案。修改分级时在同一事务中重新计算引用该方案的收益分析，响应中 recomputed 为重新计算的条数。"""
+    schedule = RevenueShareSchedule() if schedule_id is None else RevenueShareSchedule.query.get_or_404(schedule_id)
+    data = request.get_json(silent=True) or {}
+    for field in ('name', 'description', 'tiers'):
+        if field in data:
+            setattr(schedule, field, data[field])
+    if not schedule.name or schedule.tiers is None:
+        return jsonify({'error': '缺少方案名称 name 或分级 tiers'}), 400
+    tiers_changed = schedule_id is not None and inspect(schedule).attrs.tiers.history.has_changes()
+    db.session.add(schedule)
+    try:
+        # flush 时校验分级并递增修订号，收益分析按新分级重新计算后一起提交
+        db.session.flush()
+        recomputed = recompute_analyses(schedule) if tiers_changed else 0
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': f'方案名称 {schedule.name} 已存在'}), 400
+    analyses = ProfitAnalysis.query.filter_by(revenue_share_schedule_id=schedule.id).count()
+    return jsonify(dict(_schedule_dict(schedule, analyses), recomputed=recomputed)), \
+        201 if schedule_id is None else 200
+
+@main.route('/admin/revenue_share_schedules/<int:schedule_id>', methods=['DELETE'])
+@login_required
+@require_admin()
+def admin_delete_revenue_share_schedule(schedule_id):
+    """删除未被收益分析引用的资源费分成方案。"""
+    schedule = RevenueShareSchedule.query.get_or_404(schedule_id)
+    if ProfitAnalysis.query.filter_by(revenue_share_schedule_id=schedule.id).first() is not None:
+        return jsonify({'error': '方案已被收益分析引用，不能删除'}), 409
+    db.session.delete(schedule)
+    db.session.commit()
+    return jsonify({'deleted': schedule_id})
+
+def _schedule_dict(schedule, analyses):
+    return {'id': schedule.id, 'name': schedule.name, 'description': schedule.description,
+            'tiers': schedule.tiers, 'revision': schedule.revision, 'analyses': analyses,
+            'updated_at': schedule.updated_at.isoformat() if schedule.updated_at else None}
+
 @main.route('/admin/projects')
 @login_required
 @require_permission('can_view_all_projects')
+@read_only
 def admin_projects():
     """项目管理页面。"""
     projects = Project.query.all()
@@ -363,11 +444,11 @@ def admin_edit_project(project_id):
         project.project_type = form.project_type.data
         project.capacity_mw = form.capacity_mw.data
         project.location = form.location.data
-        project.current_stage = form.current_stage.data
         project.description = form.description.data
         
         if form.manager_id.data:
             project.manager_id = form.manager_id.data
+        change_stage(project, form.current_stage.data, user_id=current_user.id)
         
         db.session.commit()
         flash(f'项目 {project.name} 更新成功！')
@@ -389,6 +470,38 @@ def admin_system_info():
     }
     return render_template('admin/system_info.html', title='系统信息', system_info=system_info)
 
+@main.route('/admin/performance')
+@login_required
+@require_admin()
+def admin_performance():
+    """性能分析页面：按端点汇总请求耗时、SQL和模板渲染开销。"""
+    profiler = get_request_profiler()
+    sort = request.args.get('sort', 'avg_ms')
+    return render_template('admin/performance.html',
+                         title='性能分析',
+                         endpoints=profiler.worst_endpoints(sort=sort),
+                         slow_requests=profiler.slow_requests(),
+                         profiles=profiler.list_profiles(),
+                         sort=sort,
+                         sort_keys=profiler.SORT_KEYS,
+                         threshold=current_app.config['PROFILING_SLOW_THRESHOLD_MS'])
+
+@main.route('/admin/performance/profiles/<path:filename>')
+@login_required
+@require_admin()
+def admin_performance_profile(filename):
+    """下载采样剖析文件（.prof 可用 snakeviz 查看）。"""
+    return send_from_directory(current_app.config['PROFILING_PROFILE_DIR'], filename, as_attachment=True)
+
+@main.route('/admin/performance/reset', methods=['POST'])
+@login_required
+@require_admin()
+def admin_performance_reset():
+    """清空当前进程的性能统计。"""
+    get_request_profiler().reset()
+    flash('性能统计已清空。')
+    return redirect(url_for('main.admin_performance'))
+
 @main.route('/logout')
 def logout():
     logout_user()
@@ -417,8 +530,7 @@ def create_project():
             name=form.name.data,
             project_type=form.project_type.data,
             capacity_mw=form.capacity_mw.data,
-            current_stage=form.current_stage.data,
-            manager=current_user,
+            manager_id=current_user.id,
             # 地理信息字段
             longitude=form.longitude.data,
             latitude=form.latitude.data,
@@ -427,6 +539,7 @@ def create_project():
             city=form.city.data,
             district=form.district.data
         )
+        change_stage(project, form.current_stage.data, user_id=current_user.id)
         db.session.add(project)
         db.session.commit()
         flash('项目创建成功！')
@@ -438,7 +551,7 @@ def create_project():
 def edit_project(project_id):
     project = Project.query.get_or_404(project_id)
     # 确保只有项目经理或管理员可以编辑项目
-    if project.manager != current_user and current_user.role != '管理员':
+    if not can(current_user, 'edit', project):
         flash('您没有权限编辑此项目。')
         return redirect(url_for('main.index'))
 
@@ -447,7 +560,7 @@ def edit_project(project_id):
         project.name = form.name.data
         project.project_type = form.project_type.data
         project.capacity_mw = form.capacity_mw.data
-        project.current_stage = form.current_stage.data
+        change_stage(project, form.current_stage.data, user_id=current_user.id)
         # 更新地理信息字段
         project.longitude = form.longitude.data
         project.latitude = form.latitude.data
@@ -465,7 +578,7 @@ def edit_project(project_id):
 def delete_project(project_id):
     project = Project.query.get_or_404(project_id)
     # 确保只有项目经理或管理员可以删除项目
-    if project.manager != current_user and current_user.role != '管理员':
+    if not can(current_user, 'delete', project):
         flash('您没有权限删除此项目。')
         return redirect(url_for('main.index'))
 
@@ -476,6 +589,7 @@ def delete_project(project_id):
 
 @main.route('/project/<int:project_id>')
 @login_required
+@read_only
 def project_detail(project_id):
     project = Project.query.get_or_404(project_id)
     cost_estimation = ProfitAnalysis.query.filter_by(project_id=project.id).first() # 假设成本估算和收益分析结果都存储在ProfitAnalysis中，或者需要单独查询CostEstimation模型
@@ -489,7 +603,7 @@ def update_project_location(project_id):
     project = Project.query.get_or_404(project_id)
     
     # 检查权限：项目经理或管理员可以编辑
-    if project.manager != current_user and current_user.role != '管理员':
+    if not can(current_user, 'edit', project):
         flash('您没有权限编辑此项目的地理信息。')
         return redirect(url_for('main.project_detail', project_id=project_id))
     
@@ -526,56 +640,62 @@ def cost_estimation(project_id):
     # 如果没有自定义成本明细，从默认模型初始化
     if not cost_details:
         cost_model = CostModel.query.filter_by(project_type=project.project_type).first()
-        if cost_model and cost_model.cost_details:
-            # cost_details 是 JSON 字段，在 Python 中已经是字典类型，无需 json.loads()
-            default_costs = cost_model.cost_details
-            for category, items in default_costs.items():
-                for item_name, item_cost in items.items():
-                    # item_cost 是直接的数值，需要使用项目类型对应的单位标签
-                    cost_detail = ProjectCostDetail(
-                        project_id=project.id,
-                        cost_category=category,
-                        cost_item=item_name,
-                        unit_cost=item_cost,
-                        unit_label=cost_model.unit_cost_label,
-                        description='',
-                        is_custom=False
-                    )
-                    cost_detail.calculate_total_cost(project.capacity_mw)
-                    db.session.add(cost_detail)
-            db.session.commit()
+        # 从当前造价模型版本初始化，成本项记录来源版本
+        version = cost_model.current_version if cost_model else None
+        if version and version.cost_details:
+            def add_default_details():
+                # cost_details 是 JSON 字段，在 Python 中已经是字典类型，无需 json.loads()
+                default_costs = version.cost_details
+                for category, items in default_costs.items():
+                    for item_name, item_cost in items.items():
+                        # item_cost 是直接的数值，需要使用项目类型对应的单位标签
+                        cost_detail = ProjectCostDetail(
+                            project_id=project.id,
+                            cost_category=category,
+                            cost_item=item_name,
+                            unit_cost=item_cost,
+                            unit_label=version.unit_cost_label,
+                            description='',
+                            is_custom=False,
+                            cost_model_version_id=version.id
+                        )
+                        cost_detail.calculate_total_cost(project.capacity_mw)
+                        db.session.add(cost_detail)
+            commit_with_retry(add_default_details)
             cost_details = ProjectCostDetail.query.filter_by(project_id=project.id).all()
     
     if form.validate_on_submit():
-        # 计算总造价
-        total_cost = sum(detail.calculate_total_cost(project.capacity_mw) for detail in cost_details)
-        
-        # 保存成本估算结果到 ProfitAnalysis
-        profit_analysis = ProfitAnalysis.query.filter_by(project_id=project.id).first()
-        if profit_analysis:
-            profit_analysis.total_project_cost = total_cost
-        else:
-            profit_analysis = ProfitAnalysis(
-                project_id=project.id,
-                total_project_cost=total_cost,
-                dev_fee_rate=0.1,
-                extra_investment=0,
-                resource_fee_total=0,
-                dengpin_cost=0,
-                commission_income=0,
-                resource_income=0,
-                total_income=0,
-                net_profit=0,
-                roi_percentage=0,
-                market_profit_rate=0
-            )
-            db.session.add(profit_analysis)
-        
-        # 更新所有成本明细的总成本
-        for detail in cost_details:
-            detail.calculate_total_cost(project.capacity_mw)
+        def save_estimation():
+            # 计算总造价
+            total_cost = sum(detail.calculate_total_cost(project.capacity_mw) for detail in cost_details)
+            # 估算依据的造价模型版本（成本项全部为自定义时为空）
+            version_id = next((d.cost_model_version_id for d in cost_details if d.cost_model_version_id), None)
+            
+            # 保存成本估算结果到 ProfitAnalysis
+            profit_analysis = ProfitAnalysis.query.filter_by(project_id=project.id).first()
+            if profit_analysis:
+                profit_analysis.total_project_cost = total_cost
+                profit_analysis.cost_model_version_id = version_id
+            else:
+                profit_analysis = ProfitAnalysis(
+                    project_id=project.id,
+                    total_project_cost=total_cost,
+                    cost_model_version_id=version_id,
+                    dev_fee_rate=0.1,
+                    extra_investment=0,
+                    resource_fee_total=0,
+                    dengpin_cost=0,
+                    commission_income=0,
+                    resource_income=0,
+                    total_income=0,
+                    net_profit=0,
+                    roi_percentage=0,
+                    market_profit_rate=0
+                )
+                db.session.add(profit_analysis)
         
-        db.session.commit()
+        # 锁冲突时整体重新计算并提交
+        commit_with_retry(save_estimation)
         flash('成本估算成功！')
         return redirect(url_for('main.project_detail', project_id=project.id))
     
@@ -704,14 +824,21 @@ def profit_analysis(project_id):
         return redirect(url_for('main.cost_estimation', project_id=project.id))
 
     form = ProfitAnalysisForm(obj=profit_analysis_record) # 预填充表单
+    form.revenue_share_schedule_id.choices = [(0, '默认累进分级')] + [
+        (schedule.id, schedule.name) for schedule in RevenueShareSchedule.query.order_by(RevenueShareSchedule.name)]
+    if request.method == 'GET' and profit_analysis_record.revenue_share_schedule_id is None:
+        form.revenue_share_schedule_id.data = 0
 
     if form.validate_on_submit():
-        try:
+        def save_analysis():
             # 更新表单数据到数据库记录
             profit_analysis_record.dev_fee_rate = form.dev_fee_rate.data
             profit_analysis_record.extra_investment = form.extra_investment.data
             profit_analysis_record.resource_fee_total = form.resource_fee_total.data
             profit_analysis_record.dengpin_cost = form.dengpin_cost.data
+            schedule_id = form.revenue_share_schedule_id.data
+            profit_analysis_record.revenue_share_schedule = \
+                db.session.get(RevenueShareSchedule, schedule_id) if schedule_id else None
             
             # 保留旧字段用于兼容性（标记为废弃）
             profit_analysis_record.market_profit_rate = form.market_profit_rate.data
@@ -722,7 +849,8 @@ def profit_analysis(project_id):
                 dev_fee_rate=profit_analysis_record.dev_fee_rate,
                 extra_investment=profit_analysis_record.extra_investment,
                 resource_fee_total=profit_analysis_record.resource_fee_total,
-                dengpin_cost=profit_analysis_record.dengpin_cost
+                dengpin_cost=profit_analysis_record.dengpin_cost,
+                schedule=compiled_schedule(profit_analysis_record.revenue_share_schedule)
             )
 
             # 更新计算结果
@@ -732,7 +860,8 @@ def profit_analysis(project_id):
             profit_analysis_record.net_profit = float(analysis_result['net_profit'])
             profit_analysis_record.roi_percentage = float(analysis_result['roi']) if analysis_result['roi'] != 'N/A' else 0.0
 
-            db.session.commit()
+        try:
+            commit_with_retry(save_analysis)
             flash('收益分析计算成功！')
             return redirect(url_for('main.project_detail', project_id=project.id))
             
@@ -750,6 +879,7 @@ def profit_analysis(project_id):
 # 报表生成路由
 @main.route('/export/project/<int:project_id>/pdf')
 @login_required
+@read_only
 def export_project_pdf(project_id):
     """导出单个项目PDF报告。"""
     project = Project.query.get_or_404(project_id)
@@ -768,6 +898,7 @@ def export_project_pdf(project_id):
 
 @main.route('/export/project/<int:project_id>/excel')
 @login_required
+@read_only
 def export_project_excel(project_id):
     """导出单个项目Excel报告。"""
     project = Project.query.get_or_404(project_id)
@@ -786,6 +917,7 @@ def export_project_excel(project_id):
 
 @main.route('/export/all_projects/excel')
 @login_required
+@read_only
 def export_all_projects_excel():
     """导出所有项目汇总Excel报告。"""
     try:
@@ -800,21 +932,42 @@ def export_all_projects_excel():
         flash(f'汇总报告生成失败: {str(e)}')
         return redirect(url_for('main.index'))
 
+@main.route('/export/portfolio/pdf')
+@login_required
+@read_only
+def export_portfolio_pdf():
+    """导出项目组合PDF报告，可按 project_type、stage 筛选。"""
+    project_type = request.args.get('project_type') or None
+    stage = request.args.get('stage') or None
+    try:
+        pdf_buffer = generate_portfolio_pdf(project_type=project_type, stage=stage)
+        
+        response = make_response(pdf_buffer.getvalue())
+        response.headers['Content-Type'] = 'application/pdf'
+        response.headers['Content-Disposition'] = f'attachment; filename="项目组合报告_{datetime.now().strftime("%Y%m%d")}.pdf"'
+        
+        return response
+    except Exception as e:
+        flash(f'组合报告生成失败: {str(e)}')
+        return redirect(url_for('main.index'))
+
 # 文档管理路由
 @main.route('/project/<int:project_id>/documents')
 @login_required
+@read_only
 def project_documents(project_id):
     """项目文档列表页面。"""
     project = Project.query.get_or_404(project_id)
     
-    # 检查用户权限：项目经理、管理员或有项目访问权限的用户
-    if (project.manager != current_user and 
-        current_user.role != '管理员' and 
-        not has_permission('view_all_projects')):
+    # 检查用户权限：项目经理或管理员
+    if not can(current_user, 'documents', project):
         flash('您没有权限查看此项目的文档。')
         return redirect(url_for('main.index'))
     
-    documents = ProjectDocument.query.filter_by(project_id=project_id).order_by(ProjectDocument.uploaded_at.desc()).all()
+    # 预先加载后处理结果，列表页直接展示缩略图和摘要
+    documents = ProjectDocument.query.filter_by(project_id=project_id).options(
+        db.joinedload(ProjectDocument.preview)
+    ).order_by(ProjectDocument.uploaded_at.desc()).all()
     return render_template('documents/document_list.html', 
                          title=f'{project.name} - 项目文档', 
                          project=project, 
@@ -826,10 +979,8 @@ def upload_document(project_id):
     """上传项目文档。"""
     project = Project.query.get_or_404(project_id)
     
-    # 检查用户权限：项目经理、管理员或有项目编辑权限的用户
-    if (project.manager != current_user and 
-        current_user.role != '管理员' and 
-        not has_permission('can_edit_all_projects')):
+    # 检查用户权限：项目经理或管理员
+    if not can(current_user, 'documents', project):
         flash('您没有权限上传此项目的文档。')
         return redirect(url_for('main.project_documents', project_id=project_id))
     
@@ -841,35 +992,37 @@ def upload_document(project_id):
             # 确保文件名安全
             filename = secure_filename(file.filename)
             
-            # 创建项目文档目录
-            upload_dir = os.path.join(current_app.root_path, '..', 'uploads', 'projects', str(project_id))
-            os.makedirs(upload_dir, exist_ok=True)
+            # 写入内容寻址存储：相同内容只保存一份；文件落盘在事务之外，锁冲突重试时不需要重新写入
+            sha256, file_size, created = get_blob_store().ingest_stream(file.stream)
+            record_upload(file_size, deduplicated=not created)
             
-            # 生成唯一文件名（添加时间戳）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            name, ext = os.path.splitext(filename)
-            unique_filename = f"{name}_{timestamp}{ext}"
+            def save_document():
+                # 登记实体引用并保存文档信息到数据库
+                acquire_blob(sha256, file_size)
+                document = ProjectDocument(
+                    filename=filename,
+                    stored_filename=sha256,
+                    file_path=get_blob_store().path_for(sha256),
+                    file_size=file_size,
+                    file_type=file.content_type or 'application/octet-stream',
+                    stage=form.stage.data,
+                    description=form.description.data,
+                    project_id=project_id,
+                    uploaded_by=current_user.id,
+                    content_hash=sha256
+                )
+                db.session.add(document)
+                return document
             
-            file_path = os.path.join(upload_dir, unique_filename)
-            file.save(file_path)
+            document = commit_with_retry(save_document)
             
-            # 保存文档信息到数据库
-            document = ProjectDocument(
-                filename=filename,
-                stored_filename=unique_filename,
-                file_path=file_path,
-                file_size=os.path.getsize(file_path),
-                file_type=file.content_type or 'application/octet-stream',
-                stage=form.stage.data,
-                description=form.description.data,
-                project_id=project_id,
-                uploaded_by=current_user.id
-            )
+            # 正文提取和缩略图在后台线程中生成
+            get_document_pipeline().submit(document.id)
             
-            db.session.add(document)
-            db.session.commit()
-            
-            flash(f'文档 "{filename}" 上传成功！')
+            if created:
+                flash(f'文档 "{filename}" 上传成功！')
+            else:
+                flash(f'文档 "{filename}" 上传成功（内容已存在，已复用）！')
             return redirect(url_for('main.project_documents', project_id=project_id))
     
     return render_template('documents/upload_document.html', 
@@ -877,28 +1030,103 @@ def upload_document(project_id):
                          form=form, 
                          project=project)
 
+@main.route('/project/<int:project_id>/documents/attach', methods=['POST'])
+@login_required
+def attach_document(project_id):
+    """按内容哈希关联已存在的文档，内容已在存储中时无需重新上传。"""
+    from app.models import DocumentBlob
+    
+    project = Project.query.get_or_404(project_id)
+    
+    if not can(current_user, 'documents', project):
+        return jsonify({'error': '您没有权限上传此项目的文档。'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    sha256 = (data.get('sha256') or '').lower()
+    filename = secure_filename(data.get('filename') or '')
+    if len(sha256) != 64 or not filename:
+        return jsonify({'error': '缺少有效的sha256或filename参数'}), 400
+    
+    # 只能关联自己已能读取的内容，否则哈希值就相当于跨项目读取文档的凭证
+    readable = db.session.query(Project.manager_id).join(
+        ProjectDocument, ProjectDocument.project_id == Project.id
+    ).filter(ProjectDocument.content_hash == sha256).distinct()
+    if not any(can(current_user, 'documents', row) for row in readable):
+        return jsonify({'exists': False}), 404
+    
+    blob = DocumentBlob.query.filter_by(sha256=sha256).first()
+    # 刷新实体文件的修改时间，垃圾回收在宽限期内不会删除即将被引用的内容
+    if blob is None or not get_blob_store().touch(sha256):
+        # 内容不存在，客户端需要走常规上传
+        return jsonify({'exists': False}), 404
+    
+    size = blob.size
+    
+    def save_document():
+        acquire_blob(sha256, size)
+        document = ProjectDocument(
+            filename=filename,
+            stored_filename=sha256,
+            file_path=get_blob_store().path_for(sha256),
+            file_size=size,
+            file_type=data.get('file_type') or 'application/octet-stream',
+            stage=data.get('stage') or '其他',
+            description=data.get('description'),
+            project_id=project_id,
+            uploaded_by=current_user.id,
+            content_hash=sha256
+        )
+        db.session.add(document)
+        return document
+    
+    try:
+        document = commit_with_retry(save_document)
+    except Exception:
+        # 提交失败时回滚，撤销 acquire_blob 增加的引用
+        db.session.rollback()
+        raise
+    get_document_pipeline().submit(document.id)
+    
+    return jsonify({'exists': True, 'document_id': document.id}), 201
+
 @main.route('/documents/<int:document_id>/download')
 @login_required
+@read_only
 def download_document(document_id):
     """下载项目文档。"""
     document = ProjectDocument.query.get_or_404(document_id)
     project = document.project
     
     # 检查用户权限
-    if (project.manager != current_user and 
-        current_user.role != '管理员' and 
-        not has_permission('view_all_projects')):
+    if not can(current_user, 'documents', project):
         flash('您没有权限下载此文档。')
         return redirect(url_for('main.index'))
     
     try:
-        return send_file(document.file_path, 
-                        as_attachment=True, 
-                        download_name=document.filename)
+        # 支持Range/条件请求，配置了X-Accel-Redirect/X-Sendfile时交由前端代理发送
+        return send_document(document)
     except FileNotFoundError:
         flash('文件不存在或已被删除。')
         return redirect(url_for('main.project_documents', project_id=project.id))
 
+@main.route('/documents/<int:document_id>/thumbnail')
+@login_required
+@read_only
+def document_thumbnail(document_id):
+    """文档首页缩略图。"""
+    document = ProjectDocument.query.get_or_404(document_id)
+    project = document.project
+    
+    if not can(current_user, 'documents', project):
+        return '', 403
+    
+    path = thumbnail_file(document.preview)
+    if path is None or not os.path.exists(path):
+        return '', 404
+    response = send_file(path, mimetype='image/png', conditional=True, max_age=current_app.config['DOCUMENT_CACHE_MAX_AGE'])
+    response.cache_control.private = True
+    return response
+
 @main.route('/documents/<int:document_id>/delete', methods=['POST'])
 @login_required
 def delete_document(document_id):
@@ -907,16 +1135,16 @@ def delete_document(document_id):
     project = document.project
     
     # 检查用户权限：项目经理、管理员或文档上传者
-    if (project.manager != current_user and 
-        current_user.role != '管理员' and 
-        document.uploaded_by != current_user.id and
-        not has_permission('can_delete_projects')):
+    if not (can(current_user, 'delete', project) or document.uploaded_by == current_user.id):
         flash('您没有权限删除此文档。')
         return redirect(url_for('main.project_documents', project_id=project.id))
     
     try:
-        # 删除物理文件
-        if os.path.exists(document.file_path):
+        if document.content_hash:
+            # 内容寻址存储只释放引用，物理文件由垃圾回收统一清理
+            release_blob(document.content_hash)
+        elif os.path.exists(document.file_path):
+            # 旧版上传文件直接删除物理文件
             os.remove(document.file_path)
         
         # 删除数据库记录
@@ -929,9 +1157,179 @@ def delete_document(document_id):
     
     return redirect(url_for('main.project_documents', project_id=project.id))
 
+@main.route('/search')
+@login_required
+@read_only
+def search():
+    """全文检索项目和文档。"""
+    from app.search import search_for_user
+    
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    results, took_ms = search_for_user(current_user, query, limit=limit) if query else ([], 0)
+    
+    # 补充结果所属项目名称和访问链接
+    project_names = dict(db.session.query(Project.id, Project.name)
+                         .filter(Project.id.in_({r['project_id'] for r in results})).all()) if results else {}
+    for result in results:
+        result['project_name'] = project_names.get(result['project_id'], '')
+        if result['kind'] == 'project':
+            result['url'] = url_for('main.project_detail', project_id=result['ref_id'])
+        else:
+            result['url'] = url_for('main.download_document', document_id=result['ref_id'])
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'query': query,
+            'took_ms': took_ms,
+            'results': [dict(r, title=str(r['title']), snippet=str(r['snippet'])) for r in results]
+        })
+    
+    return render_template('search/search_results.html', 
+                         title='搜索', 
+                         query=query, 
+                         results=results, 
+                         took_ms=took_ms)
+
+@main.route('/analytics/stages')
+@login_required
+@require_permission('can_view_all_projects')
+@read_only
+def stage_analytics():
+    """项目生命周期分析API：阶段停留时长、转化漏斗和吞吐量。"""
+    group_by = request.args.get('group_by') or None
+    period = request.args.get('period', 'month')
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        return jsonify({
+            'group_by': group_by,
+            'dwell_times': dwell_times(group_by, since, until),
+            'funnel': conversion_funnel(group_by, since, until),
+            'throughput': stage_throughput(period, group_by, since, until),
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@main.route('/analytics/profit_history')
+@login_required
+@require_permission('can_view_financial_data')
+@read_only
+def profit_history():
+    """收益分析历史API：指定 project_id 时返回该项目的快照序列，否则返回组合按周期的累计收益。"""
+    project_id = request.args.get('project_id', type=int)
+    period = request.args.get('period', 'month')
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        if project_id is not None:
+            snapshots = project_history(project_id, since, until)
+            return jsonify({'project_id': project_id, 'snapshots': [snapshot_dict(s) for s in snapshots]})
+        return jsonify({'period': period, 'history': portfolio_history(period, since, until)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@main.route('/analytics/profit_solver')
+@login_required
+@require_permission('can_view_financial_data')
+@read_only
+def profit_solver():
+    """收益反算API：按各项目当前输入，求达到目标总收益、净利润或ROI所需的资源费总额或开发收益费率。"""
+    # numpy 在首次请求时才加载，不影响应用启动
+    from app.profit_solver import solve_portfolio
+
+    target = request.args.get('target', 'roi_percentage')
+    solve_for = request.args.get('solve_for', 'resource_fee_total')
+    value = request.args.get('value', type=float)
+    project_ids = request.args.getlist('project_id', type=int) or None
+    if value is None:
+        return jsonify({'error': '缺少目标值 value'}), 400
+    try:
+        projects = solve_portfolio(target, value, solve_for, project_ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    status_counts = {}
+    for project in projects:
+        status_counts[project['status']] = status_counts.get(project['status'], 0) + 1
+    return jsonify({'target': target, 'value': value, 'solve_for': solve_for,
+                    'status_counts': status_counts, 'projects': projects})
+
+@main.route('/analytics/portfolio_optimizer')
+@login_required
+@require_permission('can_view_financial_data')
+@read_only
+def portfolio_optimizer():
+    """
+    投资组合优化API：在预算、各类型容量和各省份项目数上限下，选择目标之和最大的候选项目
+
+    上限参数可重复，格式为 名称:上限，例如 capacity_limit=集中式光伏:800&province_limit=河北省:3；
+    stage 可重复，默认只考虑前期开发阶段的项目，stage=all 时不限阶段；gap 为允许的相对误差，默认求精确最优解。
+    """
+    # numpy 在首次请求时才加载，不影响应用启动
+    from app.portfolio_optimizer import DEFAULT_STAGES, optimize_portfolio
+
+    budget = request.args.get('budget', type=float)
+    if budget is None:
+        return jsonify({'error': '缺少预算 budget（万元）'}), 400
+    try:
+        capacity_limits = _parse_limits(request.args.getlist('capacity_limit'))
+        province_limits = _parse_limits(request.args.getlist('province_limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stages = request.args.getlist('stage') or DEFAULT_STAGES
+    try:
+        result = optimize_portfolio(
+            budget, objective=request.args.get('objective', 'net_profit'),
+            cost_basis=request.args.get('cost_basis', 'investment'),
+            capacity_limits=capacity_limits, province_limits=province_limits,
+            stages=None if 'all' in stages else stages,
+            project_ids=request.args.getlist('project_id', type=int) or None,
+            gap=request.args.get('gap', 0.0, type=float))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+def _parse_limits(values):
+    """把重复的 名称:上限 参数解析为字典。"""
+    limits = {}
+    for value in values:
+        name, separator, limit = value.rpartition(':')
+        if not separator or not name:
+            raise ValueError(f'上限参数格式应为 名称:上限：{value}')
+        try:
+            limits[name] = float(limit)
+        except ValueError:
+            raise ValueError(f'上限必须是数值：{value}')
+    return limits
+
+@main.route('/analytics/cash_flow')
+@login_required
+@require_permission('can_view_financial_data')
+@read_only
+def cash_flow():
+    """
+    现金流API：各项目从当前阶段开始的年度现金流的净现值、内部收益率和投资回收期，以及组合汇总
+
+    rate 为折现率（默认 0.08）；cost_basis 为投入口径；stage、project_id 可重复；flows=1 时返回各项目的年度现金流。
+    """
+    # numpy/pandas 在首次请求时才加载，不影响应用启动
+    from app.cash_flow import DEFAULT_RATE, portfolio_cash_flow
+
+    rate = request.args.get('rate', DEFAULT_RATE, type=float)
+    try:
+        result = portfolio_cash_flow(
+            rate, cost_basis=request.args.get('cost_basis', 'investment'),
+            stages=request.args.getlist('stage') or None,
+            project_ids=request.args.getlist('project_id', type=int) or None,
+            include_flows=request.args.get('flows') in ('1', 'true'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
 @main.route('/admin/documents')
 @login_required
 @require_admin()
+@read_only
 def admin_documents():
     """管理员文档管理页面。"""
     documents = ProjectDocument.query.join(Project).order_by(ProjectDocument.uploaded_at.desc()).all()
@@ -0,0 +1,564 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全文检索模块 - 基于 SQLite FTS5
+
+索引内容：
+- 项目：名称、类型、阶段、详细地址、省/市/区县
+- 文档：文件名、描述以及从 PDF/DOCX 等文件中提取的正文
+
+分词器可插拔（SEARCH_TOKENIZER），默认的 cjk_bigram 在入库前将中文切分为
+重叠二元组，使 FTS5 自带的 unicode61 分词器可以检索中文。
+
+索引由后台线程维护：会话提交后收集 Project/ProjectDocument 的增删改，
+投递到队列中异步更新，不增加请求的提交延迟。索引表首次创建后，已有数据也由后台线程补建，
+检索请求不会同步提取文档正文。
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from flask import current_app, has_app_context
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = 'search_index'
+META_TABLE = 'search_index_meta'
+
+# 补建全部已有数据的索引任务
+_BACKFILL = 'backfill'
+
+# bm25 列权重：标题命中比正文命中更相关
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+_CJK_RUN_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+
+
+class SearchTokenizer:
+    """分词器基类：直接使用 FTS5 的 unicode61 分词器，适用于英文等以空格分词的文本。"""
+
+    name = 'unicode61'
+    fts_tokenize = 'unicode61'
+
+    def prepare(self, value):
+        """将原文转换为入库文本。"""
+        return value or ''
+
+    def term_expression(self, term):
+        """将用户输入的单个检索词转换为 FTS5 查询表达式，无法检索时返回 None。"""
+        prepared = self.prepare(term).strip()
+        if not prepared:
+            return None
+        expression = _quote(prepared)
+        if prepared[-1].isascii() and prepared[-1].isalnum():
+            # 英文/数字结尾的检索词按前缀匹配
+            expression += '*'
+        return expression
+
+    def build_match(self, query):
+        expressions = [self.term_expression(term) for term in query.split()]
+        expressions = [e for e in expressions if e]
+        return ' AND '.join(expressions)
+
+
+class CJKBigramTokenizer(SearchTokenizer):
+    """中文二元切分：'光伏项目' 入库为 '光伏 伏项 项目'，检索词按同样方式切分后作为短语匹配。"""
+
+    name = 'cjk_bigram'
+
+    def prepare(self, value):
+        if not value:
+            return ''
+        return _CJK_RUN_RE.sub(lambda m: ' ' + _bigrams(m.group()) + ' ', value)
+
+    def term_expression(self, term):
+        prepared = self.prepare(term).split()
+        if not prepared:
+            return None
+        expression = _quote(' '.join(prepared))
+        last = prepared[-1]
+        if len(last) == 1 or (last[-1].isascii() and last[-1].isalnum()):
+            # 单个汉字或英文结尾时按前缀匹配
+            expression += '*'
+        return expression
+
+
+class TrigramTokenizer(SearchTokenizer):
+    """FTS5 内置 trigram 分词器（SQLite 3.34+），支持任意子串检索，少于3个字符的检索词会被忽略。"""
+
+    name = 'trigram'
+    fts_tokenize = 'trigram'
+
+    def term_expression(self, term):
+        if len(term) < 3:
+            return None
+        return _quote(term)
+
+
+class JiebaTokenizer(SearchTokenizer):
+    """基于 jieba 的中文分词（可选依赖），索引体积比二元切分小，但需要安装 jieba。"""
+
+    name = 'jieba'
+
+    def __init__(self):
+        import jieba
+        self._jieba = jieba
+
+    def prepare(self, value):
+        if not value:
+            return ''
+        return ' '.join(self._jieba.cut_for_search(value))
+
+    def term_expression(self, term):
+        words = [w for w in self._jieba.cut(term) if w.strip()]
+        if not words:
+            return None
+        return _quote(' '.join(words))
+
+
+TOKENIZERS = {
+    CJKBigramTokenizer.name: CJKBigramTokenizer,
+    TrigramTokenizer.name: TrigramTokenizer,
+    JiebaTokenizer.name: JiebaTokenizer,
+    SearchTokenizer.name: SearchTokenizer,
+}
+
+
+def register_tokenizer(tokenizer_class):
+    """注册自定义分词器，配置 SEARCH_TOKENIZER 为其 name 即可启用。"""
+    TOKENIZERS[tokenizer_class.name] = tokenizer_class
+    return tokenizer_class
+
+
+def get_tokenizer(name):
+    try:
+        return TOKENIZERS[name]()
+    except KeyError:
+        raise ValueError(f'未知的检索分词器: {name}')
+    except ImportError:
+        logger.warning('分词器 %s 的依赖未安装，改用 cjk_bigram', name)
+        return CJKBigramTokenizer()
+
+
+class SearchIndexer:
+    """全文索引维护器：管理索引表结构、后台更新线程和检索查询。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        # 串行化本进程内索引表的创建、重建和写入（同步模式下补建索引会重入）
+        self._index_lock = threading.RLock()
+        self._schema_ready = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_TOKENIZER', 'cjk_bigram')
+        app.config.setdefault('SEARCH_INDEX_SYNC', False)
+        app.config.setdefault('SEARCH_MAX_BODY_CHARS', 200000)
+
+        self.app = app
+        self.tokenizer = get_tokenizer(app.config['SEARCH_TOKENIZER'])
+        self.sync = app.config['SEARCH_INDEX_SYNC']
+        self.max_body_chars = app.config['SEARCH_MAX_BODY_CHARS']
+        app.extensions['search_indexer'] = self
+        _register_session_events()
+
+    @property
+    def enabled(self):
+        return db.engine.dialect.name == 'sqlite'
+
+    # ------------------------------------------------------------------
+    # 索引更新
+    # ------------------------------------------------------------------
+
+    def enqueue(self, jobs):
+        """
+        投递索引更新任务
+
+        Args:
+            jobs: 可迭代的 (kind, ref_id, deleted) 元组，kind 为 'project' 或 'document'
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return
+        if self.sync:
+            self._process(jobs)
+            return
+        self._ensure_worker()
+        for job in jobs:
+            self._queue.put(job)
+
+    def flush(self):
+        """等待队列中的索引任务全部完成。"""
+        if not self.sync:
+            self._queue.join()
+
+    def rebuild(self):
+        """重建整个索引（切换分词器或首次启用时使用），返回索引条目数。"""
+        with self.app.app_context():
+            if not self.enabled:
+                return 0
+            with self._index_lock:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'DROP TABLE IF EXISTS {INDEX_TABLE}'))
+                    self._create_schema(conn)
+                    jobs = self._all_jobs(conn)
+                    self._write(conn, jobs)
+                self._schema_ready = True
+        return len(jobs)
+
+    def _ensure_worker(self):
+        # gunicorn 预加载时线程不会随 fork 复制，按进程号检查并重新启动
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='search-indexer', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            # 合并短时间内的多个更新，减少写事务次数
+            while len(jobs) < 100:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(jobs)
+            except Exception:
+                logger.exception('全文索引更新失败')
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    def _process(self, jobs):
+        with self.app.app_context():
+            if not self.enabled:
+                return
+            with self._index_lock:
+                self._ensure_schema()
+                with db.engine.begin() as conn:
+                    self._write(conn, jobs)
+
+    def _write(self, conn, jobs):
+        if any(kind == _BACKFILL for kind, _, _ in jobs):
+            # 补建任务展开为全部项目和文档，同批次中的其他任务在后面，以其为准
+            jobs = self._all_jobs(conn) + [job for job in jobs if job[0] != _BACKFILL]
+        latest = {}
+        for kind, ref_id, deleted in jobs:
+            latest[(kind, ref_id)] = deleted
+
+        for (kind, ref_id), deleted in latest.items():
+            conn.execute(text(f'DELETE FROM {INDEX_TABLE} WHERE kind = :kind AND ref_id = :ref_id'),
+                         {'kind': kind, 'ref_id': ref_id})
+            if deleted:
+                if kind == 'project':
+                    conn.execute(text(f'DELETE FROM {INDEX_TABLE} WHERE project_id = :project_id'),
+                                 {'project_id': ref_id})
+                continue
+
+            row = self._build_project_row(conn, ref_id) if kind == 'project' \
+                else self._build_document_row(conn, ref_id)
+            if row is None:
+                continue
+            conn.execute(text(
+                f'INSERT INTO {INDEX_TABLE} (title, body, kind, ref_id, project_id, title_raw, body_raw) '
+                'VALUES (:title, :body, :kind, :ref_id, :project_id, :title_raw, :body_raw)'
+            ), {
+                'title': self.tokenizer.prepare(row['title']),
+                'body': self.tokenizer.prepare(row['body']),
+                'kind': kind,
+                'ref_id': ref_id,
+                'project_id': row['project_id'],
+                'title_raw': row['title'],
+                'body_raw': row['body'],
+            })
+
+    def _build_project_row(self, conn, project_id):
+        from app.models import Project
+
+        project = conn.execute(db.select(
+            Project.name, Project.project_type, Project.current_stage, Project.address,
+            Project.province, Project.city, Project.district
+        ).where(Project.id == project_id)).first()
+        if project is None:
+            return None
+        body = ' '.join(part for part in (
+            project.project_type, project.current_stage, project.province,
+            project.city, project.district, project.address
+        ) if part)
+        return {'title': project.name or '', 'body': body, 'project_id': project_id}
+
+    def _build_document_row(self, conn, document_id):
+        from app.models import ProjectDocument, DocumentPreview
+
+        document = conn.execute(db.select(
+            ProjectDocument.project_id, ProjectDocument.filename, ProjectDocument.description,
+            ProjectDocument.file_path, ProjectDocument.content_hash
+        ).where(ProjectDocument.id == document_id)).first()
+        if document is None:
+            return None
+        # 优先使用后处理流水线已提取的正文，避免重复解析文件
+        preview_text = conn.execute(db.select(DocumentPreview.text_content).where(
+            DocumentPreview.document_id == document_id,
+            DocumentPreview.status.in_(('done', 'unavailable')),
+            DocumentPreview.content_hash == document.content_hash
+        )).scalar()
+        document_text = preview_text if preview_text is not None else self._document_text(document)
+        body = '\n'.join(part for part in (
+            document.description, document_text
+        ) if part)
+        return {'title': document.filename or '', 'body': body[:self.max_body_chars],
+                'project_id': document.project_id}
+
+    def _document_text(self, document):
+        from app.blob_store import get_blob_store
+        from app.text_extraction import DependencyUnavailable, extract_text
+
+        path = get_blob_store(self.app).path_for(document.content_hash) \
+            if document.content_hash else document.file_path
+        if not path or not os.path.exists(path):
+            return ''
+        try:
+            return extract_text(path, document.filename, max_chars=self.max_body_chars)
+        except DependencyUnavailable:
+            # 流水线安装依赖后重新处理文档时会刷新索引
+            return ''
+
+    def _ensure_schema(self):
+        """创建索引表；本次新建时投递补建任务，由后台线程（同步模式下在当前线程）索引已有数据。"""
+        if self._schema_ready:
+            return
+        with self._index_lock:
+            if self._schema_ready:
+                return
+            with db.engine.begin() as conn:
+                created = self._create_schema(conn)
+            self._schema_ready = True
+            if created:
+                self.enqueue([(_BACKFILL, None, False)])
+
+    def _create_schema(self, conn):
+        """创建元数据表和索引表，分词器变化时删除旧索引，返回索引表是否为本次新建。"""
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)'))
+        current = conn.execute(text(f"SELECT value FROM {META_TABLE} WHERE key = 'tokenizer'")).scalar()
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': INDEX_TABLE}).first() is not None
+
+        if exists and current != self.tokenizer.name:
+            # 分词器变化后旧索引无法复用
+            conn.execute(text(f'DROP TABLE IF EXISTS {INDEX_TABLE}'))
+            exists = False
+
+        # 其他进程可能同时创建
+        conn.execute(text(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+            'title, body, kind UNINDEXED, ref_id UNINDEXED, project_id UNINDEXED, '
+            'title_raw UNINDEXED, body_raw UNINDEXED, '
+            f"tokenize = '{self.tokenizer.fts_tokenize}')"
+        ))
+        conn.execute(text(f'INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (\'tokenizer\', :name)'),
+                     {'name': self.tokenizer.name})
+        return not exists
+
+    def _all_jobs(self, conn):
+        from app.models import Project, ProjectDocument
+
+        jobs = [('project', row[0], False) for row in conn.execute(db.select(Project.id))]
+        jobs += [('document', row[0], False) for row in conn.execute(db.select(ProjectDocument.id))]
+        return jobs
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+
+    def search(self, query, project_ids=None, document_project_ids=None, limit=20):
+        """
+        执行全文检索
+
+        Args:
+            query (str): 用户输入的检索词，空格分隔的多个词按 AND 匹配
+            project_ids (set): 可见项目ID集合，None 表示全部可见
+            document_project_ids (set): 可查看文档的项目ID集合，None 表示全部可见
+            limit (int): 最大返回条数
+
+        Returns:
+            list: 按相关度排序的结果，每项包含 kind/ref_id/project_id/title/snippet/score
+        """
+        match = self.tokenizer.build_match(query or '')
+        if not match or not self.enabled:
+            return []
+
+        conditions = []
+        params = {'match': match, 'limit': limit}
+        for kind, ids in (('project', project_ids), ('document', document_project_ids)):
+            if ids is None:
+                conditions.append(f"kind = '{kind}'")
+            elif ids:
+                placeholders = ', '.join(f':{kind}_{i}' for i in range(len(ids)))
+                conditions.append(f"(kind = '{kind}' AND project_id IN ({placeholders}))")
+                params.update({f'{kind}_{i}': pid for i, pid in enumerate(ids)})
+        if not conditions:
+            return []
+
+        self._ensure_schema()
+        with db.engine.connect() as conn:
+            rows = conn.execute(text(
+                f'SELECT kind, ref_id, project_id, title_raw, body_raw, '
+                f'bm25({INDEX_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS score '
+                f'FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :match '
+                f'AND ({" OR ".join(conditions)}) ORDER BY score LIMIT :limit'
+            ), params).fetchall()
+
+        terms = query.split()
+        return [{
+            'kind': row.kind,
+            'ref_id': row.ref_id,
+            'project_id': row.project_id,
+            'title': highlight(row.title_raw, terms),
+            'snippet': make_snippet(row.body_raw, terms),
+            'score': round(-row.score, 4),
+        } for row in rows]
+
+
+def get_search_indexer(app=None):
+    return (app or current_app).extensions['search_indexer']
+
+
+def search_for_user(user, query, limit=20):
+    """
+    按用户权限执行检索
+
+    项目结果按 can_view_all_projects 过滤；文档结果与文档列表页一致，
+    仅管理员和项目经理本人可见。
+
+    Returns:
+        tuple: (结果列表, 耗时毫秒)
+    """
+    from app.models import Project
+    from app.permissions import can
+
+    started = time.perf_counter()
+    if can(user, 'view'):
+        project_ids = None
+    else:
+        project_ids = {pid for (pid,) in db.session.query(Project.id).filter_by(manager_id=user.id)}
+
+    if can(user, 'documents'):
+        document_project_ids = None
+    else:
+        document_project_ids = {pid for (pid,) in db.session.query(Project.id).filter_by(manager_id=user.id)}
+
+    results = get_search_indexer().search(query, project_ids, document_project_ids, limit)
+    return results, round((time.perf_counter() - started) * 1000, 2)
+
+
+def highlight(value, terms):
+    """HTML转义后用 <mark> 标记检索词。"""
+    if not value:
+        return Markup('')
+    pattern = _terms_pattern(terms)
+    escaped = str(escape(value))
+    if pattern is None:
+        return Markup(escaped)
+    return Markup(pattern.sub(lambda m: f'<mark>{m.group()}</mark>', escaped))
+
+
+def make_snippet(value, terms, width=60):
+    """截取首个命中位置附近的文本片段并高亮检索词。"""
+    if not value:
+        return Markup('')
+    pattern = _terms_pattern(terms, escaped=False)
+    match = pattern.search(value) if pattern else None
+    start = max(0, match.start() - width // 2) if match else 0
+    end = min(len(value), start + width * 2)
+    fragment = value[start:end].replace('\n', ' ')
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(value) else ''
+    return Markup(prefix) + highlight(fragment, terms) + Markup(suffix)
+
+
+def _terms_pattern(terms, escaped=True):
+    terms = sorted({str(escape(t)) if escaped else t for t in terms if t}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile('|'.join(re.escape(t) for t in terms), re.IGNORECASE)
+
+
+def _bigrams(run):
+    if len(run) == 1:
+        return run
+    return ' '.join(run[i:i + 2] for i in range(len(run) - 1))
+
+
+def _quote(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+# ----------------------------------------------------------------------
+# 会话事件：提交后收集需要更新索引的记录
+# ----------------------------------------------------------------------
+
+_events_registered = False
+_TRACKED_MODELS = {'Project': 'project', 'ProjectDocument': 'document'}
+
+
+def _register_session_events():
+    global _events_registered
+    if _events_registered:
+        return
+    event.listen(db.session, 'after_flush', _collect_changes)
+    event.listen(db.session, 'after_commit', _dispatch_changes)
+    event.listen(db.session, 'after_rollback', _discard_changes)
+    _events_registered = True
+
+
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('search_pending', {})
+    for obj in session.new:
+        kind = _TRACKED_MODELS.get(type(obj).__name__)
+        if kind:
+            pending[(kind, obj.id)] = False
+    for obj in session.dirty:
+        kind = _TRACKED_MODELS.get(type(obj).__name__)
+        if kind and session.is_modified(obj, include_collections=False):
+            pending[(kind, obj.id)] = False
+    for obj in session.deleted:
+        kind = _TRACKED_MODELS.get(type(obj).__name__)
+        if kind:
+            pending[(kind, obj.id)] = True
+
+
+def _dispatch_changes(session):
+    pending = session.info.pop('search_pending', None)
+    if not pending or not has_app_context():
+        return
+    indexer = current_app.extensions.get('search_indexer')
+    if indexer is None:
+        return
+    try:
+        indexer.enqueue((kind, ref_id, deleted) for (kind, ref_id), deleted in pending.items())
+    except Exception:
+        # 索引失败不影响业务提交，可通过 rebuild 重建
+        logger.exception('全文索引任务投递失败')
+
+
+def _discard_changes(session):
+    session.info.pop('search_pending', None)
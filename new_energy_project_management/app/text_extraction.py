@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档文本提取模块
+
+从上传的文档中提取纯文本，供全文检索和文档预览使用。
+- DOCX/XLSX：直接解析 Office Open XML，无需额外依赖
+- PDF：使用 pypdf，未安装时抛出 DependencyUnavailable，由调用方稍后重新处理
+- 文本类文件：按 UTF-8 / GBK 依次尝试解码
+"""
+
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.markdown', '.csv', '.json', '.xml', '.html', '.htm'}
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'[ \t\r\f\v]+')
+
+
+class DependencyUnavailable(Exception):
+    """当前环境缺少处理该类型文档所需的依赖。"""
+
+
+def extract_text(path, filename=None, max_chars=None):
+    """
+    提取文档纯文本
+
+    Args:
+        path (str): 文件路径
+        filename (str): 原始文件名，用于判断类型（内容寻址存储的文件没有扩展名）
+        max_chars (int): 最大返回字符数，None 表示不限制
+
+    Returns:
+        str: 提取的文本，不支持的类型或解析失败时返回空字符串
+
+    Raises:
+        DependencyUnavailable: 缺少解析该类型文档所需的依赖
+    """
+    ext = os.path.splitext(filename or path)[1].lower()
+    try:
+        if ext == '.pdf':
+            text = _extract_pdf(path)
+        elif ext == '.docx':
+            text = _extract_docx(path)
+        elif ext == '.xlsx':
+            text = _extract_xlsx(path)
+        elif ext in TEXT_EXTENSIONS:
+            text = _extract_plain(path, strip_tags=ext in ('.html', '.htm', '.xml'))
+        else:
+            return ''
+    except DependencyUnavailable:
+        raise
+    except Exception:
+        # 损坏或加密的文件不影响上传和检索的其他部分
+        return ''
+
+    text = normalize_whitespace(text)
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
+
+
+def pdf_page_count(path):
+    """返回PDF页数，无法解析时返回 None；未安装 pypdf 时抛出 DependencyUnavailable。"""
+    PdfReader = _pdf_reader()
+    try:
+        return len(PdfReader(path).pages)
+    except Exception:
+        return None
+
+
+def normalize_whitespace(text):
+    lines = (_SPACE_RE.sub(' ', line).strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _pdf_reader():
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise DependencyUnavailable('未安装 pypdf，无法解析PDF')
+    return PdfReader
+
+
+def _extract_pdf(path):
+    reader = _pdf_reader()(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def _extract_docx(path):
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read('word/document.xml'))
+    paragraphs = []
+    for paragraph in root.iter(f'{_WORD_NS}p'):
+        paragraphs.append(''.join(node.text or '' for node in paragraph.iter(f'{_WORD_NS}t')))
+    return '\n'.join(paragraphs)
+
+
+def _extract_xlsx(path):
+    with zipfile.ZipFile(path) as archive:
+        if 'xl/sharedStrings.xml' not in archive.namelist():
+            return ''
+        root = ElementTree.fromstring(archive.read('xl/sharedStrings.xml'))
+    return '\n'.join(''.join(t.text or '' for t in item.iter(f'{_SHEET_NS}t'))
+                     for item in root.iter(f'{_SHEET_NS}si'))
+
+
+def _extract_plain(path, strip_tags=False):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = raw.decode('utf-8', errors='ignore')
+    if strip_tags:
+        text = _TAG_RE.sub(' ', text)
+    return text
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+登录用户缓存
+
+Flask-Login 在每个已登录请求中调用 user_loader 查询 users 表，之后权限判断和模板
+又反复读取 current_user.role。这里把用户压缩为只读快照 SessionUser（id、用户名、角色、
+按 ROLE_PERMISSIONS 编译好的权限掩码），在进程内缓存 USER_CACHE_TTL 秒：
+
+- 缓存命中时请求不再访问 users 表
+- 管理员编辑、删除用户提交后调用 invalidate_user 立即失效
+- 多进程部署时其他进程的缓存依靠 TTL 过期，角色变更最多延迟 USER_CACHE_TTL 秒生效
+
+current_user 不再是 ORM 对象：需要关联项目时使用 current_user.id 比较 manager_id，
+需要完整用户记录时用 db.session.get(User, current_user.id) 重新加载。
+"""
+
+import threading
+import time
+
+from flask import current_app
+from flask_login import UserMixin
+
+from app import db
+from app.metrics import USER_CACHE_LOOKUPS
+from app.permissions import PERMISSION_BITS, ROLE_MASKS
+
+
+class SessionUser(UserMixin):
+    """登录用户的只读快照。"""
+
+    __slots__ = ('id', 'username', 'role', 'permission_mask')
+
+    def __init__(self, id, username, role, permission_mask=0):
+        for name, value in zip(self.__slots__, (id, username, role, permission_mask)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SessionUser 为只读快照，修改用户请操作 User 模型')
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role, ROLE_MASKS.get(user.role, 0))
+
+    def has_permission(self, permission_name):
+        return bool(self.permission_mask & PERMISSION_BITS.get(permission_name, 0))
+
+
+class UserCache:
+    """进程内的用户快照缓存，USER_CACHE_TTL 为 0 时关闭。"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('USER_CACHE_TTL', 30)
+        app.config.setdefault('USER_CACHE_MAX_SIZE', 10000)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """
+        返回用户快照，缓存未命中或已过期时查询数据库
+
+        Returns:
+            SessionUser: 用户不存在时返回 None
+        """
+        ttl = self.app.config['USER_CACHE_TTL']
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            USER_CACHE_LOOKUPS.inc(('hit',))
+            return entry[1]
+
+        USER_CACHE_LOOKUPS.inc(('miss',))
+        from app.models import User
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        snapshot = SessionUser.from_user(user)
+        if ttl > 0:
+            with self._lock:
+                if len(self._entries) >= self.app.config['USER_CACHE_MAX_SIZE']:
+                    self._evict_expired(now)
+                self._entries[user_id] = (now + ttl, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self, now):
+        expired = [key for key, (expires, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.app.config['USER_CACHE_MAX_SIZE']:
+            # 全部有效时丢弃最早过期的一半
+            keep = sorted(self._entries.items(), key=lambda item: item[1][0])[len(self._entries) // 2:]
+            self._entries = dict(keep)
+
+
+def get_user_cache(app=None):
+    return (app or current_app).extensions['user_cache']
+
+
+def invalidate_user(user_id):
+    """用户记录修改或删除并提交后调用。"""
+    get_user_cache().invalidate(user_id)
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+
+- datagen: 确定性的合成项目组合数据生成器
+- cases: 看板、成本估算、收益分析、报表导出和核心计算用例
+- runner: 计时、保存JSON基线、超过阈值时以非0退出的回归门禁
+- loadtest: 多用户并发压测
+- startup: 应用启动耗时和内存
+- concurrency: SQLite 多进程并发读写
+
+运行: python -m benchmarks --scale 1k 10k
+"""
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试用例
+
+每个用例是一个接收 BenchmarkContext 的函数，由 runner 负责计时和重复执行。
+HTTP 用例通过 Flask test_client 在进程内请求完整的视图（含模板渲染），
+计算用例直接调用核心计算函数。
+"""
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Project, ProfitAnalysis, CostModel, User
+from app.cash_flow import portfolio_cash_flow
+from app.cash_flow_cache import get_cash_flow_cache
+from app.lifecycle import conversion_funnel, dwell_times, stage_throughput
+from app.portfolio_cli import ALL_CHECKS, run_checks
+from app.portfolio_optimizer import optimize_portfolio
+from app.profit_history import portfolio_history, project_history
+from app.profit_calculator import ProfitCalculator
+
+from benchmarks.datagen import BENCHMARK_PASSWORD
+
+CASES = {}
+
+
+def case(name):
+    def decorator(func):
+        CASES[name] = func
+        return func
+    return decorator
+
+
+class BenchmarkContext:
+    """用例共享的应用、已登录客户端和样本数据。"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = self._login('admin')
+
+        with app.app_context():
+            # 取一个有收益分析的中位项目作为单项目用例的对象
+            analysed = db.session.query(ProfitAnalysis.project_id).order_by(ProfitAnalysis.project_id)
+            count = analysed.count()
+            self.project_id = analysed.offset(count // 2).limit(1).scalar()
+            self.calculator_inputs = [
+                (row.capacity_mw, row.dev_fee_rate, row.extra_investment or 0,
+                 row.resource_fee_total or 0, row.dengpin_cost or 0)
+                for row in db.session.query(
+                    Project.capacity_mw, ProfitAnalysis.dev_fee_rate, ProfitAnalysis.extra_investment,
+                    ProfitAnalysis.resource_fee_total, ProfitAnalysis.dengpin_cost
+                ).join(ProfitAnalysis, ProfitAnalysis.project_id == Project.id)
+            ]
+            self.cost_inputs = db.session.query(Project.project_type, Project.capacity_mw).all()
+            manager = User.query.filter_by(role='项目经理').order_by(User.id).first().username
+            # 组合优化的约束：预算为已分析项目总造价的 30%，各类型容量为 20%，各省份项目数为 15%
+            totals = db.session.query(func.sum(ProfitAnalysis.total_project_cost)).scalar() or 0
+            self.optimizer_budget = round(totals * 0.3, 2)
+            self.optimizer_capacity_limits = {
+                project_type: round(capacity * 0.2, 1) for project_type, capacity in db.session.query(
+                    Project.project_type, func.sum(Project.capacity_mw)
+                ).join(ProfitAnalysis, ProfitAnalysis.project_id == Project.id).group_by(Project.project_type)}
+            self.optimizer_province_limits = {
+                province: max(1, int(count * 0.15)) for province, count in db.session.query(
+                    Project.province, func.count(Project.id)
+                ).join(ProfitAnalysis, ProfitAnalysis.project_id == Project.id).group_by(Project.province)}
+
+        self.manager_client = self._login(manager)
+
+    def _login(self, username):
+        client = self.app.test_client()
+        response = client.post('/login', data={'username': username, 'password': BENCHMARK_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'基准测试账号 {username} 登录失败')
+        return client
+
+    def get(self, url, client=None):
+        response = (client or self.client).get(url)
+        _check(response, url)
+        return response
+
+    def post(self, url, data):
+        response = self.client.post(url, data=data)
+        _check(response, url)
+        return response
+
+
+def _check(response, url):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{url} 返回 {response.status_code}')
+
+
+@case('dashboard')
+def dashboard(ctx):
+    ctx.get('/index')
+
+
+@case('project_detail')
+def project_detail(ctx):
+    ctx.get(f'/project/{ctx.project_id}')
+
+
+@case('cost_estimation_view')
+def cost_estimation_view(ctx):
+    ctx.get(f'/cost_estimation/{ctx.project_id}')
+
+
+@case('cost_estimation_submit')
+def cost_estimation_submit(ctx):
+    ctx.post(f'/cost_estimation/{ctx.project_id}', {'submit': '计算项目造价'})
+
+
+@case('profit_analysis_submit')
+def profit_analysis_submit(ctx):
+    ctx.post(f'/profit_analysis/{ctx.project_id}', {
+        'dev_fee_rate': 0.1, 'extra_investment': 100, 'resource_fee_total': 6000,
+        'dengpin_cost': 300, 'market_profit_rate': 0,
+    })
+
+
+@case('export_project_pdf')
+def export_project_pdf(ctx):
+    ctx.get(f'/export/project/{ctx.project_id}/pdf')
+
+
+@case('export_project_excel')
+def export_project_excel(ctx):
+    ctx.get(f'/export/project/{ctx.project_id}/excel')
+
+
+@case('export_all_projects_excel')
+def export_all_projects_excel(ctx):
+    ctx.get('/export/all_projects/excel')
+
+
+@case('export_portfolio_pdf')
+def export_portfolio_pdf(ctx):
+    ctx.get('/export/portfolio/pdf')
+
+
+@case('calculator_core')
+def calculator_core(ctx):
+    """对组合中所有已分析项目重新计算收益。"""
+    calculate = ProfitCalculator.calculate_comprehensive_profit_analysis
+    for inputs in ctx.calculator_inputs:
+        calculate(*inputs)
+
+
+@case('cost_model_core')
+def cost_model_core(ctx):
+    """按标准造价模型计算组合中所有项目的总造价。"""
+    with ctx.app.app_context():
+        models = {model.project_type: model for model in CostModel.query.all()}
+        for project_type, capacity_mw in ctx.cost_inputs:
+            models[project_type].calculate_total_cost(capacity_mw)
+
+
+@case('project_list')
+def project_list(ctx):
+    """以项目经理身份渲染项目列表页，模板对每个项目调用 can() 判断是否显示编辑入口。"""
+    ctx.get('/', client=ctx.manager_client)
+
+
+@case('stage_analytics')
+def stage_analytics(ctx):
+    """按阶段、项目类型和项目经理计算全部流转历史的停留时长、转化漏斗和月度吞吐量。"""
+    with ctx.app.app_context():
+        for group_by in (None, 'project_type', 'manager_id'):
+            dwell_times(group_by)
+            conversion_funnel(group_by)
+            stage_throughput('month', group_by)
+
+
+@case('profit_history')
+def profit_history(ctx):
+    """全部项目 5 年收益分析快照的月度和年度组合趋势，以及单个项目的快照序列。"""
+    with ctx.app.app_context():
+        portfolio_history('month')
+        portfolio_history('year')
+        project_history(1)
+
+
+@case('consistency_check')
+def consistency_check(ctx):
+    """向量化校验全部成本明细、项目总造价和收益分析结果（flask portfolio verify）。"""
+    with ctx.app.app_context():
+        run_checks(ALL_CHECKS, dry_run=True)
+
+
+@case('portfolio_optimizer')
+def portfolio_optimizer(ctx):
+    """全部已分析项目为候选，在 30% 总造价的预算、各类型容量和各省份项目数上限下选择最优组合。"""
+    with ctx.app.app_context():
+        optimize_portfolio(ctx.optimizer_budget, capacity_limits=ctx.optimizer_capacity_limits,
+                           province_limits=ctx.optimizer_province_limits, stages=None)
+
+
+@case('cash_flow')
+def cash_flow(ctx):
+    """清空缓存后计算全部已分析项目的年度现金流、净现值、内部收益率和回收期，以及组合汇总。"""
+    with ctx.app.app_context():
+        get_cash_flow_cache().clear()
+        portfolio_cash_flow()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite 并发读写基准测试
+
+模拟多个 gunicorn 工作进程同时读写同一个 SQLite 文件：每个进程创建自己的应用，
+按比例执行读操作（项目详情所需的查询）和写操作（更新收益分析，通过 commit_with_retry 提交），
+分别在默认配置（回滚日志、无重试）和调优配置（WAL + PRAGMA + 锁冲突重试）下运行，
+对比读写吞吐量、P95 延迟和锁冲突错误数。
+
+replica 配置在调优配置基础上把数据库复制一份作为只读副本（DATABASE_REPLICA_URL），
+读操作在 replica_reads() 中执行，用于评估读写分离在读多写少场景下的效果；
+基准期间不做复制，副本数据保持初始状态。
+
+用法:
+    python -m benchmarks.concurrency --workers 4 --duration 10
+    python -m benchmarks.concurrency --workers 8 --write-ratio 0.3 --output concurrency.json
+    python -m benchmarks.concurrency --profiles tuned replica --write-ratio 0.1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import DEFAULT_SEED, benchmark_config, build_database
+from benchmarks.loadtest import percentile
+from benchmarks.runner import DEFAULT_DATA_DIR
+
+PROFILES = {
+    # 默认日志模式、pysqlite 默认的5秒锁等待，锁冲突直接报错
+    'default': {'SQLITE_PRAGMAS': {}, 'DB_LOCK_RETRIES': 0},
+    # WAL 等 PRAGMA 和锁冲突重试（Config 默认值）
+    'tuned': {},
+    # 调优配置加只读副本，run_profile 生成副本文件并设置 DATABASE_REPLICA_URL
+    'replica': {},
+}
+REPLICA_PROFILES = {'replica'}
+
+
+def _worker(db_path, storage_dir, overrides, duration, write_ratio, seed, project_ids, results):
+    from sqlalchemy.exc import OperationalError
+
+    from app import create_app, db
+    from app.db_engine import commit_with_retry, is_lock_error
+    from app.db_routing import replica_reads
+    from app.models import Project, ProfitAnalysis, ProjectDocument
+
+    config_class = type('ConcurrencyConfig', (benchmark_config(db_path, storage_dir),), overrides)
+    app = create_app(config_class)
+    rng = random.Random(seed)
+    stats = {'read': [], 'write': [], 'errors': 0}
+
+    with app.app_context():
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            project_id = rng.choice(project_ids)
+            started = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    def update():
+                        analysis = ProfitAnalysis.query.filter_by(project_id=project_id).first()
+                        analysis.resource_fee_total = round(rng.uniform(0, 12000), 2)
+                    commit_with_retry(update)
+                    kind = 'write'
+                else:
+                    # 未配置副本时 replica_reads 不改变路由
+                    with replica_reads():
+                        db.session.get(Project, project_id)
+                        ProfitAnalysis.query.filter_by(project_id=project_id).first()
+                        ProjectDocument.query.filter_by(project_id=project_id).count()
+                        db.session.commit()
+                    kind = 'read'
+                stats[kind].append(time.perf_counter() - started)
+            except OperationalError as e:
+                db.session.rollback()
+                if not is_lock_error(e):
+                    raise
+                stats['errors'] += 1
+        db.session.remove()
+    results.put(stats)
+
+
+def run_profile(profile, source_db, storage_dir, workers=4, duration=5.0, write_ratio=0.2, seed=DEFAULT_SEED):
+    """
+    在数据库副本上以指定配置运行并发读写
+
+    Returns:
+        dict: 读写吞吐量、延迟和错误数
+    """
+    with tempfile.TemporaryDirectory() as root:
+        db_path = os.path.join(root, 'concurrency.db')
+        with sqlite3.connect(source_db) as src, sqlite3.connect(db_path) as dst:
+            src.backup(dst)
+        with sqlite3.connect(db_path) as conn:
+            # 默认配置从回滚日志模式开始；调优配置由连接事件切换为 WAL
+            conn.execute('PRAGMA journal_mode=DELETE')
+            project_ids = [row[0] for row in conn.execute('SELECT DISTINCT project_id FROM profit_analysis')]
+
+        overrides = dict(PROFILES[profile])
+        if profile in REPLICA_PROFILES:
+            replica_path = os.path.join(root, 'replica.db')
+            with sqlite3.connect(db_path) as src, sqlite3.connect(replica_path) as dst:
+                src.backup(dst)
+            overrides['DATABASE_REPLICA_URL'] = 'sqlite:///' + replica_path
+
+        ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        results = ctx.Queue()
+        processes = [
+            ctx.Process(target=_worker, args=(db_path, storage_dir, overrides, duration, write_ratio,
+                                              seed + i, project_ids, results))
+            for i in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        wall = time.perf_counter() - started
+
+    summary = {'profile': profile, 'workers': workers, 'duration_s': round(wall, 2),
+               'errors': sum(stats['errors'] for stats in collected)}
+    for kind in ('read', 'write'):
+        latencies = sorted(value for stats in collected for value in stats[kind])
+        summary[f'{kind}s'] = len(latencies)
+        summary[f'{kind}s_per_s'] = round(len(latencies) / duration, 1)
+        summary[f'{kind}_p95_ms'] = round(percentile(latencies, 95) * 1000, 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite 并发读写基准测试')
+    parser.add_argument('--projects', type=int, default=1000, help='合成数据库项目数')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='随机种子')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='合成数据库缓存目录')
+    parser.add_argument('--workers', type=int, default=4, help='并发进程数')
+    parser.add_argument('--duration', type=float, default=10.0, help='每种配置的运行秒数')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='写操作比例')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES), help='对比的配置')
+    parser.add_argument('--output', default=None, help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    scale_dir = os.path.join(args.data_dir, f'load_{args.projects}_{args.seed}')
+    db_path = os.path.join(scale_dir, 'bench.db')
+    storage_dir = os.path.join(scale_dir, 'blobs')
+    build_database(db_path, args.projects, args.seed, storage_dir=storage_dir)
+
+    results = []
+    print(f"{'配置':<10}{'读/s':>10}{'写/s':>10}{'读P95':>12}{'写P95':>12}{'锁错误':>8}")
+    for profile in args.profiles:
+        summary = run_profile(profile, db_path, storage_dir, args.workers, args.duration, args.write_ratio, args.seed)
+        results.append(summary)
+        print(f"{profile:<12}{summary['reads_per_s']:>10}{summary['writes_per_s']:>10}"
+              f"{summary['read_p95_ms']:>10.1f}ms{summary['write_p95_ms']:>10.1f}ms{summary['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
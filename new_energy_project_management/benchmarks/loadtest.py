@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTP 压测工具
+
+多个虚拟用户并发登录（auth.login），按权重随机回放典型操作路径
+（看板、项目详情、成本估算、收益分析、报表导出），统计每个端点的
+吞吐量、P50/P95/P99 延迟和错误率。数据来自 benchmarks.datagen 生成的合成数据库，
+可完全离线运行。
+
+驱动方式：
+- inprocess：在本进程内用 Flask test_client 直接调用 create_app() 的应用（默认）
+- gunicorn：启动本地 gunicorn 进程后通过 HTTP 请求（需安装 gunicorn）
+- --url：对已运行的服务发起 HTTP 请求
+
+用法:
+    python -m benchmarks.loadtest --users 8 --duration 30
+    python -m benchmarks.loadtest --driver gunicorn --workers 4 --users 16 --duration 60
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000 --users 4 --requests 500
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks.datagen import BENCHMARK_PASSWORD, DEFAULT_SEED, benchmark_config, build_database
+from benchmarks.runner import DEFAULT_DATA_DIR
+
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+OK = (200,)
+OK_OR_REDIRECT = (200, 302)
+
+
+# ----------------------------------------------------------------------
+# 驱动：每个虚拟用户一个会话，返回 (状态码, 响应体)
+# ----------------------------------------------------------------------
+
+class InProcessSession:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpSession:
+    def __init__(self, base_url, timeout=60):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self._base_url + path, data=body, method=method)
+        try:
+            with self._opener.open(req, timeout=self._timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ----------------------------------------------------------------------
+# 操作路径
+# ----------------------------------------------------------------------
+
+class VirtualUser:
+    """一个已登录的虚拟用户，记录每个请求的延迟和结果。"""
+
+    def __init__(self, session, recorder, rng, project_ids, analysed_ids):
+        self.session = session
+        self.recorder = recorder
+        self.rng = rng
+        self.project_ids = project_ids
+        self.analysed_ids = analysed_ids or project_ids
+        self._csrf_token = None
+
+    def call(self, label, method, path, data=None, expected=OK):
+        if data is not None and self._csrf_token:
+            data = dict(data, csrf_token=self._csrf_token)
+        started = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, data)
+        except Exception as e:
+            self.recorder.record(label, time.perf_counter() - started, False, type(e).__name__)
+            return None
+        ok = status in expected
+        self.recorder.record(label, time.perf_counter() - started, ok, None if ok else str(status))
+        if ok and body:
+            match = _CSRF_RE.search(body.decode('utf-8', errors='ignore'))
+            if match:
+                self._csrf_token = match.group(1)
+        return body if ok else None
+
+    def login(self, username='admin'):
+        self.call('GET /auth/login', 'GET', '/auth/login')
+        self.call('POST /auth/login', 'POST', '/auth/login',
+                  {'username': username, 'password': BENCHMARK_PASSWORD}, expected=(302,))
+
+    def project_id(self):
+        return self.rng.choice(self.project_ids)
+
+    def analysed_project_id(self):
+        return self.rng.choice(self.analysed_ids)
+
+
+def browse_dashboard(user):
+    user.call('GET /index', 'GET', '/index')
+
+
+def view_project(user):
+    project_id = user.project_id()
+    user.call('GET /project/<id>', 'GET', f'/project/{project_id}')
+    user.call('GET /project/<id>/documents', 'GET', f'/project/{project_id}/documents')
+
+
+def cost_estimation(user):
+    project_id = user.project_id()
+    if user.call('GET /cost_estimation/<id>', 'GET', f'/cost_estimation/{project_id}') is not None:
+        user.call('POST /cost_estimation/<id>', 'POST', f'/cost_estimation/{project_id}',
+                  {'submit': '计算项目造价'}, expected=(302,))
+
+
+def profit_analysis(user):
+    project_id = user.analysed_project_id()
+    if user.call('GET /profit_analysis/<id>', 'GET', f'/profit_analysis/{project_id}', expected=OK_OR_REDIRECT):
+        user.call('POST /profit_analysis/<id>', 'POST', f'/profit_analysis/{project_id}', {
+            'dev_fee_rate': round(user.rng.uniform(0.08, 0.12), 3),
+            'extra_investment': 0,
+            'resource_fee_total': round(user.rng.uniform(0, 12000), 2),
+            'dengpin_cost': round(user.rng.uniform(50, 800), 2),
+            'market_profit_rate': 0,
+        }, expected=OK_OR_REDIRECT)
+
+
+def export_project(user):
+    project_id = user.analysed_project_id()
+    if user.rng.random() < 0.5:
+        user.call('GET /export/project/<id>/pdf', 'GET', f'/export/project/{project_id}/pdf')
+    else:
+        user.call('GET /export/project/<id>/excel', 'GET', f'/export/project/{project_id}/excel')
+
+
+def export_all_projects(user):
+    user.call('GET /export/all_projects/excel', 'GET', '/export/all_projects/excel')
+
+
+JOURNEYS = {
+    'dashboard': browse_dashboard,
+    'project': view_project,
+    'cost_estimation': cost_estimation,
+    'profit_analysis': profit_analysis,
+    'export_project': export_project,
+    'export_all': export_all_projects,
+}
+
+DEFAULT_MIX = {'dashboard': 30, 'project': 30, 'cost_estimation': 15, 'profit_analysis': 15,
+               'export_project': 9, 'export_all': 1}
+
+
+def parse_mix(text):
+    """解析 'dashboard=40,project=30' 形式的权重配置。"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise ValueError(f'未知的操作路径: {name}（可选: {", ".join(JOURNEYS)}）')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ----------------------------------------------------------------------
+# 统计
+# ----------------------------------------------------------------------
+
+class Recorder:
+    """线程安全的请求结果记录器。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._errors = {}
+        self.requests = 0
+
+    def record(self, label, elapsed, ok, error=None):
+        with self._lock:
+            self._samples.setdefault(label, []).append((elapsed, ok))
+            self.requests += 1
+            if error:
+                errors = self._errors.setdefault(label, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        total = errors_total = 0
+        for label, samples in sorted(self._samples.items()):
+            latencies = sorted(elapsed for elapsed, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            total += len(samples)
+            errors_total += errors
+            endpoints[label] = {
+                'requests': len(samples),
+                'rps': round(len(samples) / wall_seconds, 2),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                'error_rate': round(errors / len(samples), 4),
+                'errors': self._errors.get(label, {}),
+            }
+        return {
+            'duration_s': round(wall_seconds, 2),
+            'requests': total,
+            'rps': round(total / wall_seconds, 2) if wall_seconds else 0.0,
+            'error_rate': round(errors_total / total, 4) if total else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+def percentile(sorted_values, pct):
+    """最近秩法分位数。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values) - 1e-9))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ----------------------------------------------------------------------
+# 运行
+# ----------------------------------------------------------------------
+
+def run_load(session_factory, project_ids, analysed_ids, users=4, duration=None, requests=None,
+             mix=None, seed=DEFAULT_SEED, usernames=('admin',)):
+    """
+    并发运行虚拟用户
+
+    Args:
+        session_factory: 无参函数，返回新的会话（每个虚拟用户一个）
+        project_ids (list): 可访问的项目ID
+        analysed_ids (list): 已有收益分析的项目ID
+        users (int): 并发虚拟用户数
+        duration (float): 运行秒数
+        requests (int): 总请求数上限（与 duration 至少指定一个）
+        mix (dict): 操作路径权重
+
+    Returns:
+        dict: 统计报告
+    """
+    if duration is None and requests is None:
+        raise ValueError('需要指定 duration 或 requests')
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        user = VirtualUser(session_factory(), recorder, rng, project_ids, analysed_ids)
+        user.login(usernames[index % len(usernames)])
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if requests is not None and recorder.requests >= requests:
+                return
+            JOURNEYS[rng.choices(names, weights)[0]](user)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def load_project_ids(db_path):
+    with sqlite3.connect(db_path) as conn:
+        project_ids = [row[0] for row in conn.execute('SELECT id FROM project ORDER BY id')]
+        analysed_ids = [row[0] for row in conn.execute(
+            'SELECT DISTINCT project_id FROM profit_analysis WHERE total_project_cost IS NOT NULL ORDER BY project_id')]
+    return project_ids, analysed_ids
+
+
+def create_target_app():
+    """gunicorn 入口：gunicorn 'benchmarks.loadtest:create_target_app()'，数据库路径由环境变量传入。"""
+    from app import create_app
+    return create_app(benchmark_config(os.environ['LOADTEST_DB'], os.environ['LOADTEST_STORAGE']))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(db_path, storage_dir, workers, threads):
+    """启动本地 gunicorn，返回 (进程, 地址)。"""
+    port = _free_port()
+    env = dict(os.environ, LOADTEST_DB=db_path, LOADTEST_STORAGE=storage_dir)
+    cmd = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+           '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'benchmarks.loadtest:create_target_app()']
+    process = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn 启动失败（是否已安装 gunicorn？）')
+        try:
+            urllib.request.urlopen(url + '/auth/login', timeout=1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('gunicorn 启动超时')
+
+
+def print_report(report):
+    print(f"\n总计: {report['requests']} 个请求，{report['duration_s']}s，"
+          f"{report['rps']} req/s，错误率 {report['error_rate']:.2%}\n")
+    header = f"{'端点':<34}{'请求数':>8}{'req/s':>9}{'P50':>10}{'P95':>10}{'P99':>10}{'错误率':>9}"
+    print(header)
+    print('-' * len(header))
+    for label, stats in report['endpoints'].items():
+        print(f"{label:<36}{stats['requests']:>8}{stats['rps']:>9}"
+              f"{stats['p50_ms']:>9.1f}ms{stats['p95_ms']:>8.1f}ms{stats['p99_ms']:>8.1f}ms"
+              f"{stats['error_rate']:>9.1%}")
+        for error, count in stats['errors'].items():
+            print(f"    {error}: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP 压测工具')
+    parser.add_argument('--driver', choices=['inprocess', 'gunicorn'], default='inprocess', help='驱动方式')
+    parser.add_argument('--url', default=None, help='对已运行的服务压测（忽略 --driver）')
+    parser.add_argument('--projects', type=int, default=1000, help='合成数据库项目数')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='数据和路径选择的随机种子')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='合成数据库缓存目录')
+    parser.add_argument('--users', type=int, default=4, help='并发虚拟用户数')
+    parser.add_argument('--duration', type=float, default=None, help='运行秒数')
+    parser.add_argument('--requests', type=int, default=None, help='总请求数')
+    parser.add_argument('--mix', default=None, help='操作路径权重，如 dashboard=40,project=30,export_all=1')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn 工作进程数')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn 每进程线程数')
+    parser.add_argument('--output', default=None, help='报告JSON输出路径')
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        args.duration = 30
+
+    mix = parse_mix(args.mix) if args.mix else None
+    scale_dir = os.path.join(args.data_dir, f'load_{args.projects}_{args.seed}')
+    db_path = os.path.join(scale_dir, 'bench.db')
+    storage_dir = os.path.join(scale_dir, 'blobs')
+    config_class = build_database(db_path, args.projects, args.seed, storage_dir=storage_dir)
+    project_ids, analysed_ids = load_project_ids(db_path)
+
+    process = None
+    try:
+        if args.url:
+            factory = lambda: HttpSession(args.url)  # noqa: E731
+        elif args.driver == 'gunicorn':
+            process, url = start_gunicorn(db_path, storage_dir, args.workers, args.threads)
+            factory = lambda: HttpSession(url)  # noqa: E731
+        else:
+            from app import create_app
+            app = create_app(config_class)
+            factory = lambda: InProcessSession(app)  # noqa: E731
+
+        report = run_load(factory, project_ids, analysed_ids, users=args.users, duration=args.duration,
+                          requests=args.requests, mix=mix, seed=args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
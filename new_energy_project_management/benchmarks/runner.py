@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试运行器与回归门禁
+
+用法:
+    python -m benchmarks --scale 1k                      # 运行并与基线比较，退化超过阈值时返回非0
+    python -m benchmarks --scale 1k 10k --save-baseline  # 运行并保存为新基线
+    python -m benchmarks --scale 100k --only dashboard calculator_core --repeat 3
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, 'baselines')
+DEFAULT_DATA_DIR = os.path.join(BENCHMARK_DIR, '.data')
+
+# 中位数超过基线 (1 + threshold) 倍且绝对差值超过 min_delta 秒才判定为退化，避免短用例的噪声误报
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_DELTA = 0.005
+
+
+def run_scale(scale, seed, repeat, warmup, only=None, data_dir=DEFAULT_DATA_DIR, rebuild=False, log=print):
+    """生成（或复用）指定规模的数据库并运行所有用例，返回结果字典。"""
+    from app import create_app
+    from benchmarks.cases import CASES, BenchmarkContext
+    from benchmarks.datagen import build_database
+
+    n_projects = SCALES[scale]
+    scale_dir = os.path.join(data_dir, f'{scale}_{seed}')
+    started = time.perf_counter()
+    config_class = build_database(os.path.join(scale_dir, 'bench.db'), n_projects, seed, force=rebuild)
+    log(f'[{scale}] 数据准备 {time.perf_counter() - started:.1f}s')
+
+    app = create_app(config_class)
+    ctx = BenchmarkContext(app)
+    results = {}
+    for name, func in CASES.items():
+        if only and name not in only:
+            continue
+        for _ in range(warmup):
+            func(ctx)
+        timings = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            func(ctx)
+            timings.append(time.perf_counter() - begin)
+        results[name] = {
+            'median': round(statistics.median(timings), 6),
+            'min': round(min(timings), 6),
+            'max': round(max(timings), 6),
+            'repeat': repeat,
+        }
+        log(f'[{scale}] {name:<28} median {results[name]["median"] * 1000:10.2f} ms')
+
+    return {
+        'scale': scale,
+        'projects': n_projects,
+        'seed': seed,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': results,
+    }
+
+
+def compare(result, baseline, threshold=DEFAULT_THRESHOLD, min_delta=DEFAULT_MIN_DELTA):
+    """
+    与基线比较各用例的中位耗时
+
+    Returns:
+        list: [(用例名, 基线秒数, 当前秒数, 变化比例, 是否退化)]
+    """
+    rows = []
+    for name, current in result['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            continue
+        before, after = base['median'], current['median']
+        change = (after - before) / before if before else 0.0
+        regressed = after > before * (1 + threshold) and after - before > min_delta
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+
+def baseline_path(scale, directory=BASELINE_DIR):
+    return os.path.join(directory, f'{scale}.json')
+
+
+def load_baseline(scale, directory=BASELINE_DIR):
+    path = baseline_path(scale, directory)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='性能基准测试与回归门禁')
+    parser.add_argument('--scale', nargs='+', choices=list(SCALES), default=['1k'], help='数据规模')
+    parser.add_argument('--seed', type=int, default=None, help='数据生成随机种子')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的计时次数')
+    parser.add_argument('--warmup', type=int, default=1, help='每个用例的预热次数')
+    parser.add_argument('--only', nargs='+', default=None, help='只运行指定用例')
+    parser.add_argument('--save-baseline', action='store_true', help='将结果保存为基线')
+    parser.add_argument('--baseline-dir', default=BASELINE_DIR, help='基线目录')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='合成数据库缓存目录')
+    parser.add_argument('--rebuild', action='store_true', help='重新生成合成数据库')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='允许的退化比例')
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA, help='忽略小于该秒数的差值')
+    parser.add_argument('--output', default=None, help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    from benchmarks.datagen import DEFAULT_SEED
+    seed = args.seed if args.seed is not None else DEFAULT_SEED
+
+    failed = False
+    all_results = {}
+    for scale in args.scale:
+        result = run_scale(scale, seed, args.repeat, args.warmup, args.only, args.data_dir, args.rebuild)
+        all_results[scale] = result
+
+        if args.save_baseline:
+            save_json(result, baseline_path(scale, args.baseline_dir))
+            print(f'[{scale}] 基线已保存: {baseline_path(scale, args.baseline_dir)}')
+            continue
+
+        baseline = load_baseline(scale, args.baseline_dir)
+        if baseline is None:
+            print(f'[{scale}] 没有基线，跳过比较（使用 --save-baseline 生成）')
+            continue
+        if baseline.get('seed') != seed:
+            print(f'[{scale}] 基线种子 {baseline.get("seed")} 与本次 {seed} 不一致，跳过比较')
+            continue
+
+        print(f'\n[{scale}] 与基线比较（阈值 +{args.threshold:.0%}）')
+        for name, before, after, change, regressed in compare(result, baseline, args.threshold, args.min_delta):
+            flag = '❌ 退化' if regressed else '✅'
+            print(f'  {name:<28} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  {change:+7.1%}  {flag}')
+            failed = failed or regressed
+
+    if args.output:
+        save_json(all_results, args.output)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+启动开销基准测试
+
+在全新的子进程中测量导入应用的耗时、导入完成后的常驻内存（RSS）
+以及已加载的重量级依赖，用于衡量 gunicorn 工作进程和 flask 命令行脚本的启动成本。
+
+用法:
+    python -m benchmarks.startup                  # 与 baselines/startup.json 比较
+    python -m benchmarks.startup --save-baseline  # 保存为新基线
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.runner import BASELINE_DIR, DEFAULT_MIN_DELTA, DEFAULT_THRESHOLD, compare, load_baseline, \
+    save_json, baseline_path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab', 'openpyxl', 'PIL')
+
+SCENARIOS = {
+    # 只导入应用包
+    'import_app': 'import app',
+    # gunicorn 加载 run:app 时的开销（flask 命令行同样会执行 create_app）
+    'wsgi_app': 'import run',
+    # 启动后首次导出 PDF，重量级依赖在这里才加载
+    'first_pdf_export': '''
+import run
+from app import db
+from app.models import Project
+from app.reports import generate_project_report_pdf
+with run.app.app_context():
+    db.create_all()
+    project = Project(name='启动测试', project_type='集中式光伏', capacity_mw=10)
+    db.session.add(project)
+    db.session.commit()
+    generate_project_report_pdf(project.id)
+''',
+}
+
+_CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+exec(compile({code!r}, '<startup>', 'exec'))
+elapsed = time.perf_counter() - started
+rss_kb = 0
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss_kb,
+                  'modules': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(code):
+    """在子进程中执行代码，返回耗时、RSS和已加载的重量级模块。"""
+    env = dict(os.environ, DATABASE_URL='sqlite://', PYTHONPATH=PROJECT_ROOT)
+    output = subprocess.run(
+        [sys.executable, '-c', _CHILD.format(code=code, heavy=HEAVY_MODULES)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_startup(repeat=5, only=None, log=print):
+    results = {}
+    for name, code in SCENARIOS.items():
+        if only and name not in only:
+            continue
+        samples = [measure(code) for _ in range(repeat)]
+        timings = [sample['seconds'] for sample in samples]
+        results[name] = {
+            'median': round(statistics.median(timings), 6),
+            'min': round(min(timings), 6),
+            'max': round(max(timings), 6),
+            'repeat': repeat,
+            'rss_mb': round(statistics.median(sample['rss_kb'] for sample in samples) / 1024, 1),
+            'heavy_modules': samples[-1]['modules'],
+        }
+        log(f"{name:<18} median {results[name]['median'] * 1000:9.1f} ms  RSS {results[name]['rss_mb']:7.1f} MB  "
+            f"已加载: {', '.join(results[name]['heavy_modules']) or '-'}")
+    return {'scale': 'startup', 'cases': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='启动开销基准测试')
+    parser.add_argument('--repeat', type=int, default=5, help='每个场景的子进程次数')
+    parser.add_argument('--only', nargs='+', default=None, help='只运行指定场景')
+    parser.add_argument('--save-baseline', action='store_true', help='将结果保存为基线')
+    parser.add_argument('--baseline-dir', default=BASELINE_DIR, help='基线目录')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='允许的退化比例（耗时和RSS）')
+    parser.add_argument('--output', default=None, help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    result = run_startup(args.repeat, args.only)
+    if args.output:
+        save_json(result, args.output)
+    if args.save_baseline:
+        save_json(result, baseline_path('startup', args.baseline_dir))
+        print(f"基线已保存: {baseline_path('startup', args.baseline_dir)}")
+        return 0
+
+    baseline = load_baseline('startup', args.baseline_dir)
+    if baseline is None:
+        print('没有基线，跳过比较（使用 --save-baseline 生成）')
+        return 0
+
+    failed = False
+    print(f'\n与基线比较（阈值 +{args.threshold:.0%}）')
+    for name, before, after, change, regressed in compare(result, baseline, args.threshold, DEFAULT_MIN_DELTA):
+        rss_before = baseline['cases'][name]['rss_mb']
+        rss_after = result['cases'][name]['rss_mb']
+        rss_regressed = rss_after > rss_before * (1 + args.threshold)
+        flag = '❌ 退化' if regressed or rss_regressed else '✅'
+        print(f'  {name:<18} {before * 1000:9.1f} ms -> {after * 1000:9.1f} ms  {change:+7.1%}  '
+              f'RSS {rss_before:6.1f} -> {rss_after:6.1f} MB  {flag}')
+        failed = failed or regressed or rss_regressed
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
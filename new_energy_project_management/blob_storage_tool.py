@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内容寻址文档存储维护脚本
+
+用法:
+    python blob_storage_tool.py migrate [--dry-run]   # 将历史上传文件原地转换为内容寻址存储
+    python blob_storage_tool.py gc [--dry-run]        # 回收无引用的文档实体
+"""
+
+import argparse
+
+from app import create_app
+from app.blob_store import collect_garbage, migrate_legacy_uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='内容寻址文档存储维护工具')
+    parser.add_argument('command', choices=['migrate', 'gc'], help='migrate: 迁移历史上传文件; gc: 垃圾回收')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不修改文件和数据库')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'migrate':
+            stats = migrate_legacy_uploads(dry_run=args.dry_run)
+            print(f"迁移文档: {stats['migrated']} 个")
+            print(f"重复内容: {stats['deduplicated']} 个，节省空间 {stats['saved_bytes'] / 1024 / 1024:.2f} MB")
+            if stats['missing']:
+                print(f"⚠️ 源文件缺失: {stats['missing']} 个")
+        else:
+            stats = collect_garbage(dry_run=args.dry_run)
+            print(f"校正引用计数: {stats['corrected']} 个")
+            print(f"回收无引用实体: {stats['deleted_blobs']} 个")
+            print(f"清理孤立文件: {stats['deleted_orphans']} 个")
+            print(f"宽限期内保留: {stats['skipped_recent']} 个")
+            print(f"清理残留临时文件: {stats['purged_temps']} 个")
+            print(f"释放空间: {stats['freed_bytes'] / 1024 / 1024:.2f} MB")
+
+        if args.dry_run:
+            print('(dry-run 模式，未做任何修改)')
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,141 @@ class Config:
     # 关闭 SQLAlchemy 的事件通知系统，以节省资源
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # 文档存储配置
+    # 内容寻址存储根目录，文件按SHA-256哈希命名并按前缀分片，相同内容只保存一份
+    BLOB_STORAGE_DIR = os.environ.get('BLOB_STORAGE_DIR') or \
+        os.path.join(basedir, 'uploads', 'blobs')
+    # 垃圾回收只删除超过该时长未被写入或关联的无引用实体（秒），避免删除正在上传、尚未提交引用的内容
+    BLOB_GC_GRACE_SECONDS = 3600
+    
+    # 文档下载配置
+    # 大文件交由前端代理发送：留空由Python发送，'x-accel-redirect'（Nginx）或 'x-sendfile'（Apache/lighttpd）
+    DOCUMENT_SENDFILE_BACKEND = os.environ.get('DOCUMENT_SENDFILE_BACKEND') or None
+    # X-Accel-Redirect 模式下对应 BLOB_STORAGE_DIR 的 Nginx internal location 前缀
+    DOCUMENT_ACCEL_REDIRECT_PREFIX = os.environ.get('DOCUMENT_ACCEL_REDIRECT_PREFIX') or '/protected-blobs/'
+    # 浏览器私有缓存时间（秒），文档内容按哈希不可变
+    DOCUMENT_CACHE_MAX_AGE = int(os.environ.get('DOCUMENT_CACHE_MAX_AGE') or 3600)
+    
+    # 全文检索配置（SQLite FTS5）
+    # 分词器：'cjk_bigram'（中文二元切分，默认）、'trigram'（SQLite 3.34+）、'jieba'（需安装jieba）、'unicode61'
+    SEARCH_TOKENIZER = os.environ.get('SEARCH_TOKENIZER') or 'cjk_bigram'
+    # 为 True 时在提交后同步更新索引，否则由后台线程异步更新
+    SEARCH_INDEX_SYNC = False
+    # 单个文档写入索引的最大正文字符数
+    SEARCH_MAX_BODY_CHARS = 200000
+    
+    # 文档后处理流水线配置（正文提取、页数统计、缩略图）
+    # 后台线程池大小
+    DOCUMENT_PIPELINE_WORKERS = int(os.environ.get('DOCUMENT_PIPELINE_WORKERS') or 2)
+    # 为 True 时在上传请求内同步处理（测试用）
+    DOCUMENT_PIPELINE_SYNC = False
+    # 最大尝试次数，失败后按 DOCUMENT_PIPELINE_RETRY_DELAY 秒为基数指数退避重试
+    DOCUMENT_PIPELINE_MAX_ATTEMPTS = 3
+    DOCUMENT_PIPELINE_RETRY_DELAY = 30
+    # 缩略图目录和最大尺寸（像素）
+    THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR') or \
+        os.path.join(basedir, 'uploads', 'thumbnails')
+    THUMBNAIL_SIZE = (320, 320)
+    
+    # 请求性能剖析配置：默认只在开发环境（FLASK_DEBUG=1）开启，其他环境需设置 PROFILING_ENABLED=true
+    PROFILING_ENABLED = (os.environ.get('PROFILING_ENABLED') or os.environ.get('FLASK_DEBUG') or 'false').lower() in ('true', '1')
+    # 超过该耗时（毫秒）的请求写入慢请求日志
+    PROFILING_SLOW_THRESHOLD_MS = int(os.environ.get('PROFILING_SLOW_THRESHOLD_MS') or 500)
+    # 慢请求日志文件（JSON行），留空时只输出到 app.slow_requests 日志记录器
+    PROFILING_SLOW_LOG = os.environ.get('PROFILING_SLOW_LOG') or None
+    # 请求剖析采样率（0~1），剖析文件保存在 PROFILING_PROFILE_DIR
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0)
+    # 剖析引擎：'cprofile' 或 'pyinstrument'（需安装pyinstrument）
+    PROFILING_ENGINE = os.environ.get('PROFILING_ENGINE') or 'cprofile'
+    PROFILING_PROFILE_DIR = os.environ.get('PROFILING_PROFILE_DIR') or \
+        os.path.join(basedir, 'profiles')
+    # 记录内存分配峰值（tracemalloc，会明显增加开销，仅排查时开启）
+    PROFILING_TRACEMALLOC = (os.environ.get('PROFILING_TRACEMALLOC') or 'false').lower() == 'true'
+    
+    # 运行指标配置（/metrics）
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() != 'false'
+    # 各进程指标文件目录，多进程部署（gunicorn）时必须配置为共享目录，并在启动前清空
+    METRICS_DIR = os.environ.get('METRICS_DIR') or None
+    # 设置后抓取时需携带 Authorization: Bearer <token>；未设置时只允许本机抓取
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN') or None
+    # 为 True 时不设置令牌也允许任意地址抓取（仅在网络层已做隔离时使用）
+    METRICS_PUBLIC = (os.environ.get('METRICS_PUBLIC') or 'false').lower() == 'true'
+    
+    # SQLite 连接调优：每个新连接上设置的 PRAGMA（WAL、同步级别、内存映射、页缓存、锁等待毫秒数），
+    # 设为空字典可关闭。其他数据库忽略此项
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000),
+    }
+    # 连接池（PostgreSQL/MySQL 生效）：常驻连接数、额外连接数、等待秒数、连接回收秒数、取出前检测
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    DB_POOL_PRE_PING = (os.environ.get('DB_POOL_PRE_PING') or 'true').lower() != 'false'
+    # 只读副本：看板、列表页、导出等只读视图的查询发送到副本；
+    # 用户写入后 DB_REPLICA_STICKY_SECONDS 秒内仍读主库，避免复制延迟
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL') or None
+    DB_REPLICA_STICKY_SECONDS = 5
+    
+    # 登录用户快照缓存秒数，0 表示每个请求都查询用户表；管理员修改、删除用户后立即失效
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    USER_CACHE_MAX_SIZE = 10000
+    
+    # 审计日志：后台线程每攒够 AUDIT_BATCH_SIZE 条或等待 AUDIT_FLUSH_INTERVAL 秒写入一次，
+    # AUDIT_SYNC 为 True 时在提交后同步写入（测试用）
+    AUDIT_ENABLED = (os.environ.get('AUDIT_ENABLED') or 'true').lower() != 'false'
+    AUDIT_SYNC = False
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 1.0
+    # 写入失败时按 AUDIT_RETRY_DELAY 秒为基数指数退避重试（最长 AUDIT_RETRY_MAX_DELAY 秒），
+    # 连续失败 AUDIT_MAX_ATTEMPTS 次后追加到备用文件，用 flask audit replay-fallback 写回
+    AUDIT_MAX_ATTEMPTS = 5
+    AUDIT_RETRY_DELAY = 1.0
+    AUDIT_RETRY_MAX_DELAY = 60.0
+    AUDIT_FALLBACK_FILE = os.environ.get('AUDIT_FALLBACK_FILE') or \
+        os.path.join(basedir, 'logs', 'audit_fallback.jsonl')
+    
+    # 按 (造价模型版本, 装机容量) 缓存的造价计算结果条数，版本不可变，无需失效；0 表示不缓存
+    COST_VERSION_CACHE_SIZE = 100000
+    
+    # 按输入哈希缓存的各项目现金流指标条数，输入变化后哈希不同，无需失效；0 表示不缓存
+    CASH_FLOW_CACHE_SIZE = 100000
+    
+    # 收益分析新增或重新计算时追加历史快照，用于收益趋势分析
+    PROFIT_SNAPSHOTS_ENABLED = (os.environ.get('PROFIT_SNAPSHOTS_ENABLED') or 'true').lower() != 'false'
+    
+    # 写事务遇到 "database is locked" 时的最大重试次数和指数退避基数（秒）
+    DB_LOCK_RETRIES = 5
+    DB_LOCK_RETRY_DELAY = 0.02
+    
+    # PDF 报表中文字体配置
+    # TrueType 字体文件（.ttf/.ttc，嵌入时只包含用到的字形子集），留空时依次尝试 PDF_FONT_SEARCH_PATHS
+    PDF_FONT_PATH = os.environ.get('PDF_FONT_PATH') or None
+    # .ttc 字体集合中使用的字体序号
+    PDF_FONT_SUBFONT_INDEX = int(os.environ.get('PDF_FONT_SUBFONT_INDEX') or 0)
+    PDF_FONT_SEARCH_PATHS = [
+        os.path.join(basedir, 'fonts', 'SimSun.ttf'),
+        'C:/Windows/Fonts/simsun.ttc',
+        '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+        '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+        '/System/Library/Fonts/STHeiti Light.ttc',
+    ]
+    # 找不到 TrueType 字体时使用的 CID 字体（不嵌入，由阅读器提供字形）
+    PDF_CID_FONT = 'STSong-Light'
+    
     # 其他应用相关的配置可以添加在这里
     # 例如：每页显示的项目数量
-    ITEMS_PER_PAGE = 10
\ No newline at end of file
+    ITEMS_PER_PAGE = 10
+
+class TestConfig(Config):
+    """测试配置：使用内存数据库并关闭CSRF校验。"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    SEARCH_INDEX_SYNC = True
+    DOCUMENT_PIPELINE_SYNC = True
+    AUDIT_SYNC = True
\ No newline at end of file
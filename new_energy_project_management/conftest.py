@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试公用夹具：按 TestConfig 和覆盖的配置项创建应用、建表并添加用户，以及登录后的测试客户端
+"""
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from config import TestConfig
+
+# 默认添加的用户：(用户名, 角色, 密码)
+ADMIN = ('admin', '管理员', 'admin123')
+
+
+@pytest.fixture
+def make_app():
+    """
+    返回 make_app(users=(ADMIN,), **config)
+
+    按 TestConfig 加上 config 中的配置项创建应用，建表后依次添加 users 中的用户
+    （邮箱为 <用户名>@example.com），返回应用。
+    """
+    def factory(users=(ADMIN,), **config):
+        app = create_app(type('FixtureTestConfig', (TestConfig,), config))
+        with app.app_context():
+            db.create_all()
+            for username, role, password in users:
+                user = User(username=username, email=f'{username}@example.com', role=role)
+                user.set_password(password)
+                db.session.add(user)
+            db.session.commit()
+        return app
+    return factory
+
+
+@pytest.fixture
+def login():
+    """返回 login(app, username='admin', password='admin123')，得到已登录的测试客户端。"""
+    def factory(app, username=ADMIN[0], password=ADMIN[2]):
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': password})
+        return client
+    return factory
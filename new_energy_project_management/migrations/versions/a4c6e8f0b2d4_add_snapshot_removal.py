@@ -0,0 +1,73 @@
+"""Record project removals in profit analysis snapshots
+
+Revision ID: a4c6e8f0b2d4
+Revises: f3a9c5e7b1d2
+Create Date: 2025-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c6e8f0b2d4'
+down_revision = 'f3a9c5e7b1d2'
+branch_labels = None
+depends_on = None
+
+_MEASURES = ('total_project_cost', 'dengpin_cost', 'commission_income', 'resource_income',
+             'total_income', 'net_profit')
+
+
+def upgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    # 回填期间临时去掉只追加触发器（SQLite 上 batch 模式重建表时触发器也会丢失）
+    if sqlite:
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_update')
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_delete')
+
+    with op.batch_alter_table('profit_analysis_snapshot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('removed', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('projects_change', sa.Integer(), nullable=False, server_default='0'))
+
+    # 各项目的第一条快照计入项目数
+    op.execute(
+        "UPDATE profit_analysis_snapshot SET projects_change = 1 WHERE id = ("
+        "SELECT s.id FROM profit_analysis_snapshot s WHERE s.project_id = profit_analysis_snapshot.project_id "
+        "ORDER BY s.taken_at, s.id LIMIT 1)"
+    )
+
+    # 已删除项目（或不再有收益分析的项目）补一条移除快照，金额变化量为最新快照的负值
+    changes = ', '.join(f'{measure}_change' for measure in _MEASURES)
+    negated = ', '.join(f'-COALESCE(s.{measure}, 0)' for measure in _MEASURES)
+    op.execute(
+        f"INSERT INTO profit_analysis_snapshot (project_id, taken_at, removed, projects_change, {changes}) "
+        f"SELECT s.project_id, CURRENT_TIMESTAMP, 1, -1, {negated} FROM profit_analysis_snapshot s "
+        "WHERE s.id = (SELECT s2.id FROM profit_analysis_snapshot s2 WHERE s2.project_id = s.project_id "
+        "ORDER BY s2.taken_at DESC, s2.id DESC LIMIT 1) "
+        "AND NOT EXISTS (SELECT 1 FROM profit_analysis a WHERE a.project_id = s.project_id)"
+    )
+
+    if sqlite:
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_update BEFORE UPDATE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_delete BEFORE DELETE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
+
+
+def downgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_update')
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_delete')
+
+    op.execute('DELETE FROM profit_analysis_snapshot WHERE removed')
+    with op.batch_alter_table('profit_analysis_snapshot', schema=None) as batch_op:
+        batch_op.drop_column('projects_change')
+        batch_op.drop_column('removed')
+
+    if sqlite:
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_update BEFORE UPDATE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_delete BEFORE DELETE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
@@ -0,0 +1,58 @@
+"""Add project stage transition history
+
+Revision ID: b8e4f0a2c3d5
+Revises: a7d3e9f1b2c4
+Create Date: 2025-09-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4f0a2c3d5'
+down_revision = 'a7d3e9f1b2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('project_stage_transition',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('from_stage', sa.String(length=64), nullable=True),
+        sa.Column('to_stage', sa.String(length=64), nullable=False),
+        sa.Column('project_type', sa.String(length=64), nullable=True),
+        sa.Column('manager_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('entered_at', sa.DateTime(), nullable=True),
+        sa.Column('transitioned_at', sa.DateTime(), nullable=False),
+        sa.Column('dwell_seconds', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('project_stage_transition', schema=None) as batch_op:
+        batch_op.create_index('ix_stage_transition_project', ['project_id', 'transitioned_at'], unique=False)
+        batch_op.create_index('ix_stage_transition_from',
+                              ['from_stage', 'transitioned_at', 'dwell_seconds', 'project_type', 'manager_id'],
+                              unique=False)
+        batch_op.create_index('ix_stage_transition_to',
+                              ['to_stage', 'transitioned_at', 'project_id', 'project_type', 'manager_id'],
+                              unique=False)
+
+    # 已有项目没有历史记录：以创建时间作为进入当前阶段的时间
+    op.execute(
+        "INSERT INTO project_stage_transition "
+        "(project_id, from_stage, to_stage, project_type, manager_id, transitioned_at) "
+        "SELECT id, NULL, COALESCE(current_stage, '机会挖掘'), project_type, manager_id, "
+        "COALESCE(created_at, CURRENT_TIMESTAMP) FROM project"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('project_stage_transition', schema=None) as batch_op:
+        batch_op.drop_index('ix_stage_transition_to')
+        batch_op.drop_index('ix_stage_transition_from')
+        batch_op.drop_index('ix_stage_transition_project')
+
+    op.drop_table('project_stage_transition')
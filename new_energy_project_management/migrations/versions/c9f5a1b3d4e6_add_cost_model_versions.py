@@ -0,0 +1,99 @@
+"""Add immutable cost model versions
+
+Revision ID: c9f5a1b3d4e6
+Revises: b8e4f0a2c3d5
+Create Date: 2025-09-08 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f5a1b3d4e6'
+down_revision = 'b8e4f0a2c3d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cost_model_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cost_model_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('project_type', sa.String(length=64), nullable=True),
+        sa.Column('cost_items', sa.JSON(), nullable=True),
+        sa.Column('cost_details', sa.JSON(), nullable=True),
+        sa.Column('unit_cost_label', sa.String(length=20), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['cost_model_id'], ['cost_model.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cost_model_id', 'version', name='uq_cost_model_version')
+    )
+
+    with op.batch_alter_table('cost_model', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('current_version_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_cost_model_current_version', 'cost_model_version',
+                                    ['current_version_id'], ['id'])
+
+    with op.batch_alter_table('project_cost_detail', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cost_model_version_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_project_cost_detail_cost_model_version_id'),
+                              ['cost_model_version_id'], unique=False)
+        batch_op.create_foreign_key('fk_project_cost_detail_cost_model_version', 'cost_model_version',
+                                    ['cost_model_version_id'], ['id'])
+
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cost_model_version_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_profit_analysis_cost_model_version_id'),
+                              ['cost_model_version_id'], unique=False)
+        batch_op.create_foreign_key('fk_profit_analysis_cost_model_version', 'cost_model_version',
+                                    ['cost_model_version_id'], ['id'])
+
+    # 现有造价模型作为第1版；已有的估算无法确定当时的参数，视为基于第1版
+    op.execute(
+        "INSERT INTO cost_model_version "
+        "(cost_model_id, version, project_type, cost_items, cost_details, unit_cost_label, created_at) "
+        "SELECT id, 1, project_type, cost_items, cost_details, unit_cost_label, "
+        "COALESCE(created_at, CURRENT_TIMESTAMP) FROM cost_model"
+    )
+    op.execute(
+        "UPDATE cost_model SET current_version_id = "
+        "(SELECT v.id FROM cost_model_version v WHERE v.cost_model_id = cost_model.id AND v.version = 1)"
+    )
+    op.execute(
+        "UPDATE project_cost_detail SET cost_model_version_id = "
+        "(SELECT m.current_version_id FROM cost_model m JOIN project p ON p.project_type = m.project_type "
+        "WHERE p.id = project_cost_detail.project_id) WHERE is_custom = 0"
+    )
+    op.execute(
+        "UPDATE profit_analysis SET cost_model_version_id = "
+        "(SELECT m.current_version_id FROM cost_model m JOIN project p ON p.project_type = m.project_type "
+        "WHERE p.id = profit_analysis.project_id)"
+    )
+
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE TRIGGER cost_model_version_no_update BEFORE UPDATE ON cost_model_version "
+                   "BEGIN SELECT RAISE(ABORT, 'cost_model_version is immutable'); END")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS cost_model_version_no_update')
+
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_profit_analysis_cost_model_version', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_profit_analysis_cost_model_version_id'))
+        batch_op.drop_column('cost_model_version_id')
+
+    with op.batch_alter_table('project_cost_detail', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_project_cost_detail_cost_model_version', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_project_cost_detail_cost_model_version_id'))
+        batch_op.drop_column('cost_model_version_id')
+
+    with op.batch_alter_table('cost_model', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_cost_model_current_version', type_='foreignkey')
+        batch_op.drop_column('current_version_id')
+
+    op.drop_table('cost_model_version')
@@ -0,0 +1,79 @@
+"""Add append-only profit analysis snapshots
+
+Revision ID: d1a6b2c4e5f7
+Revises: c9f5a1b3d4e6
+Create Date: 2025-09-15 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1a6b2c4e5f7'
+down_revision = 'c9f5a1b3d4e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('profit_analysis_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False),
+        sa.Column('cost_model_version_id', sa.Integer(), nullable=True),
+        sa.Column('capacity_mw', sa.Float(), nullable=True),
+        sa.Column('total_project_cost', sa.Float(), nullable=True),
+        sa.Column('dev_fee_rate', sa.Float(), nullable=True),
+        sa.Column('extra_investment', sa.Float(), nullable=True),
+        sa.Column('resource_fee_total', sa.Float(), nullable=True),
+        sa.Column('dengpin_cost', sa.Float(), nullable=True),
+        sa.Column('commission_income', sa.Float(), nullable=True),
+        sa.Column('resource_income', sa.Float(), nullable=True),
+        sa.Column('total_income', sa.Float(), nullable=True),
+        sa.Column('net_profit', sa.Float(), nullable=True),
+        sa.Column('roi_percentage', sa.Float(), nullable=True),
+        sa.Column('total_project_cost_change', sa.Float(), nullable=True),
+        sa.Column('dengpin_cost_change', sa.Float(), nullable=True),
+        sa.Column('commission_income_change', sa.Float(), nullable=True),
+        sa.Column('resource_income_change', sa.Float(), nullable=True),
+        sa.Column('total_income_change', sa.Float(), nullable=True),
+        sa.Column('net_profit_change', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('profit_analysis_snapshot', schema=None) as batch_op:
+        batch_op.create_index('ix_profit_snapshot_project', ['project_id', 'taken_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_profit_analysis_snapshot_taken_at'), ['taken_at'], unique=False)
+
+    # 现有收益分析作为各项目的第一条快照，时间取最后一次计算时间，变化量即为初值
+    op.execute(
+        "INSERT INTO profit_analysis_snapshot "
+        "(project_id, taken_at, cost_model_version_id, capacity_mw, total_project_cost, dev_fee_rate, "
+        "extra_investment, resource_fee_total, dengpin_cost, commission_income, resource_income, "
+        "total_income, net_profit, roi_percentage, total_project_cost_change, dengpin_cost_change, "
+        "commission_income_change, resource_income_change, total_income_change, net_profit_change) "
+        "SELECT a.project_id, COALESCE(a.updated_at, a.created_at, CURRENT_TIMESTAMP), a.cost_model_version_id, "
+        "p.capacity_mw, a.total_project_cost, a.dev_fee_rate, a.extra_investment, a.resource_fee_total, "
+        "a.dengpin_cost, a.commission_income, a.resource_income, a.total_income, a.net_profit, a.roi_percentage, "
+        "COALESCE(a.total_project_cost, 0), COALESCE(a.dengpin_cost, 0), COALESCE(a.commission_income, 0), "
+        "COALESCE(a.resource_income, 0), COALESCE(a.total_income, 0), COALESCE(a.net_profit, 0) "
+        "FROM profit_analysis a JOIN project p ON p.id = a.project_id"
+    )
+
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_update BEFORE UPDATE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
+        op.execute("CREATE TRIGGER profit_analysis_snapshot_no_delete BEFORE DELETE ON profit_analysis_snapshot "
+                   "BEGIN SELECT RAISE(ABORT, 'profit_analysis_snapshot is append-only'); END")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_delete')
+        op.execute('DROP TRIGGER IF EXISTS profit_analysis_snapshot_no_update')
+
+    with op.batch_alter_table('profit_analysis_snapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_profit_analysis_snapshot_taken_at'))
+        batch_op.drop_index('ix_profit_snapshot_project')
+
+    op.drop_table('profit_analysis_snapshot')
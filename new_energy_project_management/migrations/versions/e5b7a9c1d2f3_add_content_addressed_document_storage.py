@@ -0,0 +1,46 @@
+"""Add content-addressed document storage (DocumentBlob + ProjectDocument.content_hash)
+
+Revision ID: e5b7a9c1d2f3
+Revises: d1e2f3a4b5c6
+Create Date: 2025-08-04 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7a9c1d2f3'
+down_revision = 'd1e2f3a4b5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('document_blob',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('document_blob', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_document_blob_sha256'), ['sha256'], unique=True)
+
+    with op.batch_alter_table('project_document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_project_document_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_foreign_key('fk_project_document_content_hash', 'document_blob', ['content_hash'], ['sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('project_document', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_project_document_content_hash', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_project_document_content_hash'))
+        batch_op.drop_column('content_hash')
+
+    with op.batch_alter_table('document_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_blob_sha256'))
+
+    op.drop_table('document_blob')
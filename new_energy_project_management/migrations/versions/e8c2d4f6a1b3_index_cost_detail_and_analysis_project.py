@@ -0,0 +1,33 @@
+"""Index project_id on cost details and profit analyses
+
+Revision ID: e8c2d4f6a1b3
+Revises: d1a6b2c4e5f7
+Create Date: 2025-09-22 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c2d4f6a1b3'
+down_revision = 'd1a6b2c4e5f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 一致性校验按项目 id 区间分块读取成本明细和收益分析
+    with op.batch_alter_table('project_cost_detail', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_project_cost_detail_project_id'), ['project_id'], unique=False)
+
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_profit_analysis_project_id'), ['project_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_profit_analysis_project_id'))
+
+    with op.batch_alter_table('project_cost_detail', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_project_cost_detail_project_id'))
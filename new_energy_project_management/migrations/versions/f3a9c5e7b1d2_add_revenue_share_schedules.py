@@ -0,0 +1,47 @@
+"""Add configurable revenue-share schedules
+
+Revision ID: f3a9c5e7b1d2
+Revises: e8c2d4f6a1b3
+Create Date: 2025-09-29 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c5e7b1d2'
+down_revision = 'e8c2d4f6a1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revenue_share_schedule',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=128), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('tiers', sa.JSON(), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+
+    # 现有收益分析不引用方案，继续按默认累进分级计算
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revenue_share_schedule_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_profit_analysis_revenue_share_schedule_id'),
+                              ['revenue_share_schedule_id'], unique=False)
+        batch_op.create_foreign_key('fk_profit_analysis_revenue_share_schedule', 'revenue_share_schedule',
+                                    ['revenue_share_schedule_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('profit_analysis', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_profit_analysis_revenue_share_schedule', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_profit_analysis_revenue_share_schedule_id'))
+        batch_op.drop_column('revenue_share_schedule_id')
+
+    op.drop_table('revenue_share_schedule')
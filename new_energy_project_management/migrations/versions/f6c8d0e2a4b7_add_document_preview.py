@@ -0,0 +1,48 @@
+"""Add document preview table for asynchronous text extraction and thumbnails
+
+Revision ID: f6c8d0e2a4b7
+Revises: e5b7a9c1d2f3
+Create Date: 2025-08-11 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c8d0e2a4b7'
+down_revision = 'e5b7a9c1d2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('document_preview',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('text_content', sa.Text(), nullable=True),
+        sa.Column('page_count', sa.Integer(), nullable=True),
+        sa.Column('thumbnail_path', sa.String(length=255), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['project_document.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('document_id')
+    )
+    with op.batch_alter_table('document_preview', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_document_preview_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_document_preview_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document_preview', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_preview_status'))
+        batch_op.drop_index(batch_op.f('ix_document_preview_content_hash'))
+
+    op.drop_table('document_preview')
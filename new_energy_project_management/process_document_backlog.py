@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档后处理积压任务脚本
+
+为尚未生成预览、等待重试、处理中断或曾缺少依赖的文档提取正文并生成缩略图。
+可用于部署流水线或安装 pypdf、pypdfium2 等依赖后为历史文档补齐预览，或在定时任务中兜底重试。
+
+用法:
+    python process_document_backlog.py                 # 处理积压文档
+    python process_document_backlog.py --retry-failed  # 同时重新处理已失败的文档
+    python process_document_backlog.py --limit 500     # 最多处理500个文档
+"""
+
+import argparse
+
+from app import create_app
+from app.document_pipeline import get_document_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文档后处理积压任务')
+    parser.add_argument('--retry-failed', action='store_true', help='重新处理已达到最大重试次数的文档')
+    parser.add_argument('--limit', type=int, default=None, help='最多处理的文档数')
+    args = parser.parse_args()
+
+    app = create_app()
+    pipeline = get_document_pipeline(app)
+    counts = pipeline.process_backlog(retry_failed=args.retry_failed, limit=args.limit)
+    pipeline.shutdown()
+
+    print(f"本次处理文档: {counts.pop('submitted')} 个")
+    for status in ('done', 'pending', 'processing', 'failed', 'unavailable'):
+        print(f"{status}: {counts.get(status, 0)} 个")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+审计日志测试脚本
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import db
+from app.audit import get_audit_logger, get_history
+from app.models import AuditLog, Project, User
+
+
+def _create_app(make_app, **overrides):
+    app = make_app(users=[('admin', '管理员', 'audit123')], **overrides)
+    with app.app_context():
+        db.session.add(Project(name='审计项目', project_type='集中式光伏', capacity_mw=30,
+                               current_stage='规划', manager_id=User.query.one().id))
+        db.session.commit()
+    return app
+
+
+def test_diffs_and_actor(make_app, login):
+    """记录新增、修改前后值和删除；请求中的修改记录操作人；回滚不记录。"""
+    app = _create_app(make_app)
+    with app.app_context():
+        project = Project.query.one()
+        project_id = project.id
+        project.current_stage = '开发'
+        db.session.commit()
+
+        project.capacity_mw = 999
+        db.session.rollback()
+
+        admin = User.query.one()
+        admin.set_password('changed')
+        db.session.commit()
+
+        history = get_history('project', project_id)
+        assert [entry.action for entry in history] == ['update', 'create']
+        assert history[0].changes == {'current_stage': ['规划', '开发']}
+        assert history[1].changes['name'] == [None, '审计项目']
+        assert get_history('user', admin.id)[0].changes == {'password_hash': ['***', '***']}
+
+    client = login(app, 'admin', 'changed')
+    client.post(f'/project/{project_id}/update_location', data={'address': '甘肃酒泉'})
+    client.post(f'/delete_project/{project_id}')
+    with app.app_context():
+        delete, update = get_history('project', project_id)[:2]
+        assert update.changes == {'address': [None, '甘肃酒泉']}
+        assert update.username == 'admin' and update.user_id == admin.id
+        assert delete.action == 'delete'
+        assert delete.changes['address'] == ['甘肃酒泉', None]
+
+
+def test_batched_background_writes(make_app):
+    """后台线程批量写入：多次提交合并为少量插入语句，退出时写入剩余记录。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(root, 'audit.db'),
+                          AUDIT_SYNC=False, AUDIT_BATCH_SIZE=50, AUDIT_FLUSH_INTERVAL=0.2)
+        audit = get_audit_logger(app)
+        with app.app_context():
+            inserts = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *args: inserts.append(1)
+                         if statement.startswith('INSERT INTO audit_log') else None)
+            project = Project.query.one()
+            for i in range(40):
+                project.capacity_mw = 100 + i
+                db.session.commit()
+            audit.flush()
+            assert AuditLog.query.filter_by(action='update').count() == 40
+            assert len(inserts) < 10
+
+            # 等待时间很长时，shutdown 立即写入队列中剩余的记录
+            audit.flush_interval = 60
+            project.current_stage = '建设'
+            db.session.commit()
+            audit.shutdown()
+            assert get_history('project', project.id)[0].changes == {'current_stage': ['规划', '建设']}
+            db.session.remove()
+            db.engine.dispose()
+
+
+def test_append_only(make_app):
+    """审计记录不能修改或删除。"""
+    app = _create_app(make_app)
+    with app.app_context():
+        for statement in ('UPDATE audit_log SET action = \'x\'', 'DELETE FROM audit_log'):
+            try:
+                db.session.execute(db.text(statement))
+                db.session.commit()
+                assert False, '审计记录不应被修改'
+            except IntegrityError:
+                db.session.rollback()
+        assert AuditLog.query.count() == 2
+
+
+def test_failed_writes_retry_then_fallback(make_app):
+    """写入失败时保留记录退避重试；重试耗尽后写入备用文件，由 replay-fallback 写回。"""
+    with tempfile.TemporaryDirectory() as root:
+        fallback = os.path.join(root, 'logs', 'audit_fallback.jsonl')
+        app = _create_app(make_app, SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(root, 'audit.db'),
+                          AUDIT_SYNC=False, AUDIT_FLUSH_INTERVAL=0.05, AUDIT_MAX_ATTEMPTS=3,
+                          AUDIT_RETRY_DELAY=0.01, AUDIT_FALLBACK_FILE=fallback)
+        audit = get_audit_logger(app)
+        write = audit._write
+        failures = []
+
+        def flaky_write(records):
+            if len(failures) < failures_wanted:
+                failures.append(len(records))
+                raise OperationalError('INSERT INTO audit_log', {}, Exception('disk I/O error'))
+            return write(records)
+
+        audit._write = flaky_write
+        with app.app_context():
+            project = Project.query.one()
+
+            # 失败两次后第三次成功：没有记录丢失，也不写备用文件
+            failures_wanted = 2
+            project.capacity_mw = 31
+            db.session.commit()
+            audit.flush()
+            assert len(failures) == 2 and AuditLog.query.filter_by(action='update').count() == 1
+            assert not os.path.exists(fallback)
+
+            # 连续失败 AUDIT_MAX_ATTEMPTS 次：转存到备用文件
+            failures.clear()
+            failures_wanted = 3
+            project.capacity_mw = 32
+            db.session.commit()
+            audit.flush()
+            assert len(failures) == 3 and AuditLog.query.filter_by(action='update').count() == 1
+            with open(fallback, encoding='utf-8') as f:
+                assert [json.loads(line)['changes'] for line in f] == [{'capacity_mw': [31.0, 32.0]}]
+
+            assert app.test_cli_runner().invoke(args=['audit', 'replay-fallback']).output == '已写回 1 条审计记录\n'
+            assert not os.path.exists(fallback)
+            update = get_history('project', project.id)[0]
+            assert update.changes == {'capacity_mw': [31.0, 32.0]} and update.created_at is not None
+            audit.shutdown()
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+权限位掩码与授权判断测试脚本
+"""
+
+from collections import namedtuple
+
+import pytest
+
+from app import db
+from app.models import Project, User
+from app.permissions import PERMISSION_BITS, ROLE_MASKS, ROLE_PERMISSIONS, can, filter_allowed
+from app.user_cache import SessionUser
+
+Row = namedtuple('Row', 'id manager_id')
+
+
+def test_masks_match_role_table():
+    """编译后的掩码与 ROLE_PERMISSIONS 逐项一致。"""
+    assert len(set(PERMISSION_BITS.values())) == len(PERMISSION_BITS)
+    for role, permissions in ROLE_PERMISSIONS.items():
+        user = SessionUser(1, 'u', role, ROLE_MASKS[role])
+        for name, granted in permissions.items():
+            assert can(user, name) is granted
+            assert user.has_permission(name) is granted
+        assert not can(user, 'no_such_permission')
+    assert not can(SessionUser(1, 'u', '未知角色', 0), 'can_view_all_projects')
+
+
+def test_project_actions_use_ids():
+    """项目级操作：有权限位作用于所有项目，否则只能操作自己管理的项目。"""
+    admin = SessionUser(1, 'admin', '管理员', ROLE_MASKS['管理员'])
+    manager = SessionUser(2, 'manager', '项目经理', ROLE_MASKS['项目经理'])
+    own, other = Row(10, 2), Row(11, 3)
+
+    for action in ('view', 'edit', 'delete', 'documents'):
+        assert can(admin, action, other)
+        assert can(manager, action, own)
+    assert can(manager, 'view', other)
+    assert not can(manager, 'edit', other)
+    assert not can(manager, 'documents', other)
+    assert not can(manager, 'edit')
+
+    assert filter_allowed(admin, 'edit', [own, other]) == [own, other]
+    assert filter_allowed(manager, 'edit', [own, other]) == [own]
+
+
+def test_views_and_templates(make_app, login):
+    """视图和模板使用同一判断：项目经理只能看到和编辑自己的项目。"""
+    app = make_app(users=[('pm1', '项目经理', 'authz123'), ('pm2', '项目经理', 'authz123')])
+    with app.app_context():
+        pm1, pm2 = User.query.order_by(User.id).all()
+        assert pm1.permission_mask == ROLE_MASKS['项目经理']
+        db.session.add_all([
+            Project(name='自己的项目', project_type='集中式光伏', capacity_mw=10, current_stage='规划', manager_id=pm1.id),
+            Project(name='别人的项目', project_type='陆上风电', capacity_mw=20, current_stage='规划', manager_id=pm2.id),
+        ])
+        db.session.commit()
+        own_id = Project.query.filter_by(name='自己的项目').one().id
+        other_id = Project.query.filter_by(name='别人的项目').one().id
+
+    client = login(app, 'pm1', 'authz123')
+    html = client.get('/').get_data(as_text=True)
+    assert f'/edit_project/{own_id}' in html
+    assert f'/edit_project/{other_id}' not in html
+
+    assert client.get(f'/project/{own_id}/documents').status_code == 200
+    assert client.get(f'/project/{other_id}/documents').status_code == 302
+    assert client.post(f'/delete_project/{other_id}').status_code == 302
+    with app.app_context():
+        assert db.session.get(Project, other_id) is not None
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
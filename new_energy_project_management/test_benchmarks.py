@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试数据生成器与回归门禁测试脚本
+"""
+
+import tempfile
+
+import pytest
+
+from app import db
+from app.models import Project, ProjectCostDetail, ProfitAnalysis, ProjectDocument, DocumentBlob
+from benchmarks.datagen import generate_rows, populate, REGIONS
+from benchmarks.runner import compare
+
+
+def test_generator_is_deterministic():
+    """相同种子生成完全相同的数据，不同种子结果不同。"""
+    first = generate_rows(50, seed=7)
+    second = generate_rows(50, seed=7)
+    for table in ('projects', 'cost_details', 'analyses', 'documents'):
+        assert first[table] == second[table]
+    assert generate_rows(50, seed=8)['projects'] != first['projects']
+
+    types = {row['project_type'] for row in first['projects']}
+    assert types == {'集中式光伏', '陆上风电'}
+    for row in first['projects']:
+        assert row['city'] in [city for city, _, _ in REGIONS[row['province']]]
+
+
+def test_populate_database(make_app):
+    """批量写入后各表数量与生成结果一致，文档内容引用计数正确。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = make_app(users=(), BLOB_STORAGE_DIR=root)
+        rows = generate_rows(40, seed=1)
+        with app.app_context():
+            populate(rows, chunk_size=7)
+            assert Project.query.count() == 40
+            assert ProjectCostDetail.query.count() == len(rows['cost_details'])
+            assert ProfitAnalysis.query.count() == len(rows['analyses'])
+            assert ProjectDocument.query.count() == len(rows['documents'])
+            assert sum(blob.ref_count for blob in DocumentBlob.query) == len(rows['documents'])
+
+
+def test_regression_gate():
+    """超过阈值且超过最小差值时判定为退化。"""
+    baseline = {'cases': {'fast': {'median': 0.001}, 'slow': {'median': 1.0}, 'stable': {'median': 0.5}}}
+    result = {'cases': {'fast': {'median': 0.002}, 'slow': {'median': 1.5}, 'stable': {'median': 0.55},
+                        'new': {'median': 1.0}}}
+    rows = {name: regressed for name, _, _, _, regressed in compare(result, baseline, threshold=0.25, min_delta=0.005)}
+    assert rows == {'fast': False, 'slow': True, 'stable': False}
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内容寻址文档存储测试脚本
+"""
+
+import io
+import os
+import tempfile
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.blob_store import BlobStore, collect_garbage, get_blob_store, migrate_legacy_uploads
+from app.models import User, Project, ProjectDocument, DocumentBlob
+
+
+def _create_app(make_app, storage_dir):
+    app = make_app(BLOB_STORAGE_DIR=storage_dir)
+    with app.app_context():
+        admin = User.query.one()
+        db.session.add_all([
+            Project(name='测试光伏项目A', project_type='集中式光伏', capacity_mw=100, manager=admin),
+            Project(name='测试风电项目B', project_type='陆上风电', capacity_mw=50, manager=admin),
+        ])
+        db.session.commit()
+    return app
+
+
+def _upload(client, project_id, content, name='环评报告.pdf'):
+    return client.post(f'/project/{project_id}/documents/upload', data={
+        'file': (io.BytesIO(content), name),
+        'stage': '前期开发',
+        'description': '测试文档',
+    }, content_type='multipart/form-data')
+
+
+def test_blob_store_sharding_and_dedup():
+    """相同内容只保存一份，并按哈希前缀分片。"""
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+        sha1, size1, created1 = store.ingest_stream(io.BytesIO(b'grid approval'))
+        sha2, size2, created2 = store.ingest_stream(io.BytesIO(b'grid approval'))
+
+        assert sha1 == sha2 and size1 == size2 == 13
+        assert created1 and not created2
+        assert store.path_for(sha1) == os.path.join(os.path.abspath(root), sha1[:2], sha1[2:4], sha1)
+        assert list(store.iter_hashes()) == [sha1]
+        assert os.listdir(store.tmp_dir) == []
+
+
+def test_upload_reference_counting_and_gc(make_app, login):
+    """重复上传只增加引用，删除只释放引用，垃圾回收删除无引用实体。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, root)
+        client = login(app)
+
+        content = b'%PDF-1.4 same EIA report'
+        _upload(client, 1, content)
+        _upload(client, 2, content)
+
+        with app.app_context():
+            documents = ProjectDocument.query.all()
+            assert len(documents) == 2
+            assert documents[0].content_hash == documents[1].content_hash
+            blob = DocumentBlob.query.one()
+            assert blob.ref_count == 2
+
+            # 通过哈希直接关联，无需重新上传
+            response = client.post('/project/1/documents/attach', json={
+                'sha256': blob.sha256, 'filename': 'copy.pdf'})
+            assert response.status_code == 201
+            assert DocumentBlob.query.one().ref_count == 3
+
+            response = client.post('/project/1/documents/attach', json={
+                'sha256': '0' * 64, 'filename': 'missing.pdf'})
+            assert response.status_code == 404
+
+            ids = [d.id for d in ProjectDocument.query.all()]
+
+        for document_id in ids:
+            client.post(f'/documents/{document_id}/delete')
+
+        with app.app_context():
+            blob = DocumentBlob.query.one()
+            assert blob.ref_count == 0
+            store_path = os.path.join(root, blob.sha256[:2], blob.sha256[2:4], blob.sha256)
+            assert os.path.exists(store_path)
+
+            # 宽限期内刚上传过的实体即使没有引用也保留
+            stats = collect_garbage()
+            assert stats['deleted_blobs'] == 0 and stats['skipped_recent'] == 1
+            assert os.path.exists(store_path)
+
+            stats = collect_garbage(grace_seconds=0)
+            assert stats['deleted_blobs'] == 1
+            assert DocumentBlob.query.count() == 0
+            assert not os.path.exists(store_path)
+
+
+def test_attach_requires_readable_content(make_app, login, monkeypatch):
+    """只能按哈希关联自己能读取的内容；提交失败时不留下多余的引用。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = make_app(users=[('admin', '管理员', 'admin123'), ('manager', '项目经理', 'manager123')],
+                       BLOB_STORAGE_DIR=root)
+        with app.app_context():
+            admin, manager = User.query.order_by(User.id).all()
+            db.session.add_all([Project(name='管理员项目', project_type='集中式光伏', capacity_mw=100, manager=admin),
+                                Project(name='经理项目', project_type='陆上风电', capacity_mw=50, manager=manager)])
+            db.session.commit()
+        _upload(login(app), 1, b'%PDF-1.4 confidential grid study')
+        client = login(app, 'manager', 'manager123')
+        with app.app_context():
+            sha256 = DocumentBlob.query.one().sha256
+
+        # 内容只在他人项目中：与内容不存在一样返回 404，需要正常上传
+        response = client.post('/project/2/documents/attach', json={'sha256': sha256, 'filename': 'copy.pdf'})
+        assert response.status_code == 404
+        _upload(client, 2, b'%PDF-1.4 confidential grid study')
+        response = client.post('/project/2/documents/attach', json={'sha256': sha256, 'filename': 'copy.pdf'})
+        assert response.status_code == 201
+
+        def locked_commit():
+            raise OperationalError('COMMIT', {}, Exception('database is locked'))
+
+        monkeypatch.setattr(db.session, 'commit', locked_commit)
+        with pytest.raises(OperationalError):
+            client.post('/project/2/documents/attach', json={'sha256': sha256, 'filename': 'again.pdf'})
+        monkeypatch.undo()
+        with app.app_context():
+            assert DocumentBlob.query.one().ref_count == 3
+            assert ProjectDocument.query.count() == 3
+
+
+def test_migrate_legacy_uploads(make_app):
+    """历史上传文件原地迁移到内容寻址存储，重复内容只保留一份。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, os.path.join(root, 'blobs'))
+        legacy_dir = os.path.join(root, 'projects', '1')
+        os.makedirs(legacy_dir)
+
+        with app.app_context():
+            for index in range(3):
+                path = os.path.join(legacy_dir, f'report_{index}.pdf')
+                with open(path, 'wb') as f:
+                    f.write(b'identical legacy content')
+                db.session.add(ProjectDocument(
+                    project_id=1, filename=f'report_{index}.pdf', stored_filename=f'report_{index}.pdf',
+                    file_path=path, file_size=24, uploaded_by=1))
+            db.session.commit()
+
+            stats = migrate_legacy_uploads()
+            assert stats['migrated'] == 3
+            assert stats['deduplicated'] == 2
+
+            blob = DocumentBlob.query.one()
+            assert blob.ref_count == 3
+            for document in ProjectDocument.query.all():
+                assert document.content_hash == blob.sha256
+                assert os.path.exists(document.file_path)
+            assert not os.path.exists(legacy_dir)
+
+
+def test_migration_interrupted_mid_batch(make_app):
+    """批次中途中断时未提交记录的源文件仍在，重新执行后全部迁移。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, os.path.join(root, 'blobs'))
+        legacy_dir = os.path.join(root, 'projects', '1')
+        os.makedirs(legacy_dir)
+
+        with app.app_context():
+            paths = []
+            for index in range(3):
+                path = os.path.join(legacy_dir, f'report_{index}.pdf')
+                with open(path, 'wb') as f:
+                    f.write(f'legacy content {index}'.encode())
+                paths.append(path)
+                db.session.add(ProjectDocument(
+                    project_id=1, filename=f'report_{index}.pdf', stored_filename=f'report_{index}.pdf',
+                    file_path=path, file_size=16, uploaded_by=1))
+            db.session.commit()
+
+            store = get_blob_store()
+            ingest_file = store.ingest_file
+            calls = []
+
+            def failing_ingest(path, move=False):
+                calls.append(path)
+                if len(calls) == 3:
+                    raise OSError('模拟迁移中断')
+                return ingest_file(path, move)
+
+            store.ingest_file = failing_ingest
+            try:
+                migrate_legacy_uploads(batch_size=2)
+                assert False, '应在第3个文件中断'
+            except OSError:
+                db.session.rollback()
+            finally:
+                store.ingest_file = ingest_file
+
+            # 第一批已提交并删除源文件，中断的记录仍指向原文件
+            assert [os.path.exists(path) for path in paths] == [False, False, True]
+            assert ProjectDocument.query.filter(ProjectDocument.content_hash.is_(None)).count() == 1
+
+            stats = migrate_legacy_uploads(batch_size=2)
+            assert stats['migrated'] == 1 and stats['missing'] == 0
+            for document in ProjectDocument.query.all():
+                assert document.content_hash and os.path.exists(document.file_path)
+            assert not os.path.exists(legacy_dir)
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
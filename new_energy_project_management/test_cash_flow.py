@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目现金流测试脚本
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from app import db
+from app.cash_flow import cash_flow_metrics, flow_template, irr, payback_period, project_flows
+from app.cash_flow_cache import get_cash_flow_cache
+from app.models import CostModel, ProfitAnalysis, Project
+from app.profit_calculator import ProfitCalculator
+
+
+def _npv(flows, rate):
+    return sum(flow / (1 + rate) ** t for t, flow in enumerate(flows))
+
+
+def _payback(flows):
+    """逐年累加的静态回收期，作为对照。"""
+    cumulative, result = 0.0, 0.0
+    for t, flow in enumerate(flows):
+        previous, cumulative = cumulative, cumulative + flow
+        if previous < 0 <= cumulative:
+            result = t - 1 - previous / flow
+        elif cumulative < 0:
+            result = None
+    return result
+
+
+def test_metrics_match_scalar():
+    """净现值、回收期与逐年计算一致，内部收益率使净现值为 0；没有变号、全为 0 时为空。"""
+    rng = random.Random(20240801)
+    rows = []
+    for _ in range(500):
+        periods = rng.randint(1, 8)
+        rows.append([round(rng.uniform(-5000, 3000), 2) if rng.random() < 0.8 else 0.0 for _ in range(periods)]
+                    + [0.0] * (8 - periods))
+    flows = np.array(rows)
+    metrics = cash_flow_metrics(flows, 0.08)
+    assert np.allclose(metrics['npv'], [_npv(row, 0.08) for row in rows])
+    for row, rate, payback in zip(rows, metrics['irr'], metrics['payback_years']):
+        expected = _payback(row)
+        assert (np.isnan(payback) and expected is None) or np.isclose(payback, expected), (row, payback, expected)
+        if not np.isnan(rate):
+            # 折现率接近 -1 时各项折现值很大，按各项绝对值之和衡量误差
+            scale = _npv([abs(flow) for flow in row], rate)
+            assert abs(_npv(row, rate)) <= 1e-9 * scale, (row, rate)
+
+    # 常规现金流（先投入后收益）的内部收益率唯一
+    assert np.isclose(irr([-1000, 0, 1210])[0], 0.1)
+    assert np.isclose(irr([-100, 230, -132])[0], 0.1) or np.isclose(irr([-100, 230, -132])[0], 0.2)
+    assert np.isnan(irr([[100, 50], [0, 0], [-100, -10]])).all()
+    assert payback_period([[100, 50], [-100, 40], [-100, 100]]).tolist()[0] == 0.0
+    assert np.isnan(payback_period([-100, 40])[0]) and payback_period([-100, 100])[0] == 1.0
+
+
+def test_project_flows():
+    """投入按建设期分摊、收益按进入各阶段时的比例收取；当前阶段按刚进入计算，之前阶段的投入和收益不再计入。"""
+    assert flow_template('陆上风电', '前期开发').tolist() == [
+        [0, 0, 0.4, 0.6, 0], [0, 0.3, 0.4, 0, 0.3], [0, 0, 0.5, 0, 0.5]]
+    assert flow_template('集中式光伏', '建设执行').tolist() == [[1, 0], [0.4, 0.3], [0.5, 0.5]]
+    assert flow_template('集中式光伏', '并网运营').tolist() == [[0], [0.3], [0.5]]
+    assert flow_template('集中式光伏', None) is None
+
+    flows = project_flows(['陆上风电', '集中式光伏', '集中式光伏', '陆上风电'],
+                          ['机会挖掘', '投资决策', '未知阶段', '机会挖掘'],
+                          [20000, 10000, 10000, 20000], [1000, 500, 500, 1000], [2000, 0, 0, 2000])
+    assert flows.shape == (4, 6)
+    assert flows[0].tolist() == [0, 0, 300, -8000 + 400 + 1000, -12000, 300 + 1000]
+    assert flows[1].tolist() == [150, -10000 + 200, 150, 0, 0, 0]
+    assert np.isnan(flows[2]).all() and flows[3].tolist() == flows[0].tolist()
+    assert np.isclose(flows[0].sum(), 1000 + 2000 - 20000) and np.isclose(flows[1].sum(), 500 - 10000)
+
+
+def test_cash_flow_endpoint(make_app, login):
+    """API 按造价模型计算投入、按 ProfitCalculator 计算收益，组合现金流为各项目之和；输入不变时命中缓存。"""
+    app = make_app()
+    with app.app_context():
+        db.session.add(CostModel(project_type='集中式光伏', unit_cost_label='元/W', cost_items={'设备费': 0.2}))
+        # (容量, 阶段, 资源费总额)：投资 = 容量 × 20 万元
+        for index, (capacity, stage, fee) in enumerate([(100, '前期开发', 4000), (50, '投资决策', 0),
+                                                        (80, '并网运营', 0), (60, '已终止', 0)]):
+            project = Project(name=f'现金流项目{index}', project_type='集中式光伏', capacity_mw=capacity,
+                              current_stage=stage)
+            db.session.add(project)
+            db.session.flush()
+            db.session.add(ProfitAnalysis(project_id=project.id, dev_fee_rate=0.1, extra_investment=0,
+                                          resource_fee_total=fee, dengpin_cost=500))
+        db.session.commit()
+    client = login(app)
+
+    data = client.get('/analytics/cash_flow?flows=1').get_json()
+    assert data['skipped'] == 1 and data['computed'] == 3 and data['periods'] == 4
+    first, second, third = data['projects']
+    commission = ProfitCalculator.calculate_commission_revenue(100, 0.1, 0)
+    resource = ProfitCalculator.calculate_resource_share_revenue(4000)
+    assert (first['cost'], first['commission_income'], first['resource_income']) == (2000, commission, resource)
+    assert first['flows'] == [0, round(0.3 * commission, 2), round(-2000 + 0.4 * commission + 0.5 * resource, 2),
+                              round(0.3 * commission + 0.5 * resource, 2)]
+    assert first['npv'] == round(_npv(first['flows'], 0.08), 2)
+    assert abs(_npv(first['flows'], first['irr'])) < 1e-3
+    # 并网运营：只有第 0 年的并网里程碑收益
+    operating = round(0.3 * ProfitCalculator.calculate_commission_revenue(80, 0.1, 0), 2)
+    assert third['flows'] == [operating, 0, 0, 0] and third['irr'] is None and third['npv'] == operating
+    assert data['portfolio']['flows'] == [round(sum(p['flows'][t] for p in data['projects']), 2) for t in range(4)]
+
+    with app.app_context():
+        cache = get_cash_flow_cache(app)
+        assert len(cache) == 3
+        assert client.get('/analytics/cash_flow').get_json()['computed'] == 0
+        assert client.get('/analytics/cash_flow?rate=0.1').get_json()['computed'] == 3
+        # 修改收益分析后只重新计算该项目
+        analysis = ProfitAnalysis.query.filter_by(project_id=1).one()
+        analysis.resource_fee_total = 6000
+        db.session.commit()
+    assert client.get('/analytics/cash_flow?project_id=1&project_id=2').get_json()['computed'] == 1
+    data = client.get('/analytics/cash_flow?project_id=1&project_id=2&cost_basis=dengpin_cost').get_json()
+    assert data['computed'] == 2 and [p['cost'] for p in data['projects']] == [500, 500]
+    assert client.get('/analytics/cash_flow?stage=前期开发').get_json()['computed'] == 0
+
+    assert client.get('/analytics/cash_flow?rate=-1').status_code == 400
+    assert client.get('/analytics/cash_flow?cost_basis=capacity').status_code == 400
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
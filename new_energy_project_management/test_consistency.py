@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+向量化一致性校验测试脚本
+"""
+
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+import pytest
+
+from app import db
+from app.consistency import check_projects, cost_item_totals, profit_results
+from app.models import ProfitAnalysis, Project, ProjectCostDetail
+from app.profit_calculator import ProfitCalculator
+
+# 收益分析字段 -> ProfitCalculator 结果键
+RESULT_KEYS = {'commission_income': 'commission_revenue', 'resource_income': 'resource_share_revenue',
+               'total_income': 'total_revenue', 'net_profit': 'net_profit', 'roi_percentage': 'roi'}
+
+
+def test_vectorized_matches_scalar_calculation():
+    """向量化计算与 ProjectCostDetail.compute_total_cost、ProfitCalculator 的结果逐项相同。"""
+    rng = random.Random(20240801)
+    labels = ['元/W', '万元/MW', '万元', '其他']
+    unit_costs = [round(rng.uniform(0, 5), rng.randint(0, 4)) for _ in range(2000)]
+    unit_labels = [rng.choice(labels) for _ in range(2000)]
+    capacities = [round(rng.uniform(1, 500), rng.randint(0, 3)) for _ in range(2000)]
+    expected = [ProjectCostDetail.compute_total_cost(*args) for args in zip(unit_costs, unit_labels, capacities)]
+    assert cost_item_totals(unit_costs, unit_labels, capacities).tolist() == expected
+
+    inputs = [(round(rng.uniform(1, 500), 2), rng.choice([0.1, 0.08, 0.125]), rng.choice([0, 0, 123.45]),
+               round(rng.uniform(0, 8000), 2), rng.choice([0, round(rng.uniform(100, 5000), 2)]))
+              for _ in range(2000)]
+    vectorized = profit_results(*map(list, zip(*inputs)))
+    for i, args in enumerate(inputs):
+        result = ProfitCalculator.calculate_comprehensive_profit_analysis(*args)
+        result['roi'] = 0.0 if result['roi'] == 'N/A' else result['roi']
+        for field, key in RESULT_KEYS.items():
+            assert vectorized[field][i] == float(result[key]), (args, field)
+
+
+def test_missing_inputs():
+    """费率为空或 0 时取默认费率，资源费、投资为空时按 0 计算，没有投资时 ROI 为 0。"""
+    results = profit_results([100, 100], [np.nan, 0], [np.nan, 0], [np.nan, 500], [np.nan, 0])
+    default_commission = float(100 * ProfitCalculator.DEFAULT_DEV_FEE_RATE * 100)
+    assert results['commission_income'].tolist() == [default_commission, default_commission]
+    assert results['resource_income'].tolist() == [0, 500 * float(ProfitCalculator.RATE_1)]
+    assert results['roi_percentage'].tolist() == [0, 0]
+    assert results['net_profit'].tolist() == results['total_income'].tolist()
+
+
+def test_check_projects_and_report(make_app):
+    """按项目区间检查过期结果；--report 写出各项差异数和差异样本。"""
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(users=())
+        with app.app_context():
+            for index in range(3):
+                project = Project(name=f'校验项目{index}', project_type='集中式光伏', capacity_mw=100,
+                                  current_stage='前期开发')
+                db.session.add(project)
+                db.session.flush()
+                detail = ProjectCostDetail(project_id=project.id, cost_category='设备费', cost_item='光伏组件',
+                                           unit_cost=1.1, unit_label='元/W')
+                detail.calculate_total_cost(project.capacity_mw)
+                db.session.add(detail)
+                db.session.add(ProfitAnalysis(project_id=project.id, total_project_cost=detail.total_cost))
+            db.session.commit()
+            assert check_projects(1, 3, ('costs', 'totals')) == {'costs': [], 'totals': []}
+
+            db.session.get(Project, 2).capacity_mw = 50
+            db.session.commit()
+            results = check_projects(1, 3, ('costs', 'totals'))
+            assert [(diff.project_id, diff.stored, diff.expected) for diff in results['costs']] == \
+                [(2, 11000.0, 5500.0)]
+            assert [diff.entity_id for diff in results['totals']] == [2]
+            assert check_projects(3, 3, ('costs', 'totals')) == {'costs': [], 'totals': []}
+
+        path = os.path.join(directory, 'report.json')
+        result = app.test_cli_runner().invoke(args=['portfolio', 'verify', '--report', path, '--show', '1'])
+        assert result.exit_code == 1
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['dry_run'] is True
+        assert report['checks']['costs']['mismatches'] == 1
+        assert report['checks']['costs']['samples'][0]['expected'] == 5500.0
+        assert report['checks']['totals']['fields'] == {'total_project_cost': 1}
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
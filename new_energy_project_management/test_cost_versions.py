@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+造价模型版本测试脚本
+"""
+
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.cost_versions import get_cost_version_cache, outdated_analyses, version_for_project
+from app.models import CostModel, CostModelVersion, ProfitAnalysis, Project, ProjectCostDetail, User
+from app.reports.portfolio import load_portfolio
+
+COST_DETAILS = {'设备费': {'光伏组件': 1.10, '逆变器': 0.15}, '工程费': {'建安工程(含桩基)': 0.50}}
+COST_ITEMS = {'设备费': 1.25, '工程费': 0.50}
+
+
+def _create_app(make_app, login):
+    app = make_app(users=[('admin', '管理员', 'version123')])
+    with app.app_context():
+        db.session.add(CostModel(project_type='集中式光伏', unit_cost_label='元/W',
+                                 cost_items=COST_ITEMS, cost_details=COST_DETAILS))
+        db.session.add(Project(name='版本项目', project_type='集中式光伏', capacity_mw=100,
+                               current_stage='前期开发', manager_id=User.query.one().id))
+        db.session.commit()
+    return app, login(app, 'admin', 'version123')
+
+
+def _edit_model(client, model_id, cost_items, cost_details=COST_DETAILS):
+    return client.post(f'/admin/cost_models/{model_id}/edit', data={
+        'project_type': '集中式光伏', 'unit_cost_label': '元/W',
+        'cost_items_json': json.dumps(cost_items, ensure_ascii=False),
+        'cost_details_json': json.dumps(cost_details, ensure_ascii=False),
+    })
+
+
+def test_edits_create_immutable_versions(make_app, login):
+    """修改参数生成新版本，未修改时不生成；版本记录不能修改。"""
+    app, client = _create_app(make_app, login)
+    with app.app_context():
+        model = CostModel.query.one()
+        model_id = model.id
+        assert model.current_version.version == 1
+        assert model.current_version.cost_items == COST_ITEMS
+
+    _edit_model(client, model_id, {'设备费': 1.0, '工程费': 0.5})
+    _edit_model(client, model_id, {'设备费': 1.0, '工程费': 0.5})
+    with app.app_context():
+        model = db.session.get(CostModel, model_id)
+        assert [v.version for v in model.versions] == [1, 2]
+        assert model.current_version.version == 2
+        assert model.current_version.created_by == User.query.one().id
+        first = model.versions.first()
+        assert first.cost_items == COST_ITEMS
+        # 同一容量下两个版本的造价不同，历史版本仍按原参数计算
+        assert first.calculate_total_cost(100) == 17500.0
+        assert model.current_version.calculate_total_cost(100) == 15000.0
+
+        try:
+            db.session.execute(db.text('UPDATE cost_model_version SET cost_items = NULL'))
+            db.session.commit()
+            assert False, '造价模型版本不应被修改'
+        except IntegrityError:
+            db.session.rollback()
+
+
+def test_estimates_reference_their_version(make_app, login):
+    """成本估算记录所用版本；造价模型修改后报告仍按原版本复现，且能找出需要重算的项目。"""
+    app, client = _create_app(make_app, login)
+    with app.app_context():
+        project_id = Project.query.one().id
+        model_id = CostModel.query.one().id
+
+    client.get(f'/cost_estimation/{project_id}')
+    client.post(f'/cost_estimation/{project_id}', data={'cost_items_json': '{}', 'cost_details_json': '{}'})
+    _edit_model(client, model_id, {'设备费': 2.0, '工程费': 0.5})
+
+    with app.app_context():
+        v1, v2 = CostModel.query.one().versions.all()
+        details = ProjectCostDetail.query.filter_by(project_id=project_id).all()
+        assert len(details) == 3 and {d.cost_model_version_id for d in details} == {v1.id}
+        analysis = ProfitAnalysis.query.one()
+        assert analysis.cost_model_version_id == v1.id
+        assert analysis.total_project_cost == 17500.0
+
+        project = db.session.get(Project, project_id)
+        assert version_for_project(project, analysis) == v1
+        assert version_for_project(project) == v2
+        assert outdated_analyses().all() == [analysis]
+
+    assert client.get(f'/export/project/{project_id}/excel').status_code == 200
+
+
+def test_report_costs_cached_by_version(make_app, login):
+    """组合报表按版本缓存造价：重复导出不再计算，模型修改后按新版本计算。"""
+    app, client = _create_app(make_app, login)
+    calls = []
+    original = CostModelVersion.calculate_total_cost
+
+    def counting(self, capacity_mw):
+        calls.append(self.id)
+        return original(self, capacity_mw)
+
+    CostModelVersion.calculate_total_cost = counting
+    try:
+        with app.app_context():
+            model_id = CostModel.query.one().id
+            assert load_portfolio()[0].total_cost == 17500.0
+            assert load_portfolio()[0].total_cost == 17500.0
+            assert len(calls) == 1
+
+        _edit_model(client, model_id, {'设备费': 2.0, '工程费': 0.5})
+        with app.app_context():
+            assert load_portfolio()[0].total_cost == 25000.0
+            assert len(calls) == 2
+            assert len(get_cost_version_cache()) == 2
+    finally:
+        CostModelVersion.calculate_total_cost = original
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
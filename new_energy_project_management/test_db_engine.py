@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库引擎配置与锁冲突重试测试脚本
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.db_engine import commit_with_retry, is_lock_error
+from app.models import User
+from config import TestConfig
+
+
+def _file_app(make_app, root, **overrides):
+    overrides.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(root, 'engine.db'))
+    return make_app(users=(), **overrides)
+
+
+def _pragma(name):
+    return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+
+def test_sqlite_pragmas(make_app):
+    """文件数据库启用 WAL 等 PRAGMA；内存数据库跳过只对文件有效的项。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _file_app(make_app, root)
+        with app.app_context():
+            assert _pragma('journal_mode') == 'wal'
+            assert _pragma('synchronous') == 1
+            assert _pragma('busy_timeout') == 5000
+            assert _pragma('cache_size') == -64000
+            db.session.remove()
+            db.engine.dispose()
+
+    app = make_app(users=())
+    with app.app_context():
+        assert _pragma('journal_mode') == 'memory'
+        assert _pragma('busy_timeout') == 5000
+
+
+def test_retry_only_on_lock_errors(make_app):
+    """锁冲突时回滚后重新执行写单元，其他错误直接抛出。"""
+    app = make_app(users=())
+    with app.app_context():
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('UPDATE', {}, sqlite3.OperationalError('database is locked'))
+            db.session.add(User(username='retry', email='retry@example.com', role='普通员工'))
+            return 'ok'
+
+        assert commit_with_retry(flaky, base_delay=0.001) == 'ok'
+        assert len(calls) == 3
+        assert User.query.filter_by(username='retry').count() == 1
+
+        def broken():
+            calls.append(1)
+            raise OperationalError('SELECT', {}, sqlite3.OperationalError('no such table: missing'))
+
+        calls.clear()
+        try:
+            commit_with_retry(broken, base_delay=0.001)
+            assert False, '非锁冲突错误不应重试'
+        except OperationalError as e:
+            assert not is_lock_error(e)
+        assert len(calls) == 1
+
+
+def test_commit_waits_for_concurrent_writer(make_app):
+    """另一连接持有写锁时，短锁等待加退避重试最终提交成功。"""
+    with tempfile.TemporaryDirectory() as root:
+        pragmas = dict(TestConfig.SQLITE_PRAGMAS, busy_timeout=20)
+        app = _file_app(make_app, root, SQLITE_PRAGMAS=pragmas, DB_LOCK_RETRIES=8, DB_LOCK_RETRY_DELAY=0.02)
+        locked = threading.Event()
+
+        def hold_lock():
+            conn = sqlite3.connect(os.path.join(root, 'engine.db'), isolation_level=None)
+            conn.execute('BEGIN IMMEDIATE')
+            locked.set()
+            time.sleep(0.3)
+            conn.execute('ROLLBACK')
+            conn.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        with app.app_context():
+            commit_with_retry(lambda: db.session.add(User(username='waiter', email='w@example.com', role='普通员工')))
+            assert User.query.filter_by(username='waiter').count() == 1
+            db.session.remove()
+            db.engine.dispose()
+        thread.join()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档下载（范围请求、条件请求、代理卸载）测试脚本
+"""
+
+import io
+import tempfile
+
+import pytest
+
+from app import db
+from app.models import User, Project, ProjectDocument
+
+CONTENT = b'0123456789' * 100
+
+
+def _create_client(make_app, login, storage_dir, **overrides):
+    app = make_app(BLOB_STORAGE_DIR=storage_dir, **overrides)
+    with app.app_context():
+        db.session.add(Project(name='测试光伏项目', project_type='集中式光伏', capacity_mw=100,
+                               manager=User.query.one()))
+        db.session.commit()
+
+    client = login(app)
+    client.post('/project/1/documents/upload', data={
+        'file': (io.BytesIO(CONTENT), 'report.pdf'),
+        'stage': '前期开发',
+    }, content_type='multipart/form-data')
+    with app.app_context():
+        document = ProjectDocument.query.one()
+        return client, document.id, document.content_hash
+
+
+def test_range_and_conditional_requests(make_app, login):
+    """下载响应携带内容哈希ETag，支持Range和If-None-Match。"""
+    with tempfile.TemporaryDirectory() as root:
+        client, document_id, sha256 = _create_client(make_app, login, root)
+        url = f'/documents/{document_id}/download'
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data == CONTENT
+        assert response.headers['ETag'] == f'"{sha256}"'
+        assert 'Last-Modified' in response.headers
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert 'private' in response.headers['Cache-Control']
+
+        response = client.get(url, headers={'Range': 'bytes=10-19'})
+        assert response.status_code == 206
+        assert response.data == CONTENT[10:20]
+        assert response.headers['Content-Range'] == f'bytes 10-19/{len(CONTENT)}'
+
+        response = client.get(url, headers={'If-None-Match': f'"{sha256}"'})
+        assert response.status_code == 304
+        assert response.data == b''
+
+
+def test_x_accel_redirect_offload(make_app, login):
+    """配置X-Accel-Redirect后只返回头部，由前端代理发送文件内容。"""
+    with tempfile.TemporaryDirectory() as root:
+        client, document_id, sha256 = _create_client(
+            make_app, login, root,
+            DOCUMENT_SENDFILE_BACKEND='x-accel-redirect', DOCUMENT_ACCEL_REDIRECT_PREFIX='/protected-blobs/')
+        url = f'/documents/{document_id}/download'
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data == b''
+        assert response.headers['X-Accel-Redirect'] == f'/protected-blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+        assert response.headers['Content-Disposition'] == 'attachment; filename="report.pdf"'
+
+        response = client.get(url, headers={'If-None-Match': f'"{sha256}"'})
+        assert response.status_code == 304
+        assert 'X-Accel-Redirect' not in response.headers
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
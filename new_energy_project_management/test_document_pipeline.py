@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文档后处理流水线（正文提取、缩略图、重试）测试脚本
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+from PIL import Image
+from reportlab.pdfgen import canvas
+
+from app import db
+from app.blob_store import get_blob_store
+from app.document_pipeline import get_document_pipeline
+from app.models import User, Project, ProjectDocument, DocumentPreview
+
+
+def _png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), (30, 120, 200)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _pdf_bytes(text):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.drawString(72, 720, text)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _create_app(make_app, login, root, **overrides):
+    app = make_app(BLOB_STORAGE_DIR=os.path.join(root, 'blobs'),
+                   THUMBNAIL_DIR=os.path.join(root, 'thumbnails'), **overrides)
+    with app.app_context():
+        db.session.add(Project(name='测试光伏项目', project_type='集中式光伏', capacity_mw=100,
+                               manager=User.query.one()))
+        db.session.commit()
+    return app, login(app)
+
+
+def _upload(client, content, filename, description=''):
+    return client.post('/project/1/documents/upload', data={
+        'file': (io.BytesIO(content), filename),
+        'stage': '前期开发',
+        'description': description,
+    }, content_type='multipart/form-data')
+
+
+def test_upload_generates_text_and_thumbnail(make_app, login):
+    """上传后生成正文摘要和缩略图，相同内容复用处理结果。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_app(make_app, login, root)
+        _upload(client, '接入系统设计报告\n并网电压等级110kV'.encode('utf-8'), 'design.txt')
+        _upload(client, _png_bytes(), 'site.png')
+
+        with app.app_context():
+            text_preview = DocumentPreview.query.filter_by(document_id=1).one()
+            assert text_preview.status == 'done'
+            assert '并网电压等级110kV' in text_preview.text_content
+            assert text_preview.thumbnail_path is None
+
+            image_preview = DocumentPreview.query.filter_by(document_id=2).one()
+            assert image_preview.status == 'done'
+            assert image_preview.page_count == 1
+            sha256 = image_preview.content_hash
+
+        response = client.get('/documents/2/thumbnail')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert max(Image.open(io.BytesIO(response.data)).size) <= 320
+        assert client.get('/documents/1/thumbnail').status_code == 404
+
+        page = client.get('/project/1/documents').get_data(as_text=True)
+        assert '并网电压等级110kV' in page
+        assert '/documents/2/thumbnail' in page
+
+        # 按哈希关联同一内容，直接复用已有结果
+        response = client.post('/project/1/documents/attach', json={'sha256': sha256, 'filename': 'copy.png'})
+        assert response.status_code == 201
+        with app.app_context():
+            preview = DocumentPreview.query.filter_by(document_id=response.get_json()['document_id']).one()
+            assert preview.status == 'done'
+            assert preview.attempts == 0
+            assert preview.thumbnail_path == image_preview.thumbnail_path
+
+
+def test_failed_processing_retries_and_backlog(make_app, login):
+    """处理失败后按退避重试，超过次数标记失败，积压脚本可重新处理。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_app(make_app, login, root, DOCUMENT_PIPELINE_MAX_ATTEMPTS=2)
+        pipeline = get_document_pipeline(app)
+        content = '可研报告正文'.encode('utf-8')
+
+        with app.app_context():
+            sha256, size, _ = get_blob_store().ingest_stream(io.BytesIO(content))
+        path = get_blob_store(app).path_for(sha256)
+        os.rename(path, path + '.bak')
+
+        with app.app_context():
+            from app.blob_store import acquire_blob
+            acquire_blob(sha256, size)
+            db.session.add(ProjectDocument(filename='report.txt', stored_filename=sha256, file_path=path,
+                                           file_size=size, project_id=1, uploaded_by=1, content_hash=sha256))
+            db.session.commit()
+
+        assert pipeline.process(1) == 'pending'
+        with app.app_context():
+            preview = DocumentPreview.query.one()
+            assert preview.attempts == 1
+            assert preview.next_attempt_at is not None
+            assert '不存在' in preview.last_error
+
+            # 未到重试时间的文档不会被积压任务选中
+            assert pipeline.process_backlog()['submitted'] == 0
+            preview.next_attempt_at = None
+            db.session.commit()
+
+        assert pipeline.process(1) == 'failed'
+        os.rename(path + '.bak', path)
+        assert pipeline.process_backlog()['submitted'] == 0
+
+        counts = pipeline.process_backlog(retry_failed=True)
+        assert counts['submitted'] == 1
+        assert counts['done'] == 1
+        with app.app_context():
+            assert DocumentPreview.query.one().text_content == '可研报告正文'
+
+
+def test_background_workers(make_app, login):
+    """后台线程池模式下上传请求立即返回，处理在线程中完成。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_app(make_app, login, root, DOCUMENT_PIPELINE_SYNC=False)
+        _upload(client, _png_bytes(), 'layout.png')
+        get_document_pipeline(app).shutdown()
+
+        with app.app_context():
+            preview = DocumentPreview.query.one()
+            assert preview.status == 'done'
+            assert os.path.exists(os.path.join(root, 'thumbnails', preview.thumbnail_path))
+
+
+def test_missing_dependencies_marked_unavailable(make_app, login, monkeypatch):
+    """缺少 PDF 依赖时不标记为完成，安装依赖后由积压任务补齐正文、页数和缩略图。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_app(make_app, login, root)
+        for module in ('pypdf', 'pypdfium2', 'fitz'):
+            monkeypatch.setitem(sys.modules, module, None)
+        _upload(client, _pdf_bytes('Grid connection study 110kV'), 'study.pdf')
+
+        with app.app_context():
+            preview = DocumentPreview.query.one()
+            assert preview.status == 'unavailable'
+            assert 'pypdf' in preview.last_error and 'pypdfium2' in preview.last_error
+            assert not preview.text_content and preview.thumbnail_path is None
+        assert '缺少预览组件' in client.get('/project/1/documents').get_data(as_text=True)
+
+        monkeypatch.undo()
+        assert get_document_pipeline(app).process_backlog()['submitted'] == 1
+        with app.app_context():
+            preview = DocumentPreview.query.one()
+            assert preview.status == 'done' and preview.last_error is None
+            assert 'Grid connection study 110kV' in preview.text_content
+            assert preview.page_count == 1 and preview.thumbnail_path is not None
+        assert get_document_pipeline(app).process_backlog()['submitted'] == 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目阶段流转记录与生命周期分析测试脚本
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.lifecycle import change_stage, conversion_funnel, dwell_times, stage_throughput, stage_timeline
+from app.models import Project, ProjectStageTransition, User
+
+
+USERS = [('admin', '管理员', 'stage123'), ('manager', '项目经理', 'stage123')]
+
+
+def _project_form(name, stage, **extra):
+    return dict({'name': name, 'project_type': '集中式光伏', 'capacity_mw': 50, 'current_stage': stage}, **extra)
+
+
+def test_edits_record_transitions(make_app, login):
+    """创建项目记录初始阶段；编辑页和管理员编辑页修改阶段时追加记录，阶段不变时不记录。"""
+    app = make_app(users=USERS)
+    client = login(app, 'manager', 'stage123')
+    client.post('/create_project', data=_project_form('流转项目', '机会挖掘'))
+    with app.app_context():
+        project = Project.query.one()
+        project_id, manager_id = project.id, project.manager_id
+        assert project.current_stage == '机会挖掘'
+
+    client.post(f'/edit_project/{project_id}', data=_project_form('流转项目', '机会挖掘', address='酒泉'))
+    client.post(f'/edit_project/{project_id}', data=_project_form('流转项目', '前期开发'))
+    admin = login(app, 'admin', 'stage123')
+    admin.post(f'/admin/projects/{project_id}/edit',
+               data=_project_form('流转项目', '投资决策', project_type='陆上风电', manager_id=manager_id))
+
+    with app.app_context():
+        timeline = stage_timeline(project_id)
+        assert [(t.from_stage, t.to_stage) for t in timeline] == [
+            (None, '机会挖掘'), ('机会挖掘', '前期开发'), ('前期开发', '投资决策')]
+        assert timeline[0].user_id == manager_id and timeline[0].dwell_seconds is None
+        assert timeline[1].entered_at == timeline[0].transitioned_at
+        assert timeline[1].dwell_seconds >= 0
+        # 流转记录保存修改后的项目类型
+        assert timeline[2].project_type == '陆上风电'
+        assert timeline[2].user_id == User.query.filter_by(username='admin').one().id
+        assert Project.query.one().current_stage == '投资决策'
+
+    admin.post(f'/delete_project/{project_id}')
+    with app.app_context():
+        assert ProjectStageTransition.query.count() == 0
+
+
+def test_lifecycle_analytics(make_app, login):
+    """停留时长分位数、含跳级的转化漏斗、按月吞吐量，以及按类型和项目经理分组。"""
+    app = make_app(users=USERS)
+    start = datetime(2023, 1, 1)
+    with app.app_context():
+        manager_id = User.query.filter_by(username='manager').one().id
+        # (项目类型, 项目经理, [(阶段, 距开始的天数)])
+        histories = [
+            ('集中式光伏', manager_id, [('机会挖掘', 0), ('前期开发', 10), ('投资决策', 100)]),
+            ('集中式光伏', manager_id, [('机会挖掘', 0), ('前期开发', 30)]),
+            ('陆上风电', None, [('机会挖掘', 5), ('前期开发', 25), ('建设执行', 85)]),
+            ('陆上风电', None, [('机会挖掘', 40)]),
+        ]
+        for index, (project_type, manager, history) in enumerate(histories):
+            project = Project(name=f'分析项目{index}', project_type=project_type, capacity_mw=100,
+                              manager_id=manager, created_at=start)
+            for stage, days in history:
+                change_stage(project, stage, at=start + timedelta(days=days))
+                db.session.add(project)
+                db.session.flush()
+        db.session.commit()
+
+        dwell = {row['stage']: row for row in dwell_times()}
+        assert dwell['机会挖掘']['count'] == 3
+        assert dwell['机会挖掘']['p50_days'] == 20
+        assert dwell['机会挖掘']['max_days'] == 30
+        assert dwell['前期开发']['mean_days'] == 75
+        assert dwell['前期开发']['p90_days'] == 87
+
+        by_type = {(row['stage'], row['group']): row for row in dwell_times('project_type')}
+        assert by_type[('机会挖掘', '集中式光伏')]['mean_days'] == 20
+        assert by_type[('机会挖掘', '陆上风电')]['count'] == 1
+
+        funnel = {row['stage']: row for row in conversion_funnel()}
+        # 跳过投资决策直接进入建设执行的项目计入投资决策
+        assert [funnel[stage]['reached'] for stage in ('机会挖掘', '前期开发', '投资决策', '建设执行', '并网运营')] \
+            == [4, 3, 2, 1, 0]
+        assert funnel['前期开发']['conversion'] == 75.0
+        assert funnel['建设执行']['overall'] == 25.0
+        assert funnel['并网运营']['conversion'] == 0
+        by_manager = {(row['stage'], row['group']): row['reached'] for row in conversion_funnel('manager_id')}
+        assert by_manager[('前期开发', manager_id)] == 2
+        assert by_manager[('前期开发', None)] == 1
+
+        throughput = {(row['period'], row['stage']): row['count'] for row in stage_throughput('month')}
+        assert throughput[('2023-01', '机会挖掘')] == 3
+        assert throughput[('2023-02', '机会挖掘')] == 1
+        assert throughput[('2023-01', '前期开发')] == 3
+        assert throughput[('2023-04', '投资决策')] == 1
+        ranged = stage_throughput('year', since=datetime(2023, 2, 1), until=datetime(2023, 4, 1))
+        assert ranged == [{'period': '2023', 'stage': '机会挖掘', 'group': None, 'count': 1},
+                          {'period': '2023', 'stage': '建设执行', 'group': None, 'count': 1}]
+
+        try:
+            dwell_times('province')
+            assert False, '不支持的分组维度应报错'
+        except ValueError:
+            pass
+
+    client = login(app, 'manager', 'stage123')
+    data = client.get('/analytics/stages?group_by=project_type&period=year').get_json()
+    assert {row['group'] for row in data['funnel']} == {'集中式光伏', '陆上风电'}
+    assert client.get('/analytics/stages?period=hour').status_code == 400
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
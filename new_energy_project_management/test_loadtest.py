@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+压测工具测试脚本
+"""
+
+import os
+import tempfile
+import threading
+
+from werkzeug.serving import make_server
+
+from app import create_app
+from benchmarks.datagen import build_database
+from benchmarks.loadtest import (HttpSession, InProcessSession, Recorder, load_project_ids, parse_mix,
+                                 percentile, run_load)
+
+
+def _build(root):
+    db_path = os.path.join(root, 'load.db')
+    config_class = build_database(db_path, 20, seed=3, storage_dir=os.path.join(root, 'blobs'))
+    project_ids, analysed_ids = load_project_ids(db_path)
+    return create_app(config_class), project_ids, analysed_ids
+
+
+def test_percentile_and_report():
+    """分位数使用最近秩法，报告按端点汇总错误率。"""
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.5
+    assert percentile(values, 99) == 0.99
+    assert percentile([], 95) == 0.0
+
+    recorder = Recorder()
+    for i in range(9):
+        recorder.record('GET /index', 0.01 * (i + 1), True)
+    recorder.record('GET /index', 0.5, False, '500')
+    report = recorder.report(2.0)
+    stats = report['endpoints']['GET /index']
+    assert stats['requests'] == 10 and stats['rps'] == 5.0
+    assert stats['error_rate'] == 0.1 and stats['errors'] == {'500': 1}
+    assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'] == 500.0
+
+    assert parse_mix('dashboard=3,export_all') == {'dashboard': 3.0, 'export_all': 1.0}
+
+
+def test_inprocess_load():
+    """进程内并发压测：所有操作路径均成功。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, project_ids, analysed_ids = _build(root)
+        mix = {'dashboard': 1, 'project': 1, 'cost_estimation': 1, 'profit_analysis': 1, 'export_project': 1}
+        report = run_load(lambda: InProcessSession(app), project_ids, analysed_ids,
+                          users=3, requests=60, mix=mix, seed=1)
+        assert report['requests'] >= 60
+        assert report['error_rate'] == 0.0, report
+        assert report['endpoints']['POST /auth/login']['requests'] == 3
+        assert 'GET /index' in report['endpoints']
+
+
+def test_http_load():
+    """HTTP 驱动：对本地 WSGI 服务器压测并保持登录会话。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, project_ids, analysed_ids = _build(root)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}'
+            report = run_load(lambda: HttpSession(url), project_ids, analysed_ids,
+                              users=2, requests=20, mix={'dashboard': 1, 'project': 1}, seed=2)
+        finally:
+            server.shutdown()
+        assert report['error_rate'] == 0.0, report
+        assert report['endpoints']['GET /project/<id>']['requests'] > 0
+
+
+if __name__ == '__main__':
+    test_percentile_and_report()
+    test_inprocess_load()
+    test_http_load()
+    print('✅ 压测工具测试通过')
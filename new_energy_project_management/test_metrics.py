@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+运行指标（/metrics）测试脚本
+"""
+
+import io
+import multiprocessing
+import os
+import tempfile
+
+import pytest
+
+from app import db
+from app.metrics import REGISTRY, PROFIT_CALCULATOR_CALLS, Metric, MetricsRegistry
+from app.models import User, Project
+from app.profit_calculator import ProfitCalculator
+
+
+def _create_client(make_app, login, root, **overrides):
+    app = make_app(METRICS_DIR=os.path.join(root, 'metrics'), BLOB_STORAGE_DIR=os.path.join(root, 'blobs'),
+                   **overrides)
+    with app.app_context():
+        db.session.add(Project(name='测试光伏项目', project_type='集中式光伏', capacity_mw=100,
+                               manager=User.query.one()))
+        db.session.commit()
+    return app, login(app)
+
+
+def _sample(body, prefix):
+    """返回以 prefix 开头的样本行的值。"""
+    for line in body.splitlines():
+        if line.startswith(prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_metrics_endpoint(make_app, login):
+    """请求延迟、SQL计数、报表、收益计算和上传字节数都出现在 /metrics 中。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_client(make_app, login, root)
+        client.get('/index')
+        client.get('/index')
+        client.get('/export/all_projects/excel')
+        client.post('/project/1/documents/upload', data={
+            'file': (io.BytesIO(b'x' * 1000), 'a.txt'), 'stage': '前期开发',
+        }, content_type='multipart/form-data')
+        ProfitCalculator.calculate_comprehensive_profit_analysis(100, 0.1, 0, 5000, 100)
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        body = response.get_data(as_text=True)
+
+        assert '# TYPE http_request_duration_seconds histogram' in body
+        assert _sample(body, 'http_request_duration_seconds_count{endpoint="main.index",method="GET",status="200"}') == 2
+        assert _sample(body, 'http_request_duration_seconds_bucket{endpoint="main.index",method="GET",status="200",le="+Inf"}') == 2
+        assert _sample(body, 'http_request_duration_seconds_count{endpoint="main.login",method="POST",status="302"}') == 1
+        assert _sample(body, 'db_queries_total{endpoint="main.index"}') >= 2
+        assert _sample(body, 'report_generation_seconds_count{report="all_projects_excel"}') == 1
+        assert _sample(body, 'report_size_bytes_sum{report="all_projects_excel"}') > 0
+        assert _sample(body, 'profit_calculator_calls_total{method="calculate_comprehensive_profit_analysis"}') == 1
+        assert _sample(body, 'profit_calculator_calls_total{method="calculate_resource_share_revenue"}') == 1
+        assert _sample(body, 'document_upload_bytes_total') == 1000
+        assert _sample(body, 'document_uploads_total{deduplicated="false"}') == 1
+
+
+def _child_increment(directory):
+    REGISTRY.configure(directory)
+    for _ in range(5):
+        PROFIT_CALCULATOR_CALLS.inc(('child',))
+
+
+def test_multiprocess_aggregation_and_auth(make_app, login):
+    """每个进程写自己的文件，抓取时汇总所有进程；配置令牌后需要认证。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_client(make_app, login, root, METRICS_AUTH_TOKEN='secret')
+        PROFIT_CALCULATOR_CALLS.inc(('child',), 2)
+
+        process = multiprocessing.get_context('fork').Process(target=_child_increment, args=(REGISTRY.directory,))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        assert len(os.listdir(REGISTRY.directory)) == 2
+
+        assert client.get('/metrics').status_code == 401
+        body = client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+        assert _sample(body, 'profit_calculator_calls_total{method="child"}') == 7
+
+
+def test_remote_access_requires_token(make_app, login):
+    """未配置令牌时只允许本机抓取，METRICS_PUBLIC 取消限制。"""
+    remote = {'REMOTE_ADDR': '10.0.0.8'}
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_client(make_app, login, root)
+        assert client.get('/metrics').status_code == 200
+        assert client.get('/metrics', environ_base=remote).status_code == 403
+
+        app, client = _create_client(make_app, login, root, METRICS_PUBLIC=True)
+        assert client.get('/metrics', environ_base=remote).status_code == 200
+
+        app, client = _create_client(make_app, login, root, METRICS_AUTH_TOKEN='secret')
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_temporary_directory_removed_at_exit():
+    """未配置 METRICS_DIR 时使用临时目录，进程退出时删除；fork 出的子进程退出时不删除。"""
+    registry = MetricsRegistry()
+    Metric(registry, 'temporary_total', '测试').inc()
+    directory = registry.directory
+    assert os.listdir(directory) == [f'metrics_{os.getpid()}.db']
+
+    process = multiprocessing.get_context('fork').Process(target=registry._remove_temporary)
+    process.start()
+    process.join()
+    assert os.path.isdir(directory)
+
+    registry._remove_temporary()
+    assert not os.path.exists(directory)
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
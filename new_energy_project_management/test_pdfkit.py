@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+PDF 渲染工具集测试脚本
+"""
+
+import os
+
+import pytest
+import reportlab
+
+from app import db
+from app.models import Project, CostModel
+from app.reports import generate_project_report_pdf
+from app.reports.pdfkit import get_pdf_kit
+
+VERA_TTF = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+
+
+def test_cid_font_fallback_and_cache(make_app):
+    """找不到 TrueType 字体时使用 CID 字体，同一配置只构建一次。"""
+    app = make_app(users=(), PDF_FONT_SEARCH_PATHS=[], PDF_FONT_PATH='/nonexistent/font.ttf')
+    kit = get_pdf_kit(app)
+    assert kit.font_name == 'STSong-Light'
+    assert kit.styles['title'].fontName == 'STSong-Light'
+    assert get_pdf_kit(app) is kit
+
+
+def test_truetype_font_is_subset(make_app):
+    """配置 TrueType 字体时嵌入字形子集。"""
+    app = make_app(users=(), PDF_FONT_PATH=VERA_TTF)
+    kit = get_pdf_kit(app)
+    assert kit.font_name.startswith('CJKFont-Vera')
+
+    with app.app_context():
+        db.session.add(CostModel(project_type='集中式光伏', unit_cost_label='元/W', cost_items={'组件': 1.2}))
+        project = Project(name='Subset Test', project_type='集中式光伏', capacity_mw=10)
+        db.session.add(project)
+        db.session.commit()
+        pdf = generate_project_report_pdf(project.id).getvalue()
+    assert pdf.startswith(b'%PDF')
+    # 子集字体名带有6位前缀，且远小于完整字体文件
+    assert b'+Vera' in pdf or b'AAAAAA+' in pdf
+    assert len(pdf) < os.path.getsize(VERA_TTF)
+
+
+def test_chinese_report_uses_cid_font(make_app):
+    """默认环境下中文报告使用 CID 字体，而不是无法显示中文的 Helvetica。"""
+    app = make_app(users=(), PDF_FONT_SEARCH_PATHS=[])
+    with app.app_context():
+        project = Project(name='中文项目', project_type='陆上风电', capacity_mw=50)
+        db.session.add(project)
+        db.session.commit()
+        pdf = generate_project_report_pdf(project.id).getvalue()
+    assert b'STSong-Light' in pdf
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
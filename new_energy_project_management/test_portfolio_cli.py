@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目组合批量维护命令测试脚本
+"""
+
+import os
+import tempfile
+
+import pytest
+
+from app import db
+from app.models import ProfitAnalysis, Project, ProjectCostDetail
+from app.portfolio_cli import run_checks
+
+
+def _create_app(make_app, **config):
+    app = make_app(users=(), **config)
+    with app.app_context():
+        for index in range(5):
+            project = Project(name=f'维护项目{index}', project_type='集中式光伏', capacity_mw=100 + index,
+                              current_stage='前期开发')
+            db.session.add(project)
+            db.session.flush()
+            details = [ProjectCostDetail(project_id=project.id, cost_category='设备费', cost_item='光伏组件',
+                                         unit_cost=1.1, unit_label='元/W'),
+                       ProjectCostDetail(project_id=project.id, cost_category='其他费用', cost_item='管理费',
+                                         unit_cost=50, unit_label='万元')]
+            for detail in details:
+                detail.calculate_total_cost(project.capacity_mw)
+            db.session.add_all(details)
+            analysis = ProfitAnalysis(project_id=project.id, total_project_cost=sum(d.total_cost for d in details),
+                                      dev_fee_rate=0.1, extra_investment=0, resource_fee_total=1000, dengpin_cost=200)
+            db.session.add(analysis)
+        db.session.commit()
+        # 按输入参数写入收益分析结果
+        run_checks(['profits'])
+
+        # 人为制造不一致：装机容量修改后未重新计算，收益结果被改写
+        project = Project.query.filter_by(name='维护项目1').one()
+        project.capacity_mw = 200
+        ProfitAnalysis.query.filter_by(project_id=Project.query.filter_by(name='维护项目3').one().id) \
+            .one().net_profit = 1.0
+        db.session.commit()
+    return app
+
+
+def test_verify_dry_run_and_recompute(make_app):
+    """verify 和 --dry-run 只报告差异不写入，recompute-all 分块修正后校验通过。"""
+    app = _create_app(make_app)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['portfolio', 'verify', '--show', '10'])
+    assert result.exit_code == 1
+    assert '成本明细：差异 1 处' in result.output
+    assert '项目总造价：差异 1 处' in result.output
+    assert '收益分析：差异 5 处' in result.output
+    assert 'net_profit: 1.0 -> ' in result.output
+
+    result = runner.invoke(args=['portfolio', 'recompute-all', '--dry-run', '--chunk-size', '2'])
+    assert result.exit_code == 0 and '（未写入）' in result.output
+    assert runner.invoke(args=['portfolio', 'verify']).exit_code == 1
+
+    result = runner.invoke(args=['portfolio', 'recompute-all', '--chunk-size', '2'])
+    assert result.exit_code == 0 and '（已修正）' in result.output
+    assert runner.invoke(args=['portfolio', 'verify']).exit_code == 0
+
+    with app.app_context():
+        project = Project.query.filter_by(name='维护项目1').one()
+        analysis = ProfitAnalysis.query.filter_by(project_id=project.id).one()
+        assert analysis.total_project_cost == 200 * 110 + 50
+        # 容量变化后委托费按新容量重新计算
+        assert analysis.commission_income == 200 * 0.1 * 100
+
+
+def test_single_step_commands(make_app):
+    """单步命令只修正各自负责的字段。"""
+    app = _create_app(make_app)
+    runner = app.test_cli_runner()
+
+    assert runner.invoke(args=['portfolio', 'recompute-costs']).exit_code == 0
+    with app.app_context():
+        diffs = run_checks(['costs', 'totals', 'profits'], dry_run=True)
+        assert [len(diffs[name]) for name in ('costs', 'totals', 'profits')] == [0, 1, 5]
+
+    assert runner.invoke(args=['portfolio', 'rebuild-totals']).exit_code == 0
+    assert runner.invoke(args=['portfolio', 'recompute-profits']).exit_code == 0
+    assert runner.invoke(args=['portfolio', 'verify']).exit_code == 0
+
+
+def test_parallel_workers(make_app):
+    """--workers 大于1时在子进程中计算差异，结果与单进程一致；内存数据库拒绝多进程。"""
+    runner = _create_app(make_app).test_cli_runner()
+    assert runner.invoke(args=['portfolio', 'verify', '--workers', '2']).exit_code == 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'portfolio.db')
+        app = _create_app(make_app, SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['portfolio', 'recompute-all', '--workers', '2', '--chunk-size', '2'])
+        assert result.exit_code == 0, result.output
+        assert '收益分析：差异 5 处' in result.output
+        assert runner.invoke(args=['portfolio', 'verify']).exit_code == 0
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+投资组合优化测试脚本
+"""
+
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from app import db
+from app.models import CostModel, ProfitAnalysis, Project
+from app.portfolio_optimizer import optimize
+from app.profit_calculator import ProfitCalculator
+
+
+def _exhaustive(values, costs, budget, capacity, types, provinces, capacity_limits, province_limits):
+    """枚举全部组合求最优目标值，作为对照。"""
+    best = 0.0
+    for mask in itertools.product((False, True), repeat=len(values)):
+        chosen = [i for i, selected in enumerate(mask) if selected]
+        if sum(costs[i] for i in chosen) > budget + 1e-9:
+            continue
+        if any(sum(capacity[i] for i in chosen if types[i] == t) > limit + 1e-9
+               for t, limit in capacity_limits.items()):
+            continue
+        if any(sum(1 for i in chosen if provinces[i] == p) > limit for p, limit in province_limits.items()):
+            continue
+        best = max(best, sum(values[i] for i in chosen))
+    return round(best, 2)
+
+
+def test_matches_exhaustive_search():
+    """小规模问题的最优值与枚举结果相同，节点数受限时返回的解仍满足全部约束且不超过上界。"""
+    rng = random.Random(20240801)
+    for _ in range(300):
+        n = rng.randint(0, 11)
+        values = [rng.choice([round(rng.uniform(-200, 3000), 2), 1000.0]) for _ in range(n)]
+        costs = [rng.choice([round(rng.uniform(0, 5000), 2), 0.0]) for _ in range(n)]
+        capacity = [round(rng.uniform(20, 400), 1) for _ in range(n)]
+        types = [rng.choice(['集中式光伏', '陆上风电']) for _ in range(n)]
+        provinces = [rng.choice(['河北省', '山东省', '内蒙古']) for _ in range(n)]
+        budget = rng.uniform(0, sum(costs) + 1)
+        capacity_limits = {'集中式光伏': rng.choice([0, rng.uniform(0, 600)])} if rng.random() < 0.7 else {}
+        province_limits = {'河北省': rng.randint(0, 2), '山东省': rng.randint(0, 3)} if rng.random() < 0.7 else {}
+        expected = _exhaustive(values, costs, budget, capacity, types, provinces, capacity_limits, province_limits)
+
+        result = optimize(values, costs, budget, capacity, types, provinces, capacity_limits, province_limits)
+        assert result['status'] == 'optimal' and result['objective'] == expected, (result, expected)
+
+        limited = optimize(values, costs, budget, capacity, types, provinces, capacity_limits, province_limits,
+                           node_limit=1)
+        chosen = np.flatnonzero(limited['selected'])
+        assert sum(costs[i] for i in chosen) <= budget + 1e-9
+        assert limited['objective'] <= expected <= limited['upper_bound']
+
+
+def test_marginal_values():
+    """预算的边际价值为预算增加时才能选入的项目的单位投入收益，项目边际价值扣除所占预算的价值。"""
+    result = optimize([100, 90, 30], [10, 10, 10], 20)
+    assert result['selected'].tolist() == [True, True, False] and result['objective'] == 190
+    budget, = result['constraints']
+    assert (budget['kind'], budget['used'], budget['marginal_value']) == ('budget', 20, 3)
+    assert np.allclose(result['marginal_values'], [70, 60, 0])
+
+    # 河北省只能选一个项目：项目 0 入选后预算还能选入项目 2；省份名额和容量上限为 0 时边际价值为空
+    result = optimize([100, 90, 30], [10, 10, 10], 20, [50, 50, 50], ['集中式光伏'] * 3,
+                      ['河北省', '河北省', '山东省'], {'陆上风电': 0}, {'河北省': 1})
+    assert result['selected'].tolist() == [True, False, True] and result['objective'] == 130
+    assert [(c['kind'], c['key'], c['used']) for c in result['constraints']] == \
+        [('budget', None, 20), ('capacity', '陆上风电', 0), ('province', '河北省', 1)]
+    assert result['constraints'][1]['marginal_value'] is None
+
+    try:
+        optimize([100], [10], -1)
+        assert False, '预算为负应拒绝'
+    except ValueError:
+        pass
+
+
+def test_optimizer_endpoint(make_app, login):
+    """优化API按造价模型计算投入、按 ProfitCalculator 计算净利润，参数错误返回400。"""
+    app = make_app()
+    with app.app_context():
+        db.session.add(CostModel(project_type='集中式光伏', unit_cost_label='元/W', cost_items={'设备费': 2.0}))
+        # (容量, 省份, 阶段, 资源费总额)：投资 = 容量 × 200 万元
+        for index, (capacity, province, stage, fee) in enumerate([
+                (100, '河北省', '前期开发', 4000), (50, '河北省', '前期开发', 0), (80, '山东省', '前期开发', 0),
+                (60, '山东省', '投资决策', 8000)]):
+            project = Project(name=f'优化项目{index}', project_type='集中式光伏', capacity_mw=capacity,
+                              province=province, current_stage=stage)
+            db.session.add(project)
+            db.session.flush()
+            db.session.add(ProfitAnalysis(project_id=project.id, dev_fee_rate=0.1, extra_investment=0,
+                                          resource_fee_total=fee, dengpin_cost=500))
+        db.session.commit()
+    client = login(app)
+
+    net_profit = [ProfitCalculator.calculate_comprehensive_profit_analysis(capacity, 0.1, 0, fee, 500)['net_profit']
+                  for capacity, fee in ((100, 4000), (50, 0), (80, 0))]
+    # 预算 36000 万元只够两个项目：项目 1、3 净利润之和最大；河北省限 1 个项目后只能选项目 1 或 2
+    data = client.get('/analytics/portfolio_optimizer?budget=36000').get_json()
+    assert data['status'] == 'optimal' and data['candidates'] == 3
+    assert [p['cost'] for p in data['projects']] == [20000, 10000, 16000]
+    assert [p['value'] for p in data['projects']] == net_profit
+    assert [p['project_id'] for p in data['projects'] if p['selected']] == [1, 3]
+    assert data['objective'] == net_profit[0] + net_profit[2]
+
+    data = client.get('/analytics/portfolio_optimizer?budget=36000&province_limit=山东省:0'
+                      '&capacity_limit=集中式光伏:120&stage=all').get_json()
+    assert [p['project_id'] for p in data['projects'] if p['selected']] == [1]
+    assert data['candidates'] == 4 and data['constraints'][1]['used'] == 100
+
+    assert client.get('/analytics/portfolio_optimizer').status_code == 400
+    assert client.get('/analytics/portfolio_optimizer?budget=1000&province_limit=河北省').status_code == 400
+    assert client.get('/analytics/portfolio_optimizer?budget=1000&objective=roi').status_code == 400
+    assert client.get('/analytics/portfolio_optimizer?budget=-1').status_code == 400
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
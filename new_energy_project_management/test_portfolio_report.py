@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+项目组合PDF报告测试脚本
+"""
+
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import User, Project
+from app.reports import generate_portfolio_pdf
+from app.reports.portfolio import ChunkedStory, load_portfolio, portfolio_kpis
+from benchmarks.datagen import BENCHMARK_PASSWORD, generate_rows, populate
+
+
+def _app(make_app, root):
+    app = make_app(users=(), BLOB_STORAGE_DIR=root)
+    with app.app_context():
+        populate(generate_rows(24, seed=5))
+    return app
+
+
+def test_chunked_story_is_lazy():
+    """故事列表只在缓冲不足时才生成下一块。"""
+    produced = []
+
+    def chunks():
+        for i in range(10):
+            produced.append(i)
+            yield [f'flowable-{i}-{j}' for j in range(5)]
+
+    story = ChunkedStory(chunks(), low_water=8)
+    assert story[0] == 'flowable-0-0'
+    assert produced == [0, 1]
+    taken = 0
+    while len(story):
+        del story[0]
+        taken += 1
+    assert taken == 50 and produced == list(range(10))
+
+
+def test_bulk_loading_query_count(make_app):
+    """数据加载的查询次数与项目数量无关。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _app(make_app, root)
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2])  # noqa: E731
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                portfolio = load_portfolio()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            assert len(portfolio) == 24
+            assert len(statements) <= 4
+            kpis = portfolio_kpis(portfolio)
+            assert kpis['total_projects'] == 24
+            assert kpis['projects_with_analysis'] == sum(1 for p in portfolio if p.analysis)
+
+
+def test_portfolio_pdf_with_progress(make_app, login):
+    """两遍排版生成目录，进度回调覆盖全部项目，支持筛选和导出路由。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _app(make_app, root)
+        with app.app_context():
+            events = []
+            pdf = generate_portfolio_pdf(progress=lambda *args: events.append(args)).getvalue()
+            assert pdf.startswith(b'%PDF')
+            final = [e for e in events if e[0] == max(e[0] for e in events)]
+            assert max(e[0] for e in events) == 2
+            assert [e[1] for e in final] == list(range(1, len(final) + 1))
+            assert final[-1][2:] == (24, 24)
+
+            stage = db.session.query(Project.current_stage).first()[0]
+            expected = Project.query.filter_by(current_stage=stage).count()
+            events.clear()
+            generate_portfolio_pdf(stage=stage, progress=lambda *args: events.append(args))
+            assert events[-1][2:] == (expected, expected)
+
+            username = db.session.get(User, 1).username
+        client = login(app, username, BENCHMARK_PASSWORD)
+        response = client.get('/export/portfolio/pdf?project_type=陆上风电')
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'application/pdf'
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
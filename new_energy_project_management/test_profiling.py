@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求性能剖析测试脚本
+"""
+
+import json
+import os
+import tempfile
+import tracemalloc
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.models import User, Project
+from app.profiling import RequestProfiler, get_request_profiler
+
+
+def _create_client(make_app, login, **overrides):
+    app = make_app(users=[('admin', '管理员', 'admin123'), ('staff', '普通员工', 'staff123')],
+                   **{'PROFILING_ENABLED': True, **overrides})
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        for i in range(3):
+            db.session.add(Project(name=f'测试项目{i}', project_type='集中式光伏', capacity_mw=50, manager=admin))
+        db.session.commit()
+    return app, login(app)
+
+
+def test_request_stats_and_slow_log(make_app, login):
+    """记录SQL数、模板耗时，超过阈值的请求写入JSON慢请求日志。"""
+    with tempfile.TemporaryDirectory() as root:
+        log_path = os.path.join(root, 'slow.log')
+        app, client = _create_client(make_app, login, PROFILING_SLOW_THRESHOLD_MS=0, PROFILING_SLOW_LOG=log_path,
+                                     PROFILING_TRACEMALLOC=True)
+
+        response = client.get('/index')
+        assert response.status_code == 200
+        assert 'db;dur=' in response.headers['Server-Timing']
+
+        stats = {item['endpoint']: item for item in get_request_profiler(app).worst_endpoints()}
+        assert stats['main.index']['count'] == 1
+        assert stats['main.index']['avg_sql_count'] >= 1
+        assert stats['main.index']['avg_template_ms'] > 0
+        assert stats['main.index']['max_peak_kb'] > 0
+
+        with open(log_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        record = next(r for r in records if r['endpoint'] == 'main.index')
+        assert record['path'] == '/index'
+        assert record['status'] == 200
+        assert record['sql_count'] >= 1
+        tracemalloc.stop()
+
+
+def test_sampled_profiles_and_admin_page(make_app, login):
+    """采样请求保存cProfile文件，管理员页面列出最慢端点。"""
+    with tempfile.TemporaryDirectory() as root:
+        app, client = _create_client(make_app, login, PROFILING_SAMPLE_RATE=1.0, PROFILING_PROFILE_DIR=root,
+                                     PROFILING_SLOW_THRESHOLD_MS=0)
+        client.get('/index')
+
+        profiles = get_request_profiler(app).list_profiles()
+        assert any(name.startswith('main_index_') and name.endswith('.prof') for name in profiles)
+
+        page = client.get('/admin/performance?sort=avg_sql_count')
+        assert page.status_code == 200
+        body = page.get_data(as_text=True)
+        assert 'main.index' in body
+        assert 'main_index_' in body
+
+        name = next(name for name in profiles if name.startswith('main_index_'))
+        assert client.get(f'/admin/performance/profiles/{name}').status_code == 200
+
+        client.post('/admin/performance/reset')
+        assert [item['endpoint'] for item in get_request_profiler(app).worst_endpoints()] == ['main.admin_performance_reset']
+
+        staff_client = login(app, 'staff', 'staff123')
+        assert staff_client.get('/admin/performance').status_code != 200
+
+
+def test_disabled_outside_development(make_app, login):
+    """未配置时只在调试模式下开启；关闭后响应不带 Server-Timing，不累计端点统计。"""
+    app, client = _create_client(make_app, login, PROFILING_ENABLED=False)
+    assert 'Server-Timing' not in client.get('/index').headers
+    assert get_request_profiler(app).worst_endpoints() == []
+
+    for debug in (False, True):
+        bare = Flask(__name__)
+        bare.debug = debug
+        RequestProfiler(bare)
+        assert bare.config['PROFILING_ENABLED'] is debug
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+收益分析历史快照测试脚本
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import ProfitAnalysis, Project, User
+from app.profit_history import append_snapshots, portfolio_history, project_history
+
+ANALYSIS_FORM = {'dev_fee_rate': 0.1, 'extra_investment': 0, 'resource_fee_total': 1000,
+                 'dengpin_cost': 200, 'market_profit_rate': 0}
+
+
+def _create_app(make_app, login, **config):
+    app = make_app(users=[('admin', '管理员', 'history123')], **config)
+    with app.app_context():
+        db.session.add(Project(name='快照项目', project_type='集中式光伏', capacity_mw=100,
+                               current_stage='前期开发', manager_id=User.query.one().id))
+        db.session.commit()
+    return app, login(app, 'admin', 'history123')
+
+
+def _snapshot(project_id, taken_at, total_income, net_profit):
+    return {'project_id': project_id, 'taken_at': taken_at, 'total_income': total_income, 'net_profit': net_profit}
+
+
+def test_recalculation_appends_snapshots(make_app, login):
+    """新增和重新计算收益分析各追加一条快照，未变化的保存不追加；快照不能修改或删除。"""
+    app, client = _create_app(make_app, login)
+    with app.app_context():
+        project = Project.query.one()
+        project_id = project.id
+        db.session.add(ProfitAnalysis(project=project, total_project_cost=17500.0))
+        db.session.commit()
+
+    client.post(f'/profit_analysis/{project_id}', data=ANALYSIS_FORM)
+    client.post(f'/profit_analysis/{project_id}', data=ANALYSIS_FORM)
+    client.post(f'/profit_analysis/{project_id}', data=dict(ANALYSIS_FORM, resource_fee_total=3000))
+
+    with app.app_context():
+        snapshots = project_history(project_id)
+        assert len(snapshots) == 3
+        assert snapshots[0].total_income is None and snapshots[0].capacity_mw == 100
+        assert [s.resource_fee_total for s in snapshots[1:]] == [1000, 3000]
+        assert snapshots[2].total_income > snapshots[1].total_income
+        assert snapshots[2].total_income == ProfitAnalysis.query.one().total_income
+
+        for statement in ('UPDATE profit_analysis_snapshot SET net_profit = 0',
+                          'DELETE FROM profit_analysis_snapshot'):
+            try:
+                db.session.execute(db.text(statement))
+                db.session.commit()
+                assert False, '快照只能追加'
+            except IntegrityError:
+                db.session.rollback()
+
+        # 删除项目后历史仍保留，并追加一条移除快照
+        db.session.delete(ProfitAnalysis.query.one())
+        db.session.delete(Project.query.one())
+        db.session.commit()
+        assert [s.removed for s in project_history(project_id)] == [False, False, False, True]
+
+    data = client.get(f'/analytics/profit_history?project_id={project_id}').get_json()
+    assert [s['resource_fee_total'] for s in data['snapshots']][1:] == [1000, 3000, None]
+
+
+def test_portfolio_history_carries_latest_snapshot(make_app, login):
+    """组合历史按周期取各项目最新快照求和，无快照的周期沿用上一周期，起始前的快照作为期初值。"""
+    app, client = _create_app(make_app, login, PROFIT_SNAPSHOTS_ENABLED=False)
+    with app.app_context():
+        append_snapshots(db.session.connection(), [
+            _snapshot(1, datetime(2023, 1, 20), 120, 12),
+            _snapshot(1, datetime(2023, 1, 10), 100, 10),
+            _snapshot(2, datetime(2023, 1, 15), 50, 5),
+        ])
+        append_snapshots(db.session.connection(), [_snapshot(1, datetime(2023, 4, 2), 80, 8),
+                                                   _snapshot(3, datetime(2023, 5, 1), 30, None)])
+        db.session.commit()
+        assert [s.total_income_change for s in project_history(1)] == [100, 20, -40]
+
+        history = portfolio_history('month')
+        assert [row['period'] for row in history] == ['2023-01', '2023-02', '2023-03', '2023-04', '2023-05']
+        assert [row['total_income'] for row in history] == [170, 170, 170, 130, 160]
+        assert [row['net_profit'] for row in history] == [17, 17, 17, 13, 13]
+        assert [row['projects'] for row in history] == [2, 2, 2, 2, 3]
+        assert [row['recalculations'] for row in history] == [3, 0, 0, 1, 1]
+
+        ranged = portfolio_history('month', since=datetime(2023, 3, 1), until=datetime(2023, 5, 1))
+        assert [(row['period'], row['total_income']) for row in ranged] == [('2023-03', 170), ('2023-04', 130)]
+        assert [row['total_income'] for row in portfolio_history('year', project_ids=[2, 3])] == [80]
+
+        weekly = portfolio_history('week', since=datetime(2022, 12, 26), until=datetime(2023, 1, 23))
+        # SQLite 按 %W 编号，跨年的一周拆为 2022-W52 和 2023-W00
+        assert [row['period'] for row in weekly] == ['2022-W52', '2023-W00', '2023-W01', '2023-W02', '2023-W03']
+        assert [row['total_income'] for row in weekly] == [0, 0, 0, 150, 170]
+
+        try:
+            portfolio_history('hour')
+            assert False, '不支持的统计周期应报错'
+        except ValueError:
+            pass
+
+    assert client.get('/analytics/profit_history?period=year').get_json()['history'][0]['total_income'] == 160
+    assert client.get('/analytics/profit_history?period=hour').status_code == 400
+
+
+def test_removed_projects_leave_portfolio(make_app, login):
+    """删除项目或收益分析后追加移除快照，组合合计和项目数不再包含该项目；重新分析后再次计入。"""
+    app, client = _create_app(make_app, login)
+    with app.app_context():
+        manager_id = User.query.one().id
+        db.session.add(Project(name='快照项目2', project_type='陆上风电', capacity_mw=50,
+                               current_stage='前期开发', manager_id=manager_id))
+        for project in Project.query.all():
+            db.session.add(ProfitAnalysis(project=project, total_project_cost=17500.0))
+        db.session.commit()
+        first_id, second_id = [p.id for p in Project.query.order_by(Project.id)]
+
+    for project_id in (first_id, second_id):
+        client.post(f'/profit_analysis/{project_id}', data=ANALYSIS_FORM)
+    with app.app_context():
+        total_income, second_income = [ProfitAnalysis.query.filter_by(project_id=project_id).one().total_income
+                                       for project_id in (first_id, second_id)]
+        history = portfolio_history('year')[-1]
+        assert history['projects'] == 2 and history['total_income'] == total_income + second_income
+
+    # 删除项目：收益分析的 project_id 被置空
+    client.post(f'/delete_project/{first_id}')
+    with app.app_context():
+        assert Project.query.count() == 1
+        removal = project_history(first_id)[-1]
+        assert removal.removed and removal.total_income is None and removal.total_income_change == -total_income
+        history = portfolio_history('year')[-1]
+        assert history['projects'] == 1 and history['total_income'] == second_income
+
+        # 删除收益分析后重新分析
+        db.session.delete(ProfitAnalysis.query.filter_by(project_id=second_id).one())
+        db.session.commit()
+        history = portfolio_history('year')[-1]
+        assert (history['projects'], history['total_income']) == (0, 0)
+
+        db.session.add(ProfitAnalysis(project_id=second_id, total_project_cost=17500.0))
+        db.session.commit()
+    client.post(f'/profit_analysis/{second_id}', data=ANALYSIS_FORM)
+    with app.app_context():
+        history = portfolio_history('year')[-1]
+        assert history['projects'] == 1 and history['total_income'] == second_income
+        assert [s.projects_change for s in project_history(second_id)] == [1, 0, -1, 1, 0]
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+收益反算测试脚本
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from app import db
+from app.models import ProfitAnalysis, Project
+from app.profit_calculator import ProfitCalculator
+from app.profit_solver import required_resource_fee, solve, SOLVE_FOR
+
+# 收益分析字段 -> ProfitCalculator 结果键
+RESULT_KEYS = {'total_income': 'total_revenue', 'net_profit': 'net_profit', 'roi_percentage': 'roi'}
+
+
+def test_inverse_resource_share():
+    """资源费分成的反函数在各分段与 ProfitCalculator 互逆。"""
+    fees = [0, 1000, 4000, 5000, 8000, 12000.5]
+    shares = [ProfitCalculator.calculate_resource_share_revenue(fee) for fee in fees]
+    assert np.allclose(required_resource_fee(shares), fees, atol=0.01)
+
+
+def test_solution_is_minimal():
+    """所需值代入 ProfitCalculator 后达到目标，再少一个最小单位则达不到。"""
+    rng = random.Random(20240801)
+    n = 300
+    capacity = np.round([rng.uniform(1, 300) for _ in range(n)], 2)
+    rate = np.array([rng.choice([0.1, 0.08, np.nan]) for _ in range(n)])
+    extra = np.array([rng.choice([0, 50.5]) for _ in range(n)])
+    fee = np.round([rng.uniform(0, 9000) for _ in range(n)], 2)
+    dengpin = np.round([rng.choice([0, rng.uniform(100, 4000)]) for _ in range(n)], 2)
+
+    for target, value in (('roi_percentage', 30), ('net_profit', 2000), ('total_income', 5000)):
+        for solve_for, step in SOLVE_FOR.items():
+            result = solve(target, value, solve_for, capacity, rate, extra, fee, dengpin)
+            assert set(result['status']) <= {'ok', 'met', 'unreachable'}
+            for i in np.flatnonzero(result['status'] == 'ok'):
+                inputs = {'capacity_mw': capacity[i], 'dev_fee_rate': None if np.isnan(rate[i]) else rate[i],
+                          'extra_investment': extra[i], 'resource_fee_total': fee[i], 'dengpin_cost': dengpin[i]}
+
+                def achieved(x):
+                    inputs[solve_for] = x
+                    return ProfitCalculator.calculate_comprehensive_profit_analysis(**inputs)[RESULT_KEYS[target]]
+
+                required = result['required'][i]
+                assert achieved(required) >= value and result['achieved'][i] == achieved(required)
+                lower = round(required - step, 4)
+                assert lower <= 0 or achieved(lower) < value, (target, solve_for, i)
+            if target == 'roi_percentage':
+                # 没有登品投入时 ROI 无法计算
+                assert all(result['status'][dengpin == 0] == 'unreachable')
+
+
+def test_solver_endpoint(make_app, login):
+    """反算API对组合一次求解，参数错误返回400。"""
+    app = make_app()
+    with app.app_context():
+        for index, dengpin_cost in enumerate([3000, 0, 500]):
+            project = Project(name=f'反算项目{index}', project_type='集中式光伏', capacity_mw=100,
+                              current_stage='前期开发')
+            db.session.add(project)
+            db.session.flush()
+            db.session.add(ProfitAnalysis(project_id=project.id, dev_fee_rate=0.1, extra_investment=0,
+                                          resource_fee_total=1000, dengpin_cost=dengpin_cost))
+        db.session.commit()
+    client = login(app)
+
+    data = client.get('/analytics/profit_solver?target=roi_percentage&value=30'
+                      '&solve_for=resource_fee_total').get_json()
+    assert [p['status'] for p in data['projects']] == ['ok', 'unreachable', 'met']
+    assert data['status_counts'] == {'ok': 1, 'unreachable': 1, 'met': 1}
+    # 100MW × 0.1元/W 委托费 1000 万元，还需资源费分成 2900 万元：1000 + (费 - 4000) × 0.75 = 2900；
+    # ROI 保留 2 位小数，29.995% 即达到 30%，所需资源费略低于精确反解值
+    assert 4000 + 1900 / 0.75 - 0.25 < data['projects'][0]['required'] <= 4000 + 1900 / 0.75
+    assert data['projects'][0]['roi_percentage'] == 30
+
+    data = client.get('/analytics/profit_solver?target=net_profit&value=500&solve_for=dev_fee_rate'
+                      '&project_id=1').get_json()
+    # 净利润 500 = 委托费 + 资源费分成 250 - 投入 3000，委托费 3250 万元即 0.325 元/W
+    assert [(p['project_id'], p['required']) for p in data['projects']] == [(1, 0.325)]
+
+    assert client.get('/analytics/profit_solver?value=30&target=irr').status_code == 400
+    assert client.get('/analytics/profit_solver?value=30&solve_for=capacity_mw').status_code == 400
+    assert client.get('/analytics/profit_solver').status_code == 400
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+资源费分成方案测试脚本
+"""
+
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pytest
+
+from app import db
+from app.consistency import round_half_up
+from app.models import ProfitAnalysis, Project, RevenueShareSchedule
+from app.portfolio_cli import run_checks
+from app.profit_calculator import ProfitCalculator
+from app.profit_solver import solve_portfolio
+from app.revenue_share import CompiledSchedule, default_schedule, get_revenue_share_schedules
+
+PARTNER_TIERS = [{'threshold': 0, 'rate': 0.3}, {'threshold': 2000, 'rate': 0.5}, {'threshold': 5000, 'rate': 0.4}]
+
+
+def _tiered_share(fee):
+    """逐级累加的默认分成（原实现），作为对照。"""
+    P = ProfitCalculator
+    fee = Decimal(str(fee))
+    share = min(fee, P.TIER_1_LIMIT) * P.RATE_1
+    if fee > P.TIER_1_LIMIT:
+        share += (min(fee, P.TIER_2_LIMIT) - P.TIER_1_LIMIT) * P.RATE_2
+    if fee > P.TIER_2_LIMIT:
+        share += (fee - P.TIER_2_LIMIT) * P.RATE_3
+    return float(share.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+def test_compiled_schedule_matches_tiers():
+    """编译后的默认分级与逐级计算一致，批量计算与单个计算一致，反函数互逆。"""
+    rng = random.Random(20240801)
+    fees = [0, 4000, 8000, 4000.01, 7999.99] + [round(rng.uniform(0, 20000), 2) for _ in range(2000)]
+    scalar = [ProfitCalculator.calculate_resource_share_revenue(fee) for fee in fees]
+    assert scalar == [_tiered_share(fee) for fee in fees]
+    assert round_half_up(default_schedule().share_batch(fees)).tolist() == scalar
+    assert np.allclose(default_schedule().fee_for_share_batch(default_schedule().share_batch(fees)), fees)
+
+    partner = CompiledSchedule(PARTNER_TIERS)
+    assert partner.share(Decimal('6000')) == Decimal('2000') * Decimal('0.3') + 3000 * Decimal('0.5') + 400
+    assert ProfitCalculator.calculate_resource_share_revenue(6000, partner) == 2500.0
+
+    for tiers in ([], [{'threshold': 100, 'rate': 0.3}], [{'threshold': 0, 'rate': 0}],
+                  [{'threshold': 0, 'rate': 0.3}, {'threshold': 0, 'rate': 0.5}], [{'rate': 0.3}]):
+        try:
+            CompiledSchedule(tiers)
+            assert False, f'分级不合法：{tiers}'
+        except ValueError:
+            pass
+
+
+def _create_app(make_app):
+    app = make_app(users=[('admin', '管理员', 'share123')])
+    with app.app_context():
+        schedule = RevenueShareSchedule(name='合作合同A', tiers=PARTNER_TIERS)
+        db.session.add(schedule)
+        for index in range(2):
+            project = Project(name=f'分成项目{index}', project_type='集中式光伏', capacity_mw=100,
+                              current_stage='前期开发')
+            db.session.add(project)
+            db.session.flush()
+            analysis = ProfitAnalysis(project=project, total_project_cost=17500, dev_fee_rate=0.1,
+                                      extra_investment=0, resource_fee_total=6000, dengpin_cost=1000,
+                                      revenue_share_schedule=schedule if index == 0 else None)
+            analysis.calculate_profit_analysis()
+            db.session.add(analysis)
+        db.session.commit()
+    return app
+
+
+def test_schedule_cache_and_edit(make_app):
+    """收益分析按引用的方案计算；编译结果按方案缓存，修改分级后修订号加1、缓存失效，批量校验发现过期结果。"""
+    app = _create_app(make_app)
+    with app.app_context():
+        cache = get_revenue_share_schedules()
+        first, second = ProfitAnalysis.query.order_by(ProfitAnalysis.project_id).all()
+        assert first.resource_income == 2500.0
+        assert second.resource_income == ProfitCalculator.calculate_resource_share_revenue(6000)
+
+        schedule = RevenueShareSchedule.query.one()
+        compiled = cache.compiled(schedule)
+        assert cache.compiled(schedule) is compiled and cache.compiled_by_id([schedule.id])[schedule.id] is compiled
+
+        schedule.tiers = [{'threshold': 0, 'rate': 0.2}, {'threshold': 3000, 'rate': 0.6}]
+        db.session.commit()
+        assert schedule.revision == 2 and len(cache) == 0
+        assert cache.compiled(schedule) is not compiled
+        assert run_checks(['profits'], dry_run=True)['profits'][0].expected == 600 + 3000 * 0.6
+        run_checks(['profits'])
+        assert db.session.get(ProfitAnalysis, first.id).resource_income == 2400.0
+
+        # 其他进程修改方案：本进程缓存的修订号过期，按新分级重新编译
+        db.session.execute(db.text("UPDATE revenue_share_schedule SET tiers = :tiers, revision = 3"),
+                           {'tiers': '[{"threshold": 0, "rate": 0.1}]'})
+        db.session.commit()
+        assert cache.compiled_by_id([schedule.id])[schedule.id].rates == (Decimal('0.1'),)
+
+        # 读取方案后其他事务递增了修订号：修订号在 UPDATE 语句中加1，不会回退
+        assert schedule.revision == 3
+        db.session.execute(db.text("UPDATE revenue_share_schedule SET revision = 5"))
+        schedule.tiers = [{'threshold': 0, 'rate': 0.1}, {'threshold': 9000, 'rate': 0.2}]
+        db.session.commit()
+        assert schedule.revision == 6
+
+        # 反算按方案的分级求资源费：委托费 1000 万元，还需分成 600 万元；分成保留到分，5999.95 × 10% 即为 600.00
+        result = solve_portfolio('total_income', 1600, 'resource_fee_total', [first.project_id])
+        assert result[0]['required'] == 5999.95
+
+        schedule.tiers = [{'threshold': 0, 'rate': 1.5}]
+        try:
+            db.session.commit()
+            assert False, '分成比例超过1应拒绝保存'
+        except ValueError:
+            db.session.rollback()
+
+
+def test_schedule_admin_api(make_app, login):
+    """管理员通过API新增、修改和删除方案，分级不合法返回400，被引用的方案不能删除。"""
+    app = _create_app(make_app)
+    client = login(app, 'admin', 'share123')
+
+    response = client.post('/admin/revenue_share_schedules',
+                           json={'name': '合作合同B', 'tiers': [{'threshold': 0, 'rate': 0.35}]})
+    assert response.status_code == 201
+    schedule_id = response.get_json()['id']
+    assert client.post('/admin/revenue_share_schedules', json={'name': '合作合同B', 'tiers': PARTNER_TIERS}) \
+        .status_code == 400
+    assert client.put(f'/admin/revenue_share_schedules/{schedule_id}',
+                      json={'tiers': [{'threshold': 10, 'rate': 0.35}]}).status_code == 400
+
+    data = client.put(f'/admin/revenue_share_schedules/{schedule_id}',
+                      json={'tiers': [{'threshold': 0, 'rate': 0.4}]}).get_json()
+    assert data['revision'] == 2 and data['analyses'] == 0 and data['recomputed'] == 0
+
+    schedules = client.get('/admin/revenue_share_schedules').get_json()['schedules']
+    assert [(s['name'], s['analyses']) for s in schedules] == [('合作合同A', 1), ('合作合同B', 0)]
+    assert client.delete(f'/admin/revenue_share_schedules/{schedules[0]["id"]}').status_code == 409
+    assert client.delete(f'/admin/revenue_share_schedules/{schedule_id}').status_code == 200
+
+    with app.app_context():
+        project_id = Project.query.filter_by(name='分成项目1').one().id
+    response = client.post(f'/profit_analysis/{project_id}', data={
+        'dev_fee_rate': 0.1, 'extra_investment': 0, 'resource_fee_total': 6000, 'dengpin_cost': 1000,
+        'revenue_share_schedule_id': schedules[0]['id']})
+    assert response.status_code == 302
+    with app.app_context():
+        assert ProfitAnalysis.query.filter_by(project_id=project_id).one().resource_income == 2500.0
+
+    # 修改被引用方案的分级：引用它的收益分析在同一事务中重新计算
+    data = client.put(f'/admin/revenue_share_schedules/{schedules[0]["id"]}',
+                      json={'tiers': [{'threshold': 0, 'rate': 0.2}]}).get_json()
+    assert (data['revision'], data['analyses'], data['recomputed']) == (2, 2, 2)
+    with app.app_context():
+        analyses = ProfitAnalysis.query.filter_by(revenue_share_schedule_id=schedules[0]['id']).all()
+        assert [a.resource_income for a in analyses] == [1200.0, 1200.0]
+        assert [a.total_income for a in analyses] == [2200.0, 2200.0]
+        assert run_checks(['profits'], dry_run=True)['profits'] == []
+    assert client.put(f'/admin/revenue_share_schedules/{schedules[0]["id"]}',
+                      json={'description': '仅修改说明'}).get_json()['recomputed'] == 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全文检索功能测试脚本
+"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import zipfile
+
+import pytest
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+from app import db
+from app.document_pipeline import get_document_pipeline
+from app.models import User, Project
+from app.search import CJKBigramTokenizer, get_search_indexer
+
+
+def _docx_bytes(paragraphs):
+    """构造只包含正文段落的最小DOCX文件。"""
+    body = ''.join(f'<w:p><w:r><w:t>{p}</w:t></w:r></w:p>' for p in paragraphs)
+    xml = ('<?xml version="1.0" encoding="UTF-8"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+           f'<w:body>{body}</w:body></w:document>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', xml)
+    return buffer.getvalue()
+
+
+def _pdf_bytes(text):
+    """用 CID 中文字体生成单页PDF。"""
+    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.setFont('STSong-Light', 12)
+    pdf.drawString(72, 720, text)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _create_app(make_app, storage_dir, sync=True):
+    overrides = {'BLOB_STORAGE_DIR': storage_dir, 'THUMBNAIL_DIR': os.path.join(storage_dir, 'thumbnails'),
+                 'SEARCH_INDEX_SYNC': sync}
+    if not sync:
+        # 内存数据库只有一个连接，测试线程归还连接时的回滚会撤销后台线程未提交的写入
+        overrides['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(storage_dir, 'search.db')
+    app = make_app(users=[('admin', '管理员', 'admin123'), ('staff', '普通员工', 'staff123')], **overrides)
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        db.session.add_all([
+            Project(name='酒泉集中式光伏电站', project_type='集中式光伏', capacity_mw=200,
+                    province='甘肃省', city='酒泉市', address='玉门镇戈壁滩', manager=admin),
+            Project(name='张北陆上风电场', project_type='陆上风电', capacity_mw=100,
+                    province='河北省', city='张家口市', manager=admin),
+        ])
+        db.session.commit()
+    return app
+
+
+def test_bigram_tokenizer():
+    tokenizer = CJKBigramTokenizer()
+    assert tokenizer.prepare('光伏项目').split() == ['光伏', '伏项', '项目']
+    assert tokenizer.build_match('光伏 A区') == '"光伏" AND "A 区"*'
+
+
+def test_search_projects_and_document_contents(make_app, login):
+    """检索项目字段和文档正文，结果带高亮片段并按权限过滤。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, root)
+        client = login(app)
+
+        client.post('/project/2/documents/upload', data={
+            'file': (io.BytesIO(_docx_bytes(['张北风电场接入系统设计', '并网批复文号：冀发改能源2024第18号'])), 'approval.docx'),
+            'stage': '前期开发',
+            'description': '并网批复',
+        }, content_type='multipart/form-data')
+
+        data = client.get('/search?q=光伏&format=json').get_json()
+        assert [r['title'] for r in data['results']] == ['酒泉集中式<mark>光伏</mark>电站']
+
+        data = client.get('/search?q=甘肃&format=json').get_json()
+        assert data['results'][0]['kind'] == 'project'
+
+        data = client.get('/search?q=冀发改能源&format=json').get_json()
+        assert len(data['results']) == 1
+        result = data['results'][0]
+        assert result['kind'] == 'document'
+        assert result['project_name'] == '张北陆上风电场'
+        assert '<mark>冀发改能源</mark>' in result['snippet']
+
+        response = client.get('/search?q=张北')
+        assert response.status_code == 200
+        assert '张北陆上风电场' in response.get_data(as_text=True)
+
+        # 普通员工可以检索项目，但看不到他人项目的文档
+        staff_client = login(app, 'staff', 'staff123')
+        assert staff_client.get('/search?q=冀发改能源&format=json').get_json()['results'] == []
+        assert len(staff_client.get('/search?q=风电&format=json').get_json()['results']) == 1
+
+
+def test_search_pdf_contents(make_app, login, monkeypatch):
+    """PDF 正文可检索；缺少 pypdf 时暂不可检索，安装后积压任务重新处理并刷新索引。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, root)
+        client = login(app)
+        monkeypatch.setitem(sys.modules, 'pypdf', None)
+        client.post('/project/1/documents/upload', data={
+            'file': (io.BytesIO(_pdf_bytes('酒泉光伏电站环境影响评价批复')), 'eia.pdf'),
+            'stage': '前期开发',
+        }, content_type='multipart/form-data')
+        assert client.get('/search?q=环境影响评价&format=json').get_json()['results'] == []
+
+        monkeypatch.undo()
+        get_document_pipeline(app).process_backlog()
+        results = client.get('/search?q=环境影响评价&format=json').get_json()['results']
+        assert [(r['kind'], r['title']) for r in results] == [('document', 'eia.pdf')]
+        assert '<mark>环境影响评价</mark>' in results[0]['snippet']
+
+
+def test_background_indexer_tracks_edits_and_deletes(make_app):
+    """后台索引线程在项目修改和删除后更新索引。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, root, sync=False)
+        with app.app_context():
+            indexer = get_search_indexer()
+            indexer.rebuild()
+
+            project = db.session.get(Project, 1)
+            project.name = '敦煌光热示范项目'
+            db.session.commit()
+            indexer.flush()
+            assert [r['ref_id'] for r in indexer.search('敦煌')] == [1]
+            assert indexer.search('电站') == []
+
+            db.session.delete(db.session.get(Project, 2))
+            db.session.commit()
+            indexer.flush()
+            assert indexer.search('张北') == []
+
+
+def test_concurrent_first_use_creates_index_once(make_app):
+    """后台线程、检索和重建同时首次使用索引时只创建一次索引表，已有数据由后台线程补建。"""
+    with tempfile.TemporaryDirectory() as root:
+        app = _create_app(make_app, root, sync=False)
+        indexer = get_search_indexer(app)
+        errors = []
+
+        def use(action):
+            with app.app_context():
+                try:
+                    action()
+                except Exception as e:
+                    errors.append(e)
+
+        actions = [lambda: indexer.search('光伏'), lambda: indexer.enqueue([('project', 1, False)])] * 4
+        threads = [threading.Thread(target=use, args=(action,)) for action in actions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        indexer.flush()
+        assert errors == []
+        with app.app_context():
+            assert [r['ref_id'] for r in indexer.search('张北')] == [2]
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+启动开销测试脚本：报表依赖应在首次导出时才加载
+"""
+
+from benchmarks.startup import SCENARIOS, measure
+
+
+def test_app_startup_skips_report_dependencies():
+    """创建应用时不加载 pandas、ReportLab 等重量级依赖。"""
+    result = measure(SCENARIOS['wsgi_app'])
+    assert result['modules'] == [], result['modules']
+
+
+def test_first_export_loads_reportlab():
+    """首次导出PDF时才加载 ReportLab，且不需要 pandas。"""
+    result = measure(SCENARIOS['first_pdf_export'])
+    assert 'reportlab' in result['modules']
+    assert 'pandas' not in result['modules']
+
+
+if __name__ == '__main__':
+    test_app_startup_skips_report_dependencies()
+    test_first_export_loads_reportlab()
+    print('✅ 启动开销测试通过')
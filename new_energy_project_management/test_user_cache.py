@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+登录用户缓存测试脚本
+"""
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import Project, User
+from app.user_cache import SessionUser, get_user_cache, invalidate_user
+
+
+def _create_app(make_app):
+    app = make_app(users=[('admin', '管理员', 'cache123'), ('manager', '项目经理', 'cache123')])
+    with app.app_context():
+        manager = User.query.filter_by(username='manager').one()
+        db.session.add(Project(name='缓存测试项目', project_type='集中式光伏', capacity_mw=20,
+                               current_stage='规划', manager_id=manager.id))
+        db.session.commit()
+    return app
+
+
+class UserTableQueries:
+    """统计访问 user 表的 SQL 语句数。"""
+
+    def __init__(self, app):
+        with app.app_context():
+            self.engine = db.engine
+        self.count = 0
+
+    def _listener(self, conn, cursor, statement, parameters, context, executemany):
+        if 'FROM user' in statement:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._listener)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._listener)
+
+
+def test_snapshot_is_immutable(make_app):
+    """快照包含按角色解析的权限集合，且不能修改。"""
+    app = _create_app(make_app)
+    with app.app_context():
+        snapshot = get_user_cache().get(User.query.filter_by(username='manager').one().id)
+        assert isinstance(snapshot, SessionUser)
+        assert snapshot.role == '项目经理'
+        assert snapshot.has_permission('can_create_projects')
+        assert not snapshot.has_permission('can_manage_users')
+        try:
+            snapshot.role = '管理员'
+            assert False, '快照不应允许修改'
+        except AttributeError:
+            pass
+
+
+def test_page_views_skip_user_table(make_app, login):
+    """缓存命中后，已登录页面不再查询用户表。"""
+    app = _create_app(make_app)
+    client = login(app, 'manager', 'cache123')
+    client.get('/')
+    with UserTableQueries(app) as queries:
+        for _ in range(3):
+            assert client.get('/create_project').status_code == 200
+    assert queries.count == 0
+
+    # 关闭缓存时每个请求都查询用户表
+    app.config['USER_CACHE_TTL'] = 0
+    get_user_cache(app).clear()
+    with UserTableQueries(app) as queries:
+        for _ in range(3):
+            client.get('/create_project')
+    assert queries.count == 3
+
+
+def test_admin_edit_and_delete_invalidate(make_app, login):
+    """管理员修改角色、删除用户后立即生效。"""
+    app = _create_app(make_app)
+    admin = login(app, 'admin', 'cache123')
+    manager = login(app, 'manager', 'cache123')
+    with app.app_context():
+        manager_id = User.query.filter_by(username='manager').one().id
+
+    assert manager.get('/admin/users').status_code == 403
+    # 与 admin_edit_user 相同：提交后使缓存失效（用户表单的邮箱校验依赖 email_validator）
+    with app.app_context():
+        db.session.get(User, manager_id).role = '管理员'
+        db.session.commit()
+        assert manager.get('/admin/users').status_code == 403
+        invalidate_user(manager_id)
+    assert manager.get('/admin/users').status_code == 200
+
+    with app.app_context():
+        Project.query.delete()
+        db.session.commit()
+    admin.post(f'/admin/users/{manager_id}/delete')
+    response = manager.get('/')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__]))